@@ -0,0 +1,105 @@
+"""
+Access tracking
+Keeps last-access timestamps in memory and flushes them in batches to a small
+per-campaign access.json, so reads never rewrite the documents they touch.
+A background thread started with the app flushes on the interval even when
+no further requests arrive.
+"""
+
+import atexit
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from helpers import load_campaign_json, save_campaign_json, get_campaign_dir
+
+ACCESS_FILENAME = "access.json"
+
+# Seconds between flushes of pending timestamps to disk
+FLUSH_INTERVAL_SECONDS = 30.0
+
+
+class AccessTracker:
+    """Batched last-access timestamps keyed by (campaign_id, key)"""
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL_SECONDS):
+        self.flush_interval = flush_interval
+        self._pending: dict[str, dict[str, str]] = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def touch(self, campaign_id: str, key: str):
+        """Record an access now. The flush thread writes it out; without one
+        running (scripts, tests) the touch flushes once the interval has elapsed."""
+        now = datetime.utcnow().isoformat() + "Z"
+        with self._lock:
+            self._pending.setdefault(campaign_id, {})[key] = now
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+        if due and not self.running():
+            self.flush()
+
+    def get(self, campaign_id: str, key: str) -> Optional[str]:
+        """Latest known access time, pending or flushed"""
+        with self._lock:
+            pending = self._pending.get(campaign_id, {}).get(key)
+        if pending:
+            return pending
+        return load_campaign_json(campaign_id, ACCESS_FILENAME).get(key)
+
+    def get_all(self, campaign_id: str) -> dict[str, str]:
+        """All access times for a campaign, pending values taking precedence"""
+        with self._lock:
+            pending = dict(self._pending.get(campaign_id, {}))
+        return {**load_campaign_json(campaign_id, ACCESS_FILENAME), **pending}
+
+    def flush(self):
+        """Write every pending timestamp to its campaign's access file"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        for campaign_id, entries in pending.items():
+            # Never recreate the directory of a campaign deleted since the touch
+            if not os.path.isdir(get_campaign_dir(campaign_id)):
+                continue
+            try:
+                data = load_campaign_json(campaign_id, ACCESS_FILENAME)
+                data.update(entries)
+                save_campaign_json(campaign_id, ACCESS_FILENAME, data)
+            except OSError as e:
+                print(f"Failed to flush access times for {campaign_id}: {e}")
+
+    def forget(self, campaign_id: str):
+        """Drop pending timestamps for a campaign (e.g. when it is deleted)"""
+        with self._lock:
+            self._pending.pop(campaign_id, None)
+
+    def start(self):
+        """Start the background thread that flushes every flush_interval seconds"""
+        if self.running():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="access-tracker-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the flush thread and write anything still pending"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+
+tracker = AccessTracker()
+atexit.register(tracker.flush)
@@ -0,0 +1,142 @@
+"""
+Benchmark: loading campaign documents
+
+Builds a large campaign (every list and text field at its schema maximum)
+and a long-running state, then times the ways they can be read back:
+
+  dict       json.load, then Model(**data) (the old load path)
+  json       Model.model_validate_json(raw), one pass in pydantic-core
+  trusted    sha256 check, json.loads, recursive model_construct (skips validation)
+
+and, for the state, the ways a cached model can be handed out as a fresh copy:
+
+  deepcopy   model_copy(deep=True)
+  revalidate model_validate_json(cached model_dump_json())
+
+Usage: python benchmarks/bench_load.py [--repeat N]
+"""
+
+import argparse
+import copy
+import hashlib
+import json
+import os
+import sys
+import timeit
+import types
+from enum import Enum
+from typing import Any, Union, get_args, get_origin
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pydantic import BaseModel  # noqa: E402
+
+from campaign_schema import CampaignContent, CampaignState, EXAMPLE_CAMPAIGN  # noqa: E402
+from ordered_set import OrderedSet  # noqa: E402
+
+
+def large_campaign() -> dict:
+    data = copy.deepcopy(EXAMPLE_CAMPAIGN)
+    prose = " ".join(["The hedgerows whisper of old bargains and older debts."] * 10)
+
+    def text(prefix: str, limit: int) -> str:
+        return f"{prefix}: {prose}"[:limit]
+
+    base_npc, base_loc, base_run = data["npcs"][0], data["locations"][0], data["anchor_runs"][0]
+    data["npcs"] = [{**base_npc, "name": f"Npc {i}", "wants": text("Wants", 200), "secret": text(f"Secret {i}", 300)}
+                    for i in range(10)]
+    data["locations"] = [{**base_loc, "name": f"Location {i}", "vibe": text("Vibe", 200)} for i in range(10)]
+    data["anchor_runs"] = [
+        {**base_run, "id": f"run_{i}", "hook": text("Hook", 300), "goal": text("Goal", 200),
+         "reveal": text(f"Reveal {i}", 300), "must_include": [f"Npc {i % 10}"] * 5,
+         "trigger": {"type": "start", "value": None} if i == 0 else {"type": "after_run", "value": f"run_{i - 1}"}}
+        for i in range(10)
+    ]
+    data["filler_seeds"] = [text(f"Seed {i}", 150) for i in range(15)]
+    return CampaignContent(**data).model_dump(mode="json")
+
+
+def large_state() -> dict:
+    return CampaignState(
+        runs_completed=400,
+        threat_stage=2,
+        anchor_runs_completed=[f"run_{i}" for i in range(10)],
+        filler_seeds_used=list(range(15)),
+        facts_known=[f"Fact {i}: the party learned something" for i in range(3000)],
+        locations_visited=[f"Location {i}" for i in range(500)],
+        npcs={f"npc_{i}": {"met": i % 2 == 0, "disposition": "neutral"} for i in range(200)},
+        flags={f"flag_{i}": True for i in range(200)},
+    ).model_dump(mode="json")
+
+
+# === Unvalidated construction (the "trusted" candidate) ===
+
+def _build(annotation: Any, value: Any) -> Any:
+    if value is None:
+        return None
+    origin = get_origin(annotation)
+    if origin in (Union, types.UnionType):
+        options = [arg for arg in get_args(annotation) if arg is not type(None)]
+        return _build(options[0], value) if len(options) == 1 else value
+    if origin is list:
+        return [_build(get_args(annotation)[0], v) for v in value]
+    if origin is dict:
+        return {k: _build(get_args(annotation)[1], v) for k, v in value.items()}
+    if origin is OrderedSet:
+        return OrderedSet(value)
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return construct(annotation, value)
+    if isinstance(annotation, type) and issubclass(annotation, Enum):
+        return annotation(value)
+    return value
+
+
+def construct(model_cls, data: dict):
+    return model_cls.model_construct(**{
+        name: _build(field.annotation, data[name]) for name, field in model_cls.model_fields.items() if name in data
+    })
+
+
+# === Timing ===
+
+def _time(fn, repeat: int) -> float:
+    return min(timeit.repeat(fn, number=repeat, repeat=5)) / repeat * 1e3
+
+
+def bench_load(name: str, model_cls, data: dict, repeat: int):
+    raw = json.dumps(data, indent=2).encode("utf-8")
+    known = hashlib.sha256(raw).hexdigest()
+
+    def trusted():
+        assert hashlib.sha256(raw).hexdigest() == known
+        return construct(model_cls, json.loads(raw))
+
+    assert trusted().model_dump() == model_cls.model_validate_json(raw).model_dump()
+    timings = {
+        "dict": _time(lambda: model_cls(**json.loads(raw)), repeat),
+        "json": _time(lambda: model_cls.model_validate_json(raw), repeat),
+        "trusted": _time(trusted, repeat),
+    }
+    print(f"{name:<16} {len(raw) / 1024:>7.1f} KiB  " +
+          "  ".join(f"{path} {ms:.3f} ms" for path, ms in timings.items()))
+
+
+def bench_copy(data: dict, repeat: int):
+    state = CampaignState(**data)
+    cached = state.model_dump_json()
+    print(f"{'state copy':<16} {len(cached) / 1024:>7.1f} KiB  "
+          f"deepcopy {_time(lambda: state.model_copy(deep=True), repeat):.3f} ms  "
+          f"revalidate {_time(lambda: CampaignState.model_validate_json(cached), repeat):.3f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args(argv)
+    bench_load("CampaignContent", CampaignContent, large_campaign(), args.repeat)
+    bench_load("CampaignState", CampaignState, large_state(), args.repeat)
+    bench_copy(large_state(), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
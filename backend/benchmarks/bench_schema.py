@@ -0,0 +1,89 @@
+"""
+Benchmark: campaign_schema validation and serialization throughput
+
+Times validating (from a dict and from JSON bytes) and serializing (to a
+dict and to JSON) CampaignContent, CampaignState, DMPrepData and
+CampaignSystem, using documents at realistic upper sizes.
+
+Usage: python benchmarks/bench_schema.py [--repeat N]
+"""
+
+import argparse
+import copy
+import json
+import os
+import sys
+import timeit
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from campaign_schema import (  # noqa: E402
+    BLOOMBURROW_SYSTEM,
+    CampaignContent,
+    CampaignState,
+    CampaignSystem,
+    DMPrepData,
+)
+from bench_load import large_campaign, large_state  # noqa: E402
+
+
+def large_prep() -> dict:
+    note = {"content": "Bramblewick lies about the shrine until the party brings proof. " * 5,
+            "category": "secret", "related_to": "Bramblewick", "created_at": "2026-01-01T00:00:00Z"}
+    return {
+        "author_notes": [{**note, "id": f"note_{i}"} for i in range(200)],
+        "pinned": [{**note, "id": f"pin_{i}", "category": "voice"} for i in range(50)],
+        "last_accessed": "2026-01-01T00:00:00Z",
+    }
+
+
+def large_system() -> dict:
+    data = copy.deepcopy(BLOOMBURROW_SYSTEM)
+    base = data["species"][0]
+    data["species"] = [{**base, "name": f"Species {i}"} for i in range(20)]
+    return data
+
+
+def _rate(fn, repeat: int) -> float:
+    """Operations per second (best of 5)"""
+    return repeat / min(timeit.repeat(fn, number=repeat, repeat=5))
+
+
+def bench(name: str, model_cls, data: dict, repeat: int) -> dict:
+    raw = json.dumps(data).encode("utf-8")
+    model = model_cls.model_validate(data)
+    return {
+        "model": name,
+        "validate_dict": _rate(lambda: model_cls.model_validate(data), repeat),
+        "validate_json": _rate(lambda: model_cls.model_validate_json(raw), repeat),
+        "dump_dict": _rate(lambda: model.model_dump(), repeat),
+        "dump_json": _rate(lambda: model.model_dump_json(), repeat),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    # Deprecation warnings are not what is being measured
+    warnings.simplefilter("ignore", DeprecationWarning)
+    results = [
+        bench("CampaignContent", CampaignContent, large_campaign(), args.repeat),
+        bench("CampaignState", CampaignState, large_state(), args.repeat),
+        bench("DMPrepData", DMPrepData, large_prep(), args.repeat),
+        bench("CampaignSystem", CampaignSystem, large_system(), args.repeat),
+    ]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'ops/s':<16} {'validate_dict':>14} {'validate_json':>14} {'dump_dict':>14} {'dump_json':>14}")
+    for row in results:
+        print(f"{row['model']:<16} " + " ".join(f"{row[k]:>14,.0f}" for k in
+                                                 ("validate_dict", "validate_json", "dump_dict", "dump_json")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,448 @@
+"""
+Campaign archives
+Moving a campaign between instances as a tar stream: a manifest (campaign
+metadata, and the sha256 and size of every campaign file and image blob)
+followed by the files themselves. Exports are written block by block as
+they are sent, never held in memory; given an earlier manifest, only what
+changed since is included. Imports verify every checksum, validate the
+campaign documents, and give the campaign a fresh id (or update the copy
+an earlier archive was imported into) before anything is published
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import time
+import uuid
+from contextlib import ExitStack
+from datetime import datetime
+from typing import Iterator, Optional
+
+from pydantic import ValidationError
+
+import image_store
+from campaign_schema import CampaignContent, CampaignSystem, DMPrepData
+from downloads import CHUNK_SIZE
+from helpers import CAMPAIGNS_LOCK, get_campaign_dir, load_json, new_campaign_id, save_json
+from http_cache import file_digest, is_immutable_name
+from state_events import STATE_LOG_DIRNAME, load_state, state_lock
+
+ARCHIVE_FORMAT = "weave-campaign-archive"
+ARCHIVE_VERSION = 1
+
+MANIFEST_NAME = "manifest.json"
+FILES_PREFIX = "files/"
+BLOBS_PREFIX = "blobs/"
+
+# Largest manifest accepted by an import
+MAX_MANIFEST_BYTES = 16 * 1024 * 1024
+
+# Campaign files left out of archives: in-progress writes and regenerable renditions
+SKIPPED_SUFFIXES = (".tmp", ".part", ".upload")
+SKIPPED_DIRS = ("derived",)
+
+# Documents checked against their schema on import
+VALIDATED_DOCUMENTS = {
+    "campaign.json": CampaignContent,
+    "system.json": CampaignSystem,
+    "dm_prep.json": DMPrepData,
+}
+
+
+class ArchiveError(ValueError):
+    """An archive that is malformed, fails verification, or doesn't fit the target campaign"""
+
+
+def find_campaign(campaign_id: str) -> Optional[dict]:
+    """A campaign's entry in campaigns.json, or None"""
+    return next((c for c in load_json("campaigns.json").get("campaigns", []) if c["id"] == campaign_id), None)
+
+
+def _manifest_id(files: dict, blobs: dict) -> str:
+    listing = json.dumps({"files": files, "blobs": blobs}, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(listing).hexdigest()
+
+
+# === Export ===
+
+def _campaign_files(campaign_id: str) -> Iterator[tuple[str, str]]:
+    """(archive-relative path, absolute path) of every file in the campaign directory"""
+    root = get_campaign_dir(campaign_id)
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith(".") and d not in SKIPPED_DIRS)
+        for name in sorted(filenames):
+            if name.startswith(".") or name.endswith(SKIPPED_SUFFIXES):
+                continue
+            path = os.path.join(dirpath, name)
+            yield os.path.relpath(path, root).replace(os.sep, "/"), path
+
+
+def _hash_open_file(f) -> tuple[str, int]:
+    digest = hashlib.sha256()
+    size = 0
+    while chunk := f.read(CHUNK_SIZE):
+        digest.update(chunk)
+        size += len(chunk)
+    f.seek(0)
+    return digest.hexdigest(), size
+
+
+class CampaignExport:
+    """A campaign's manifest, with the sources to stream the archive from.
+
+    Mutable documents are opened (and hashed) while the manifest is built,
+    under the state log lock, so the archive carries the exact bytes its
+    checksums describe even if the campaign is written to while it streams.
+    Content-addressed and uuid-named files never change once written.
+    """
+
+    def __init__(self, campaign_id: str, campaign: dict, base: Optional[dict] = None):
+        self._stack = ExitStack()
+        self._sources: list[tuple[str, object, int]] = []
+        files: dict[str, dict] = {}
+        blobs: dict[str, dict] = {}
+        base_files = (base or {}).get("files", {})
+        base_blobs = (base or {}).get("blobs", {})
+
+        try:
+            with state_lock(campaign_id):
+                for rel, path in _campaign_files(campaign_id):
+                    if is_immutable_name(path):
+                        source, sha, size = path, file_digest(path), os.path.getsize(path)
+                    else:
+                        source = self._stack.enter_context(open(path, "rb"))
+                        sha, size = _hash_open_file(source)
+                    files[rel] = {"sha256": sha, "size": size}
+                    if base_files.get(rel, {}).get("sha256") != sha:
+                        self._sources.append((FILES_PREFIX + rel, source, size))
+
+            for name, holders in sorted(image_store.blob_holdings(campaign_id).items()):
+                sha, ext = image_store.parse_blob_name(name)
+                path = image_store.blob_path(sha, ext)
+                if not os.path.exists(path):
+                    continue
+                size = os.path.getsize(path)
+                blobs[name] = {"sha256": sha, "size": size, "holders": holders}
+                if name not in base_blobs:
+                    self._sources.append((BLOBS_PREFIX + name, path, size))
+        except BaseException:
+            self._stack.close()
+            raise
+
+        self.manifest = {
+            "format": ARCHIVE_FORMAT,
+            "version": ARCHIVE_VERSION,
+            "id": _manifest_id(files, blobs),
+            "base": base.get("id") if base else None,
+            "campaign_id": campaign_id,
+            "campaign": campaign,
+            "exported_at": datetime.utcnow().isoformat() + "Z",
+            "files": files,
+            "blobs": blobs,
+        }
+
+    def close(self):
+        self._stack.close()
+
+    def stream(self) -> Iterator[bytes]:
+        """The tar archive, in chunks; closes the export's files when done"""
+        try:
+            mtime = time.time()
+            manifest = json.dumps(self.manifest, indent=2).encode("utf-8")
+            written = 0
+            for name, source, size in [(MANIFEST_NAME, None, len(manifest))] + self._sources:
+                header = _header(name, size, mtime)
+                yield header
+                if source is None:
+                    yield manifest
+                else:
+                    yield from _read_exactly(source, size)
+                yield _padding(size)
+                written += len(header) + size + len(_padding(size))
+
+            # End of archive: two zero blocks, then pad out the final record
+            end = 2 * tarfile.BLOCKSIZE
+            end += -(written + end) % tarfile.RECORDSIZE
+            yield b"\0" * end
+        finally:
+            self.close()
+
+
+def _header(name: str, size: int, mtime: float) -> bytes:
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(mtime)
+    info.mode = 0o644
+    return info.tobuf(tarfile.PAX_FORMAT)
+
+
+def _padding(size: int) -> bytes:
+    return b"\0" * (-size % tarfile.BLOCKSIZE)
+
+
+def _read_exactly(source, size: int) -> Iterator[bytes]:
+    """size bytes from an open file or a path, in chunks"""
+    with ExitStack() as stack:
+        f = stack.enter_context(open(source, "rb")) if isinstance(source, str) else source
+        remaining = size
+        while remaining:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                raise ArchiveError(f"{getattr(f, 'name', source)} shrank while it was being exported")
+            remaining -= len(chunk)
+            yield chunk
+
+
+def export_campaign(campaign_id: str, base: Optional[dict] = None) -> Optional[CampaignExport]:
+    """Export of a campaign (only what changed since base, if given), or None if there is no such campaign"""
+    campaign = find_campaign(campaign_id)
+    if campaign is None:
+        return None
+    if base is not None and not isinstance(base.get("files"), dict):
+        raise ArchiveError("Base manifest has no file listing")
+    return CampaignExport(campaign_id, campaign, base)
+
+
+# === Import ===
+
+def _safe_relpath(rel: str) -> str:
+    """Reject archive paths that would land outside the campaign directory"""
+    parts = rel.split("/")
+    if not rel or rel.startswith("/") or "\\" in rel or any(p in ("", ".", "..") for p in parts):
+        raise ArchiveError(f"Unsafe path in archive: {rel!r}")
+    if parts[0].startswith(".") or rel.endswith(SKIPPED_SUFFIXES):
+        raise ArchiveError(f"Unexpected file in archive: {rel!r}")
+    return rel
+
+
+def _read_manifest(tar: tarfile.TarFile) -> dict:
+    member = tar.next()
+    if member is None or member.name != MANIFEST_NAME or not member.isfile():
+        raise ArchiveError("Archive must start with manifest.json")
+    if member.size > MAX_MANIFEST_BYTES:
+        raise ArchiveError("Manifest is too large")
+    try:
+        manifest = json.loads(tar.extractfile(member).read())
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        raise ArchiveError("Manifest is not valid JSON")
+    if not isinstance(manifest, dict) or manifest.get("format") != ARCHIVE_FORMAT:
+        raise ArchiveError("Not a campaign archive")
+    if manifest.get("version") != ARCHIVE_VERSION:
+        raise ArchiveError(f"Unsupported archive version {manifest.get('version')!r}")
+    if not isinstance(manifest.get("files"), dict) or not isinstance(manifest.get("blobs"), dict):
+        raise ArchiveError("Manifest is missing its file listing")
+    if not isinstance(manifest.get("campaign"), dict):
+        raise ArchiveError("Manifest is missing campaign metadata")
+    for rel in manifest["files"]:
+        _safe_relpath(rel)
+    for name in manifest["blobs"]:
+        if image_store.parse_blob_name(name) is None:
+            raise ArchiveError(f"Invalid image name in manifest: {name!r}")
+    return manifest
+
+
+def _receive(fileobj, dest: str, expected: dict, name: str):
+    """Copy a member to dest, checking it against its manifest entry"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(dest, "wb") as f:
+        while chunk := fileobj.read(CHUNK_SIZE):
+            digest.update(chunk)
+            size += len(chunk)
+            f.write(chunk)
+    if size != expected.get("size") or digest.hexdigest() != expected.get("sha256"):
+        raise ArchiveError(f"Checksum mismatch for {name}")
+
+
+def _validate_documents(staging_id: str):
+    root = get_campaign_dir(staging_id)
+    for filename, model_cls in VALIDATED_DOCUMENTS.items():
+        path = os.path.join(root, filename)
+        if not os.path.exists(path):
+            continue
+        with open(path, "rb") as f:
+            raw = f.read()
+        try:
+            model_cls.model_validate_json(raw)
+        except ValidationError as e:
+            raise ArchiveError(f"{filename} is invalid: {e.error_count()} validation error(s)")
+    for rel, path in _campaign_files(staging_id):
+        if rel.endswith(".json"):
+            try:
+                with open(path, "rb") as f:
+                    json.load(f)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                raise ArchiveError(f"{rel} is not valid JSON")
+    try:
+        load_state(staging_id)
+    except (ValidationError, ValueError, KeyError) as e:
+        raise ArchiveError(f"Campaign state does not replay: {e}")
+
+
+def _remapped(rel: str) -> bool:
+    """Whether a file's campaign-scoped URLs are rewritten on import.
+
+    The state log is left alone: its snapshots record byte offsets into it,
+    and its events never carry URLs.
+    """
+    return not rel.startswith(STATE_LOG_DIRNAME + "/") and rel.endswith((".json", ".jsonl"))
+
+
+def _url_prefix(campaign_id: str) -> bytes:
+    return f"/api/campaigns/{campaign_id}/".encode("utf-8")
+
+
+def _unchanged(rel: str, path: str, expected: dict, old_id: Optional[str], new_id: str) -> bool:
+    """Whether a file matches its manifest entry, allowing for ids remapped when it was imported"""
+    if not os.path.exists(path):
+        return False
+    if file_digest(path) == expected.get("sha256"):
+        return True
+    if not old_id or old_id == new_id or not _remapped(rel):
+        return False
+    with open(path, "rb") as f:
+        original = f.read().replace(_url_prefix(new_id), _url_prefix(old_id))
+    return hashlib.sha256(original).hexdigest() == expected.get("sha256")
+
+
+def _remap_ids(staging_id: str, old_id: str, new_id: str):
+    """Point campaign-scoped URLs stored in documents at the new campaign id"""
+    old, new = _url_prefix(old_id), _url_prefix(new_id)
+    for rel, path in _campaign_files(staging_id):
+        if not _remapped(rel):
+            continue
+        with open(path, "rb") as f:
+            raw = f.read()
+        if old in raw:
+            with open(path + ".tmp", "wb") as f:
+                f.write(raw.replace(old, new))
+            os.replace(path + ".tmp", path)
+
+
+def _campaign_entry(manifest: dict, campaign_id: str, existing: Optional[dict]) -> dict:
+    entry = {**(existing or {}), **manifest["campaign"], "id": campaign_id}
+    old_id = manifest.get("campaign_id")
+    if isinstance(entry.get("bannerImage"), str) and old_id:
+        entry["bannerImage"] = entry["bannerImage"].replace(f"/api/campaigns/{old_id}/", f"/api/campaigns/{campaign_id}/")
+    return entry
+
+
+def import_campaign(archive, into: Optional[str] = None) -> dict:
+    """Import a campaign from a readable tar stream.
+
+    Creates a new campaign under a fresh id, or with into, replaces that
+    campaign's files with the archive's; an incremental archive (one with
+    a base) can only be imported into the campaign that already holds
+    every file it leaves out. Returns campaign_id, files and images.
+    Raises ArchiveError if anything fails to verify; nothing is published
+    in that case.
+    """
+    existing = find_campaign(into) if into else None
+    if into and existing is None:
+        raise ArchiveError(f"Campaign '{into}' not found")
+
+    staging_id = f".import_{uuid.uuid4().hex}"
+    staging_dir = get_campaign_dir(staging_id)
+    incoming_dir = image_store.get_incoming_dir()
+    os.makedirs(staging_dir)
+    os.makedirs(incoming_dir, exist_ok=True)
+    received_blobs: dict[str, str] = {}
+    try:
+        try:
+            tar = tarfile.open(fileobj=archive, mode="r|")
+        except tarfile.TarError:
+            raise ArchiveError("Not a tar archive")
+        with tar:
+            manifest = _read_manifest(tar)
+            if manifest.get("base") and not into:
+                raise ArchiveError("Incremental archive: import it into the campaign it was exported against")
+            received_files = set()
+            try:
+                # Not `for member in tar`: that would start over with the manifest
+                while (member := tar.next()) is not None:
+                    if not member.isfile():
+                        raise ArchiveError(f"Unexpected archive entry: {member.name!r}")
+                    if member.name.startswith(FILES_PREFIX):
+                        rel = _safe_relpath(member.name[len(FILES_PREFIX):])
+                        if rel not in manifest["files"] or rel in received_files:
+                            raise ArchiveError(f"Unexpected file in archive: {rel!r}")
+                        dest = os.path.join(staging_dir, *rel.split("/"))
+                        os.makedirs(os.path.dirname(dest), exist_ok=True)
+                        _receive(tar.extractfile(member), dest, manifest["files"][rel], rel)
+                        received_files.add(rel)
+                    elif member.name.startswith(BLOBS_PREFIX):
+                        name = member.name[len(BLOBS_PREFIX):]
+                        expected = manifest["blobs"].get(name)
+                        if expected is None or name in received_blobs:
+                            raise ArchiveError(f"Unexpected image in archive: {name!r}")
+                        if expected.get("sha256") != image_store.parse_blob_name(name)[0]:
+                            raise ArchiveError(f"Checksum mismatch for {name}")
+                        temp_path = os.path.join(incoming_dir, f".{uuid.uuid4().hex}.part")
+                        received_blobs[name] = temp_path
+                        _receive(tar.extractfile(member), temp_path, expected, name)
+                    else:
+                        raise ArchiveError(f"Unexpected archive entry: {member.name!r}")
+            except tarfile.TarError:
+                raise ArchiveError("Archive is truncated or corrupt")
+
+        # Whatever an incremental archive left out must already be in place, unchanged
+        for rel, expected in manifest["files"].items():
+            if rel in received_files:
+                continue
+            source = os.path.join(get_campaign_dir(into), *rel.split("/")) if into else None
+            if not source or not _unchanged(rel, source, expected, manifest.get("campaign_id"), into):
+                raise ArchiveError(f"Archive leaves out {rel}, which the campaign doesn't have unchanged")
+            dest = os.path.join(staging_dir, *rel.split("/"))
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            shutil.copy2(source, dest)
+        for name in manifest["blobs"]:
+            sha, ext = image_store.parse_blob_name(name)
+            if name not in received_blobs and not os.path.exists(image_store.blob_path(sha, ext)):
+                raise ArchiveError(f"Archive leaves out image {name}, which this instance doesn't have")
+
+        campaign_id = into or new_campaign_id(manifest["campaign"].get("name") or "campaign")
+        _validate_documents(staging_id)
+        if manifest.get("campaign_id") and manifest["campaign_id"] != campaign_id:
+            _remap_ids(staging_id, manifest["campaign_id"], campaign_id)
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        for temp_path in received_blobs.values():
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        raise
+
+    # Publish: images first, so documents never point at blobs that aren't stored
+    holders = {holder.split(":", 1)[0]: holder for holder in image_store.campaign_holders(campaign_id)}
+    if into:
+        image_store.release_campaign(campaign_id)
+    for name, entry in manifest["blobs"].items():
+        sha, ext = image_store.parse_blob_name(name)
+        kinds = [kind for kind in entry.get("holders", []) if kind in holders] or ["archive"]
+        if name in received_blobs:
+            image_store.put_file(received_blobs[name], sha, ext, holder=holders[kinds[0]])
+        for kind in kinds:
+            image_store.add_ref(sha, holders[kind])
+
+    target_dir = get_campaign_dir(campaign_id)
+    if into:
+        retired = get_campaign_dir(f".retired_{uuid.uuid4().hex}")
+        os.replace(target_dir, retired)
+        os.replace(staging_dir, target_dir)
+        shutil.rmtree(retired, ignore_errors=True)
+    else:
+        os.replace(staging_dir, target_dir)
+
+    with CAMPAIGNS_LOCK:
+        data = load_json("campaigns.json") or {"activeCampaignId": None, "campaigns": []}
+        entry = _campaign_entry(manifest, campaign_id, existing)
+        campaigns = data.setdefault("campaigns", [])
+        index = next((i for i, c in enumerate(campaigns) if c["id"] == campaign_id), None)
+        if index is None:
+            campaigns.append(entry)
+        else:
+            campaigns[index] = entry
+        save_json("campaigns.json", data)
+
+    return {"campaign_id": campaign_id, "files": len(manifest["files"]), "images": len(manifest["blobs"])}
@@ -3,6 +3,7 @@ Campaign content, state, and run management logic
 """
 
 import random
+from typing import Optional
 
 from campaign_schema import (
     CampaignContent,
@@ -12,28 +13,24 @@ from campaign_schema import (
     DMPrepData,
 )
 from helpers import load_campaign_json, save_campaign_json
+from prep_conversation import migrate_inline_conversation
+from content_index import ContentIndex, filler_run_id, get_content_index
+from run_graph import RunGraph
+from state_events import load_state, record_event
 
 
 def load_campaign_content(campaign_id: str):
-    """Load authored campaign content"""
-    data = load_campaign_json(campaign_id, "campaign.json")
-    if not data:
-        return None
-    try:
-        return CampaignContent(**data)
-    except Exception:
-        return None
+    """Load authored campaign content (validated once per content version; treat as read-only)"""
+    index = get_content_index(campaign_id)
+    return index.content if index else None
 
 def load_campaign_state(campaign_id: str) -> CampaignState:
-    """Load runtime campaign state"""
-    data = load_campaign_json(campaign_id, "state.json")
-    if not data:
-        return CampaignState()
-    return CampaignState(**data)
+    """Load runtime campaign state (latest snapshot plus the event tail)"""
+    return load_state(campaign_id)
 
 def save_campaign_state(campaign_id: str, state: CampaignState):
-    """Save runtime campaign state"""
-    save_campaign_json(campaign_id, "state.json", state.dict())
+    """Replace runtime campaign state wholesale; routine changes record typed events instead"""
+    record_event(campaign_id, "state_replaced", state=state.model_dump())
 
 def check_trigger(trigger, state: CampaignState) -> bool:
     """Check if a run trigger condition is met"""
@@ -47,70 +44,54 @@ def check_trigger(trigger, state: CampaignState) -> bool:
         return state.threat_stage >= int(trigger.value)
     return False
 
-def get_available_runs(content: CampaignContent, state: CampaignState) -> dict:
-    """Get currently available anchor runs and filler seeds"""
-    available_anchors = []
-    for run in content.anchor_runs:
-        if run.id not in state.anchor_runs_completed:
-            if check_trigger(run.trigger, state):
-                available_anchors.append(run)
-
-    available_fillers = []
-    for i, seed in enumerate(content.filler_seeds):
-        if i not in state.filler_seeds_used:
-            available_fillers.append({"index": i, "seed": seed})
+def get_available_runs(content: CampaignContent, state: CampaignState, graph: Optional[RunGraph] = None) -> dict:
+    """Get currently available anchor runs and filler seeds.
 
+    Pass the campaign's cached graph (run_graph.get_run_graph) to skip compiling triggers.
+    """
+    graph = graph or RunGraph(content)
+    available_anchors = [graph.runs[run_id] for run_id in graph.available_anchors(state)]
+    available_fillers = [{"index": i, "seed": content.filler_seeds[i]} for i in graph.available_fillers(state)]
     return {"anchors": available_anchors, "fillers": available_fillers}
 
-def select_next_run(content: CampaignContent, state: CampaignState) -> dict:
+def select_next_run(content: CampaignContent, state: CampaignState, graph: Optional[RunGraph] = None,
+                    index: Optional[ContentIndex] = None) -> dict:
     """Select the next recommended run"""
-    available = get_available_runs(content, state)
+    index = index or ContentIndex(content)
+    available = get_available_runs(content, state, graph)
 
     if available["anchors"]:
-        run = available["anchors"][0]
-        return {
-            "type": "anchor",
-            "id": run.id,
-            "hook": run.hook,
-            "goal": run.goal,
-            "tone": run.tone or content.tone,
-            "must_include": run.must_include,
-            "reveal": run.reveal
-        }
+        return index.details(available["anchors"][0].id)
 
     if available["fillers"]:
         filler = random.choice(available["fillers"])
-        return {
-            "type": "filler",
-            "index": filler["index"],
-            "hook": filler["seed"],
-            "goal": "Complete the task",
-            "tone": content.tone,
-            "must_include": [],
-            "reveal": None
-        }
+        return index.details(filler_run_id(filler["index"]))
 
     return {"type": "none", "message": "No runs available. Campaign may be complete."}
 
-def build_dm_context(content: CampaignContent, state: CampaignState, run_details: dict) -> dict:
-    """Build full context for the DM"""
-    party_knows = list(state.facts_known)
-    party_does_not_know = []
+def current_run_details(content: CampaignContent, state: CampaignState, index: Optional[ContentIndex] = None):
+    """Build run details for the state's active run, or None if there isn't a valid one.
 
-    for npc in content.npcs:
-        npc_key = npc.name.lower().replace(" ", "_")
-        if npc.secret not in party_knows:
-            party_does_not_know.append(f"{npc.name}'s secret: {npc.secret}")
+    Pass the campaign's cached index (content_index.get_content_index) to skip compiling one.
+    """
+    if not state.current_run_id:
+        return None
+    index = index or ContentIndex(content)
+    return index.details(state.current_run_id, state.current_run_type or "filler")
 
-    for run in content.anchor_runs:
-        if run.id not in state.anchor_runs_completed and run.reveal:
-            if run.reveal not in party_knows:
-                party_does_not_know.append(f"Run reveal ({run.id}): {run.reveal}")
+def build_dm_context(content: CampaignContent, state: CampaignState, run_details: dict,
+                     index: Optional[ContentIndex] = None) -> dict:
+    """Build full context for the DM"""
+    index = index or ContentIndex(content)
+    party_knows = list(state.facts_known)
+    party_does_not_know = [
+        line for fact, run_id, line in index.hidden
+        if fact not in state.facts_known and (run_id is None or run_id not in state.anchor_runs_completed)
+    ]
 
     npc_states = {}
-    for npc in content.npcs:
-        npc_key = npc.name.lower().replace(" ", "_")
-        npc_runtime = state.npcs.get(npc_key, NPCState())
+    for key, npc in index.npcs.items():
+        npc_runtime = state.npcs.get(key, NPCState())
         npc_states[npc.name] = {
             "species": npc.species,
             "role": npc.role,
@@ -124,12 +105,7 @@ def build_dm_context(content: CampaignContent, state: CampaignState, run_details
 
     return {
         "run": run_details,
-        "campaign_context": {
-            "name": content.name,
-            "premise": content.premise,
-            "tone": content.tone,
-            "locations": [{"name": loc.name, "vibe": loc.vibe, "contains": loc.contains} for loc in content.locations]
-        },
+        "campaign_context": {**index.campaign_context},
         "party_knows": party_knows,
         "party_does_not_know": party_does_not_know,
         "npc_states": npc_states,
@@ -137,7 +113,7 @@ def build_dm_context(content: CampaignContent, state: CampaignState, run_details
         "threat_name": content.threat.name,
         "threat_description": threat_desc,
         "runs_completed": state.runs_completed,
-        "locations_visited": state.locations_visited
+        "locations_visited": list(state.locations_visited)
     }
 
 
@@ -148,9 +124,15 @@ def load_dm_prep_data(campaign_id: str) -> DMPrepData:
     data = load_campaign_json(campaign_id, "dm_prep.json")
     if not data:
         return DMPrepData()
+
+    # Conversation history now lives in its own log; move any inline copy out
+    if data.get("conversation"):
+        migrate_inline_conversation(campaign_id)
+        data = load_campaign_json(campaign_id, "dm_prep.json")
+
     return DMPrepData(**data)
 
 
 def save_dm_prep_data(campaign_id: str, prep_data: DMPrepData):
     """Save DM prep data for a campaign"""
-    save_campaign_json(campaign_id, "dm_prep.json", prep_data.dict())
+    save_campaign_json(campaign_id, "dm_prep.json", prep_data.model_dump())
@@ -3,12 +3,22 @@ Campaign Schema and Validation
 Defines the structure for authored campaign content
 """
 
-from pydantic import BaseModel, Field, validator
+from pydantic import (
+    BaseModel,
+    Field,
+    TypeAdapter,
+    ValidationError,
+    ValidationInfo,
+    field_validator,
+    model_validator,
+)
 from typing import Optional, Literal
 from enum import Enum
 import yaml
 import json
 
+from ordered_set import OrderedSet
+
 
 class Species(str, Enum):
     MOUSEFOLK = "Mousefolk"
@@ -58,22 +68,23 @@ class SpeciesDefinition(BaseModel):
 
 class StatConfig(BaseModel):
     """Configuration for the stat system"""
-    names: list[str] = Field(..., min_items=2, max_items=6, description="Stat names (e.g., Brave, Clever, Kind)")
+    names: list[str] = Field(..., min_length=2, max_length=6, description="Stat names (e.g., Brave, Clever, Kind)")
     colors: list[str] = Field(default_factory=list, description="Hex colors for UI display")
     starting_pool: int = Field(5, ge=3, le=20, description="Total stat points to distribute at creation")
     min_per_stat: int = Field(1, ge=0, le=5, description="Minimum value for each stat")
     max_per_stat: int = Field(3, ge=1, le=10, description="Maximum value for each stat at creation")
 
-    @validator('colors', always=True)
-    def fill_colors(cls, v, values):
+    @model_validator(mode='after')
+    def fill_colors(self):
         """Ensure colors array matches names length"""
-        names = values.get('names', [])
-        if len(v) < len(names):
+        colors = list(self.colors)
+        if len(colors) < len(self.names):
             # Fill with default colors
             default_colors = ["#c75050", "#5090c7", "#50c770", "#c7a050", "#a050c7", "#50c7a0"]
-            while len(v) < len(names):
-                v.append(default_colors[len(v) % len(default_colors)])
-        return v[:len(names)]
+            while len(colors) < len(self.names):
+                colors.append(default_colors[len(colors) % len(default_colors)])
+        self.colors = colors[:len(self.names)]
+        return self
 
 
 class ResourceConfig(BaseModel):
@@ -108,11 +119,12 @@ class LevelReward(BaseModel):
 class LevelingConfig(BaseModel):
     """Configuration for the leveling system"""
     max_level: int = Field(5, ge=2, le=20)
-    thresholds: list[int] = Field(..., min_items=1, description="XP needed for each level (starting at level 2)")
+    thresholds: list[int] = Field(..., min_length=1, description="XP needed for each level (starting at level 2)")
     rewards: dict[str, LevelReward] = Field(default_factory=dict, description="Rewards keyed by level number")
 
-    @validator('thresholds')
-    def validate_thresholds(cls, v, values):
+    @field_validator('thresholds')
+    @classmethod
+    def validate_thresholds(cls, v):
         """Ensure thresholds are ascending"""
         for i in range(1, len(v)):
             if v[i] <= v[i-1]:
@@ -153,7 +165,7 @@ class CampaignSystem(BaseModel):
     player_context: str = Field("players", max_length=200, description="Who the players are (for DM prompt)")
 
     # Character creation
-    species: list[SpeciesDefinition] = Field(..., min_items=2, max_items=20)
+    species: list[SpeciesDefinition] = Field(..., min_length=2, max_length=20)
     stats: StatConfig
 
     # Resources
@@ -373,7 +385,7 @@ class Location(BaseModel):
     """A key location in the campaign"""
     name: str = Field(..., min_length=1, max_length=50)
     vibe: str = Field(..., min_length=1, max_length=200, description="One sentence atmosphere")
-    contains: list[str] = Field(..., min_items=1, description="Tags for what can be found here")
+    contains: list[str] = Field(..., min_length=1, description="Tags for what can be found here")
 
 
 class RunTrigger(BaseModel):
@@ -381,9 +393,10 @@ class RunTrigger(BaseModel):
     type: RunTriggerType
     value: Optional[str] = None  # run_id for AFTER_RUN, number as string for counts
     
-    @validator('value')
-    def validate_value(cls, v, values):
-        trigger_type = values.get('type')
+    @field_validator('value')
+    @classmethod
+    def validate_value(cls, v, info: ValidationInfo):
+        trigger_type = info.data.get('type')
         if trigger_type == RunTriggerType.START:
             return None
         if trigger_type in [RunTriggerType.AFTER_RUN] and not v:
@@ -400,7 +413,7 @@ class AnchorRun(BaseModel):
     hook: str = Field(..., min_length=10, max_length=300, description="The quest prompt shown to players")
     goal: str = Field(..., min_length=10, max_length=200, description="What success looks like")
     tone: Optional[str] = Field(None, max_length=100, description="Optional tone override")
-    must_include: list[str] = Field(default_factory=list, max_items=5, description="Things AI must weave in")
+    must_include: list[str] = Field(default_factory=list, max_length=5, description="Things AI must weave in")
     reveal: str = Field(..., min_length=5, max_length=300, description="What party learns on success")
     trigger: RunTrigger
 
@@ -408,10 +421,11 @@ class AnchorRun(BaseModel):
 class Threat(BaseModel):
     """The campaign's escalating threat"""
     name: str = Field(..., min_length=1, max_length=50)
-    stages: list[str] = Field(..., min_items=3, max_items=6, description="Escalating threat states")
+    stages: list[str] = Field(..., min_length=3, max_length=6, description="Escalating threat states")
     advance_on: ThreatAdvanceTrigger
     
-    @validator('stages')
+    @field_validator('stages')
+    @classmethod
     def validate_stages(cls, v):
         for stage in v:
             if len(stage) < 5 or len(stage) > 150:
@@ -426,20 +440,22 @@ class CampaignContent(BaseModel):
     tone: str = Field(..., min_length=3, max_length=100, description="Short phrase or comma-separated tags")
     
     threat: Threat
-    npcs: list[NPC] = Field(..., min_items=2, max_items=10)
-    locations: list[Location] = Field(..., min_items=2, max_items=10)
-    anchor_runs: list[AnchorRun] = Field(..., min_items=3, max_items=10)
-    filler_seeds: list[str] = Field(..., min_items=5, max_items=15)
+    npcs: list[NPC] = Field(..., min_length=2, max_length=10)
+    locations: list[Location] = Field(..., min_length=2, max_length=10)
+    anchor_runs: list[AnchorRun] = Field(..., min_length=3, max_length=10)
+    filler_seeds: list[str] = Field(..., min_length=5, max_length=15)
     
-    @validator('filler_seeds')
+    @field_validator('filler_seeds')
+    @classmethod
     def validate_filler_seeds(cls, v):
         for seed in v:
             if len(seed) < 10 or len(seed) > 150:
                 raise ValueError("Each filler seed must be 10-150 characters")
         return v
     
-    @validator('anchor_runs')
-    def validate_anchor_run_references(cls, v, values):
+    @field_validator('anchor_runs')
+    @classmethod
+    def validate_anchor_run_references(cls, v):
         """Ensure AFTER_RUN triggers reference valid run IDs"""
         run_ids = {run.id for run in v}
         for run in v:
@@ -480,7 +496,10 @@ class DMPrepNote(BaseModel):
 class DMPrepData(BaseModel):
     """Complete DM prep data for a campaign"""
     author_notes: list[DMPrepNote] = Field(default_factory=list, description="Manually added notes")
-    conversation: list[dict] = Field(default_factory=list, description="Chat history with prep coach")
+    conversation: list[dict] = Field(
+        default_factory=list,
+        description="Legacy inline chat history; migrated to the prep conversation log on load"
+    )
     pinned: list[DMPrepNote] = Field(default_factory=list, description="Insights pinned from conversation")
     last_accessed: Optional[str] = Field(None, description="ISO datetime of last access")
 
@@ -489,13 +508,14 @@ class CampaignState(BaseModel):
     """Runtime state tracking for a campaign"""
     threat_stage: int = 0
     runs_completed: int = 0
-    anchor_runs_completed: list[str] = Field(default_factory=list)
-    filler_seeds_used: list[int] = Field(default_factory=list)  # indices into filler_seeds
+    # Ordered sets: O(1) membership, first-seen order kept, stored as JSON lists
+    anchor_runs_completed: OrderedSet[str] = Field(default_factory=OrderedSet)
+    filler_seeds_used: OrderedSet[int] = Field(default_factory=OrderedSet)  # indices into filler_seeds
     current_run_id: Optional[str] = None
     current_run_type: Optional[Literal["anchor", "filler"]] = None
-    facts_known: list[str] = Field(default_factory=list)
+    facts_known: OrderedSet[str] = Field(default_factory=OrderedSet)
     npcs: dict[str, NPCState] = Field(default_factory=dict)
-    locations_visited: list[str] = Field(default_factory=list)
+    locations_visited: OrderedSet[str] = Field(default_factory=OrderedSet)
     flags: dict[str, bool] = Field(default_factory=dict)
     
     def initialize_from_content(self, content: CampaignContent):
@@ -514,78 +534,104 @@ class ValidationResult(BaseModel):
     warnings: list[str] = Field(default_factory=list)
 
 
-def validate_campaign_content(data: dict) -> ValidationResult:
-    """Validate campaign content and return detailed results"""
+def content_issues(content: CampaignContent) -> tuple[list[str], list[str]]:
+    """Semantic (errors, warnings) for content that has passed schema validation"""
     errors = []
     warnings = []
-    
+
+    if not content.has_start_run():
+        errors.append("At least one anchor run must be available from start")
+
+    # Warn if filler seeds are sparse
+    if len(content.filler_seeds) < len(content.anchor_runs):
+        warnings.append("Consider adding more filler seeds for variety between anchor runs")
+
+    return errors, warnings
+
+
+def parse_campaign_content(data: dict) -> tuple[Optional[CampaignContent], ValidationResult]:
+    """Validate campaign content in one pass: (content or None if it doesn't parse, detailed results)"""
     try:
         content = CampaignContent(**data)
-        
-        # Additional semantic checks
-        if not content.has_start_run():
-            errors.append("At least one anchor run must be available from start")
-        
-        # Check for NPC/location references in runs (warnings, not errors)
-        npc_names = {npc.name.lower() for npc in content.npcs}
-        location_names = {loc.name.lower() for loc in content.locations}
-        
-        for run in content.anchor_runs:
-            # Check if must_include mentions NPCs or locations
-            for item in run.must_include:
-                item_lower = item.lower()
-                has_npc_ref = any(name in item_lower for name in npc_names)
-                has_loc_ref = any(name in item_lower for name in location_names)
-                if not has_npc_ref and not has_loc_ref:
-                    # This is fine, just a note
-                    pass
-        
-        # Warn if filler seeds are sparse
-        if len(content.filler_seeds) < len(content.anchor_runs):
-            warnings.append("Consider adding more filler seeds for variety between anchor runs")
-        
-        return ValidationResult(valid=len(errors) == 0, errors=errors, warnings=warnings)
-        
     except Exception as e:
         error_str = str(e)
         # Parse pydantic errors into readable messages
         if "validation error" in error_str.lower():
-            errors.append(error_str)
+            return None, ValidationResult(valid=False, errors=[error_str])
+        return None, ValidationResult(valid=False, errors=[f"Validation failed: {error_str}"])
+
+    errors, warnings = content_issues(content)
+    return content, ValidationResult(valid=len(errors) == 0, errors=errors, warnings=warnings)
+
+
+def validate_campaign_content(data: dict) -> ValidationResult:
+    """Validate campaign content and return detailed results"""
+    return parse_campaign_content(data)[1]
+
+
+def validation_messages(error: ValidationError) -> list[str]:
+    """One 'location: message' line per pydantic error"""
+    return [f"{'.'.join(str(part) for part in e['loc'])}: {e['msg']}" for e in error.errors()]
+
+
+def validate_sections(model: BaseModel, data: dict, sections) -> tuple[BaseModel, dict[str, list[str]]]:
+    """Revalidate only the named top-level sections of an already valid model.
+
+    Returns (a copy of model with those sections taken from data, errors by section).
+    Sections not named keep their validated values, and ones the model doesn't
+    define are ignored, as full validation would ignore them.
+    """
+    model_cls = type(model)
+    updated = model.model_copy()
+    errors = {}
+    for section in sections:
+        field = model_cls.model_fields.get(section)
+        if field is None:
+            continue
+        if section in data:
+            value = data[section]
+        elif not field.is_required():
+            value = field.get_default(call_default_factory=True)
         else:
-            errors.append(f"Validation failed: {error_str}")
-        
-        return ValidationResult(valid=False, errors=errors)
+            errors[section] = [f"{section}: Field required"]
+            continue
+        try:
+            model_cls.__pydantic_validator__.validate_assignment(updated, section, value)
+        except ValidationError as e:
+            errors[section] = validation_messages(e)
+    return updated, errors
 
 
 # === Serialization ===
 
 def content_to_yaml(content: CampaignContent) -> str:
     """Serialize campaign content to YAML"""
-    data = content.dict()
-    # Convert enums to strings
-    data['threat']['advance_on'] = content.threat.advance_on.value
-    for run in data['anchor_runs']:
-        run['trigger'] = {
-            'type': run['trigger']['type'],
-            'value': run['trigger']['value']
-        }
+    # JSON mode turns enums into their string values
+    data = content.model_dump(mode='json')
     return yaml.dump(data, default_flow_style=False, allow_unicode=True, sort_keys=False)
 
 
 def content_from_yaml(yaml_str: str) -> CampaignContent:
     """Deserialize campaign content from YAML"""
     data = yaml.safe_load(yaml_str)
-    return CampaignContent(**data)
+    return CampaignContent.model_validate(data)
 
 
 def content_to_json(content: CampaignContent) -> str:
     """Serialize campaign content to JSON"""
-    return content.json(indent=2)
+    return content.model_dump_json(indent=2)
 
 
 def content_from_json(json_str: str) -> CampaignContent:
     """Deserialize campaign content from JSON"""
-    return CampaignContent.parse_raw(json_str)
+    return CampaignContent.model_validate_json(json_str)
+
+
+# === Cached Adapters ===
+# Building a TypeAdapter compiles a validator/serializer, so hot non-model
+# types get one adapter at import rather than one per call
+
+DM_PREP_NOTES = TypeAdapter(list[DMPrepNote])
 
 
 # === Example Content ===
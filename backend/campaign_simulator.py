@@ -0,0 +1,256 @@
+"""
+Campaign playthrough simulator
+Monte Carlo playthroughs of a CampaignContent, vectorized with NumPy over
+batches of simulated states: run selection as select_next_run does it,
+complete_run outcomes and threat advancement, and trigger unlocks from the
+compiled run graph. Reports how long campaigns take, how often the threat
+maxes out, and which anchor runs are never reached.
+
+Usage: python campaign_simulator.py <campaign_id | campaign.json | campaign.yaml> [options]
+"""
+
+import argparse
+import json
+import os
+from typing import Optional
+
+import numpy as np
+
+from campaign_schema import CampaignContent, CampaignState, RunTriggerType, ThreatAdvanceTrigger
+from run_graph import RunGraph
+
+# Playthroughs simulated together in one set of arrays
+BATCH_SIZE = 10000
+
+DEFAULT_PLAYTHROUGHS = 10000
+DEFAULT_MAX_RUNS = 100
+
+END_REASONS = ("all_anchors", "threat_maxed", "stuck", "max_runs")
+
+_KIND_CODES = {
+    RunTriggerType.START: 0,
+    RunTriggerType.AFTER_RUN: 1,
+    RunTriggerType.AFTER_RUNS_COUNT: 2,
+    RunTriggerType.THREAT_STAGE: 3,
+}
+
+
+class _Compiled:
+    """Trigger columns of the run graph as arrays, one entry per anchor in authored order"""
+
+    def __init__(self, content: CampaignContent, graph: RunGraph):
+        self.ids = [run.id for run in content.anchor_runs]
+        kinds = np.array([_KIND_CODES[graph.requires[i][0]] for i in self.ids])
+        self.start = kinds == 0
+        self.after = kinds == 1
+        self.count = kinds == 2
+        self.threat = kinds == 3
+        index = {run_id: i for i, run_id in enumerate(self.ids)}
+        # Prerequisite column for after-run triggers (0 elsewhere, masked out by self.after)
+        self.dependency = np.array([
+            index.get(graph.requires[i][1], 0) if graph.requires[i][0] == RunTriggerType.AFTER_RUN else 0
+            for i in self.ids
+        ])
+        self.threshold = np.array([
+            graph.requires[i][1] if graph.requires[i][0] in (RunTriggerType.AFTER_RUNS_COUNT,
+                                                             RunTriggerType.THREAT_STAGE) else 0
+            for i in self.ids
+        ])
+        self.fillers = len(content.filler_seeds)
+        self.max_stage = len(content.threat.stages) - 1
+        self.advance_on = content.threat.advance_on
+
+
+def _simulate_batch(compiled: _Compiled, size: int, start: CampaignState, victory: float, failed: float,
+                    max_runs: int, rng: np.random.Generator) -> dict:
+    anchors = len(compiled.ids)
+    start_completed = np.array([run_id in start.anchor_runs_completed for run_id in compiled.ids])
+    completed = np.tile(start_completed, (size, 1))
+    completed_at = np.where(completed, 0, -1)
+    runs = np.full(size, start.runs_completed)
+    threat = np.full(size, start.threat_stage)
+    fillers_used = np.full(size, len(set(start.filler_seeds_used)))
+    active = np.ones(size, dtype=bool)
+    end_reason = np.full(size, END_REASONS.index("max_runs"))
+    end_runs = np.full(size, -1)
+    rows = np.arange(size)
+
+    for _ in range(max_runs):
+        if not active.any():
+            break
+
+        # Available anchors: triggers met and not yet completed
+        unlocked = (
+            compiled.start
+            | (compiled.after & completed[:, compiled.dependency])
+            | (compiled.count & (runs[:, None] >= compiled.threshold))
+            | (compiled.threat & (threat[:, None] >= compiled.threshold))
+        )
+        available = unlocked & ~completed
+        has_anchor = available.any(axis=1)
+        choice = available.argmax(axis=1)  # first in authored order, as select_next_run
+        has_filler = fillers_used < compiled.fillers
+
+        stuck = active & ~has_anchor & ~has_filler
+        end_reason[stuck] = END_REASONS.index("stuck")
+        end_runs[stuck] = runs[stuck]
+        active &= ~stuck
+        playing = active
+        if not playing.any():
+            break
+
+        roll = rng.random(size)
+        won = playing & (roll < victory)
+        lost = playing & (roll >= victory) & (roll < victory + failed)
+
+        runs += playing
+        anchor_won = won & has_anchor
+        completed[rows[anchor_won], choice[anchor_won]] = True
+        completed_at[rows[anchor_won], choice[anchor_won]] = runs[anchor_won]
+        fillers_used += won & ~has_anchor
+
+        if compiled.advance_on == ThreatAdvanceTrigger.RUN_FAILED:
+            threat += lost
+        elif compiled.advance_on == ThreatAdvanceTrigger.EVERY_2_RUNS:
+            threat += playing & (runs % 2 == 0)
+        elif compiled.advance_on == ThreatAdvanceTrigger.EVERY_3_RUNS:
+            threat += playing & (runs % 3 == 0)
+        np.minimum(threat, compiled.max_stage, out=threat)
+
+        all_done = playing & completed.all(axis=1) if anchors else playing
+        maxed = playing & ~all_done & (threat >= compiled.max_stage)
+        end_reason[all_done] = END_REASONS.index("all_anchors")
+        end_reason[maxed] = END_REASONS.index("threat_maxed")
+        finished = all_done | maxed
+        end_runs[finished] = runs[finished]
+        active &= ~finished
+
+    end_runs[active] = runs[active]
+    return {"end_reason": end_reason, "end_runs": end_runs, "threat": threat, "completed_at": completed_at}
+
+
+def simulate(content: CampaignContent, playthroughs: int = DEFAULT_PLAYTHROUGHS, victory: float = 0.7,
+             failed: float = 0.2, max_runs: int = DEFAULT_MAX_RUNS, seed: Optional[int] = None,
+             state: Optional[CampaignState] = None) -> dict:
+    """Simulate playthroughs from a state (a fresh campaign by default) and summarize them.
+
+    Each run is won with probability `victory`, failed with `failed`, and
+    retreated from otherwise.
+    """
+    if victory < 0 or failed < 0 or victory + failed > 1:
+        raise ValueError("victory and failed must be probabilities summing to at most 1")
+    graph = RunGraph(content)
+    compiled = _Compiled(content, graph)
+    start = state or CampaignState()
+    rng = np.random.default_rng(seed)
+
+    batches = []
+    remaining = playthroughs
+    while remaining > 0:
+        size = min(BATCH_SIZE, remaining)
+        batches.append(_simulate_batch(compiled, size, start, victory, failed, max_runs, rng))
+        remaining -= size
+    end_reason = np.concatenate([b["end_reason"] for b in batches])
+    end_runs = np.concatenate([b["end_runs"] for b in batches])
+    threat = np.concatenate([b["threat"] for b in batches])
+    completed_at = np.concatenate([b["completed_at"] for b in batches])
+
+    finished = end_reason <= END_REASONS.index("threat_maxed")
+    finished_runs = end_runs[finished]
+    runs_summary = None
+    if finished_runs.size:
+        runs_summary = {
+            "mean": round(float(finished_runs.mean()), 2),
+            "median": float(np.median(finished_runs)),
+            "p10": float(np.percentile(finished_runs, 10)),
+            "p90": float(np.percentile(finished_runs, 90)),
+            "min": int(finished_runs.min()),
+            "max": int(finished_runs.max()),
+        }
+
+    anchor_runs = []
+    for i, run_id in enumerate(compiled.ids):
+        done = completed_at[:, i] >= 0
+        anchor_runs.append({
+            "id": run_id,
+            "completion_rate": round(float(done.mean()), 4),
+            "mean_completed_at_run": round(float(completed_at[done, i].mean()), 2) if done.any() else None,
+        })
+
+    unreachable = [{"id": run_id, "reason": "trigger_cycle"} for run_id in compiled.ids if run_id in graph.unreachable]
+    unreachable += [{"id": run["id"], "reason": "never_completed"} for run in anchor_runs
+                    if run["completion_rate"] == 0 and run["id"] not in graph.unreachable]
+
+    stages = np.bincount(threat, minlength=compiled.max_stage + 1)
+    return {
+        "playthroughs": playthroughs,
+        "settings": {"victory": victory, "failed": failed, "retreat": round(1 - victory - failed, 4),
+                     "max_runs": max_runs, "seed": seed, "advance_on": compiled.advance_on.value},
+        "completion_rate": round(float(finished.mean()), 4),
+        "end_reasons": {reason: round(float((end_reason == i).mean()), 4) for i, reason in enumerate(END_REASONS)},
+        "runs_to_completion": runs_summary,
+        "threat_stage_distribution": [round(float(n) / playthroughs, 4) for n in stages],
+        "threat_maxed_rate": round(float((threat >= compiled.max_stage).mean()), 4),
+        "anchor_runs": anchor_runs,
+        "unreachable_runs": unreachable,
+    }
+
+
+# === CLI ===
+
+def _load_content(source: str) -> CampaignContent:
+    """Campaign content from a campaign.json / .yaml path, or a campaign id in the data directory"""
+    if os.path.isfile(source):
+        with open(source, "r") as f:
+            text = f.read()
+        if source.endswith((".yaml", ".yml")):
+            from campaign_schema import content_from_yaml
+            return content_from_yaml(text)
+        return CampaignContent(**json.loads(text))
+
+    from campaign_logic import load_campaign_content
+    content = load_campaign_content(source)
+    if content is None:
+        raise SystemExit(f"No campaign content found for '{source}'")
+    return content
+
+
+def _print_report(report: dict):
+    runs = report["runs_to_completion"]
+    print(f"Playthroughs: {report['playthroughs']}  (advance_on: {report['settings']['advance_on']})")
+    print(f"Completed: {report['completion_rate']:.1%}  " +
+          "  ".join(f"{reason}: {rate:.1%}" for reason, rate in report["end_reasons"].items()))
+    if runs:
+        print(f"Runs to completion: mean {runs['mean']}, median {runs['median']}, "
+              f"p10 {runs['p10']}, p90 {runs['p90']}")
+    print("Final threat stage: " +
+          "  ".join(f"{stage}: {share:.1%}" for stage, share in enumerate(report["threat_stage_distribution"])))
+    print("Anchor runs:")
+    for run in report["anchor_runs"]:
+        at = f", around run {run['mean_completed_at_run']}" if run["mean_completed_at_run"] is not None else ""
+        print(f"  {run['id']}: completed in {run['completion_rate']:.1%}{at}")
+    for run in report["unreachable_runs"]:
+        print(f"  UNREACHABLE {run['id']} ({run['reason']})")
+
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Simulate playthroughs of a campaign")
+    parser.add_argument("campaign", help="campaign id, or path to a campaign .json/.yaml file")
+    parser.add_argument("-n", "--playthroughs", type=int, default=DEFAULT_PLAYTHROUGHS)
+    parser.add_argument("--victory", type=float, default=0.7, help="probability a run is won")
+    parser.add_argument("--failed", type=float, default=0.2, help="probability a run is failed")
+    parser.add_argument("--max-runs", type=int, default=DEFAULT_MAX_RUNS)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--json", action="store_true", help="print the full report as JSON")
+    args = parser.parse_args(argv)
+
+    report = simulate(_load_content(args.campaign), args.playthroughs, args.victory, args.failed,
+                      args.max_runs, args.seed)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        _print_report(report)
+
+
+if __name__ == "__main__":
+    main()
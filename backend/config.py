@@ -9,5 +9,21 @@ PROMPTS_DIR = os.path.join(os.path.dirname(__file__), "prompts")
 IMAGES_DIR = os.path.join(DATA_DIR, "images")
 TEMPLATES_DIR = os.path.join(DATA_DIR, "templates")
 
+# Largest remote image accepted by a download, in bytes
+MAX_IMAGE_DOWNLOAD_BYTES = int(os.environ.get("WEAVE_MAX_IMAGE_DOWNLOAD_BYTES", 20 * 1024 * 1024))
+
+# Largest banner upload accepted, in bytes
+MAX_BANNER_UPLOAD_BYTES = int(os.environ.get("WEAVE_MAX_BANNER_UPLOAD_BYTES", 15 * 1024 * 1024))
+
+# Largest campaign archive accepted by an import, in bytes
+MAX_ARCHIVE_IMPORT_BYTES = int(os.environ.get("WEAVE_MAX_ARCHIVE_IMPORT_BYTES", 4 * 1024 * 1024 * 1024))
+
+# Default per-campaign limits on retained generated images (campaigns may override)
+IMAGE_QUOTA_BYTES = int(os.environ.get("WEAVE_IMAGE_QUOTA_BYTES", 500 * 1024 * 1024))
+IMAGE_QUOTA_COUNT = int(os.environ.get("WEAVE_IMAGE_QUOTA_COUNT", 1000))
+
+# Index of this process in multi-worker mode (set by the dispatcher); worker 0 runs shared jobs
+WORKER_INDEX = int(os.environ.get("WEAVE_WORKER_INDEX", 0))
+
 # Ensure images directory exists
 os.makedirs(IMAGES_DIR, exist_ok=True)
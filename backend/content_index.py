@@ -0,0 +1,144 @@
+"""
+Content index
+Campaign content validated and compiled once per content hash: runs by id,
+NPCs by key, locations by name, secret and reveal sets, and pre-built run
+details, so run routes answer lookups from dicts instead of re-validating
+campaign.json and scanning lists on every request
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from campaign_schema import AnchorRun, CampaignContent, Location, NPC
+from helpers import get_campaign_dir, get_campaign_file_version
+
+CONTENT_FILENAME = "campaign.json"
+
+# Compiled indexes kept, by content hash
+MAX_CACHED_INDEXES = 64
+
+
+def npc_key(name: str) -> str:
+    """Key an NPC is tracked under in CampaignState.npcs"""
+    return name.lower().replace(" ", "_")
+
+
+def filler_run_id(index: int) -> str:
+    return f"filler_{index}"
+
+
+def filler_index(run_id: str) -> Optional[int]:
+    """Filler seed index from a filler run id, or None if it isn't one"""
+    prefix, _, number = run_id.partition("_")
+    if prefix != "filler" or not number.isdigit():
+        return None
+    return int(number)
+
+
+class ContentIndex:
+    """Lookups compiled from one version of campaign content. Treat as read-only."""
+
+    def __init__(self, content: CampaignContent, content_hash: Optional[str] = None):
+        self.content = content
+        self.hash = content_hash
+        self.runs: dict[str, AnchorRun] = {run.id: run for run in content.anchor_runs}
+        self.npcs: dict[str, NPC] = {npc_key(npc.name): npc for npc in content.npcs}
+        self.locations: dict[str, Location] = {loc.name: loc for loc in content.locations}
+        self.secrets = {npc.secret for npc in content.npcs}
+        self.reveals = {run.reveal for run in content.anchor_runs if run.reveal}
+
+        # What the party doesn't know until a fact is learned: (fact, anchor whose completion
+        # also settles it or None, line for the DM)
+        self.hidden: list[tuple] = [(npc.secret, None, f"{npc.name}'s secret: {npc.secret}")
+                                    for npc in content.npcs]
+        self.hidden += [(run.reveal, run.id, f"Run reveal ({run.id}): {run.reveal}")
+                        for run in content.anchor_runs if run.reveal]
+
+        self.run_details: dict[str, dict] = {}
+        for run in content.anchor_runs:
+            self.run_details[run.id] = {
+                "type": "anchor",
+                "id": run.id,
+                "hook": run.hook,
+                "goal": run.goal,
+                "tone": run.tone or content.tone,
+                "must_include": run.must_include,
+                "reveal": run.reveal
+            }
+        for i, seed in enumerate(content.filler_seeds):
+            self.run_details[filler_run_id(i)] = {
+                "type": "filler",
+                "index": i,
+                "hook": seed,
+                "goal": "Complete the task",
+                "tone": content.tone,
+                "must_include": [],
+                "reveal": None
+            }
+
+        self.campaign_context = {
+            "name": content.name,
+            "premise": content.premise,
+            "tone": content.tone,
+            "locations": [{"name": loc.name, "vibe": loc.vibe, "contains": loc.contains} for loc in content.locations]
+        }
+
+    def details(self, run_id: Optional[str], run_type: Optional[str] = None) -> Optional[dict]:
+        """A copy of the pre-built details for a run id, or None if unknown (or of another type)"""
+        details = self.run_details.get(run_id) if run_id else None
+        if not details or (run_type and details["type"] != run_type):
+            return None
+        return {**details, "must_include": list(details["must_include"])}
+
+
+_by_hash: "OrderedDict[str, ContentIndex]" = OrderedDict()
+_by_campaign: dict[str, tuple] = {}
+_lock = threading.Lock()
+
+
+def compile_content(raw: bytes) -> Optional[ContentIndex]:
+    """Index for raw campaign.json bytes, validated only the first time its hash is seen"""
+    content_hash = hashlib.sha256(raw).hexdigest()
+    with _lock:
+        if content_hash in _by_hash:
+            _by_hash.move_to_end(content_hash)
+            return _by_hash[content_hash]
+
+    try:
+        index = ContentIndex(CampaignContent.model_validate_json(raw), content_hash)
+    except Exception:
+        return None
+    with _lock:
+        _by_hash[content_hash] = index
+        while len(_by_hash) > MAX_CACHED_INDEXES:
+            _by_hash.popitem(last=False)
+    return index
+
+
+def get_content_index(campaign_id: str) -> Optional[ContentIndex]:
+    """Compiled index of a campaign's content, or None if it has none (or it doesn't validate).
+
+    The file's version stamp is checked first, so an unchanged campaign.json
+    is neither read nor hashed.
+    """
+    version = get_campaign_file_version(campaign_id, CONTENT_FILENAME)
+    if version is None:
+        return None
+    key = get_campaign_dir(campaign_id)
+    with _lock:
+        cached = _by_campaign.get(key)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    try:
+        with open(os.path.join(key, CONTENT_FILENAME), "rb") as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return None
+    index = compile_content(raw)
+    with _lock:
+        _by_campaign[key] = (version, index)
+    return index
@@ -0,0 +1,130 @@
+"""
+Campaign document patches
+RFC 6902 JSON Patch edits to campaign.json and system.json. Only the
+sections a patch touches are revalidated (their cross-reference checks
+included), writes are atomic and guarded by an ETag version check, and a
+dry run reports errors by section without writing
+"""
+
+import copy
+import os
+import threading
+from typing import Optional
+
+from pydantic import ValidationError
+
+from campaign_schema import (
+    BLOOMBURROW_SYSTEM,
+    CampaignContent,
+    CampaignSystem,
+    content_issues,
+    validate_sections,
+    validation_messages,
+)
+from content_index import CONTENT_FILENAME, get_content_index
+from helpers import get_campaign_dir, load_campaign_json, save_campaign_json
+from http_cache import file_etag, if_match_satisfied
+from json_patch import apply_patch, touched_sections
+
+SYSTEM_FILENAME = "system.json"
+
+# Section semantic content errors are reported under
+RUNS_SECTION = "anchor_runs"
+
+
+class PreconditionFailed(Exception):
+    """If-Match doesn't name the document's current version"""
+
+    def __init__(self, etag: Optional[str]):
+        self.etag = etag
+        super().__init__("Document has changed since it was read")
+
+
+_locks: dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def _document_lock(campaign_id: str, filename: str) -> threading.Lock:
+    key = os.path.join(get_campaign_dir(campaign_id), filename)
+    with _locks_guard:
+        if key not in _locks:
+            _locks[key] = threading.Lock()
+        return _locks[key]
+
+
+def document_etag(campaign_id: str, filename: str) -> Optional[str]:
+    """ETag of a campaign document's current version, or None if it doesn't exist"""
+    try:
+        return file_etag(os.path.join(get_campaign_dir(campaign_id), filename))
+    except FileNotFoundError:
+        return None
+
+
+def _current(campaign_id: str, filename: str) -> tuple[Optional[dict], object]:
+    """(raw document, validated model or None) as currently stored"""
+    if filename == CONTENT_FILENAME:
+        raw = load_campaign_json(campaign_id, CONTENT_FILENAME) or None
+        index = get_content_index(campaign_id)
+        return raw, index.content if index else None
+
+    # Campaigns without their own system use the default, as GET /system does
+    raw = load_campaign_json(campaign_id, SYSTEM_FILENAME) or copy.deepcopy(BLOOMBURROW_SYSTEM)
+    try:
+        return raw, CampaignSystem(**raw)
+    except ValidationError:
+        return raw, None
+
+
+def _validate_all(model_cls, data) -> tuple[object, dict[str, list[str]]]:
+    try:
+        return model_cls.model_validate(data), {}
+    except ValidationError as e:
+        errors: dict[str, list[str]] = {}
+        for error, message in zip(e.errors(), validation_messages(e)):
+            errors.setdefault(str(error["loc"][0]) if error["loc"] else "", []).append(message)
+        return None, errors
+
+
+def patch_document(campaign_id: str, filename: str, patch: list,
+                   if_match: Optional[str] = None, dry_run: bool = False) -> Optional[dict]:
+    """Apply a JSON Patch to campaign.json or system.json.
+
+    Returns None if the document doesn't exist, else a result with valid,
+    errors (by section), warnings, sections touched and the resulting etag;
+    a successful write also carries the validated model as "document".
+    Raises JsonPatchError if the patch can't be applied and
+    PreconditionFailed if if_match is stale.
+    """
+    model_cls = CampaignContent if filename == CONTENT_FILENAME else CampaignSystem
+    with _document_lock(campaign_id, filename):
+        etag = document_etag(campaign_id, filename)
+        if if_match is not None and not if_match_satisfied(if_match, etag):
+            raise PreconditionFailed(etag)
+
+        raw, model = _current(campaign_id, filename)
+        if raw is None:
+            return None
+
+        patched = apply_patch(raw, patch)
+        sections = touched_sections(patch)
+        if model is None or "" in sections or not isinstance(patched, dict):
+            model, errors = _validate_all(model_cls, patched)
+        else:
+            model, errors = validate_sections(model, patched, sections)
+
+        warnings: list[str] = []
+        if model_cls is CampaignContent and not errors:
+            semantic_errors, warnings = content_issues(model)
+            if semantic_errors:
+                errors[RUNS_SECTION] = semantic_errors
+
+        result = {"valid": not errors, "errors": errors, "warnings": warnings,
+                  "sections": sorted(sections), "etag": etag}
+        if errors or dry_run:
+            return result
+
+        # Stored the way the PUT routes store them: content normalized, system as sent
+        save_campaign_json(campaign_id, filename, model.model_dump() if model_cls is CampaignContent else patched)
+        result["etag"] = document_etag(campaign_id, filename)
+        result["document"] = model
+        return result
@@ -0,0 +1,379 @@
+"""
+Multi-worker dispatcher
+Runs several app worker processes behind one ASGI front end and sends each
+request to the worker that owns its campaign, chosen by consistent hashing
+of the campaign id. Every campaign has a single writer, so per-process locks
+and in-memory caches stay authoritative; files every worker shares
+(campaigns.json, the image store index) are guarded by interprocess locks.
+
+When workers are added or removed only the campaigns whose owner changed
+move, and each one moves safely: its next request waits until requests
+still running on the old owner finish and the old owner has released it.
+
+Usage: python dispatcher.py [--workers N] [--host HOST] [--port PORT]
+SIGTTIN adds a worker, SIGTTOU removes one.
+"""
+
+import argparse
+import asyncio
+import bisect
+import hashlib
+import itertools
+import os
+import re
+import signal
+import sys
+from typing import Optional
+from urllib.parse import parse_qs, unquote
+
+import httpx
+
+import config
+
+# Points each worker gets on the ring; more points spread campaigns more evenly
+VNODES = 64
+
+SOCKET_DIRNAME = "run"
+
+# Seconds a new worker gets to start answering
+WORKER_START_TIMEOUT = 30.0
+
+# Seconds a retired worker gets to finish its requests before it is stopped
+WORKER_DRAIN_TIMEOUT = 60.0
+
+CAMPAIGN_PATH_RE = re.compile(r"^/(?:api/)?campaigns/([^/]+)")
+INTERNAL_PATH_RE = re.compile(r"^/(?:api/)?internal(/|$)")
+
+# Headers that describe one connection, not the request, so aren't forwarded
+HOP_BY_HOP = {b"connection", b"keep-alive", b"proxy-authenticate", b"proxy-authorization", b"te",
+              b"trailer", b"transfer-encoding", b"upgrade"}
+
+
+# === Routing ===
+
+def _ring_hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hash ring: adding or removing a node only moves the keys that node gains or loses"""
+
+    def __init__(self, nodes=(), vnodes: int = VNODES):
+        self.vnodes = vnodes
+        self._points: list[int] = []
+        self._owners: dict[int, str] = {}
+        for node in nodes:
+            self.add(node)
+
+    @property
+    def nodes(self) -> set[str]:
+        return set(self._owners.values())
+
+    def add(self, node: str):
+        for i in range(self.vnodes):
+            point = _ring_hash(f"{node}#{i}")
+            if point not in self._owners:
+                bisect.insort(self._points, point)
+                self._owners[point] = node
+
+    def remove(self, node: str):
+        self._points = [p for p in self._points if self._owners[p] != node]
+        self._owners = {p: self._owners[p] for p in self._points}
+
+    def node_for(self, key: str) -> str:
+        if not self._points:
+            raise LookupError("Hash ring is empty")
+        index = bisect.bisect(self._points, _ring_hash(key)) % len(self._points)
+        return self._owners[self._points[index]]
+
+
+def campaign_key(path: str, query_string: bytes = b"") -> Optional[str]:
+    """Campaign a request belongs to, or None for requests that aren't campaign-scoped"""
+    match = CAMPAIGN_PATH_RE.match(path)
+    if not match:
+        return None
+    campaign_id = unquote(match.group(1))
+    if campaign_id == "import":
+        # Imports into an existing campaign belong to it; fresh imports to no one yet
+        into = parse_qs(query_string.decode("latin-1")).get("into")
+        return into[0] if into else None
+    return campaign_id
+
+
+class Dispatcher:
+    """ASGI app forwarding each request to a worker, campaign requests always to the campaign's owner.
+
+    Workers are httpx clients (over a unix socket in production). Requests
+    that aren't campaign-scoped go round-robin.
+    """
+
+    def __init__(self, workers: Optional[dict[str, httpx.AsyncClient]] = None):
+        self.workers: dict[str, httpx.AsyncClient] = dict(workers or {})
+        self.ring = HashRing(self.workers)
+        self.pool: Optional["WorkerPool"] = None
+        self._owners: dict[str, str] = {}
+        self._campaign_inflight: dict[str, int] = {}
+        self._worker_inflight: dict[str, int] = {}
+        self._assigning: dict[str, asyncio.Lock] = {}
+        self._changed: Optional[asyncio.Condition] = None
+        self._round_robin = itertools.count()
+
+    def add_worker(self, name: str, client: httpx.AsyncClient):
+        self.workers[name] = client
+        self.ring.add(name)
+
+    def remove_worker(self, name: str):
+        """Stop routing to a worker; requests it is serving carry on"""
+        self.ring.remove(name)
+
+    @property
+    def _condition(self) -> asyncio.Condition:
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        return self._changed
+
+    async def _wait_until(self, predicate, timeout: Optional[float] = None) -> bool:
+        async with self._condition:
+            try:
+                await asyncio.wait_for(self._condition.wait_for(predicate), timeout)
+                return True
+            except asyncio.TimeoutError:
+                return False
+
+    async def wait_idle(self, worker: str, timeout: Optional[float] = None) -> bool:
+        """Wait until a worker has no requests in flight; False on timeout"""
+        return await self._wait_until(lambda: not self._worker_inflight.get(worker), timeout)
+
+    async def _release(self, worker: str, campaign_id: str):
+        client = self.workers.get(worker)
+        if client is None:
+            # Retired and stopped: its shutdown already flushed everything
+            return
+        try:
+            await client.post(f"/internal/campaigns/{campaign_id}/release", timeout=None)
+        except httpx.HTTPError as e:
+            print(f"Releasing {campaign_id} from {worker} failed: {e}")
+
+    async def _assign(self, campaign_id: str) -> str:
+        """The campaign's owner, first moving it there if the ring has changed since it was last served"""
+        lock = self._assigning.setdefault(campaign_id, asyncio.Lock())
+        async with lock:
+            owner = self.ring.node_for(campaign_id)
+            previous = self._owners.get(campaign_id)
+            if previous is not None and previous != owner:
+                await self._wait_until(lambda: not self._campaign_inflight.get(campaign_id))
+                await self._release(previous, campaign_id)
+            self._owners[campaign_id] = owner
+            self._campaign_inflight[campaign_id] = self._campaign_inflight.get(campaign_id, 0) + 1
+        return owner
+
+    def _any_worker(self) -> str:
+        nodes = sorted(self.ring.nodes)
+        if not nodes:
+            raise LookupError("No workers")
+        return nodes[next(self._round_robin) % len(nodes)]
+
+    async def _finished(self, worker: str, campaign_id: Optional[str]):
+        async with self._condition:
+            self._worker_inflight[worker] -= 1
+            if campaign_id is not None:
+                self._campaign_inflight[campaign_id] -= 1
+            self._condition.notify_all()
+
+    # === ASGI ===
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        path = scope["path"]
+        if INTERNAL_PATH_RE.match(path):
+            await _respond(send, 404, b'{"detail":"Not Found"}')
+            return
+
+        campaign_id = campaign_key(path, scope.get("query_string", b""))
+        try:
+            worker = await self._assign(campaign_id) if campaign_id else self._any_worker()
+        except LookupError:
+            await _respond(send, 503, b'{"detail":"No workers available"}')
+            return
+        self._worker_inflight[worker] = self._worker_inflight.get(worker, 0) + 1
+        try:
+            await self._forward(self.workers[worker], scope, receive, send)
+        finally:
+            await self._finished(worker, campaign_id)
+
+    async def _forward(self, client: httpx.AsyncClient, scope, receive, send):
+        headers = [(k, v) for k, v in scope["headers"] if k.lower() not in HOP_BY_HOP]
+
+        async def body():
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+                yield message.get("body", b"")
+                if not message.get("more_body"):
+                    return
+
+        url = httpx.URL(path=scope["path"], query=scope.get("query_string", b""))
+        request = client.build_request(scope["method"], url, headers=headers, content=body())
+        try:
+            response = await client.send(request, stream=True)
+        except httpx.HTTPError:
+            await _respond(send, 502, b'{"detail":"Worker unavailable"}')
+            return
+        try:
+            await send({
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": [(k, v) for k, v in response.headers.raw if k.lower() not in HOP_BY_HOP],
+            })
+            # Streamed as the worker produces it (NDJSON, archives), never buffered whole
+            async for chunk in response.aiter_raw():
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            await response.aclose()
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    if self.pool:
+                        await self.pool.start()
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self.pool:
+                    await self.pool.stop()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+async def _respond(send, status: int, body: bytes):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+# === Worker processes ===
+
+class WorkerPool:
+    """Starts, restarts, adds and retires the worker processes behind a dispatcher"""
+
+    def __init__(self, dispatcher: Dispatcher, size: int, app: str = "main:app"):
+        self.dispatcher = dispatcher
+        self.size = size
+        self.app = app
+        self.socket_dir = os.path.join(config.DATA_DIR, SOCKET_DIRNAME)
+        self._processes: dict[str, asyncio.subprocess.Process] = {}
+        self._watchers: dict[str, asyncio.Task] = {}
+        self._scaling = asyncio.Lock()
+        dispatcher.pool = self
+
+    @staticmethod
+    def worker_name(index: int) -> str:
+        return f"worker-{index}"
+
+    def _socket_path(self, name: str) -> str:
+        return os.path.join(self.socket_dir, f"{name}.sock")
+
+    async def _spawn(self, index: int) -> asyncio.subprocess.Process:
+        name = self.worker_name(index)
+        path = self._socket_path(name)
+        if os.path.exists(path):
+            os.remove(path)
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "uvicorn", self.app, "--uds", path,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env={**os.environ, "WEAVE_WORKER_INDEX": str(index)},
+        )
+        client = self.dispatcher.workers.get(name) or httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(uds=path), base_url=f"http://{name}", timeout=None)
+        deadline = asyncio.get_running_loop().time() + WORKER_START_TIMEOUT
+        while True:
+            try:
+                if (await client.get("/", timeout=1.0)).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if process.returncode is not None or asyncio.get_running_loop().time() > deadline:
+                if process.returncode is None:
+                    process.kill()
+                raise RuntimeError(f"{name} did not start")
+            await asyncio.sleep(0.1)
+        self._processes[name] = process
+        self.dispatcher.add_worker(name, client)
+        self._watchers[name] = asyncio.create_task(self._watch(index, process))
+        return process
+
+    async def _watch(self, index: int, process: asyncio.subprocess.Process):
+        """Restart a worker that exits on its own; it keeps its name, so no campaigns move"""
+        await process.wait()
+        name = self.worker_name(index)
+        if self._processes.get(name) is process:
+            print(f"{name} exited with {process.returncode}, restarting")
+            del self._processes[name]
+            await self._spawn(index)
+
+    async def _retire(self, index: int):
+        name = self.worker_name(index)
+        self.dispatcher.remove_worker(name)
+        await self.dispatcher.wait_idle(name, WORKER_DRAIN_TIMEOUT)
+        process = self._processes.pop(name, None)
+        self._watchers.pop(name, None)
+        if process and process.returncode is None:
+            # uvicorn finishes open requests and runs shutdown (flushing access times) on SIGTERM
+            process.terminate()
+            await process.wait()
+        client = self.dispatcher.workers.pop(name, None)
+        if client:
+            await client.aclose()
+
+    async def start(self):
+        os.makedirs(self.socket_dir, exist_ok=True)
+        await asyncio.gather(*(self._spawn(i) for i in range(self.size)))
+        loop = asyncio.get_running_loop()
+        for sig, step in ((getattr(signal, "SIGTTIN", None), 1), (getattr(signal, "SIGTTOU", None), -1)):
+            if sig is not None:
+                loop.add_signal_handler(sig, lambda step=step: asyncio.ensure_future(self.scale(self.size + step)))
+
+    async def scale(self, size: int):
+        """Grow or shrink the pool; only campaigns whose owner changes move"""
+        size = max(1, size)
+        async with self._scaling:
+            while self.size < size:
+                await self._spawn(self.size)
+                self.size += 1
+            while self.size > size:
+                self.size -= 1
+                await self._retire(self.size)
+            print(f"Running {self.size} workers")
+
+    async def stop(self):
+        async with self._scaling:
+            await asyncio.gather(*(self._retire(i) for i in range(self.size)))
+
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run Weave with one worker process per core, by campaign")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args(argv)
+
+    dispatcher = Dispatcher()
+    WorkerPool(dispatcher, max(1, args.workers))
+    uvicorn.run(dispatcher, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,7 @@ DM Context Builder
 Constructs the system prompt injection from campaign content and state
 """
 
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 
 
 def build_dm_system_prompt(system_config: Dict[str, Any]) -> str:
@@ -216,6 +216,32 @@ def build_lore_section(system_config: Dict[str, Any]) -> str:
 """
 
 
+def assemble_dm_system_prompt(system_config: Dict[str, Any], campaign_context: str = "", state_context: str = "") -> str:
+    """
+    Combine the DM persona, campaign injection, rules and lore into the full system prompt.
+
+    Args:
+        system_config: The campaign's system configuration
+        campaign_context: Campaign-specific injection for the active run
+        state_context: Session state fallback for campaigns without structured content
+
+    Returns:
+        The complete DM system prompt
+    """
+    return f"""{build_dm_system_prompt(system_config)}
+
+{campaign_context}
+
+{state_context}
+
+## Rules Reference
+{build_rules_reference(system_config)}
+
+## World Lore (Brief)
+{build_lore_section(system_config)}
+"""
+
+
 def format_author_notes_for_dm(notes: list) -> str:
     """
     Format author notes for injection into the gameplay DM context.
@@ -268,10 +294,69 @@ def build_dm_system_injection(dm_context: dict, party_status: Optional[dict] = N
     Args:
         dm_context: The context dict from build_dm_context()
         party_status: Optional current party HP/Threads/gear
+        author_notes: Optional DM prep notes (author_notes + pinned)
     
     Returns:
         Markdown string to inject into DM system prompt
     """
+    before_party, after_party = build_dm_injection_sections(dm_context, author_notes)
+    return join_dm_injection(before_party, build_party_status_section(party_status), after_party)
+
+
+def join_dm_injection(before_party: List[str], party_section: Optional[str], after_party: List[str]) -> str:
+    """
+    Assemble pre-rendered injection sections around the per-turn party status.
+
+    Args:
+        before_party: Sections rendered ahead of the party status
+        party_section: The party status section, or None to omit it
+        after_party: Sections rendered after the party status
+
+    Returns:
+        Markdown string to inject into DM system prompt
+    """
+    sections = list(before_party)
+    if party_section:
+        sections.append(party_section)
+    sections.extend(after_party)
+    return "\n\n---\n\n".join(sections)
+
+
+def build_party_status_section(party_status: Optional[dict]) -> Optional[str]:
+    """
+    Build the per-turn party status section.
+
+    Args:
+        party_status: Current session dict with a 'party' list, or None
+
+    Returns:
+        The markdown section, or None if no party status was provided
+    """
+    if not party_status:
+        return None
+
+    party_section = "## Current Party Status\n"
+    for member in party_status.get('party', []):
+        party_section += f"\n**{member['name']}** ({member['species']})"
+        party_section += f"\n- Hearts: {member['currentHearts']}/{member.get('maxHearts', 5)}"
+        party_section += f"\n- Threads: {member['currentThreads']}/{member.get('maxThreads', 3)}"
+        if member.get('gear'):
+            party_section += f"\n- Gear: {', '.join(member['gear'])}"
+        party_section += "\n"
+    return party_section
+
+
+def build_dm_injection_sections(dm_context: dict, author_notes: Optional[list] = None) -> Tuple[List[str], List[str]]:
+    """
+    Render every injection section that does not change turn to turn.
+
+    Args:
+        dm_context: The context dict from build_dm_context()
+        author_notes: Optional DM prep notes (author_notes + pinned)
+
+    Returns:
+        (sections before the party status, sections after it)
+    """
     
     run = dm_context["run"]
     campaign = dm_context["campaign_context"]
@@ -352,23 +437,13 @@ def build_dm_system_injection(dm_context: dict, party_status: Optional[dict] = N
             loc_section += f"\n### {loc['name']} {visited}\n*{loc['vibe']}*\nContains: {', '.join(loc['contains'])}\n"
         sections.append(loc_section)
     
-    # Party status if provided
-    if party_status:
-        party_section = "## Current Party Status\n"
-        for member in party_status.get('party', []):
-            party_section += f"\n**{member['name']}** ({member['species']})"
-            party_section += f"\n- Hearts: {member['currentHearts']}/{member.get('maxHearts', 5)}"
-            party_section += f"\n- Threads: {member['currentThreads']}/{member.get('maxThreads', 3)}"
-            if member.get('gear'):
-                party_section += f"\n- Gear: {', '.join(member['gear'])}"
-            party_section += "\n"
-        sections.append(party_section)
+    after_party = []
 
     # Author guidance for DM (from DM Prep notes)
     if author_notes:
         guidance_section = format_author_notes_for_dm(author_notes)
         if guidance_section:
-            sections.append(guidance_section)
+            after_party.append(guidance_section)
 
     # Run progress
     progress_section = f"""## Campaign Progress
@@ -381,9 +456,9 @@ def build_dm_system_injection(dm_context: dict, party_status: Optional[dict] = N
         if run.get('reveal'):
             progress_section += f"\n- **On victory, reveal:** {run['reveal']}"
     
-    sections.append(progress_section)
+    after_party.append(progress_section)
     
-    return "\n\n---\n\n".join(sections)
+    return sections, after_party
 
 
 def build_run_intro_prompt(dm_context: dict) -> str:
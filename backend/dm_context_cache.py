@@ -0,0 +1,189 @@
+"""
+DM Context Cache
+Materializes the campaign portion of the DM system prompt once per
+(content, state, prep) version so only the party status and the retrieved
+knowledge selection are assembled per turn
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from campaign_schema import DM_PREP_NOTES
+from helpers import get_campaign_dir, get_campaign_file_version
+from state_events import EVENTS_FILENAME
+from content_index import get_content_index
+from campaign_logic import (
+    load_campaign_state,
+    load_dm_prep_data,
+    build_dm_context,
+    current_run_details,
+)
+from dm_context_builder import (
+    build_dm_injection_sections,
+    build_party_status_section,
+    join_dm_injection,
+)
+from knowledge_index import (
+    DEFAULT_TOP_K,
+    KnowledgeIndex,
+    collect_knowledge_items,
+    filter_dm_context,
+    must_include_ids,
+)
+
+# Files whose writes invalidate a campaign's materialized injection
+# (state.json only matters for campaigns whose state predates the event log)
+SOURCE_FILES = ("campaign.json", "state.json", EVENTS_FILENAME, "dm_prep.json")
+
+# Campaigns kept materialized at once
+MAX_CACHED_CAMPAIGNS = 64
+
+# Rendered knowledge selections kept per materialization
+MAX_CACHED_SELECTIONS = 8
+
+
+class MaterializedInjection:
+    """Campaign context, knowledge index and rendered sections for one set of source versions"""
+
+    def __init__(self, versions: tuple, dm_context: Optional[dict] = None,
+                 author_notes: Optional[list] = None, index: Optional[KnowledgeIndex] = None):
+        self.versions = versions
+        self.dm_context = dm_context
+        self.author_notes = author_notes or []
+        self.index = index
+        self.items: list[dict] = []
+        self.kinds: list[str] = []
+        self.always: set = set()
+        if dm_context is not None and index is not None:
+            self.items = collect_knowledge_items(dm_context, self.author_notes)
+            self.kinds = [item["kind"] for item in self.items]
+            index.update(self.items)
+            self.always = must_include_ids(dm_context, self.items)
+        self._sections: "OrderedDict[frozenset, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def empty(self) -> bool:
+        return self.dm_context is None
+
+    def sections_for(self, selected_ids: frozenset) -> tuple:
+        """Rendered (before_party, after_party) sections for a knowledge selection"""
+        with self._lock:
+            if selected_ids in self._sections:
+                self._sections.move_to_end(selected_ids)
+                return self._sections[selected_ids]
+
+        dm_context, notes = filter_dm_context(self.dm_context, self.author_notes, selected_ids)
+        sections = build_dm_injection_sections(dm_context, notes)
+        with self._lock:
+            self._sections[selected_ids] = sections
+            while len(self._sections) > MAX_CACHED_SELECTIONS:
+                self._sections.popitem(last=False)
+        return sections
+
+
+_cache: "OrderedDict[str, MaterializedInjection]" = OrderedDict()
+_indexes: dict[str, KnowledgeIndex] = {}
+_cache_lock = threading.Lock()
+
+
+def source_versions(campaign_id: str) -> tuple:
+    """Current version stamps of every file the injection depends on"""
+    return tuple(get_campaign_file_version(campaign_id, name) for name in SOURCE_FILES)
+
+
+def _materialize(campaign_id: str, versions: tuple, index: KnowledgeIndex) -> MaterializedInjection:
+    content_index = get_content_index(campaign_id)
+    if not content_index:
+        return MaterializedInjection(versions)
+    content = content_index.content
+
+    state = load_campaign_state(campaign_id)
+    run_details = current_run_details(content, state, content_index)
+    if not run_details:
+        return MaterializedInjection(versions)
+
+    # Load author notes for DM guidance
+    prep_data = load_dm_prep_data(campaign_id)
+    author_notes = DM_PREP_NOTES.dump_python(prep_data.author_notes + prep_data.pinned)
+
+    dm_context = build_dm_context(content, state, run_details, content_index)
+    return MaterializedInjection(versions, dm_context, author_notes, index)
+
+
+def get_materialized_injection(campaign_id: str) -> MaterializedInjection:
+    """Return the campaign's materialized injection, rebuilding it if a source changed"""
+    # Stamps are taken before loading, so a write that races the rebuild
+    # leaves a stale stamp behind and simply forces another rebuild next turn
+    versions = source_versions(campaign_id)
+    key = get_campaign_dir(campaign_id)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached and cached.versions == versions:
+            _cache.move_to_end(key)
+            return cached
+        # Seed from the previous index so unchanged items are not re-tokenized
+        index = KnowledgeIndex(previous=_indexes.get(key))
+
+    materialized = _materialize(campaign_id, versions, index)
+    with _cache_lock:
+        _cache[key] = materialized
+        _indexes[key] = index
+        _cache.move_to_end(key)
+        while len(_cache) > MAX_CACHED_CAMPAIGNS:
+            evicted, _ = _cache.popitem(last=False)
+            _indexes.pop(evicted, None)
+    return materialized
+
+
+def assemble_campaign_injection(campaign_id: str, session: Optional[dict] = None,
+                                query: str = "", top_k: int = DEFAULT_TOP_K) -> dict:
+    """Campaign injection for the active run, limited to the knowledge relevant to the query.
+
+    Returns the injection text ("" if there is no active run) and a report of
+    the retrieved items for the prompt breakdown.
+    """
+    materialized = get_materialized_injection(campaign_id)
+    if materialized.empty:
+        return {"text": "", "retrieval": None}
+
+    selection = materialized.index.select(
+        query, top_k=top_k, always=materialized.always, kinds=materialized.kinds
+    )
+    before_party, after_party = materialized.sections_for(frozenset(selection["ids"]))
+    text = join_dm_injection(before_party, build_party_status_section(session), after_party)
+
+    kinds = {item["id"]: item["kind"] for item in materialized.items}
+    return {
+        "text": text,
+        "retrieval": {
+            "candidates": selection["candidates"],
+            "top_k": top_k,
+            "selected": [
+                {
+                    "id": item_id,
+                    "kind": kinds[item_id],
+                    "score": selection["scores"][item_id],
+                    "must_include": item_id in materialized.always,
+                }
+                for item_id in sorted(selection["ids"], key=lambda i: -selection["scores"][i])
+            ],
+        },
+    }
+
+
+def build_campaign_injection(campaign_id: str, session: Optional[dict] = None, query: str = "") -> str:
+    """Campaign-specific DM prompt injection for the active run ("" if none)"""
+    return assemble_campaign_injection(campaign_id, session, query)["text"]
+
+
+def invalidate(campaign_id: Optional[str] = None):
+    """Drop materialized injections for one campaign, or all of them"""
+    with _cache_lock:
+        if campaign_id is None:
+            _cache.clear()
+            _indexes.clear()
+        else:
+            _cache.pop(get_campaign_dir(campaign_id), None)
+            _indexes.pop(get_campaign_dir(campaign_id), None)
@@ -0,0 +1,115 @@
+"""
+Downloads
+Shared pooled HTTP client and streaming, size-capped, checksummed downloads
+for remote images
+"""
+
+import hashlib
+import os
+import threading
+import uuid
+from typing import Optional
+from urllib.parse import urlparse
+
+import httpx
+
+from config import MAX_IMAGE_DOWNLOAD_BYTES
+
+# Concurrent downloads allowed per remote host
+PER_HOST_LIMIT = 4
+
+CHUNK_SIZE = 64 * 1024
+
+# Accepted image content types and the extension stored for each
+IMAGE_TYPES = {
+    "image/webp": ".webp",
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/gif": ".gif",
+}
+
+_client: Optional[httpx.Client] = None
+_client_lock = threading.Lock()
+_host_limits: dict[str, threading.BoundedSemaphore] = {}
+
+
+class DownloadError(Exception):
+    """A remote file could not be fetched, or was rejected"""
+
+
+def get_client() -> httpx.Client:
+    """The process-wide pooled client (connections are reused across downloads)"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = httpx.Client(
+                timeout=httpx.Timeout(30.0, connect=10.0),
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=8),
+                follow_redirects=True,
+            )
+        return _client
+
+
+def close_client():
+    """Close the pooled client (app shutdown)"""
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client:
+        client.close()
+
+
+def _host_limit(url: str) -> threading.BoundedSemaphore:
+    host = urlparse(url).netloc
+    with _client_lock:
+        if host not in _host_limits:
+            _host_limits[host] = threading.BoundedSemaphore(PER_HOST_LIMIT)
+        return _host_limits[host]
+
+
+def download_image_file(url: str, dest_dir: str, max_bytes: int = MAX_IMAGE_DOWNLOAD_BYTES) -> dict:
+    """Stream a remote image into dest_dir under a fresh uuid name.
+
+    The body is written in chunks to a temp file while its sha256 is
+    computed, then renamed into place, so a failed or oversized download
+    never leaves a partial file behind. Returns filename, path, sha256,
+    size and content_type; raises DownloadError on rejection.
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    temp_path = os.path.join(dest_dir, f".{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        with _host_limit(url):
+            with get_client().stream("GET", url) as response:
+                response.raise_for_status()
+                content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+                if content_type not in IMAGE_TYPES:
+                    raise DownloadError(f"Unexpected content type: {content_type or 'none'}")
+                declared = response.headers.get("content-length")
+                if declared and declared.isdigit() and int(declared) > max_bytes:
+                    raise DownloadError(f"Image too large: {declared} bytes")
+
+                with open(temp_path, "wb") as f:
+                    for chunk in response.iter_bytes(CHUNK_SIZE):
+                        size += len(chunk)
+                        if size > max_bytes:
+                            raise DownloadError(f"Image exceeds {max_bytes} bytes")
+                        digest.update(chunk)
+                        f.write(chunk)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+        if size == 0:
+            raise DownloadError("Empty image")
+        filename = f"{uuid.uuid4().hex}{IMAGE_TYPES[content_type]}"
+        path = os.path.join(dest_dir, filename)
+        os.replace(temp_path, path)
+        return {"filename": filename, "path": path, "sha256": digest.hexdigest(), "size": size,
+                "content_type": content_type}
+    except httpx.HTTPError as e:
+        raise DownloadError(str(e)) from e
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
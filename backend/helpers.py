@@ -4,8 +4,14 @@ File I/O and campaign data helpers
 
 import json
 import os
+import re
+import uuid
 
 from config import DATA_DIR, PROMPTS_DIR
+from interprocess import FileLock
+
+# Held for every read-modify-write of campaigns.json, which all workers share
+CAMPAIGNS_LOCK = FileLock("campaigns")
 
 
 def load_json(filename: str) -> dict:
@@ -23,6 +29,10 @@ def save_json(filename: str, data: dict):
         json.dump(data, f, indent=2)
     os.replace(temp_filepath, filepath)
 
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (about four characters per token)"""
+    return len(text) // 4 + 1
+
 def load_prompt(filename: str) -> str:
     filepath = os.path.join(PROMPTS_DIR, filename)
     if os.path.exists(filepath):
@@ -33,6 +43,11 @@ def load_prompt(filename: str) -> str:
 
 # === Campaign File Management ===
 
+def new_campaign_id(name: str) -> str:
+    """Fresh campaign id derived from a campaign name"""
+    slug = re.sub(r'[^a-z0-9]', '_', name.lower())
+    return f"{slug}_{uuid.uuid4().hex[:6]}"
+
 def get_campaign_dir(campaign_id: str) -> str:
     """Get the data directory path for a campaign"""
     return os.path.join(DATA_DIR, "campaigns", campaign_id)
@@ -55,6 +70,19 @@ def save_campaign_json(campaign_id: str, filename: str, data: dict):
         json.dump(data, f, indent=2)
     os.replace(temp_filepath, filepath)
 
+def get_campaign_file_version(campaign_id: str, filename: str):
+    """Cheap version stamp for a campaign file, or None if it doesn't exist.
+
+    Saves go through an atomic rename, so every write yields a new inode and
+    the stamp changes even when two writes land within the same mtime tick.
+    """
+    filepath = os.path.join(get_campaign_dir(campaign_id), filename)
+    try:
+        st = os.stat(filepath)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
 def get_campaign_images_dir(campaign_id: str) -> str:
     """Get the images directory path for a campaign"""
     return os.path.join(get_campaign_dir(campaign_id), "images")
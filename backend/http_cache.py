@@ -0,0 +1,111 @@
+"""
+HTTP caching for served files
+Content-addressed ETags, Cache-Control policies and conditional (304)
+handling; Range requests are answered by FileResponse itself
+"""
+
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+
+# Filenames that never change content once written (uuid and sha256 hex names)
+IMMUTABLE_NAME_RE = re.compile(r"^([0-9a-f]{32}|[0-9a-f]{64})(\.[a-z0-9]+)*$")
+
+CACHE_IMMUTABLE = "public, max-age=31536000, immutable"
+CACHE_REVALIDATE = "no-cache"
+
+# Digests remembered per file version so hot files are hashed once
+MAX_CACHED_DIGESTS = 2048
+
+_digests: "OrderedDict[tuple, str]" = OrderedDict()
+_digests_lock = threading.Lock()
+
+
+def file_digest(path: str) -> str:
+    """sha256 hex digest of a file, memoized on (path, inode, mtime, size)"""
+    st = os.stat(path)
+    key = (path, st.st_ino, st.st_mtime_ns, st.st_size)
+    with _digests_lock:
+        digest = _digests.get(key)
+        if digest:
+            _digests.move_to_end(key)
+            return digest
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+
+    with _digests_lock:
+        _digests[key] = digest
+        while len(_digests) > MAX_CACHED_DIGESTS:
+            _digests.popitem(last=False)
+    return digest
+
+
+def file_etag(path: str, digest: Optional[str] = None) -> str:
+    """Strong, content-addressed ETag for a file"""
+    return f'"{(digest or file_digest(path))[:32]}"'
+
+
+def is_immutable_name(filename: str) -> bool:
+    return bool(IMMUTABLE_NAME_RE.match(os.path.basename(filename)))
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in header.split(",")]
+    # Weak comparison, as If-None-Match requires
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def if_match_satisfied(header: str, etag: Optional[str]) -> bool:
+    """Whether an If-Match header allows writing over the version with this ETag (None: no version yet)"""
+    if etag is None:
+        return False
+    if header.strip() == "*":
+        return True
+    # Strong comparison: weak tags never match
+    return etag in (tag.strip() for tag in header.split(","))
+
+
+def _not_modified_since(header: str, mtime: float) -> bool:
+    try:
+        since = parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+    return int(mtime) <= since
+
+
+def cached_file_response(request: Request, path: str, media_type: str, immutable: bool = False,
+                         digest: Optional[str] = None, headers: Optional[dict] = None) -> Response:
+    """Serve a file with a content-addressed ETag, answering conditional requests with 304.
+
+    Range and If-Range are handled by FileResponse using the same ETag.
+    """
+    etag = file_etag(path, digest)
+    mtime = os.stat(path).st_mtime
+    response_headers = {
+        "ETag": etag,
+        "Cache-Control": CACHE_IMMUTABLE if immutable else CACHE_REVALIDATE,
+        "Last-Modified": formatdate(mtime, usegmt=True),
+        **(headers or {}),
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if (if_none_match and _etag_matches(if_none_match, etag)) or (
+        not if_none_match and if_modified_since and _not_modified_since(if_modified_since, mtime)
+    ):
+        return Response(status_code=304, headers=response_headers)
+
+    return FileResponse(path, media_type=media_type, headers=response_headers)
@@ -0,0 +1,68 @@
+"""
+Image batches
+Many Flux generations fanned out over a bounded thread pool, yielding each
+result as it finishes, with prompts optionally seeded from campaign content
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterator, Optional
+
+from image_generation import campaign_art_style, generate_flux_image, style_prompt
+from image_gallery import record_image
+
+# Concurrent Flux calls per batch unless the request asks for fewer
+DEFAULT_CONCURRENCY = int(os.environ.get("WEAVE_IMAGE_BATCH_CONCURRENCY", 4))
+
+MAX_BATCH_ITEMS = 50
+
+SEED_SOURCES = ("npcs", "locations")
+
+
+def seed_items(content: dict, sources: list[str]) -> list[dict]:
+    """Portrait prompts for NPCs and scene prompts for locations from campaign.json"""
+    items = []
+    if "npcs" in sources:
+        for npc in content.get("npcs", []):
+            items.append({
+                "prompt": f"{npc['name']}, a {npc['species'].lower()} {npc['role']}",
+                "style": "character",
+            })
+    if "locations" in sources:
+        for location in content.get("locations", []):
+            items.append({"prompt": f"{location['name']}, {location['vibe']}", "style": "scene"})
+    return items
+
+
+def _generate(index: int, item: dict, full_prompt: str, campaign_id: str) -> dict:
+    result = {"index": index, "style": item["style"], "prompt": full_prompt}
+    try:
+        result["image_url"] = generate_flux_image(full_prompt, campaign_id)
+        record_image(campaign_id, result["image_url"], full_prompt, source=item["style"])
+    except Exception as e:
+        result["image_url"] = None
+        result["error"] = str(e)
+    return result
+
+
+def run_batch(campaign_id: str, items: list[dict], concurrency: Optional[int] = None) -> Iterator[dict]:
+    """Generate every item with at most `concurrency` calls in flight, yielding results in completion order.
+
+    The last result is a summary: {"done": True, "total", "succeeded", "failed"}.
+    """
+    art_style = campaign_art_style(campaign_id)
+    workers = max(1, min(concurrency or DEFAULT_CONCURRENCY, len(items)))
+    succeeded = 0
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-batch") as pool:
+        futures = [
+            pool.submit(_generate, i, item, style_prompt(art_style, item["style"], item["prompt"]), campaign_id)
+            for i, item in enumerate(items)
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            if result["image_url"]:
+                succeeded += 1
+            yield result
+
+    yield {"done": True, "total": len(items), "succeeded": succeeded, "failed": len(items) - succeeded}
@@ -0,0 +1,214 @@
+"""
+Image derivatives
+Thumbnail, medium and placeholder renditions of generated images, rendered in
+a process pool off the request path and negotiated by format from Accept
+"""
+
+import base64
+import hashlib
+import io
+import mimetypes
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional
+
+from PIL import Image, ImageOps, features
+
+DERIVED_DIRNAME = "derived"
+
+# Longest edge in pixels per size; "full" serves the re-encoded original
+SIZES = {"thumb": 320, "medium": 960, "full": None}
+
+# Longest edge of the inline placeholder
+PLACEHOLDER_EDGE = 16
+
+# Formats rendered per size, in order of preference when the client accepts them;
+# AVIF only where this Pillow can encode it (built in from 11.3)
+FORMATS = tuple(fmt for fmt in ("avif", "webp", "jpeg") if fmt != "avif" or features.check("avif"))
+MEDIA_TYPES = {"avif": "image/avif", "webp": "image/webp", "jpeg": "image/jpeg"}
+QUALITY = {"avif": 55, "webp": 78, "jpeg": 82}
+
+# Standard banner dimensions; uploads are cropped and scaled to fill them
+BANNER_SIZE = (1280, 720)
+BANNER_QUALITY = 85
+
+POOL_WORKERS = 2
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pending: dict[str, Future] = {}
+_pool_lock = threading.Lock()
+
+
+def get_derived_dir(images_dir: str) -> str:
+    """Directory holding the derivatives of an images directory"""
+    return os.path.join(images_dir, DERIVED_DIRNAME)
+
+
+def derivative_path(images_dir: str, filename: str, size: str, fmt: str) -> str:
+    """Path of one derivative: <images_dir>/derived/<stem>.<size>.<fmt>"""
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(get_derived_dir(images_dir), f"{stem}.{size}.{fmt}")
+
+
+def placeholder_path(images_dir: str, filename: str) -> str:
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(get_derived_dir(images_dir), f"{stem}.placeholder.txt")
+
+
+def guess_media_type(filepath: str) -> str:
+    """Media type of an original image from its extension"""
+    return mimetypes.guess_type(filepath)[0] or "application/octet-stream"
+
+
+# === Rendering (runs in worker processes) ===
+
+def _save_atomic(image: Image.Image, path: str, fmt: str):
+    temp_path = path + ".tmp"
+    image.save(temp_path, format=fmt.upper(), quality=QUALITY[fmt])
+    os.replace(temp_path, path)
+
+
+def render_derivatives(images_dir: str, filename: str) -> dict:
+    """Render every size and format plus the placeholder for one image; returns what was written"""
+    source = os.path.join(images_dir, filename)
+    os.makedirs(get_derived_dir(images_dir), exist_ok=True)
+    written = []
+
+    with Image.open(source) as original:
+        original = original.convert("RGB")
+        for size, edge in SIZES.items():
+            image = original.copy()
+            if edge:
+                image.thumbnail((edge, edge), Image.LANCZOS)
+            for fmt in FORMATS:
+                path = derivative_path(images_dir, filename, size, fmt)
+                _save_atomic(image, path, fmt)
+                written.append(os.path.basename(path))
+
+        tiny = original.copy()
+        tiny.thumbnail((PLACEHOLDER_EDGE, PLACEHOLDER_EDGE), Image.BILINEAR)
+        buffer = io.BytesIO()
+        tiny.save(buffer, format="WEBP", quality=30)
+
+    data_uri = "data:image/webp;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+    path = placeholder_path(images_dir, filename)
+    with open(path + ".tmp", "w") as f:
+        f.write(data_uri)
+    os.replace(path + ".tmp", path)
+    return {"filename": filename, "derivatives": written, "placeholder": data_uri}
+
+
+def transcode_banner(source: str, dest: str) -> dict:
+    """Crop and scale an uploaded banner to BANNER_SIZE and write it as WebP; returns its sha256 and size"""
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        banner = ImageOps.fit(image, BANNER_SIZE, Image.LANCZOS)
+    buffer = io.BytesIO()
+    banner.save(buffer, format="WEBP", quality=BANNER_QUALITY)
+    content = buffer.getvalue()
+    with open(dest + ".tmp", "wb") as f:
+        f.write(content)
+    os.replace(dest + ".tmp", dest)
+    return {"sha256": hashlib.sha256(content).hexdigest(), "size": len(content)}
+
+
+# === Scheduling ===
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=POOL_WORKERS)
+    return _pool
+
+
+def submit(fn, *args) -> Future:
+    """Run a picklable function in the image worker pool"""
+    with _pool_lock:
+        return _get_pool().submit(fn, *args)
+
+
+def has_derivatives(images_dir: str, filename: str) -> bool:
+    return os.path.exists(placeholder_path(images_dir, filename))
+
+
+def schedule_derivatives(images_dir: str, filename: str) -> Optional[Future]:
+    """Queue rendering of an image's derivatives unless they exist or are already queued"""
+    if has_derivatives(images_dir, filename):
+        return None
+    key = os.path.join(images_dir, filename)
+    with _pool_lock:
+        future = _pending.get(key)
+        if future and not future.done():
+            return future
+        future = _get_pool().submit(render_derivatives, images_dir, filename)
+        _pending[key] = future
+    future.add_done_callback(lambda f: _forget(key, f))
+    return future
+
+
+def _forget(key: str, future: Future):
+    with _pool_lock:
+        if _pending.get(key) is future:
+            del _pending[key]
+    if future.exception():
+        print(f"Derivative rendering failed for {key}: {future.exception()}")
+
+
+def schedule_directory(images_dir: str) -> int:
+    """Queue derivatives for every image in a directory that lacks them; returns how many were queued"""
+    if not os.path.isdir(images_dir):
+        return 0
+    queued = 0
+    for name in sorted(os.listdir(images_dir)):
+        if not os.path.isfile(os.path.join(images_dir, name)) or not guess_media_type(name).startswith("image/"):
+            continue
+        if schedule_derivatives(images_dir, name):
+            queued += 1
+    return queued
+
+
+def shutdown():
+    """Stop the worker pool (app shutdown)"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+        _pending.clear()
+    if pool:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+# === Serving ===
+
+def negotiate_format(accept: Optional[str]) -> str:
+    """Best derivative format the client accepts (JPEG when it names none of ours)"""
+    accept = (accept or "").lower()
+    for fmt in FORMATS:
+        if MEDIA_TYPES[fmt] in accept:
+            return fmt
+    return "jpeg"
+
+
+def resolve_image(images_dir: str, filename: str, size: Optional[str], accept: Optional[str]) -> tuple[str, str]:
+    """(path, media type) to serve for a request.
+
+    Without a size the original is served. A missing derivative is queued
+    and the original served meanwhile, so existing images are converted lazily.
+    """
+    original = os.path.join(images_dir, filename)
+    if size:
+        fmt = negotiate_format(accept)
+        path = derivative_path(images_dir, filename, size, fmt)
+        if os.path.exists(path):
+            return path, MEDIA_TYPES[fmt]
+        schedule_derivatives(images_dir, filename)
+    return original, guess_media_type(original)
+
+
+def read_placeholder(images_dir: str, filename: str) -> Optional[str]:
+    """Inline data URI placeholder for an image, or None if not rendered yet"""
+    path = placeholder_path(images_dir, filename)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return f.read()
@@ -0,0 +1,260 @@
+"""
+Image gallery
+Append-only, segmented per-campaign index of every image shown or generated
+(url, prompt, run, session, size, time), read newest-first in cursor pages
+without loading the session
+"""
+
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Optional
+
+from helpers import get_campaign_dir, get_campaign_images_dir, load_campaign_json
+import image_store
+
+GALLERY_DIRNAME = "gallery"
+INDEX_FILENAME = "index.json"
+
+# Entries per segment file before a new segment is started
+SEGMENT_MAX_ENTRIES = 500
+
+# Largest page returned by a single read
+MAX_PAGE_SIZE = 100
+
+_locks: dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def _campaign_lock(campaign_id: str) -> threading.Lock:
+    with _locks_guard:
+        if campaign_id not in _locks:
+            _locks[campaign_id] = threading.Lock()
+        return _locks[campaign_id]
+
+
+# === Paths and index ===
+
+def get_gallery_dir(campaign_id: str) -> str:
+    return os.path.join(get_campaign_dir(campaign_id), GALLERY_DIRNAME)
+
+
+def _empty_index() -> dict:
+    return {"next_seq": 1, "segments": [], "backfilled": False}
+
+
+def load_index(campaign_id: str) -> dict:
+    filepath = os.path.join(get_gallery_dir(campaign_id), INDEX_FILENAME)
+    if os.path.exists(filepath):
+        with open(filepath, "r") as f:
+            return {**_empty_index(), **json.load(f)}
+    return _empty_index()
+
+
+def _save_index(campaign_id: str, index: dict):
+    gallery_dir = get_gallery_dir(campaign_id)
+    os.makedirs(gallery_dir, exist_ok=True)
+    filepath = os.path.join(gallery_dir, INDEX_FILENAME)
+    with open(filepath + ".tmp", "w") as f:
+        json.dump(index, f, indent=2)
+    os.replace(filepath + ".tmp", filepath)
+
+
+def _read_segment(campaign_id: str, segment: dict) -> list[dict]:
+    filepath = os.path.join(get_gallery_dir(campaign_id), segment["name"])
+    if not os.path.exists(filepath):
+        return []
+    entries = []
+    with open(filepath, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                # A torn final line from an interrupted append; skip it
+                continue
+    return entries
+
+
+def _image_file(campaign_id: str, name: str) -> Optional[str]:
+    """Path of an indexed image, whether a store blob or a legacy campaign image"""
+    blob = image_store.parse_blob_name(name)
+    if blob:
+        return image_store.blob_path(*blob)
+    if os.path.basename(name) != name:
+        return None
+    return os.path.join(get_campaign_images_dir(campaign_id), name)
+
+
+# === Writing ===
+
+def _append_locked(campaign_id: str, entries: list[dict]) -> list[dict]:
+    index = load_index(campaign_id)
+    gallery_dir = get_gallery_dir(campaign_id)
+    os.makedirs(gallery_dir, exist_ok=True)
+
+    written = []
+    pending = list(entries)
+    while pending:
+        segments = index["segments"]
+        if not segments or segments[-1]["count"] >= SEGMENT_MAX_ENTRIES:
+            segments.append({
+                "name": f"segment_{len(segments) + 1:06d}.jsonl",
+                "first_seq": index["next_seq"],
+                "last_seq": index["next_seq"] - 1,
+                "count": 0,
+                "runs": [],
+            })
+        segment = segments[-1]
+        room = SEGMENT_MAX_ENTRIES - segment["count"]
+        batch, pending = pending[:room], pending[room:]
+
+        lines = []
+        for entry in batch:
+            entry = {"seq": index["next_seq"], **entry}
+            index["next_seq"] += 1
+            if entry.get("run_id") and entry["run_id"] not in segment["runs"]:
+                segment["runs"].append(entry["run_id"])
+            lines.append(json.dumps(entry))
+            written.append(entry)
+
+        with open(os.path.join(gallery_dir, segment["name"]), "a") as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        segment["count"] += len(batch)
+        segment["last_seq"] = index["next_seq"] - 1
+
+    _save_index(campaign_id, index)
+    return written
+
+
+def record_image(campaign_id: str, url: str, prompt: str = "", source: str = "scene",
+                 run_id: Optional[str] = None, session_id: Optional[str] = None) -> Optional[dict]:
+    """Append an image served from the campaign to its gallery; returns the entry (None for remote URLs)"""
+    prefix = f"/api/campaigns/{campaign_id}/images/"
+    if not url or not url.startswith(prefix):
+        return None
+    name = url[len(prefix):]
+    path = _image_file(campaign_id, name)
+    entry = {
+        "url": url,
+        "name": name,
+        "prompt": prompt,
+        "source": source,
+        "run_id": run_id,
+        "session_id": session_id,
+        "size": os.path.getsize(path) if path and os.path.exists(path) else None,
+        "created_at": datetime.utcnow().isoformat() + "Z",
+    }
+    # Older images are indexed first so sequence order stays chronological
+    backfill(campaign_id, skip={name})
+    with _campaign_lock(campaign_id):
+        return _append_locked(campaign_id, [entry])[0]
+
+
+def backfill(campaign_id: str, skip: set = frozenset()) -> int:
+    """Index images that predate the gallery, once; returns how many were added.
+
+    Covers the campaign's own images directory and every store blob the
+    campaign holds (banners excepted), except names in `skip`. Prompts are
+    recovered from the current session and the reuse index where they are known.
+    """
+    with _campaign_lock(campaign_id):
+        index = load_index(campaign_id)
+        if index["backfilled"]:
+            return 0
+
+        indexed = {entry["name"] for segment in index["segments"] for entry in _read_segment(campaign_id, segment)}
+        indexed |= set(skip)
+        prompts = {img.get("url"): img.get("prompt", "")
+                   for img in load_campaign_json(campaign_id, "current_session.json").get("images", [])}
+        prompts.update({e["url"]: e["prompt"] for e in load_campaign_json(campaign_id, "image_reuse.json").get("entries", [])})
+
+        candidates = []
+        images_dir = get_campaign_images_dir(campaign_id)
+        if os.path.isdir(images_dir):
+            candidates += [name for name in os.listdir(images_dir) if os.path.isfile(os.path.join(images_dir, name))]
+        banner = image_store.banner_holder(campaign_id)
+        for name in image_store.blobs_held_by(campaign_id):
+            if image_store.get_blob(image_store.parse_blob_name(name)[0])["refs"] != [banner]:
+                candidates.append(name)
+
+        entries = []
+        for name in candidates:
+            if name in indexed:
+                continue
+            path = _image_file(campaign_id, name)
+            if not path or not os.path.exists(path):
+                continue
+            url = f"/api/campaigns/{campaign_id}/images/{name}"
+            stat = os.stat(path)
+            entries.append({
+                "url": url,
+                "name": name,
+                "prompt": prompts.get(url, ""),
+                "source": "backfill",
+                "run_id": None,
+                "session_id": None,
+                "size": stat.st_size,
+                "created_at": datetime.utcfromtimestamp(stat.st_mtime).isoformat() + "Z",
+            })
+        entries.sort(key=lambda e: e["created_at"])
+
+        if entries:
+            _append_locked(campaign_id, entries)
+        index = load_index(campaign_id)
+        index["backfilled"] = True
+        _save_index(campaign_id, index)
+        return len(entries)
+
+
+# === Reading ===
+
+def read_page(campaign_id: str, before: Optional[int] = None, limit: int = 24,
+              run_id: Optional[str] = None) -> dict:
+    """One page of images, newest first, ending just before the given sequence number.
+
+    Pass the returned `next_before` to get the next (older) page. With a
+    run_id only that run's images are returned, and segments that never
+    saw the run are skipped without being read.
+    """
+    index = load_index(campaign_id)
+    if not index["backfilled"]:
+        backfill(campaign_id)
+        index = load_index(campaign_id)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    if before is None:
+        before = index["next_seq"]
+
+    collected: list[dict] = []
+    has_more = False
+    for segment in reversed(index["segments"]):
+        if segment["count"] == 0 or segment["first_seq"] >= before:
+            continue
+        if run_id and run_id not in segment.get("runs", []):
+            continue
+        for entry in reversed(_read_segment(campaign_id, segment)):
+            if entry["seq"] >= before or (run_id and entry.get("run_id") != run_id):
+                continue
+            if len(collected) == limit:
+                has_more = True
+                break
+            collected.append(entry)
+        if has_more:
+            break
+
+    for entry in collected:
+        path = _image_file(campaign_id, entry["name"])
+        entry["available"] = bool(path and os.path.exists(path))
+    return {
+        "images": collected,
+        "next_before": collected[-1]["seq"] if has_more else None,
+        "has_more": has_more,
+        "total": index["next_seq"] - 1,
+    }
+
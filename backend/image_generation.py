@@ -0,0 +1,160 @@
+"""
+Image generation helpers
+Prompt crafting, Flux generation via Replicate, and local image downloads
+"""
+
+import os
+from typing import Optional
+
+import anthropic
+import replicate
+
+from config import IMAGES_DIR
+from helpers import load_campaign_json
+from image_store import add_ref, blob_dir, get_incoming_dir, library_holder, parse_blob_name, put_file, session_holder
+from image_quota import record_download
+from image_reuse import find_reusable, record_image, reuse_settings
+from image_derivatives import schedule_derivatives
+from downloads import DownloadError, download_image_file
+
+# Default style for backwards compatibility
+DEFAULT_ART_STYLE = "fantasy illustration, detailed, atmospheric lighting"
+
+# Subject framing added after the art style, per image request style
+STYLE_PREFIXES = {
+    "scene": "scenic landscape view",
+    "character": "character portrait",
+    "enemy": "creature design, slightly menacing but not scary",
+}
+
+
+def campaign_art_style(campaign_id: str) -> str:
+    """The campaign's configured art style, or the default"""
+    system_config = load_campaign_json(campaign_id, "system.json")
+    return system_config.get("art_style", DEFAULT_ART_STYLE) if system_config else DEFAULT_ART_STYLE
+
+
+def style_prompt(art_style: str, style: str, prompt: str) -> str:
+    """Full Flux prompt: art style, the style's framing (if any), then the subject"""
+    prefix = STYLE_PREFIXES.get(style)
+    return f"{art_style}, {prefix}, {prompt}" if prefix else f"{art_style}, {prompt}"
+
+
+def generate_flux_image(full_prompt: str, campaign_id: str = None) -> Optional[str]:
+    """Run Flux for a full prompt and download the result; returns its URL or None.
+
+    Replicate errors propagate so callers decide how to report them.
+    """
+    output = replicate.run(
+        "black-forest-labs/flux-schnell",
+        input={
+            "prompt": full_prompt,
+            "num_outputs": 1,
+            "aspect_ratio": "16:9",
+            "output_format": "webp",
+            "output_quality": 80
+        }
+    )
+    # Flux returns a list of URLs - download to campaign directory
+    if output and len(output) > 0:
+        remote_url = str(output[0])
+        # Fall back to the remote URL if the download fails
+        return download_image(remote_url, campaign_id) or remote_url
+    return None
+
+
+def craft_image_prompt(scene_description: str, session: dict) -> str:
+    """Use Claude to craft an optimized image generation prompt"""
+    party_info = ""
+    if session.get("party"):
+        party_info = ", ".join([f"{m['name']} (a {m['species'].lower()})" for m in session["party"]])
+
+    location = session.get("location", "a woodland location")
+
+    try:
+        client = anthropic.Anthropic()
+        response = client.messages.create(
+            model="claude-3-5-haiku-latest",
+            max_tokens=200,
+            messages=[{
+                "role": "user",
+                "content": f"""Convert this scene description into an optimized image generation prompt.
+
+Scene: {scene_description}
+Location: {location}
+Characters present: {party_info}
+
+Rules:
+- Output ONLY the prompt, nothing else
+- 1-2 sentences max
+- Focus on composition, lighting, mood, key visual elements
+- Describe it as a rich, atmospheric fantasy illustration with earthy tones
+- Include specific details about any characters (species, clothing, expressions)
+- No action verbs - describe a frozen moment
+- Be specific about colors and lighting"""
+            }]
+        )
+        return response.content[0].text.strip()
+    except Exception as e:
+        print(f"Prompt crafting failed: {e}")
+        return scene_description  # Fall back to original
+
+
+def download_image(url: str, campaign_id: str = None) -> str:
+    """Download image from URL and save locally, return local path"""
+    try:
+        if campaign_id:
+            # Campaign images go into the content-addressed store, held by the current session
+            result = download_image_file(url, get_incoming_dir())
+            name = put_file(result["path"], result["sha256"], os.path.splitext(result["filename"])[1],
+                            holder=session_holder(campaign_id))
+            # The library keeps it past the session, within the campaign's quota
+            add_ref(result["sha256"], library_holder(campaign_id))
+            record_download(campaign_id, name, result["size"])
+            images_dir = blob_dir(result["sha256"])
+            url_path = f"/api/campaigns/{campaign_id}/images/{name}"
+        else:
+            result = download_image_file(url, IMAGES_DIR)
+            name = result["filename"]
+            images_dir = IMAGES_DIR
+            url_path = f"/api/images/{name}"
+    except DownloadError as e:
+        print(f"Failed to download image: {e}")
+        return None
+
+    # Thumbnails and smaller formats are rendered in the background
+    schedule_derivatives(images_dir, name)
+
+    return url_path
+
+def generate_scene_image(scene_description: str, session: dict, campaign_id: str = None, art_style: str = None) -> tuple[str, str]:
+    """Generate an image for a scene and return (local_URL, crafted_prompt)"""
+
+    # First, craft an optimized prompt
+    crafted_prompt = craft_image_prompt(scene_description, session)
+
+    # Revisited scenes can reuse an earlier image when the campaign allows it
+    location = session.get("location", "")
+    party = [m["name"] for m in session.get("party", [])]
+    if campaign_id:
+        settings = reuse_settings(campaign_id)
+        if settings["enabled"]:
+            match = find_reusable(campaign_id, crafted_prompt, location, party, settings["threshold"])
+            if match:
+                add_ref(parse_blob_name(match["blob"])[0], session_holder(campaign_id))
+                return match["url"], crafted_prompt
+
+    # Use provided art style or fall back to default
+    style = art_style or DEFAULT_ART_STYLE
+
+    # Add style prefix
+    full_prompt = f"{style}, {crafted_prompt}"
+
+    try:
+        image_url = generate_flux_image(full_prompt, campaign_id)
+        if image_url and campaign_id:
+            record_image(campaign_id, image_url, crafted_prompt, location, party)
+        return image_url, crafted_prompt
+    except Exception as e:
+        print(f"Image generation failed: {e}")
+        return None, crafted_prompt
@@ -0,0 +1,152 @@
+"""
+Image quotas
+Per-campaign byte and count limits on retained generated images. Usage is
+kept incrementally in image_usage.json as images are downloaded; when a
+campaign goes over quota its least-recently-served library images are
+evicted, never ones an active session, banner or archive still references.
+"""
+
+import threading
+from datetime import datetime
+from typing import Optional
+
+import config
+from access_tracker import tracker
+from helpers import load_json, load_campaign_json, save_campaign_json
+import image_store
+
+USAGE_FILENAME = "image_usage.json"
+
+_lock = threading.Lock()
+
+
+def served_key(name: str) -> str:
+    """Access tracker key recording when an image was last served"""
+    return f"image:{name}"
+
+
+# === Settings ===
+
+def quota_settings(campaign_id: str) -> dict:
+    """The campaign's byte and count limits (its own, else the configured defaults)"""
+    campaign = next((c for c in load_json("campaigns.json").get("campaigns", []) if c["id"] == campaign_id), {})
+    return {
+        "max_bytes": int(campaign.get("imageQuotaBytes") or config.IMAGE_QUOTA_BYTES),
+        "max_count": int(campaign.get("imageQuotaCount") or config.IMAGE_QUOTA_COUNT),
+    }
+
+
+# === Usage ===
+
+def _empty_usage() -> dict:
+    return {"images": {}, "bytes": 0, "count": 0, "evicted": {"count": 0, "bytes": 0}}
+
+
+def load_usage(campaign_id: str) -> dict:
+    data = load_campaign_json(campaign_id, USAGE_FILENAME)
+    return {**_empty_usage(), **data} if data else _rebuild_usage(campaign_id)
+
+
+def _rebuild_usage(campaign_id: str) -> dict:
+    """Usage from the image store, for campaigns that predate the usage file"""
+    usage = _empty_usage()
+    banner = image_store.banner_holder(campaign_id)
+    blobs = image_store.get_blobs()
+    for name in image_store.blobs_held_by(campaign_id):
+        sha, _ = image_store.parse_blob_name(name)
+        entry = blobs.get(sha)
+        # Collected between the two reads of the index
+        if entry is None:
+            continue
+        if entry["refs"] != [banner]:
+            usage["images"][name] = {"size": entry["size"], "added_at": entry["created_at"]}
+    _total(usage)
+    return usage
+
+
+def _total(usage: dict):
+    usage["bytes"] = sum(image["size"] for image in usage["images"].values())
+    usage["count"] = len(usage["images"])
+
+
+def record_download(campaign_id: str, name: str, size: int) -> list[str]:
+    """Count a newly stored image against the campaign and enforce its quota; returns evicted names"""
+    with _lock:
+        usage = load_usage(campaign_id)
+        if name not in usage["images"]:
+            usage["images"][name] = {"size": size, "added_at": datetime.utcnow().isoformat() + "Z"}
+            usage["bytes"] += size
+            usage["count"] += 1
+        evicted = _enforce(campaign_id, usage, keep=name)
+        save_campaign_json(campaign_id, USAGE_FILENAME, usage)
+    return evicted
+
+
+# === Eviction ===
+
+def _protected(campaign_id: str, refs: list[str]) -> bool:
+    return bool({image_store.session_holder(campaign_id), image_store.archive_holder(campaign_id),
+                 image_store.banner_holder(campaign_id)}.intersection(refs))
+
+
+def _eviction_order(campaign_id: str, usage: dict) -> list[str]:
+    """Image names by last served (or added) time, oldest first"""
+    served = tracker.get_all(campaign_id)
+    return sorted(
+        usage["images"],
+        key=lambda name: served.get(served_key(name)) or usage["images"][name]["added_at"],
+    )
+
+
+def _enforce(campaign_id: str, usage: dict, keep: Optional[str] = None) -> list[str]:
+    limits = quota_settings(campaign_id)
+    library = image_store.library_holder(campaign_id)
+    blobs = image_store.get_blobs()
+    evicted = []
+    for name in _eviction_order(campaign_id, usage):
+        if usage["bytes"] <= limits["max_bytes"] and usage["count"] <= limits["max_count"]:
+            break
+        blob = image_store.parse_blob_name(name)
+        entry = blobs.get(blob[0]) if blob else None
+        if entry and (name == keep or _protected(campaign_id, entry["refs"])):
+            continue
+        if entry:
+            image_store.remove_ref(blob[0], library)
+            usage["evicted"]["count"] += 1
+            usage["evicted"]["bytes"] += usage["images"][name]["size"]
+            evicted.append(name)
+        # Images gone from the store (or never stored) simply stop counting
+        usage["bytes"] -= usage["images"].pop(name)["size"]
+        usage["count"] -= 1
+    return evicted
+
+
+def enforce_quota(campaign_id: str) -> list[str]:
+    """Evict until the campaign is within quota (e.g. after its limits were lowered)"""
+    with _lock:
+        usage = load_usage(campaign_id)
+        evicted = _enforce(campaign_id, usage)
+        save_campaign_json(campaign_id, USAGE_FILENAME, usage)
+    return evicted
+
+
+def usage_report(campaign_id: str) -> dict:
+    """Bytes and count against the limits, what is evictable now, and evictions so far"""
+    usage = load_usage(campaign_id)
+    limits = quota_settings(campaign_id)
+    blobs = image_store.get_blobs()
+    evictable = []
+    for name in usage["images"]:
+        blob = image_store.parse_blob_name(name)
+        entry = blobs.get(blob[0]) if blob else None
+        if entry and not _protected(campaign_id, entry["refs"]):
+            evictable.append(name)
+    return {
+        "bytes": usage["bytes"],
+        "count": usage["count"],
+        **limits,
+        "over_quota": usage["bytes"] > limits["max_bytes"] or usage["count"] > limits["max_count"],
+        "evictable_bytes": sum(usage["images"][name]["size"] for name in evictable),
+        "evictable_count": len(evictable),
+        "evicted": usage["evicted"],
+    }
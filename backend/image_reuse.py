@@ -0,0 +1,203 @@
+"""
+Image reuse
+Opt-in reuse of earlier scene images: a per-campaign index of
+(crafted prompt, location, party) -> image, matched by cosine similarity of
+hashed token vectors so revisited scenes skip a new Flux generation
+"""
+
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+
+from helpers import load_json, load_campaign_json, save_campaign_json, get_campaign_file_version
+from knowledge_index import tokenize
+import image_store
+
+REUSE_FILENAME = "image_reuse.json"
+
+# Cosine similarity a scene needs to reuse an image, unless the campaign sets its own
+DEFAULT_THRESHOLD = 0.85
+
+# Dimensions of the hashed token vectors
+VECTOR_DIM = 1024
+
+# Relative weight of the location and party terms against the prompt's
+LOCATION_WEIGHT = 2.0
+PARTY_WEIGHT = 1.5
+
+# Approximate Flux (schnell) cost per generated image, for the savings report
+COST_PER_IMAGE_USD = 0.003
+
+# Reuse decisions kept for the report
+MAX_RECENT = 20
+
+MAX_CACHED_CAMPAIGNS = 32
+
+_matrices: "OrderedDict[str, tuple]" = OrderedDict()
+_lock = threading.Lock()
+
+# Serializes read-modify-write of the reuse index files
+_index_lock = threading.Lock()
+
+
+# === Settings ===
+
+def reuse_settings(campaign_id: str) -> dict:
+    """Whether reuse is enabled for a campaign and the similarity it requires"""
+    campaign = next((c for c in load_json("campaigns.json").get("campaigns", []) if c["id"] == campaign_id), {})
+    return {
+        "enabled": bool(campaign.get("imageReuse", False)),
+        "threshold": float(campaign.get("imageReuseThreshold") or DEFAULT_THRESHOLD),
+    }
+
+
+# === Vectors ===
+
+def scene_terms(prompt: str, location: str = "", party: Optional[list] = None) -> dict[str, float]:
+    """Weighted terms describing a scene: prompt tokens plus namespaced location and party tokens"""
+    terms: dict[str, float] = {}
+    for token in tokenize(prompt):
+        terms[token] = terms.get(token, 0.0) + 1.0
+    for token in tokenize(location or ""):
+        key = f"loc:{token}"
+        terms[key] = terms.get(key, 0.0) + LOCATION_WEIGHT
+    for name in party or []:
+        for token in tokenize(name):
+            key = f"pc:{token}"
+            terms[key] = terms.get(key, 0.0) + PARTY_WEIGHT
+    return terms
+
+
+def vectorize(terms: dict[str, float]) -> np.ndarray:
+    """L2-normalized hashed vector of weighted terms"""
+    vector = np.zeros(VECTOR_DIM, dtype=np.float32)
+    for term, weight in terms.items():
+        vector[zlib.crc32(term.encode("utf-8")) % VECTOR_DIM] += weight
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _entry_terms(entry: dict) -> dict[str, float]:
+    return scene_terms(entry["prompt"], entry.get("location", ""), entry.get("party", []))
+
+
+# === Index ===
+
+def load_reuse_index(campaign_id: str) -> dict:
+    data = load_campaign_json(campaign_id, REUSE_FILENAME)
+    return {"entries": [], "stats": {"generated": 0, "reused": 0}, "recent": [], **data}
+
+
+def _matrix(campaign_id: str, index: dict) -> np.ndarray:
+    """Stacked entry vectors, rebuilt only when the index file changes"""
+    version = get_campaign_file_version(campaign_id, REUSE_FILENAME)
+    with _lock:
+        cached = _matrices.get(campaign_id)
+        if cached and cached[0] == version:
+            _matrices.move_to_end(campaign_id)
+            return cached[1]
+
+    entries = index["entries"]
+    matrix = np.stack([vectorize(_entry_terms(e)) for e in entries]) if entries else \
+        np.zeros((0, VECTOR_DIM), dtype=np.float32)
+    with _lock:
+        _matrices[campaign_id] = (version, matrix)
+        while len(_matrices) > MAX_CACHED_CAMPAIGNS:
+            _matrices.popitem(last=False)
+    return matrix
+
+
+def _image_exists(campaign_id: str, entry: dict) -> bool:
+    """Whether the campaign still holds the image (not evicted) and its file exists"""
+    blob = image_store.parse_blob_name(entry.get("blob", ""))
+    stored = image_store.get_blob(blob[0]) if blob else None
+    if not stored or not set(image_store.campaign_holders(campaign_id)).intersection(stored["refs"]):
+        return False
+    return os.path.exists(image_store.blob_path(*blob))
+
+
+def _record_decision(index: dict, decision: dict):
+    index["recent"] = (index["recent"] + [decision])[-MAX_RECENT:]
+
+
+def find_reusable(campaign_id: str, prompt: str, location: str = "", party: Optional[list] = None,
+                  threshold: Optional[float] = None) -> Optional[dict]:
+    """Best earlier image for a scene if it clears the threshold (and still exists), else None.
+
+    Every lookup is recorded with its best similarity for the report.
+    """
+    with _index_lock:
+        return _find_reusable(campaign_id, prompt, location, party, threshold)
+
+
+def _find_reusable(campaign_id: str, prompt: str, location: str, party: Optional[list],
+                   threshold: Optional[float]) -> Optional[dict]:
+    index = load_reuse_index(campaign_id)
+    threshold = DEFAULT_THRESHOLD if threshold is None else threshold
+    match = None
+    best_score = 0.0
+
+    matrix = _matrix(campaign_id, index)
+    if len(matrix):
+        scores = matrix @ vectorize(scene_terms(prompt, location, party))
+        for i in np.argsort(-scores, kind="stable"):
+            score = float(scores[i])
+            if score < threshold:
+                best_score = max(best_score, score)
+                break
+            entry = index["entries"][int(i)]
+            if _image_exists(campaign_id, entry):
+                match, best_score = entry, score
+                break
+
+    _record_decision(index, {
+        "prompt": prompt[:160],
+        "similarity": round(best_score, 3),
+        "reused": match is not None,
+        "at": datetime.utcnow().isoformat() + "Z",
+    })
+    if match:
+        match["reused"] = match.get("reused", 0) + 1
+        index["stats"]["reused"] += 1
+    save_campaign_json(campaign_id, REUSE_FILENAME, index)
+    return {**match, "similarity": round(best_score, 3)} if match else None
+
+
+def record_image(campaign_id: str, url: str, prompt: str, location: str = "", party: Optional[list] = None):
+    """Add a freshly generated image to the campaign's reuse index"""
+    blob = url.rsplit("/", 1)[-1]
+    with _index_lock:
+        index = load_reuse_index(campaign_id)
+        index["stats"]["generated"] += 1
+        if image_store.parse_blob_name(blob):
+            index["entries"].append({
+                "url": url,
+                "blob": blob,
+                "prompt": prompt,
+                "location": location or "",
+                "party": list(party or []),
+                "reused": 0,
+                "created_at": datetime.utcnow().isoformat() + "Z",
+            })
+        save_campaign_json(campaign_id, REUSE_FILENAME, index)
+
+
+def reuse_report(campaign_id: str) -> dict:
+    """Reuse settings, hit counts, estimated savings and recent similarity scores"""
+    index = load_reuse_index(campaign_id)
+    stats = index["stats"]
+    lookups = stats["generated"] + stats["reused"]
+    return {
+        **reuse_settings(campaign_id),
+        "indexed_images": len(index["entries"]),
+        "generated": stats["generated"],
+        "reused": stats["reused"],
+        "reuse_rate": round(stats["reused"] / lookups, 3) if lookups else 0.0,
+        "estimated_savings_usd": round(stats["reused"] * COST_PER_IMAGE_USD, 4),
+        "recent": index["recent"],
+    }
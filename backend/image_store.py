@@ -0,0 +1,311 @@
+"""
+Image store
+Content-addressed blob storage for images (data/blobs/<aa>/<sha256>.<ext>)
+with reference counts from sessions, archives and banners, deduplication
+across campaigns, and a grace-period garbage collector
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Optional
+
+import config
+from interprocess import FileLock
+
+BLOBS_DIRNAME = "blobs"
+REFS_FILENAME = "refs.json"
+
+# Unreferenced blobs are kept this long before GC may delete them
+GC_GRACE_SECONDS = 24 * 3600
+
+# Seconds between background GC passes
+GC_INTERVAL_SECONDS = 3600
+
+BLOB_NAME_RE = re.compile(r"^([0-9a-f]{64})(\.[a-z0-9]+)$")
+
+# Guards refs.json, which every worker process writes
+_lock = FileLock("image_store")
+
+
+# === Holders ===
+
+def session_holder(campaign_id: str) -> str:
+    """Holder for images shown in a campaign's current session"""
+    return f"session:{campaign_id}"
+
+
+def archive_holder(campaign_id: str) -> str:
+    """Holder for images a campaign chose to keep"""
+    return f"archive:{campaign_id}"
+
+
+def banner_holder(campaign_id: str) -> str:
+    return f"banner:{campaign_id}"
+
+
+def library_holder(campaign_id: str) -> str:
+    """Holder for generated images a campaign retains after their session, within its quota"""
+    return f"library:{campaign_id}"
+
+
+def campaign_holders(campaign_id: str) -> tuple[str, ...]:
+    return (session_holder(campaign_id), archive_holder(campaign_id), banner_holder(campaign_id),
+            library_holder(campaign_id))
+
+
+# === Paths and index ===
+
+def get_blobs_dir() -> str:
+    return os.path.join(config.DATA_DIR, BLOBS_DIRNAME)
+
+
+def get_incoming_dir() -> str:
+    """Scratch directory downloads stream into before they are hashed into the store"""
+    return os.path.join(get_blobs_dir(), "incoming")
+
+
+def blob_name(sha: str, ext: str) -> str:
+    return f"{sha}{ext}"
+
+
+def blob_dir(sha: str) -> str:
+    """Directory holding a blob (and its derived/ renditions)"""
+    return os.path.join(get_blobs_dir(), sha[:2])
+
+
+def blob_path(sha: str, ext: str) -> str:
+    return os.path.join(blob_dir(sha), blob_name(sha, ext))
+
+
+def parse_blob_name(filename: str) -> Optional[tuple[str, str]]:
+    """(sha, ext) if filename names a blob, else None"""
+    match = BLOB_NAME_RE.match(filename)
+    return (match.group(1), match.group(2)) if match else None
+
+
+def _load_refs() -> dict:
+    filepath = os.path.join(get_blobs_dir(), REFS_FILENAME)
+    if os.path.exists(filepath):
+        with open(filepath, "r") as f:
+            return json.load(f)
+    return {}
+
+
+def _save_refs(refs: dict):
+    blobs_dir = get_blobs_dir()
+    os.makedirs(blobs_dir, exist_ok=True)
+    filepath = os.path.join(blobs_dir, REFS_FILENAME)
+    temp_filepath = filepath + ".tmp"
+    with open(temp_filepath, "w") as f:
+        json.dump(refs, f, indent=2)
+    os.replace(temp_filepath, filepath)
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat() + "Z"
+
+
+# === Writing ===
+
+def put_file(path: str, sha: str, ext: str, holder: Optional[str] = None) -> str:
+    """Move a file whose sha256 is known into the store; returns its blob name.
+
+    If the blob already exists (the same image from another campaign or
+    turn) the incoming file is discarded instead of stored twice.
+    """
+    dest = blob_path(sha, ext)
+    with _lock:
+        refs = _load_refs()
+        entry = refs.get(sha)
+        if entry and os.path.exists(blob_path(sha, entry["ext"])):
+            os.remove(path)
+            ext = entry["ext"]
+        else:
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            os.replace(path, dest)
+            if entry:
+                # The blob's file went missing: restore it for the holders still referencing it
+                entry.update(ext=ext, size=os.path.getsize(dest))
+            else:
+                entry = {"ext": ext, "size": os.path.getsize(dest), "created_at": _now(), "refs": [],
+                         "unreferenced_since": time.time()}
+                refs[sha] = entry
+        if holder and holder not in entry["refs"]:
+            entry["refs"].append(holder)
+            entry["unreferenced_since"] = None
+        _save_refs(refs)
+    return blob_name(sha, ext)
+
+
+def put_bytes(content: bytes, ext: str, holder: Optional[str] = None) -> str:
+    """Store in-memory content; returns its blob name"""
+    sha = hashlib.sha256(content).hexdigest()
+    os.makedirs(get_blobs_dir(), exist_ok=True)
+    temp_path = os.path.join(get_blobs_dir(), f".{uuid.uuid4().hex}.part")
+    with open(temp_path, "wb") as f:
+        f.write(content)
+    return put_file(temp_path, sha, ext, holder)
+
+
+def add_ref(sha: str, holder: str) -> bool:
+    """Reference a blob from a holder; False if the blob is unknown"""
+    with _lock:
+        refs = _load_refs()
+        entry = refs.get(sha)
+        if not entry:
+            return False
+        if holder not in entry["refs"]:
+            entry["refs"].append(holder)
+            entry["unreferenced_since"] = None
+            _save_refs(refs)
+        return True
+
+
+def remove_ref(sha: str, holder: str):
+    """Drop one holder's reference to a blob"""
+    with _lock:
+        refs = _load_refs()
+        entry = refs.get(sha)
+        if entry and holder in entry["refs"]:
+            entry["refs"].remove(holder)
+            if not entry["refs"]:
+                entry["unreferenced_since"] = time.time()
+            _save_refs(refs)
+
+
+def release_holder(holder: str, prefix: bool = False) -> int:
+    """Drop every reference held by a holder (or by all holders starting with it); returns blobs released"""
+    released = 0
+    with _lock:
+        refs = _load_refs()
+        now = time.time()
+        for entry in refs.values():
+            kept = [h for h in entry["refs"] if not (h.startswith(holder) if prefix else h == holder)]
+            if len(kept) != len(entry["refs"]):
+                entry["refs"] = kept
+                released += 1
+                if not kept:
+                    entry["unreferenced_since"] = now
+        if released:
+            _save_refs(refs)
+    return released
+
+
+def release_campaign(campaign_id: str) -> int:
+    """Drop every reference a campaign holds (campaign deleted)"""
+    return sum(release_holder(holder) for holder in campaign_holders(campaign_id))
+
+
+def blobs_held_by(campaign_id: str) -> list[str]:
+    """Blob names referenced by any of a campaign's holders"""
+    holders = set(campaign_holders(campaign_id))
+    return [
+        blob_name(sha, entry["ext"]) for sha, entry in _load_refs().items()
+        if holders.intersection(entry["refs"])
+    ]
+
+
+def blob_holdings(campaign_id: str) -> dict[str, list[str]]:
+    """Blob names referenced by a campaign, each with the kinds of holder (session, archive, ...) referencing it"""
+    holders = set(campaign_holders(campaign_id))
+    return {
+        blob_name(sha, entry["ext"]): [holder.split(":", 1)[0] for holder in entry["refs"] if holder in holders]
+        for sha, entry in _load_refs().items() if holders.intersection(entry["refs"])
+    }
+
+
+def get_blob(sha: str) -> Optional[dict]:
+    """Index entry for a blob, or None"""
+    return _load_refs().get(sha)
+
+
+def get_blobs() -> dict[str, dict]:
+    """Index entries for every blob by sha, from one read of the index"""
+    return _load_refs()
+
+
+# === Garbage collection ===
+
+def _reclaimable(refs: dict, grace_seconds: float, now: float) -> list[str]:
+    return [
+        sha for sha, entry in refs.items()
+        if not entry["refs"] and entry.get("unreferenced_since") is not None
+        and now - entry["unreferenced_since"] >= grace_seconds
+    ]
+
+
+def storage_report(grace_seconds: float = GC_GRACE_SECONDS) -> dict:
+    """Blob counts and bytes: total, unreferenced, and reclaimable now (past the grace period)"""
+    refs = _load_refs()
+    now = time.time()
+    reclaimable = set(_reclaimable(refs, grace_seconds, now))
+    unreferenced = [sha for sha, entry in refs.items() if not entry["refs"]]
+    return {
+        "blobs": len(refs),
+        "bytes": sum(entry["size"] for entry in refs.values()),
+        "unreferenced_blobs": len(unreferenced),
+        "unreferenced_bytes": sum(refs[sha]["size"] for sha in unreferenced),
+        "reclaimable_blobs": len(reclaimable),
+        "reclaimable_bytes": sum(refs[sha]["size"] for sha in reclaimable),
+        "grace_seconds": grace_seconds,
+    }
+
+
+def collect_garbage(grace_seconds: float = GC_GRACE_SECONDS) -> dict:
+    """Delete blobs (and their renditions) unreferenced for longer than the grace period"""
+    with _lock:
+        refs = _load_refs()
+        doomed = _reclaimable(refs, grace_seconds, time.time())
+        freed = 0
+        for sha in doomed:
+            entry = refs.pop(sha)
+            path = blob_path(sha, entry["ext"])
+            if os.path.exists(path):
+                os.remove(path)
+            derived = os.path.join(blob_dir(sha), "derived")
+            if os.path.isdir(derived):
+                for name in os.listdir(derived):
+                    if name.startswith(sha + "."):
+                        os.remove(os.path.join(derived, name))
+            freed += entry["size"]
+        if doomed:
+            _save_refs(refs)
+    return {"deleted_blobs": len(doomed), "freed_bytes": freed}
+
+
+class GarbageCollector:
+    """Background thread running collect_garbage on an interval"""
+
+    def __init__(self, interval: float = GC_INTERVAL_SECONDS):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="image-store-gc", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                collect_garbage()
+            except OSError as e:
+                print(f"Image store GC failed: {e}")
+
+
+gc = GarbageCollector()
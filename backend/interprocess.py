@@ -0,0 +1,61 @@
+"""
+Interprocess locks
+Re-entrant locks that serialize threads within a process and, through
+flock(2) on a file under data/locks/, processes sharing the data directory,
+for files every worker writes (campaigns.json, the image store index)
+"""
+
+import os
+import threading
+
+import config
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, so single-process only
+    fcntl = None
+
+LOCKS_DIRNAME = "locks"
+
+
+class FileLock:
+    """A named lock held across threads and processes; re-entrant within a thread"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def path(self) -> str:
+        return os.path.join(config.DATA_DIR, LOCKS_DIRNAME, f"{self.name}.lock")
+
+    def acquire(self):
+        self._thread_lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                os.makedirs(os.path.dirname(self.path()), exist_ok=True)
+                self._file = open(self.path(), "a")
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            except BaseException:
+                if self._file:
+                    self._file.close()
+                    self._file = None
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0 and self._file is not None:
+            # Closing the file drops the flock
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
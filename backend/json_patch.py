@@ -0,0 +1,175 @@
+"""
+JSON Patch
+RFC 6902 patches (add, remove, replace, move, copy, test) applied to plain
+JSON documents. Containers along each patched path are copied, the rest of
+the document is shared with the input, which is never modified
+"""
+
+from typing import Any
+
+OPERATIONS = ("add", "remove", "replace", "move", "copy", "test")
+
+
+class JsonPatchError(ValueError):
+    """A malformed patch, or one that can't be applied to the document"""
+
+    def __init__(self, message: str, index: int = None):
+        self.index = index
+        super().__init__(message if index is None else f"Operation {index}: {message}")
+
+
+class JsonPatchTestFailed(JsonPatchError):
+    """A 'test' operation did not match"""
+
+
+def parse_pointer(pointer: str) -> list[str]:
+    """Reference tokens of an RFC 6901 JSON pointer ('' is the whole document)"""
+    if not isinstance(pointer, str):
+        raise JsonPatchError(f"Pointer must be a string, got {type(pointer).__name__}")
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise JsonPatchError(f"Pointer '{pointer}' must start with '/'")
+    return [token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")]
+
+
+def _list_index(container: list, token: str, allow_end: bool = False) -> int:
+    if token == "-" and allow_end:
+        return len(container)
+    if not token.isdigit() or (token != "0" and token.startswith("0")):
+        raise JsonPatchError(f"'{token}' is not a valid array index")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise JsonPatchError(f"Array index {index} is out of range")
+    return index
+
+
+def _child(container: Any, token: str) -> Any:
+    if isinstance(container, dict):
+        if token not in container:
+            raise JsonPatchError(f"Member '{token}' does not exist")
+        return container[token]
+    if isinstance(container, list):
+        return container[_list_index(container, token)]
+    raise JsonPatchError(f"Cannot reference '{token}' inside a {type(container).__name__}")
+
+
+def resolve(doc: Any, tokens: list[str]) -> Any:
+    """Value at a parsed pointer"""
+    for token in tokens:
+        doc = _child(doc, token)
+    return doc
+
+
+def _copy_path(doc: Any, parents: list[str]) -> tuple[Any, Any]:
+    """(new root, new parent) with every container from the root to the parent copied"""
+    root = doc.copy() if isinstance(doc, (dict, list)) else doc
+    node = root
+    for token in parents:
+        child = _child(node, token)
+        if not isinstance(child, (dict, list)):
+            raise JsonPatchError(f"Cannot reference inside a {type(child).__name__}")
+        child = child.copy()
+        node[_list_index(node, token) if isinstance(node, list) else token] = child
+        node = child
+    return root, node
+
+
+def _add(doc: Any, tokens: list[str], value: Any) -> Any:
+    if not tokens:
+        return value
+    root, parent = _copy_path(doc, tokens[:-1])
+    token = tokens[-1]
+    if isinstance(parent, dict):
+        parent[token] = value
+    else:
+        parent.insert(_list_index(parent, token, allow_end=True), value)
+    return root
+
+
+def _remove(doc: Any, tokens: list[str]) -> tuple[Any, Any]:
+    """(new document, removed value)"""
+    if not tokens:
+        raise JsonPatchError("Cannot remove the whole document")
+    root, parent = _copy_path(doc, tokens[:-1])
+    token = tokens[-1]
+    removed = _child(parent, token)
+    if isinstance(parent, dict):
+        del parent[token]
+    else:
+        del parent[_list_index(parent, token)]
+    return root, removed
+
+
+def _equal(a: Any, b: Any) -> bool:
+    # bool is an int in Python, but true and 1 are different JSON values
+    if isinstance(a, bool) or isinstance(b, bool):
+        return type(a) is type(b) and a == b
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(_equal(a[k], b[k]) for k in a)
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(_equal(x, y) for x, y in zip(a, b))
+    return a == b
+
+
+def _apply_one(doc: Any, op: dict) -> Any:
+    kind = op.get("op")
+    tokens = parse_pointer(op.get("path"))
+
+    if kind in ("add", "replace", "test") and "value" not in op:
+        raise JsonPatchError(f"'{kind}' requires a value")
+    if kind == "add":
+        return _add(doc, tokens, op["value"])
+    if kind == "remove":
+        return _remove(doc, tokens)[0]
+    if kind == "replace":
+        resolve(doc, tokens)
+        if not tokens:
+            return op["value"]
+        root, parent = _copy_path(doc, tokens[:-1])
+        parent[_list_index(parent, tokens[-1]) if isinstance(parent, list) else tokens[-1]] = op["value"]
+        return root
+    if kind == "test":
+        if not _equal(resolve(doc, tokens), op["value"]):
+            raise JsonPatchTestFailed(f"Test failed at '{op['path']}'")
+        return doc
+
+    if kind in ("move", "copy"):
+        if "from" not in op:
+            raise JsonPatchError(f"'{kind}' requires from")
+        source = parse_pointer(op["from"])
+        if kind == "copy":
+            return _add(doc, tokens, resolve(doc, source))
+        if tokens[:len(source)] == source and tokens != source:
+            raise JsonPatchError("Cannot move a value into one of its own children")
+        doc, value = _remove(doc, source)
+        return _add(doc, tokens, value)
+
+    raise JsonPatchError(f"Unknown op '{kind}', expected one of {', '.join(OPERATIONS)}")
+
+
+def apply_patch(doc: Any, patch: list) -> Any:
+    """Patched copy of doc. All or nothing: raises JsonPatchError and leaves doc as it was."""
+    if not isinstance(patch, list):
+        raise JsonPatchError("A patch must be an array of operations")
+    for index, op in enumerate(patch):
+        if not isinstance(op, dict):
+            raise JsonPatchError("Operation must be an object", index)
+        try:
+            doc = _apply_one(doc, op)
+        except JsonPatchError as e:
+            raise type(e)(str(e), index) from None
+    return doc
+
+
+def touched_sections(patch: list) -> set[str]:
+    """Top-level members a (well-formed) patch writes to; '' if it replaces the whole document"""
+    sections = set()
+    for op in patch:
+        paths = [op.get("path")] if op.get("op") != "test" else []
+        if op.get("op") == "move":
+            paths.append(op.get("from"))
+        for path in paths:
+            tokens = parse_pointer(path)
+            sections.add(tokens[0] if tokens else "")
+    return sections
@@ -0,0 +1,272 @@
+"""
+Knowledge Index
+Local BM25 retrieval over campaign knowledge (NPCs, locations, facts,
+secrets and reveals, DM prep notes) used to pick what goes into the DM prompt
+"""
+
+import hashlib
+import re
+from collections import Counter
+from typing import Optional
+
+import numpy as np
+
+# Items kept in the prompt per turn, on top of the run's must-include items
+DEFAULT_TOP_K = 16
+
+# Chat turns from the session log folded into the retrieval query
+QUERY_TURNS = 4
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have he her his in is it its of on or "
+    "our she that the their them they this to was were will with you your".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercase word tokens with stopwords dropped and plurals folded"""
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+# === Items ===
+
+def _text_ids(prefix: str, texts: list[str]) -> list[str]:
+    """Stable ids keyed by content hash, so an edit elsewhere in a list never renumbers an item"""
+    ids, seen = [], Counter()
+    for text in texts:
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+        seen[digest] += 1
+        suffix = f"-{seen[digest]}" if seen[digest] > 1 else ""
+        ids.append(f"{prefix}:{digest}{suffix}")
+    return ids
+
+
+def _contains_phrase(tokens: list[str], phrase: list[str]) -> bool:
+    """Whether the token sequence contains the phrase as consecutive whole tokens"""
+    n = len(phrase)
+    if not n:
+        return False
+    return any(tokens[i:i + n] == phrase for i in range(len(tokens) - n + 1))
+
+
+def collect_knowledge_items(dm_context: dict, author_notes: Optional[list] = None) -> list[dict]:
+    """Flatten a DM context and author notes into retrievable items"""
+    items = []
+    for name, npc in dm_context["npc_states"].items():
+        items.append({
+            "id": f"npc:{name}",
+            "kind": "npc",
+            "label": name,
+            "text": f"{name} {npc['species']} {npc['role']} {npc['wants']} {npc['secret']}",
+        })
+    for loc in dm_context["campaign_context"].get("locations", []):
+        items.append({
+            "id": f"location:{loc['name']}",
+            "kind": "location",
+            "label": loc["name"],
+            "text": f"{loc['name']} {loc['vibe']} {' '.join(loc['contains'])}",
+        })
+    facts = dm_context["party_knows"]
+    for item_id, fact in zip(_text_ids("fact", facts), facts):
+        items.append({"id": item_id, "kind": "fact", "label": fact, "text": fact})
+    secrets = dm_context["party_does_not_know"]
+    for item_id, secret in zip(_text_ids("secret", secrets), secrets):
+        items.append({"id": item_id, "kind": "secret", "label": secret, "text": secret})
+    for i, note in enumerate(author_notes or []):
+        note_id = note.get("id") or str(i)
+        text = note.get("content", "")
+        if note.get("related_to"):
+            text += f" {note['related_to']}"
+        items.append({
+            "id": f"note:{note_id}",
+            "kind": "note",
+            "label": note.get("content", ""),
+            "text": text,
+            "related_to": note.get("related_to"),
+        })
+    return items
+
+
+def must_include_ids(dm_context: dict, items: list[dict]) -> set[str]:
+    """Items the current run always needs: named in its hook, goal or must-include list, or its reveal"""
+    run = dm_context["run"]
+    run_tokens = tokenize(" ".join([run.get("hook", ""), run.get("goal", "")] + list(run.get("must_include", []))))
+    reveal = (run.get("reveal") or "").lower()
+
+    keep = set()
+    for item in items:
+        # Names match on whole tokens so "Ash" never matches "crash"
+        if item["kind"] in ("npc", "location") and _contains_phrase(run_tokens, tokenize(item["label"])):
+            keep.add(item["id"])
+        elif item["kind"] == "secret" and reveal and reveal in item["label"].lower():
+            keep.add(item["id"])
+
+    # Notes tied to the run itself or to anything it names come along too
+    related = {run.get("id") or ""} | {
+        item["label"].lower() for item in items if item["id"] in keep and item["kind"] in ("npc", "location")
+    }
+    related.discard("")
+    for item in items:
+        if item["kind"] == "note" and (item.get("related_to") or "").lower() in related:
+            keep.add(item["id"])
+    return keep
+
+
+def build_retrieval_query(session: Optional[dict], message: str = "", turns: int = QUERY_TURNS) -> str:
+    """Query text from the latest chat turns plus the incoming player message"""
+    parts = []
+    if session and session.get("log"):
+        chat = [e.get("content", "") for e in session["log"] if e.get("type") == "chat"]
+        parts.extend(chat[-turns:])
+    if message:
+        parts.append(message)
+    return "\n".join(parts)
+
+
+# === Index ===
+
+class KnowledgeIndex:
+    """BM25 index with a precomputed term-weight matrix for vectorized scoring.
+
+    Tokenized items are cached by (id, text); seeding a new index with the
+    previous one's cache means a rebuild after a content or note edit only
+    re-tokenizes the items that actually changed.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, previous: Optional["KnowledgeIndex"] = None):
+        self.k1 = k1
+        self.b = b
+        self.ids: list[str] = []
+        self.vocab: dict[str, int] = {}
+        self.weights = np.zeros((0, 0), dtype=np.float32)
+        self._token_cache: dict[tuple, Counter] = previous._token_cache if previous else {}
+
+    def update(self, items: list[dict]) -> int:
+        """Re-index the given items; returns how many needed tokenizing"""
+        cache: dict[tuple, Counter] = {}
+        counts = []
+        tokenized = 0
+        for item in items:
+            key = (item["id"], item["text"])
+            counter = self._token_cache.get(key)
+            if counter is None:
+                counter = Counter(tokenize(item["text"]))
+                tokenized += 1
+            cache[key] = counter
+            counts.append(counter)
+        self._token_cache = cache
+        self.ids = [item["id"] for item in items]
+
+        vocab: dict[str, int] = {}
+        for counter in counts:
+            for term in counter:
+                vocab.setdefault(term, len(vocab))
+        self.vocab = vocab
+
+        tf = np.zeros((len(counts), len(vocab)), dtype=np.float32)
+        for row, counter in enumerate(counts):
+            for term, n in counter.items():
+                tf[row, vocab[term]] = n
+
+        if not counts or not vocab:
+            self.weights = tf
+            return tokenized
+
+        doc_len = tf.sum(axis=1)
+        avg_len = float(doc_len.mean()) or 1.0
+        df = (tf > 0).sum(axis=0)
+        idf = np.log1p((len(counts) - df + 0.5) / (df + 0.5)).astype(np.float32)
+        norm = self.k1 * (1 - self.b + self.b * doc_len / avg_len)
+        self.weights = idf * (tf * (self.k1 + 1)) / (tf + norm[:, None])
+        return tokenized
+
+    def score(self, query: str) -> np.ndarray:
+        """BM25 score of every indexed item against the query"""
+        term_ids = [self.vocab[t] for t in tokenize(query) if t in self.vocab]
+        if not term_ids or not len(self.ids):
+            return np.zeros(len(self.ids), dtype=np.float32)
+        return self.weights[:, term_ids].sum(axis=1)
+
+    def select(self, query: str, top_k: int = DEFAULT_TOP_K, always: Optional[set] = None,
+               kinds: Optional[list[str]] = None) -> dict:
+        """Pick the top-k items for a query on top of the always-kept ids.
+
+        When everything fits in k, every item is kept. When the query matches
+        nothing (e.g. the opening turn of a run) and kinds are given, the k
+        slots are shared round-robin across kinds instead of going to
+        whichever kind is indexed first.
+        """
+        always = always or set()
+        scores = self.score(query)
+        chosen = {i for i, item_id in enumerate(self.ids) if item_id in always}
+
+        if len(self.ids) - len(chosen) <= top_k:
+            order = range(len(self.ids))
+        elif not scores.any() and kinds is not None:
+            order = self._balanced_order(kinds)
+        else:
+            order = [int(i) for i in np.argsort(-scores, kind="stable")]
+
+        retrieved = 0
+        for i in order:
+            if retrieved >= top_k:
+                break
+            if i not in chosen:
+                chosen.add(i)
+                retrieved += 1
+
+        return {
+            "ids": {self.ids[i] for i in chosen},
+            "scores": {self.ids[i]: round(float(scores[i]), 3) for i in chosen},
+            "candidates": len(self.ids),
+        }
+
+    def _balanced_order(self, kinds: list[str]) -> list[int]:
+        by_kind: dict[str, list[int]] = {}
+        for i, kind in enumerate(kinds):
+            by_kind.setdefault(kind, []).append(i)
+        order = []
+        queues = list(by_kind.values())
+        depth = 0
+        while len(order) < len(kinds):
+            for queue in queues:
+                if depth < len(queue):
+                    order.append(queue[depth])
+            depth += 1
+        return order
+
+
+# === Filtering ===
+
+def filter_dm_context(dm_context: dict, author_notes: Optional[list], selected_ids: set) -> tuple[dict, list]:
+    """Restrict a DM context and author notes to the selected items, keeping their order"""
+    campaign = dm_context["campaign_context"]
+    fact_ids = _text_ids("fact", dm_context["party_knows"])
+    secret_ids = _text_ids("secret", dm_context["party_does_not_know"])
+    filtered = {
+        **dm_context,
+        "campaign_context": {
+            **campaign,
+            "locations": [loc for loc in campaign.get("locations", []) if f"location:{loc['name']}" in selected_ids],
+        },
+        "party_knows": [f for f, i in zip(dm_context["party_knows"], fact_ids) if i in selected_ids],
+        "party_does_not_know": [
+            s for s, i in zip(dm_context["party_does_not_know"], secret_ids) if i in selected_ids
+        ],
+        "npc_states": {
+            name: npc for name, npc in dm_context["npc_states"].items() if f"npc:{name}" in selected_ids
+        },
+    }
+    notes = [
+        note for i, note in enumerate(author_notes or [])
+        if f"note:{note.get('id') or str(i)}" in selected_ids
+    ]
+    return filtered, notes
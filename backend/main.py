@@ -3,18 +3,39 @@ Weave - Backend Server
 FastAPI application for managing game state and AI DM integration
 """
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 
-from config import IMAGES_DIR
-from routes import templates, campaigns, campaign_content, dm_prep, characters, town, sessions, dm_ai
+from config import IMAGES_DIR, WORKER_INDEX
+from access_tracker import tracker
+import image_derivatives
+import downloads
+import image_store
+from routes import templates, campaigns, campaign_content, dm_prep, characters, town, sessions, dm_ai, internal
 
 # Load environment variables from .env file
 load_dotenv()
 
-app = FastAPI(title="Weave", version="1.0.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Flush batched access times on an interval and once more on shutdown
+    tracker.start()
+    # Blob GC covers the whole store, so only one worker runs it
+    if WORKER_INDEX == 0:
+        image_store.gc.start()
+    yield
+    image_store.gc.stop()
+    tracker.stop()
+    image_derivatives.shutdown()
+    downloads.close_client()
+
+
+app = FastAPI(title="Weave", version="1.0.0", lifespan=lifespan)
 
 # CORS for frontend
 app.add_middleware(
@@ -37,6 +58,7 @@ app.include_router(characters.router)
 app.include_router(town.router)
 app.include_router(sessions.router)
 app.include_router(dm_ai.router)
+app.include_router(internal.router)
 
 
 @app.get("/")
@@ -2,7 +2,7 @@
 Pydantic request/response models for API endpoints
 """
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 
 
@@ -54,6 +54,11 @@ class ImageRequest(BaseModel):
     prompt: str
     style: str = "scene"  # "scene", "character", "enemy", "item"
 
+class ImageBatchRequest(BaseModel):
+    items: List[ImageRequest] = []
+    seed: List[str] = []  # campaign.json sources to add prompts from: "npcs", "locations"
+    concurrency: Optional[int] = Field(None, ge=1, le=8)
+
 class CampaignCreate(BaseModel):
     name: str
     description: str = ""
@@ -64,6 +69,10 @@ class CampaignUpdate(BaseModel):
     name: Optional[str] = None
     description: Optional[str] = None
     currencyName: Optional[str] = None
+    imageReuse: Optional[bool] = None  # serve earlier images for similar scenes
+    imageReuseThreshold: Optional[float] = Field(None, ge=0.0, le=1.0)
+    imageQuotaBytes: Optional[int] = Field(None, ge=1)  # retained generated images, per campaign
+    imageQuotaCount: Optional[int] = Field(None, ge=1)
 
 class CampaignContentRequest(BaseModel):
     """Request body for campaign content"""
@@ -77,6 +86,16 @@ class RunCompleteRequest(BaseModel):
     locations_visited: list = []
 
 
+class SimulationRequest(BaseModel):
+    """Request body for simulating campaign playthroughs"""
+    playthroughs: int = Field(10000, ge=1, le=200000)
+    victory: float = Field(0.7, ge=0.0, le=1.0)  # chance a run is won
+    failed: float = Field(0.2, ge=0.0, le=1.0)  # chance a run is failed; the rest are retreats
+    max_runs: int = Field(100, ge=1, le=1000)
+    seed: Optional[int] = None
+    from_current_state: bool = False  # simulate on from the campaign's state instead of a fresh start
+
+
 # DM Prep request models
 class DMPrepMessageRequest(BaseModel):
     message: str
@@ -0,0 +1,83 @@
+"""
+Ordered set
+Insertion-ordered set for campaign state collections: O(1) membership,
+duplicates ignored, and a stable order that serializes as a plain JSON list
+"""
+
+from collections.abc import MutableSet
+from typing import Any, Generic, Iterable, Iterator, TypeVar, get_args
+
+from pydantic_core import core_schema
+
+T = TypeVar("T")
+
+
+class OrderedSet(MutableSet, Generic[T]):
+    """A set that remembers insertion order (backed by a dict's keys).
+
+    Keeps the list methods state code already uses (append, extend, indexing)
+    so it can replace a list field without touching every caller.
+    """
+
+    __slots__ = ("_items",)
+
+    def __init__(self, items: Iterable[T] = ()):
+        self._items: dict[T, None] = dict.fromkeys(items)
+
+    # --- Set protocol ---
+
+    def __contains__(self, item: object) -> bool:
+        return item in self._items
+
+    def __iter__(self) -> Iterator[T]:
+        return iter(self._items)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def add(self, item: T):
+        self._items[item] = None
+
+    def discard(self, item: T):
+        self._items.pop(item, None)
+
+    # --- List-compatible helpers ---
+
+    def append(self, item: T):
+        self.add(item)
+
+    def extend(self, items: Iterable[T]):
+        for item in items:
+            self._items[item] = None
+
+    update = extend
+
+    def __getitem__(self, index):
+        items = list(self._items)
+        return items[index]
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, OrderedSet):
+            return list(self._items) == list(other._items)
+        if isinstance(other, (list, tuple)):
+            return list(self._items) == list(other)
+        if isinstance(other, (set, frozenset)):
+            return set(self._items) == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"OrderedSet({list(self._items)!r})"
+
+    # --- Pydantic ---
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source: Any, handler) -> core_schema.CoreSchema:
+        args = get_args(source)
+        item_schema = handler.generate_schema(args[0]) if args else core_schema.any_schema()
+        from_list = core_schema.no_info_after_validator_function(cls, core_schema.list_schema(item_schema))
+        return core_schema.union_schema(
+            [core_schema.is_instance_schema(cls), from_list],
+            serialization=core_schema.plain_serializer_function_ser_schema(list),
+        )
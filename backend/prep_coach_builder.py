@@ -63,7 +63,8 @@ def build_prep_coach_context(
     campaign_content: Optional[Dict[str, Any]],
     campaign_state: Optional[Dict[str, Any]],
     dm_prep_data: Optional[Dict[str, Any]],
-    system_config: Dict[str, Any]
+    system_config: Dict[str, Any],
+    conversation_summary: Optional[str] = None
 ) -> str:
     """
     Build the context injection for the Prep Coach.
@@ -73,6 +74,7 @@ def build_prep_coach_context(
         campaign_state: Current runtime state (if mid-campaign)
         dm_prep_data: Existing DM prep notes and pinned insights
         system_config: The campaign's system configuration
+        conversation_summary: Summary of earlier messages no longer sent verbatim
 
     Returns:
         Context string to inject into the system prompt
@@ -206,9 +208,67 @@ def build_prep_coach_context(
                 system_section += f"\n**DM Tone Guidelines:**\n{dm_tone}\n"
             sections.append(system_section)
 
+    # Earlier conversation that has scrolled out of the history window
+    if conversation_summary:
+        sections.append(
+            "## Earlier in This Conversation\n\n"
+            "*Summary of earlier messages with the author:*\n\n"
+            f"{conversation_summary}\n"
+        )
+
     return "\n---\n\n".join(sections) if sections else ""
 
 
+def build_conversation_summary_prompt(previous_summary: str, messages: List[Dict[str, Any]]) -> str:
+    """
+    Build a prompt that folds older conversation messages into the rolling summary.
+
+    Args:
+        previous_summary: The current rolling summary (may be empty)
+        messages: Messages that have fallen out of the history window, oldest first
+
+    Returns:
+        Prompt asking the model for an updated summary
+    """
+    transcript = ""
+    for msg in messages:
+        speaker = "Author" if msg.get('role') == 'user' else "Coach"
+        transcript += f"{speaker}: {msg.get('content', '')}\n\n"
+
+    return f"""Update the running summary of a campaign prep conversation between an author and their Prep Coach.
+
+Current summary:
+{previous_summary or '(none yet)'}
+
+New messages to fold in:
+{transcript}
+Rules:
+- Output ONLY the updated summary, nothing else
+- Use short bullet points
+- Keep decisions, NPC voice ideas, pacing plans, and open questions
+- Drop pleasantries and anything already captured
+- Stay under 300 words"""
+
+
+def fallback_conversation_summary(previous_summary: str, messages: List[Dict[str, Any]]) -> str:
+    """
+    Extractive summary used when the model is unavailable.
+
+    Args:
+        previous_summary: The current rolling summary (may be empty)
+        messages: Messages that have fallen out of the history window, oldest first
+
+    Returns:
+        The previous summary with a clipped line appended per author message
+    """
+    lines = [previous_summary] if previous_summary else []
+    for msg in messages:
+        if msg.get('role') == 'user':
+            content = msg.get('content', '').strip().replace('\n', ' ')
+            lines.append(f"- Author asked about: {content[:160]}")
+    return "\n".join(lines)
+
+
 def format_notes_for_dm_context(notes: List[Dict[str, Any]]) -> str:
     """
     Format DM prep notes for injection into the gameplay DM context.
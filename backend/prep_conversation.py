@@ -0,0 +1,271 @@
+"""
+Prep Coach conversation log
+Append-only, segmented storage for the prep coach chat history, kept apart
+from the notes and pins in dm_prep.json
+"""
+
+import json
+import os
+import shutil
+import threading
+from datetime import datetime
+from typing import Optional
+
+from helpers import estimate_tokens, get_campaign_dir, load_campaign_json, save_campaign_json
+
+CONVERSATION_DIRNAME = "prep_conversation"
+INDEX_FILENAME = "index.json"
+
+# Inline conversations that could not be merged into an existing log are kept here
+LEGACY_FILENAME = "legacy_conversation.json"
+
+# Messages per segment file before a new segment is started
+SEGMENT_MAX_MESSAGES = 200
+
+# Token budget for the history window sent to the model with each message
+HISTORY_TOKEN_BUDGET = 6000
+
+# Largest page of history returned by a single read
+MAX_PAGE_SIZE = 200
+
+# Upper bound on the rolling summary of older messages
+SUMMARY_MAX_CHARS = 4000
+
+_locks: dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def _campaign_lock(campaign_id: str) -> threading.Lock:
+    with _locks_guard:
+        if campaign_id not in _locks:
+            _locks[campaign_id] = threading.Lock()
+        return _locks[campaign_id]
+
+
+# === Paths and index ===
+
+def get_conversation_dir(campaign_id: str) -> str:
+    """Get the conversation log directory for a campaign"""
+    return os.path.join(get_campaign_dir(campaign_id), CONVERSATION_DIRNAME)
+
+
+def _empty_index() -> dict:
+    return {"next_seq": 1, "segments": [], "summary": "", "summarized_through": 0}
+
+
+def load_index(campaign_id: str) -> dict:
+    """Load the segment index and rolling summary for a campaign's log"""
+    filepath = os.path.join(get_conversation_dir(campaign_id), INDEX_FILENAME)
+    if os.path.exists(filepath):
+        with open(filepath, "r") as f:
+            return {**_empty_index(), **json.load(f)}
+    return _empty_index()
+
+
+def _save_index(campaign_id: str, index: dict):
+    log_dir = get_conversation_dir(campaign_id)
+    os.makedirs(log_dir, exist_ok=True)
+    filepath = os.path.join(log_dir, INDEX_FILENAME)
+    temp_filepath = filepath + ".tmp"
+    with open(temp_filepath, "w") as f:
+        json.dump(index, f, indent=2)
+    os.replace(temp_filepath, filepath)
+
+
+def _read_segment(campaign_id: str, segment: dict) -> list[dict]:
+    filepath = os.path.join(get_conversation_dir(campaign_id), segment["name"])
+    if not os.path.exists(filepath):
+        return []
+    messages = []
+    with open(filepath, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                messages.append(json.loads(line))
+            except json.JSONDecodeError:
+                # A torn final line from an interrupted append; skip it
+                continue
+    return messages
+
+
+# === Writing ===
+
+def append_messages(campaign_id: str, messages: list[dict]) -> list[dict]:
+    """Append messages to the log, returning them with sequence numbers assigned"""
+    if not messages:
+        return []
+
+    with _campaign_lock(campaign_id):
+        return _append_locked(campaign_id, messages)
+
+
+def _append_locked(campaign_id: str, messages: list[dict]) -> list[dict]:
+    index = load_index(campaign_id)
+    log_dir = get_conversation_dir(campaign_id)
+    os.makedirs(log_dir, exist_ok=True)
+    now = datetime.utcnow().isoformat() + "Z"
+
+    written = []
+    pending = list(messages)
+    while pending:
+        segments = index["segments"]
+        if not segments or segments[-1]["count"] >= SEGMENT_MAX_MESSAGES:
+            segments.append({
+                "name": f"segment_{len(segments) + 1:06d}.jsonl",
+                "first_seq": index["next_seq"],
+                "last_seq": index["next_seq"] - 1,
+                "count": 0,
+            })
+        segment = segments[-1]
+        room = SEGMENT_MAX_MESSAGES - segment["count"]
+        batch, pending = pending[:room], pending[room:]
+
+        lines = []
+        for msg in batch:
+            entry = {
+                "seq": index["next_seq"],
+                "role": msg.get("role", "user"),
+                "content": msg.get("content", ""),
+                "created_at": msg.get("created_at", now),
+            }
+            index["next_seq"] += 1
+            lines.append(json.dumps(entry))
+            written.append(entry)
+
+        with open(os.path.join(log_dir, segment["name"]), "a") as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        segment["count"] += len(batch)
+        segment["last_seq"] = index["next_seq"] - 1
+
+    _save_index(campaign_id, index)
+    return written
+
+
+def update_summary(campaign_id: str, summary: str, through_seq: int):
+    """Record a new rolling summary covering every message up to through_seq"""
+    with _campaign_lock(campaign_id):
+        index = load_index(campaign_id)
+        if through_seq <= index["summarized_through"]:
+            return
+        index["summary"] = summary[-SUMMARY_MAX_CHARS:]
+        index["summarized_through"] = through_seq
+        _save_index(campaign_id, index)
+
+
+def clear_conversation(campaign_id: str):
+    """Delete the whole conversation log for a campaign"""
+    with _campaign_lock(campaign_id):
+        log_dir = get_conversation_dir(campaign_id)
+        if os.path.exists(log_dir):
+            shutil.rmtree(log_dir)
+
+
+def migrate_inline_conversation(campaign_id: str) -> bool:
+    """Move a legacy inline dm_prep.json conversation out of the prep file.
+
+    Runs once under the campaign's log lock. Into an empty log the messages
+    are appended; if the log already has history (a migration interrupted
+    after the append) they are set aside in legacy_conversation.json rather
+    than duplicated or dropped. Returns True if they went into the log.
+    """
+    with _campaign_lock(campaign_id):
+        data = load_campaign_json(campaign_id, "dm_prep.json")
+        conversation = data.get("conversation") or []
+        if not conversation:
+            return False
+
+        migrated = load_index(campaign_id)["next_seq"] == 1
+        if migrated:
+            _append_locked(campaign_id, conversation)
+        else:
+            legacy_path = os.path.join(get_conversation_dir(campaign_id), LEGACY_FILENAME)
+            legacy = []
+            if os.path.exists(legacy_path):
+                with open(legacy_path, "r") as f:
+                    legacy = json.load(f)
+            legacy.extend(conversation)
+            with open(legacy_path + ".tmp", "w") as f:
+                json.dump(legacy, f, indent=2)
+            os.replace(legacy_path + ".tmp", legacy_path)
+
+        data["conversation"] = []
+        save_campaign_json(campaign_id, "dm_prep.json", data)
+        return migrated
+
+
+# === Reading ===
+
+def read_page(campaign_id: str, before: Optional[int] = None, limit: int = 50) -> dict:
+    """Read one page of history ending just before the given sequence number.
+
+    Pages walk backwards from the newest message; messages within a page are
+    in chronological order. Pass the returned `next_before` to get the
+    previous page.
+    """
+    index = load_index(campaign_id)
+    total = index["next_seq"] - 1
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    if before is None:
+        before = index["next_seq"]
+
+    collected: list[dict] = []
+    for segment in reversed(index["segments"]):
+        if len(collected) >= limit:
+            break
+        if segment["count"] == 0 or segment["first_seq"] >= before:
+            continue
+        older = [m for m in _read_segment(campaign_id, segment) if m["seq"] < before]
+        collected = older[-(limit - len(collected)):] + collected
+
+    first_seq = collected[0]["seq"] if collected else before
+    return {
+        "messages": collected,
+        "next_before": first_seq if collected else None,
+        "has_more": bool(collected) and first_seq > 1,
+        "total": total,
+    }
+
+
+def build_history_window(campaign_id: str, token_budget: int = HISTORY_TOKEN_BUDGET) -> dict:
+    """Select the messages to send verbatim and those due to be summarized.
+
+    Every message after the rolling summary is sent as long as the backlog fits
+    in the token budget. Once it overflows, the window shrinks to the newest
+    half-budget of messages and the rest are returned in `to_summarize`, so the
+    summary is refreshed in occasional batches rather than on every message.
+    The window always opens on a user turn.
+    """
+    index = load_index(campaign_id)
+    summarized_through = index["summarized_through"]
+
+    backlog: list[dict] = []
+    for segment in reversed(index["segments"]):
+        if segment["count"] == 0 or segment["last_seq"] <= summarized_through:
+            break
+        older = [m for m in _read_segment(campaign_id, segment) if m["seq"] > summarized_through]
+        backlog = older + backlog
+
+    costs = [estimate_tokens(m.get("content", "")) for m in backlog]
+    if sum(costs) <= token_budget:
+        window_start = 0
+    else:
+        window_start = len(backlog)
+        used = 0
+        while window_start > 0 and used + costs[window_start - 1] <= token_budget // 2:
+            window_start -= 1
+            used += costs[window_start]
+
+    # The model expects the conversation to open with a user turn
+    while window_start < len(backlog) and backlog[window_start].get("role") != "user":
+        window_start += 1
+
+    return {
+        "messages": backlog[window_start:],
+        "summary": index["summary"],
+        "to_summarize": backlog[:window_start],
+    }
@@ -2,23 +2,36 @@
 Campaign content, drafts, state, runs, and DM context routes
 """
 
-from fastapi import APIRouter, HTTPException
+from typing import Optional
 
-from models import CampaignContentRequest, RunCompleteRequest
-from helpers import load_json, save_json, load_campaign_json, save_campaign_json
+from fastapi import APIRouter, BackgroundTasks, Header, HTTPException, Response
+
+from models import CampaignContentRequest, RunCompleteRequest, SimulationRequest
+from helpers import CAMPAIGNS_LOCK, load_json, save_json, load_campaign_json, save_campaign_json
 from campaign_schema import (
-    CampaignContent,
     CampaignState,
-    NPCState,
-    validate_campaign_content,
+    parse_campaign_content,
 )
 from campaign_logic import (
     load_campaign_content,
     load_campaign_state,
-    save_campaign_state,
     get_available_runs,
     select_next_run,
     build_dm_context,
+    current_run_details,
+)
+from content_index import CONTENT_FILENAME, filler_run_id, get_content_index, npc_key
+from content_patch import PreconditionFailed, document_etag, patch_document
+from json_patch import JsonPatchError, JsonPatchTestFailed
+from run_graph import get_run_graph
+from state_events import has_state, read_events, record_event, record_events, state_at, undo
+from campaign_simulator import simulate
+from run_narration import (
+    clear_narration,
+    discard_run,
+    generate_narration,
+    mark_pending,
+    wait_for_narration,
 )
 
 router = APIRouter()
@@ -27,27 +40,26 @@ router = APIRouter()
 @router.post("/campaigns/{campaign_id}/content")
 def create_campaign_content(campaign_id: str, request: CampaignContentRequest):
     """Create or replace campaign authored content"""
-    result = validate_campaign_content(request.content)
+    content, result = parse_campaign_content(request.content)
     if not result.valid:
         raise HTTPException(status_code=400, detail={"errors": result.errors})
 
-    content = CampaignContent(**request.content)
-    save_campaign_json(campaign_id, "campaign.json", content.dict())
+    save_campaign_json(campaign_id, "campaign.json", content.model_dump())
 
     # Mark campaign as no longer a draft
-    campaigns_data = load_json("campaigns.json")
-    for campaign in campaigns_data.get("campaigns", []):
-        if campaign["id"] == campaign_id:
-            campaign["isDraft"] = False
-            break
-    save_json("campaigns.json", campaigns_data)
+    with CAMPAIGNS_LOCK:
+        campaigns_data = load_json("campaigns.json")
+        for campaign in campaigns_data.get("campaigns", []):
+            if campaign["id"] == campaign_id:
+                campaign["isDraft"] = False
+                break
+        save_json("campaigns.json", campaigns_data)
 
     # Initialize state if needed
-    state_data = load_campaign_json(campaign_id, "state.json")
-    if not state_data:
+    if not has_state(campaign_id):
         state = CampaignState()
         state.initialize_from_content(content)
-        save_campaign_state(campaign_id, state)
+        record_event(campaign_id, "state_reset", state=state.model_dump())
 
     return {"success": True, "warnings": result.warnings, "campaign_id": campaign_id}
 
@@ -58,17 +70,18 @@ def save_campaign_draft(campaign_id: str, request: CampaignContentRequest):
     save_campaign_json(campaign_id, "draft.json", request.content)
 
     # Ensure campaign is marked as draft
-    campaigns_data = load_json("campaigns.json")
-    for campaign in campaigns_data.get("campaigns", []):
-        if campaign["id"] == campaign_id:
-            campaign["isDraft"] = True
-            # Update name/description from draft if provided
-            if request.content.get("name"):
-                campaign["name"] = request.content["name"]
-            if request.content.get("premise"):
-                campaign["description"] = request.content["premise"]
-            break
-    save_json("campaigns.json", campaigns_data)
+    with CAMPAIGNS_LOCK:
+        campaigns_data = load_json("campaigns.json")
+        for campaign in campaigns_data.get("campaigns", []):
+            if campaign["id"] == campaign_id:
+                campaign["isDraft"] = True
+                # Update name/description from draft if provided
+                if request.content.get("name"):
+                    campaign["name"] = request.content["name"]
+                if request.content.get("premise"):
+                    campaign["description"] = request.content["premise"]
+                break
+        save_json("campaigns.json", campaigns_data)
 
     return {"success": True, "campaign_id": campaign_id, "isDraft": True}
 
@@ -87,38 +100,89 @@ def get_campaign_draft(campaign_id: str):
     return {"hasDraft": False, "content": None}
 
 @router.get("/campaigns/{campaign_id}/content")
-def get_campaign_content_endpoint(campaign_id: str):
-    """Get campaign authored content for editing"""
+def get_campaign_content_endpoint(campaign_id: str, response: Response):
+    """Get campaign authored content for editing; the ETag is the version PATCH If-Match expects"""
     content = load_campaign_content(campaign_id)
     if not content:
         raise HTTPException(status_code=404, detail="Campaign content not found")
-    return content.dict()
+    response.headers["ETag"] = document_etag(campaign_id, CONTENT_FILENAME)
+    return content.model_dump()
 
 @router.put("/campaigns/{campaign_id}/content")
 def update_campaign_content(campaign_id: str, request: CampaignContentRequest):
     """Update campaign authored content"""
-    result = validate_campaign_content(request.content)
+    content, result = parse_campaign_content(request.content)
     if not result.valid:
         raise HTTPException(status_code=400, detail={"errors": result.errors})
 
-    content = CampaignContent(**request.content)
-    save_campaign_json(campaign_id, "campaign.json", content.dict())
-
-    # Update state to include any new NPCs
-    state = load_campaign_state(campaign_id)
-    for npc in content.npcs:
-        npc_key = npc.name.lower().replace(" ", "_")
-        if npc_key not in state.npcs:
-            state.npcs[npc_key] = NPCState()
-    save_campaign_state(campaign_id, state)
+    save_campaign_json(campaign_id, "campaign.json", content.model_dump())
+    _track_new_npcs(campaign_id, content)
 
     return {"success": True, "warnings": result.warnings}
 
-@router.get("/campaigns/{campaign_id}/state")
-def get_campaign_state_endpoint(campaign_id: str):
-    """Get campaign runtime state"""
+@router.patch("/campaigns/{campaign_id}/content")
+def patch_campaign_content(campaign_id: str, patch: list[dict], response: Response, dry_run: bool = False,
+                           if_match: Optional[str] = Header(None)):
+    """Apply an RFC 6902 JSON Patch to campaign content, revalidating only the sections it touches.
+
+    ?dry_run=true returns errors by section without writing, for live form
+    validation. Send the ETag from GET /content as If-Match to refuse the
+    write (412) if someone else changed the content in between.
+    """
+    try:
+        result = patch_document(campaign_id, CONTENT_FILENAME, patch, if_match, dry_run)
+    except PreconditionFailed as e:
+        raise HTTPException(status_code=412, detail=str(e), headers={"ETag": e.etag} if e.etag else None)
+    except JsonPatchTestFailed as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except JsonPatchError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Campaign content not found")
+
+    content = result.pop("document", None)
+    if result["etag"]:
+        response.headers["ETag"] = result["etag"]
+    if dry_run:
+        return result
+    if not result["valid"]:
+        raise HTTPException(status_code=400, detail={"errors": result["errors"]})
+
+    _track_new_npcs(campaign_id, content)
+    return {"success": True, "warnings": result["warnings"], "sections": result["sections"], "etag": result["etag"]}
+
+def _track_new_npcs(campaign_id: str, content):
+    """Add state entries for NPCs the content introduces"""
     state = load_campaign_state(campaign_id)
-    return state.dict()
+    new_npcs = [key for key in (npc_key(npc.name) for npc in content.npcs) if key not in state.npcs]
+    if new_npcs:
+        record_event(campaign_id, "npcs_added", npcs=new_npcs)
+
+@router.get("/campaigns/{campaign_id}/state")
+def get_campaign_state_endpoint(campaign_id: str, at: int = None):
+    """Get campaign runtime state, or the state as of an earlier event"""
+    if at is None:
+        return load_campaign_state(campaign_id).model_dump()
+    try:
+        return state_at(campaign_id, at).model_dump()
+    except KeyError:
+        raise HTTPException(status_code=404, detail="No such state event")
+
+@router.get("/campaigns/{campaign_id}/state/events")
+def get_campaign_state_events(campaign_id: str, after: int = 0, limit: int = 50):
+    """Page through the state event log, oldest first"""
+    return read_events(campaign_id, after, limit)
+
+@router.post("/campaigns/{campaign_id}/state/undo")
+def undo_campaign_state(campaign_id: str, steps: int = 1):
+    """Restore the state from before the last `steps` state changes"""
+    if steps < 1:
+        raise HTTPException(status_code=400, detail="steps must be at least 1")
+    try:
+        result = undo(campaign_id, steps)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, "to_seq": result["to_seq"], "steps": result["steps"], "state": result["state"].model_dump()}
 
 @router.post("/campaigns/{campaign_id}/state/reset")
 def reset_campaign_state(campaign_id: str):
@@ -127,9 +191,11 @@ def reset_campaign_state(campaign_id: str):
     if not content:
         raise HTTPException(status_code=404, detail="Campaign content not found")
 
+    # Recorded as an event, so the history before the reset is kept
     state = CampaignState()
     state.initialize_from_content(content)
-    save_campaign_state(campaign_id, state)
+    record_event(campaign_id, "state_reset", state=state.model_dump())
+    clear_narration(campaign_id)
     return {"success": True}
 
 @router.get("/campaigns/{campaign_id}/available-runs")
@@ -140,7 +206,7 @@ def get_available_runs_endpoint(campaign_id: str):
         return {"anchors": [], "fillers": [], "hasContent": False}
 
     state = load_campaign_state(campaign_id)
-    available = get_available_runs(content, state)
+    available = get_available_runs(content, state, get_run_graph(campaign_id, content))
 
     return {
         "hasContent": True,
@@ -153,122 +219,194 @@ def get_available_runs_endpoint(campaign_id: str):
 @router.get("/campaigns/{campaign_id}/next-run")
 def get_next_run_endpoint(campaign_id: str):
     """Get the next recommended run"""
-    content = load_campaign_content(campaign_id)
-    if not content:
+    index = get_content_index(campaign_id)
+    if not index:
         return {"type": "none", "hasContent": False}
 
     state = load_campaign_state(campaign_id)
-    return {**select_next_run(content, state), "hasContent": True}
+    graph = get_run_graph(campaign_id, index.content)
+    return {**select_next_run(index.content, state, graph, index), "hasContent": True}
 
-@router.post("/campaigns/{campaign_id}/start-run")
-def start_run(campaign_id: str, run_type: str, run_id: str = None, filler_index: int = None):
-    """Start a run and get DM context"""
+
+@router.get("/campaigns/{campaign_id}/runs/graph")
+def get_run_graph_endpoint(campaign_id: str):
+    """The compiled anchor-run dependency graph"""
     content = load_campaign_content(campaign_id)
     if not content:
         raise HTTPException(status_code=404, detail="Campaign content not found")
+    return get_run_graph(campaign_id, content).describe()
 
-    state = load_campaign_state(campaign_id)
+
+@router.get("/campaigns/{campaign_id}/runs/{run_id}/unlocks")
+def get_run_unlocks(campaign_id: str, run_id: str):
+    """Runs that completing run_id unlocks, directly and downstream"""
+    content = load_campaign_content(campaign_id)
+    if not content:
+        raise HTTPException(status_code=404, detail="Campaign content not found")
+    graph = get_run_graph(campaign_id, content)
+    if run_id not in graph.runs:
+        raise HTTPException(status_code=404, detail="Anchor run not found")
+    return graph.unlocks_after(run_id)
+
+
+@router.get("/campaigns/{campaign_id}/runs/{run_id}/path")
+def get_run_path(campaign_id: str, run_id: str):
+    """Earliest path from the current state to an anchor run"""
+    content = load_campaign_content(campaign_id)
+    if not content:
+        raise HTTPException(status_code=404, detail="Campaign content not found")
+    graph = get_run_graph(campaign_id, content)
+    if run_id not in graph.runs:
+        raise HTTPException(status_code=404, detail="Anchor run not found")
+    return graph.earliest_path(run_id, load_campaign_state(campaign_id))
+
+@router.post("/campaigns/{campaign_id}/simulate")
+def simulate_campaign(campaign_id: str, request: SimulationRequest):
+    """Monte Carlo playthroughs: runs to completion, final threat stages and unreachable runs"""
+    content = load_campaign_content(campaign_id)
+    if not content:
+        raise HTTPException(status_code=404, detail="Campaign content not found")
+    if request.victory + request.failed > 1:
+        raise HTTPException(status_code=400, detail="victory and failed probabilities must sum to at most 1")
+
+    state = load_campaign_state(campaign_id) if request.from_current_state else None
+    return simulate(content, request.playthroughs, request.victory, request.failed, request.max_runs,
+                    request.seed, state)
+
+@router.post("/campaigns/{campaign_id}/start-run")
+def start_run(campaign_id: str, run_type: str, background_tasks: BackgroundTasks,
+              run_id: str = None, filler_index: int = None, illustrate: bool = False):
+    """Start a run and get DM context; the intro narration is generated in the background"""
+    index = get_content_index(campaign_id)
+    if not index:
+        raise HTTPException(status_code=404, detail="Campaign content not found")
 
     if run_type == "anchor":
-        run = next((r for r in content.anchor_runs if r.id == run_id), None)
-        if not run:
+        run_details = index.details(run_id, "anchor")
+        if not run_details:
             raise HTTPException(status_code=404, detail="Anchor run not found")
-        state.current_run_id = run.id
-        state.current_run_type = "anchor"
-        run_details = {
-            "type": "anchor",
-            "id": run.id,
-            "hook": run.hook,
-            "goal": run.goal,
-            "tone": run.tone or content.tone,
-            "must_include": run.must_include,
-            "reveal": run.reveal
-        }
     else:
-        if filler_index is None or filler_index >= len(content.filler_seeds):
+        run_id = filler_run_id(filler_index) if filler_index is not None else None
+        run_details = index.details(run_id, "filler")
+        if not run_details:
             raise HTTPException(status_code=400, detail="Invalid filler index")
-        state.current_run_id = f"filler_{filler_index}"
-        state.current_run_type = "filler"
-        run_details = {
-            "type": "filler",
-            "index": filler_index,
-            "hook": content.filler_seeds[filler_index],
-            "goal": "Complete the task",
-            "tone": content.tone,
-            "must_include": [],
-            "reveal": None
-        }
-
-    save_campaign_state(campaign_id, state)
-    return build_dm_context(content, state, run_details)
+
+    state = record_event(campaign_id, "run_started", run_id=run_id, run_type=run_details["type"])
+    dm_context = build_dm_context(index.content, state, run_details, index)
+
+    token = mark_pending(campaign_id, state.current_run_id, "intro")
+    background_tasks.add_task(
+        generate_narration, campaign_id, state.current_run_id, "intro", token, dm_context, illustrate=illustrate
+    )
+    return dm_context
 
 @router.post("/campaigns/{campaign_id}/complete-run")
-def complete_run(campaign_id: str, request: RunCompleteRequest):
-    """Complete current run and update state"""
-    content = load_campaign_content(campaign_id)
-    if not content:
+def complete_run(campaign_id: str, request: RunCompleteRequest, background_tasks: BackgroundTasks):
+    """Complete current run and update state; the resolution narration is generated in the background"""
+    index = get_content_index(campaign_id)
+    if not index:
         raise HTTPException(status_code=404, detail="Campaign content not found")
+    content = index.content
 
     state = load_campaign_state(campaign_id)
 
     if not state.current_run_id:
         raise HTTPException(status_code=400, detail="No active run")
 
-    state.runs_completed += 1
-
-    if request.outcome == "victory":
-        if state.current_run_type == "anchor":
-            state.anchor_runs_completed.append(state.current_run_id)
-            run = next((r for r in content.anchor_runs if r.id == state.current_run_id), None)
-            if run and run.reveal:
-                state.facts_known.append(run.reveal)
-        else:
-            filler_index = int(state.current_run_id.split("_")[1])
-            if filler_index not in state.filler_seeds_used:
-                state.filler_seeds_used.append(filler_index)
-
-    elif request.outcome == "failed":
-        if content.threat.advance_on.value == "run_failed":
-            state.threat_stage = min(state.threat_stage + 1, len(content.threat.stages) - 1)
-
-    state.facts_known.extend(request.facts_learned)
-    state.facts_known = list(set(state.facts_known))
-    state.locations_visited.extend(request.locations_visited)
-    state.locations_visited = list(set(state.locations_visited))
+    # Capture the run as it was played before the state moves on (recording
+    # events returns a new state, so this one is left as it was)
+    completed_run_id = state.current_run_id
+    state_before = state
+    run_details = current_run_details(content, state, index)
+    dm_context = build_dm_context(content, state, run_details, index) if run_details else None
+
+    # Everything the run changed is recorded as one batch of events (one append, undone together)
+    events = [{"type": "run_completed", "run_id": completed_run_id, "run_type": state.current_run_type,
+               "outcome": request.outcome}]
+
+    facts = list(request.facts_learned)
+    if request.outcome == "victory" and state.current_run_type == "anchor":
+        run = index.runs.get(completed_run_id)
+        if run and run.reveal:
+            facts.insert(0, run.reveal)
+    if facts:
+        events.append({"type": "facts_learned", "facts": facts})
+    if request.locations_visited:
+        events.append({"type": "locations_visited", "locations": list(request.locations_visited)})
 
     for npc_name in request.npcs_met:
-        npc_key = npc_name.lower().replace(" ", "_")
-        if npc_key in state.npcs:
-            state.npcs[npc_key].met = True
-
-    state.current_run_id = None
-    state.current_run_type = None
-    save_campaign_state(campaign_id, state)
-
-    # Check periodic threat advance
-    if content.threat.advance_on.value == "every_2_runs" and state.runs_completed % 2 == 0:
-        state.threat_stage = min(state.threat_stage + 1, len(content.threat.stages) - 1)
-        save_campaign_state(campaign_id, state)
-    elif content.threat.advance_on.value == "every_3_runs" and state.runs_completed % 3 == 0:
-        state.threat_stage = min(state.threat_stage + 1, len(content.threat.stages) - 1)
-        save_campaign_state(campaign_id, state)
+        key = npc_key(npc_name)
+        if key in state.npcs:
+            events.append({"type": "npc_met", "npc": key})
+
+    # Threat advances on a failed run or every N runs, depending on the campaign
+    advance_on = content.threat.advance_on.value
+    runs_completed = state.runs_completed + 1
+    advances = (
+        (advance_on == "run_failed" and request.outcome == "failed")
+        or (advance_on == "every_2_runs" and runs_completed % 2 == 0)
+        or (advance_on == "every_3_runs" and runs_completed % 3 == 0)
+    )
+    max_stage = len(content.threat.stages) - 1
+    if advances and state.threat_stage < max_stage:
+        events.append({"type": "threat_advanced", "stage": state.threat_stage + 1, "reason": advance_on})
+
+    state = record_events(campaign_id, events)
 
     # Check if campaign is complete
-    all_anchors_done = all(run.id in state.anchor_runs_completed for run in content.anchor_runs)
+    all_anchors_done = all(run_id in state.anchor_runs_completed for run_id in index.runs)
     threat_maxed = state.threat_stage >= len(content.threat.stages) - 1
 
+    if dm_context:
+        token = mark_pending(campaign_id, completed_run_id, "resolution", request.outcome)
+        background_tasks.add_task(
+            generate_narration, campaign_id, completed_run_id, "resolution", token, dm_context, request.outcome
+        )
+
     return {
         "success": True,
+        "run_id": completed_run_id,
         "runs_completed": state.runs_completed,
         "threat_stage": state.threat_stage,
+        "unlocked": get_run_graph(campaign_id, content).newly_unlocked(state_before, state),
         "campaign_complete": all_anchors_done or threat_maxed
     }
 
+@router.get("/campaigns/{campaign_id}/run-intro")
+def get_run_intro(campaign_id: str, wait: float = 0):
+    """Get the pre-generated intro narration for the active run, optionally waiting for it.
+
+    The frontend shows this before the first player turn of a run; /dm/message
+    also threads a ready intro into the conversation so the model answers the
+    player's first message in its light.
+    """
+    state = load_campaign_state(campaign_id)
+    if not state.current_run_id:
+        raise HTTPException(status_code=400, detail="No active run")
+
+    entry = wait_for_narration(campaign_id, state.current_run_id, "intro", timeout=wait)
+    if not entry:
+        raise HTTPException(status_code=404, detail="No intro narration for this run")
+    return {"run_id": state.current_run_id, **entry}
+
+@router.get("/campaigns/{campaign_id}/run-resolution")
+def get_run_resolution(campaign_id: str, run_id: str, wait: float = 0):
+    """Get the resolution narration generated when a run was completed.
+
+    Once a finished resolution has been read the run's narration is dropped.
+    """
+    entry = wait_for_narration(campaign_id, run_id, "resolution", timeout=wait)
+    if not entry:
+        raise HTTPException(status_code=404, detail="No resolution narration for this run")
+    if entry["status"] != "pending":
+        discard_run(campaign_id, run_id)
+    return {"run_id": run_id, **entry}
+
 @router.get("/campaigns/{campaign_id}/dm-context")
 def get_dm_context_endpoint(campaign_id: str):
     """Get current DM context for ongoing run"""
-    content = load_campaign_content(campaign_id)
-    if not content:
+    index = get_content_index(campaign_id)
+    if not index:
         raise HTTPException(status_code=404, detail="Campaign content not found")
 
     state = load_campaign_state(campaign_id)
@@ -276,27 +414,8 @@ def get_dm_context_endpoint(campaign_id: str):
     if not state.current_run_id:
         raise HTTPException(status_code=400, detail="No active run")
 
-    if state.current_run_type == "anchor":
-        run = next((r for r in content.anchor_runs if r.id == state.current_run_id), None)
-        run_details = {
-            "type": "anchor",
-            "id": run.id,
-            "hook": run.hook,
-            "goal": run.goal,
-            "tone": run.tone or content.tone,
-            "must_include": run.must_include,
-            "reveal": run.reveal
-        }
-    else:
-        filler_index = int(state.current_run_id.split("_")[1])
-        run_details = {
-            "type": "filler",
-            "index": filler_index,
-            "hook": content.filler_seeds[filler_index],
-            "goal": "Complete the task",
-            "tone": content.tone,
-            "must_include": [],
-            "reveal": None
-        }
-
-    return build_dm_context(content, state, run_details)
+    run_details = current_run_details(index.content, state, index)
+    if not run_details:
+        raise HTTPException(status_code=404, detail="Active run not found in campaign content")
+
+    return build_dm_context(index.content, state, run_details, index)
@@ -2,29 +2,53 @@
 Campaign CRUD, select, banner, and system config routes
 """
 
+import asyncio
+import contextlib
 import json
 import os
-import re
 import uuid
 from datetime import datetime
+from typing import Optional
 
-from fastapi import APIRouter, HTTPException, UploadFile, File
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Header, HTTPException, Request, Response, UploadFile, File
+from fastapi.responses import StreamingResponse
+from PIL import Image
 
-from config import TEMPLATES_DIR
+from config import TEMPLATES_DIR, MAX_ARCHIVE_IMPORT_BYTES, MAX_BANNER_UPLOAD_BYTES
 from models import CampaignCreate, CampaignUpdate
-from helpers import load_json, save_json, load_campaign_json, save_campaign_json, get_campaign_dir
+from helpers import (
+    CAMPAIGNS_LOCK,
+    get_campaign_dir,
+    load_campaign_json,
+    load_json,
+    new_campaign_id,
+    save_campaign_json,
+    save_json,
+)
 from campaign_schema import CampaignSystem, BLOOMBURROW_SYSTEM, DEFAULT_SYSTEM
+from access_tracker import tracker
+from http_cache import cached_file_response
+import image_store
+import image_derivatives
+from campaign_archive import ArchiveError, export_campaign, import_campaign
+from content_patch import SYSTEM_FILENAME, PreconditionFailed, document_etag, patch_document
+from json_patch import JsonPatchError, JsonPatchTestFailed
+from image_derivatives import SIZES, resolve_image, transcode_banner
+from downloads import CHUNK_SIZE
+from image_quota import enforce_quota
+from session_sync import save_session
+import dm_context_cache
 
 router = APIRouter()
 
 
 @router.get("/campaigns/{campaign_id}/system")
-def get_campaign_system(campaign_id: str):
+def get_campaign_system(campaign_id: str, response: Response):
     """Get the system configuration for a campaign"""
     # First check if campaign has a custom system
     system = load_campaign_json(campaign_id, "system.json")
     if system:
+        response.headers["ETag"] = document_etag(campaign_id, SYSTEM_FILENAME)
         return system
 
     # Fall back to Bloomburrow default for backwards compatibility
@@ -44,6 +68,33 @@ def update_campaign_system(campaign_id: str, system: dict):
     return {"success": True}
 
 
+@router.patch("/campaigns/{campaign_id}/system")
+def patch_campaign_system(campaign_id: str, patch: list[dict], response: Response, dry_run: bool = False,
+                          if_match: Optional[str] = Header(None)):
+    """Apply an RFC 6902 JSON Patch to the system configuration, revalidating only the sections it touches.
+
+    ?dry_run=true returns errors by section without writing. If-Match takes the
+    ETag from GET /system (campaigns still on the default system have none yet).
+    """
+    try:
+        result = patch_document(campaign_id, SYSTEM_FILENAME, patch, if_match, dry_run)
+    except PreconditionFailed as e:
+        raise HTTPException(status_code=412, detail=str(e), headers={"ETag": e.etag} if e.etag else None)
+    except JsonPatchTestFailed as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except JsonPatchError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    result.pop("document", None)
+    if result["etag"]:
+        response.headers["ETag"] = result["etag"]
+    if dry_run:
+        return result
+    if not result["valid"]:
+        raise HTTPException(status_code=400, detail={"errors": result["errors"]})
+    return {"success": True, "sections": result["sections"], "etag": result["etag"]}
+
+
 @router.get("/campaigns")
 def get_campaigns():
     """Get all campaigns with summary stats"""
@@ -88,13 +139,8 @@ def get_campaign(campaign_id: str):
 @router.post("/campaigns")
 def create_campaign(campaign: CampaignCreate):
     """Create a new campaign"""
-    data = load_json("campaigns.json")
-    if not data:
-        data = {"activeCampaignId": None, "campaigns": []}
-
     # Generate ID from name
-    campaign_id = re.sub(r'[^a-z0-9]', '_', campaign.name.lower())
-    campaign_id = f"{campaign_id}_{uuid.uuid4().hex[:6]}"
+    campaign_id = new_campaign_id(campaign.name)
 
     # Load system config from template or use default
     system_config = None
@@ -133,7 +179,7 @@ def create_campaign(campaign: CampaignCreate):
         "buildings": buildings_init
     })
     save_campaign_json(campaign_id, "stash.json", {"items": []})
-    save_campaign_json(campaign_id, "current_session.json", {"active": False})
+    save_session(campaign_id, {"active": False})
     save_campaign_json(campaign_id, "system.json", system_config)
 
     # Add to campaigns list
@@ -148,51 +194,68 @@ def create_campaign(campaign: CampaignCreate):
         "createdAt": now,
         "isDraft": True  # New campaigns start as drafts
     }
-    data["campaigns"].append(new_campaign)
-    save_json("campaigns.json", data)
+    with CAMPAIGNS_LOCK:
+        data = load_json("campaigns.json") or {"activeCampaignId": None, "campaigns": []}
+        data["campaigns"].append(new_campaign)
+        save_json("campaigns.json", data)
 
     return {**new_campaign, "characterCount": 0, "currencyAmount": 0}
 
 @router.put("/campaigns/{campaign_id}")
 def update_campaign(campaign_id: str, update: CampaignUpdate):
     """Update campaign metadata"""
-    data = load_json("campaigns.json")
-
-    for i, campaign in enumerate(data.get("campaigns", [])):
-        if campaign["id"] == campaign_id:
-            if update.name is not None:
-                campaign["name"] = update.name
-            if update.description is not None:
-                campaign["description"] = update.description
-            if update.currencyName is not None:
-                campaign["currencyName"] = update.currencyName
-            data["campaigns"][i] = campaign
-            save_json("campaigns.json", data)
-            return campaign
-
-    raise HTTPException(status_code=404, detail="Campaign not found")
+    with CAMPAIGNS_LOCK:
+        data = load_json("campaigns.json")
+        campaign = next((c for c in data.get("campaigns", []) if c["id"] == campaign_id), None)
+        if campaign is None:
+            raise HTTPException(status_code=404, detail="Campaign not found")
+
+        if update.name is not None:
+            campaign["name"] = update.name
+        if update.description is not None:
+            campaign["description"] = update.description
+        if update.currencyName is not None:
+            campaign["currencyName"] = update.currencyName
+        if update.imageReuse is not None:
+            campaign["imageReuse"] = update.imageReuse
+        if update.imageReuseThreshold is not None:
+            campaign["imageReuseThreshold"] = update.imageReuseThreshold
+        if update.imageQuotaBytes is not None:
+            campaign["imageQuotaBytes"] = update.imageQuotaBytes
+        if update.imageQuotaCount is not None:
+            campaign["imageQuotaCount"] = update.imageQuotaCount
+        save_json("campaigns.json", data)
+
+    # Lowered limits take effect now rather than at the next download
+    if update.imageQuotaBytes is not None or update.imageQuotaCount is not None:
+        enforce_quota(campaign_id)
+    return campaign
 
 @router.delete("/campaigns/{campaign_id}")
 def delete_campaign(campaign_id: str):
     """Delete a campaign and its data"""
     import shutil
 
-    data = load_json("campaigns.json")
+    with CAMPAIGNS_LOCK:
+        data = load_json("campaigns.json")
 
-    # Find and remove campaign from list
-    original_length = len(data.get("campaigns", []))
-    data["campaigns"] = [c for c in data.get("campaigns", []) if c["id"] != campaign_id]
+        # Find and remove campaign from list
+        original_length = len(data.get("campaigns", []))
+        data["campaigns"] = [c for c in data.get("campaigns", []) if c["id"] != campaign_id]
 
-    if len(data["campaigns"]) == original_length:
-        raise HTTPException(status_code=404, detail="Campaign not found")
+        if len(data["campaigns"]) == original_length:
+            raise HTTPException(status_code=404, detail="Campaign not found")
 
-    # If deleted campaign was active, clear active
-    if data.get("activeCampaignId") == campaign_id:
-        data["activeCampaignId"] = None
+        # If deleted campaign was active, clear active
+        if data.get("activeCampaignId") == campaign_id:
+            data["activeCampaignId"] = None
 
-    save_json("campaigns.json", data)
+        save_json("campaigns.json", data)
 
     # Delete campaign data directory
+    tracker.forget(campaign_id)
+    dm_context_cache.invalidate(campaign_id)
+    image_store.release_campaign(campaign_id)
     campaign_dir = get_campaign_dir(campaign_id)
     if os.path.exists(campaign_dir):
         shutil.rmtree(campaign_dir)
@@ -202,35 +265,99 @@ def delete_campaign(campaign_id: str):
 @router.put("/campaigns/{campaign_id}/select")
 def select_campaign(campaign_id: str):
     """Set the active campaign and update lastPlayed"""
-    data = load_json("campaigns.json")
+    with CAMPAIGNS_LOCK:
+        data = load_json("campaigns.json")
 
-    found = False
-    for campaign in data.get("campaigns", []):
-        if campaign["id"] == campaign_id:
-            campaign["lastPlayed"] = datetime.utcnow().isoformat() + "Z"
-            found = True
-            break
+        found = False
+        for campaign in data.get("campaigns", []):
+            if campaign["id"] == campaign_id:
+                campaign["lastPlayed"] = datetime.utcnow().isoformat() + "Z"
+                found = True
+                break
 
-    if not found:
-        raise HTTPException(status_code=404, detail="Campaign not found")
+        if not found:
+            raise HTTPException(status_code=404, detail="Campaign not found")
 
-    data["activeCampaignId"] = campaign_id
-    save_json("campaigns.json", data)
+        data["activeCampaignId"] = campaign_id
+        save_json("campaigns.json", data)
     return {"activeCampaignId": campaign_id}
 
-@router.post("/campaigns/{campaign_id}/banner")
-async def upload_campaign_banner(campaign_id: str, file: UploadFile = File(...)):
-    """Upload a banner image for a campaign"""
-    data = load_json("campaigns.json")
+async def _receive_upload(file: UploadFile, dest_dir: str, max_bytes: int) -> str:
+    """Stream an upload to a temp file in chunks, rejecting it once it exceeds max_bytes"""
+    if file.size is not None and file.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"Image too large (max {max_bytes // (1024 * 1024)} MB)")
+    os.makedirs(dest_dir, exist_ok=True)
+    temp_path = os.path.join(dest_dir, f".{uuid.uuid4().hex}.upload")
+    size = 0
+    try:
+        f = await asyncio.to_thread(open, temp_path, "wb")
+        try:
+            while chunk := await file.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"Image too large (max {max_bytes // (1024 * 1024)} MB)")
+                await asyncio.to_thread(f.write, chunk)
+        finally:
+            await asyncio.to_thread(f.close)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(temp_path)
+        raise
+    return temp_path
+
+
+def _campaign_exists(campaign_id: str) -> bool:
+    return any(c["id"] == campaign_id for c in load_json("campaigns.json").get("campaigns", []))
+
+
+def _store_banner(campaign_id: str, banner_path: str, banner_hash: str):
+    """Move a transcoded banner into the image store, held by the campaign; returns (file, derivatives future)"""
+    banner_file = image_store.put_file(banner_path, banner_hash, ".webp", holder=image_store.banner_holder(campaign_id))
+    return banner_file, image_derivatives.schedule_derivatives(image_store.blob_dir(banner_hash), banner_file)
+
+
+def _publish_banner(campaign_id: str, banner_file: str, banner_hash: str) -> Optional[str]:
+    """Point the campaign at its new banner; returns its URL, or None if the campaign is gone"""
+    holder = image_store.banner_holder(campaign_id)
+    # Re-read campaigns.json: other updates may have landed while the banner was processed
+    with CAMPAIGNS_LOCK:
+        data = load_json("campaigns.json")
+        campaign = next((c for c in data.get("campaigns", []) if c["id"] == campaign_id), None)
+        if campaign is None:
+            image_store.remove_ref(banner_hash, holder)
+            return None
+        previous_hash = campaign.get("bannerHash")
+        if previous_hash and previous_hash != banner_hash:
+            image_store.remove_ref(previous_hash, holder)
+
+        # Banners used to be stored in the campaign directory; drop any left there
+        campaign_dir = get_campaign_dir(campaign_id)
+        for old_ext in [".jpg", ".png", ".webp", ".gif"]:
+            old_path = os.path.join(campaign_dir, f"banner{old_ext}")
+            if os.path.exists(old_path):
+                os.remove(old_path)
+
+        # Record file and content hash so serving needs no probing; the hash in
+        # the URL lets clients cache each banner version forever
+        banner_url = f"/api/campaigns/{campaign_id}/banner?v={banner_hash[:12]}"
+        campaign["bannerImage"] = banner_url
+        campaign["bannerFile"] = banner_file
+        campaign["bannerHash"] = banner_hash
+        save_json("campaigns.json", data)
+    return banner_url
 
-    # Find campaign
-    campaign_idx = None
-    for i, campaign in enumerate(data.get("campaigns", [])):
-        if campaign["id"] == campaign_id:
-            campaign_idx = i
-            break
 
-    if campaign_idx is None:
+@router.post("/campaigns/{campaign_id}/banner")
+async def upload_campaign_banner(campaign_id: str, file: UploadFile = File(...)):
+    """Upload a banner image for a campaign.
+
+    The upload is streamed to disk under a size cap, then cropped and scaled
+    to the standard banner size as WebP in the image worker pool. The banner
+    and its derivatives are in the image store before campaigns.json points
+    at it, so clients never see a half-published banner. Disk and lock work
+    runs in threads: the locks are shared with other worker processes.
+    """
+    if not await asyncio.to_thread(_campaign_exists, campaign_id):
         raise HTTPException(status_code=404, detail="Campaign not found")
 
     # Validate file type
@@ -238,45 +365,132 @@ async def upload_campaign_banner(campaign_id: str, file: UploadFile = File(...))
     if file.content_type not in allowed_types:
         raise HTTPException(status_code=400, detail="Invalid file type. Use JPEG, PNG, WebP, or GIF.")
 
-    # Create campaign directory if needed
-    campaign_dir = get_campaign_dir(campaign_id)
-    os.makedirs(campaign_dir, exist_ok=True)
-
-    # Determine file extension
-    ext_map = {"image/jpeg": ".jpg", "image/png": ".png", "image/webp": ".webp", "image/gif": ".gif"}
-    ext = ext_map.get(file.content_type, ".jpg")
-
-    # Save as banner file (overwrite existing)
-    banner_path = os.path.join(campaign_dir, f"banner{ext}")
-
-    # Remove old banner if exists with different extension
-    for old_ext in [".jpg", ".png", ".webp", ".gif"]:
-        old_path = os.path.join(campaign_dir, f"banner{old_ext}")
-        if old_path != banner_path and os.path.exists(old_path):
-            os.remove(old_path)
-
-    # Write new banner
-    content = await file.read()
-    with open(banner_path, "wb") as f:
-        f.write(content)
-
-    # Update campaign metadata
-    banner_url = f"/api/campaigns/{campaign_id}/banner"
-    data["campaigns"][campaign_idx]["bannerImage"] = banner_url
-    save_json("campaigns.json", data)
-
+    incoming_dir = image_store.get_incoming_dir()
+    upload_path = await _receive_upload(file, incoming_dir, MAX_BANNER_UPLOAD_BYTES)
+    banner_path = os.path.join(incoming_dir, f"{uuid.uuid4().hex}.webp")
+    try:
+        result = await asyncio.wrap_future(image_derivatives.submit(transcode_banner, upload_path, banner_path))
+    except (OSError, ValueError, Image.DecompressionBombError):
+        if os.path.exists(banner_path):
+            os.remove(banner_path)
+        raise HTTPException(status_code=400, detail="Could not read the image")
+    finally:
+        os.remove(upload_path)
+
+    # Store the banner in the content-addressed image store, held by the campaign
+    banner_hash = result["sha256"]
+    banner_file, derivatives = await asyncio.to_thread(_store_banner, campaign_id, banner_path, banner_hash)
+    if derivatives:
+        await asyncio.wrap_future(derivatives)
+
+    banner_url = await asyncio.to_thread(_publish_banner, campaign_id, banner_file, banner_hash)
+    if banner_url is None:
+        raise HTTPException(status_code=404, detail="Campaign not found")
     return {"bannerImage": banner_url}
 
 @router.get("/campaigns/{campaign_id}/banner")
-def get_campaign_banner(campaign_id: str):
-    """Serve a campaign's banner image"""
+def get_campaign_banner(campaign_id: str, request: Request, v: Optional[str] = None, size: Optional[str] = None,
+                        accept: Optional[str] = Header(None)):
+    """Serve a campaign's banner image.
+
+    A request carrying the current version (?v=) is cacheable forever; other
+    requests revalidate against the content ETag. ?size=thumb|medium|full
+    serves a derivative in a format negotiated from Accept.
+    """
+    if size is not None and size not in SIZES:
+        raise HTTPException(status_code=400, detail=f"Unknown size '{size}'")
     campaign_dir = get_campaign_dir(campaign_id)
+    media_types = {".jpg": "image/jpeg", ".png": "image/png", ".webp": "image/webp", ".gif": "image/gif"}
 
-    # Check for banner with any supported extension
+    campaign = next((c for c in load_json("campaigns.json").get("campaigns", []) if c["id"] == campaign_id), None)
+    if campaign and campaign.get("bannerFile"):
+        blob = image_store.parse_blob_name(campaign["bannerFile"])
+        banner_path = image_store.blob_path(*blob) if blob else os.path.join(campaign_dir, campaign["bannerFile"])
+        if os.path.exists(banner_path):
+            banner_hash = campaign.get("bannerHash")
+            current = bool(v and banner_hash and banner_hash.startswith(v))
+            if size and blob:
+                path, media_type = resolve_image(os.path.dirname(banner_path), campaign["bannerFile"], size, accept)
+                # The original standing in for a pending derivative must not be cached for good
+                fallback = path == banner_path
+                return cached_file_response(request, path, media_type, immutable=current and not fallback,
+                                            digest=banner_hash if fallback else None, headers={"Vary": "Accept"})
+            return cached_file_response(
+                request,
+                banner_path,
+                media_types.get(os.path.splitext(banner_path)[1], "application/octet-stream"),
+                immutable=current,
+                digest=banner_hash,
+            )
+
+    # Banners uploaded before their file was recorded in campaign metadata
     for ext in [".jpg", ".png", ".webp", ".gif"]:
         banner_path = os.path.join(campaign_dir, f"banner{ext}")
         if os.path.exists(banner_path):
-            media_types = {".jpg": "image/jpeg", ".png": "image/png", ".webp": "image/webp", ".gif": "image/gif"}
-            return FileResponse(banner_path, media_type=media_types[ext])
+            return cached_file_response(request, banner_path, media_types[ext])
 
     raise HTTPException(status_code=404, detail="Banner not found")
+
+
+# === Archives ===
+
+def _archive_response(campaign_id: str, base: Optional[dict]) -> StreamingResponse:
+    try:
+        export = export_campaign(campaign_id, base)
+    except ArchiveError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if export is None:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    suffix = "-changes" if base else ""
+    return StreamingResponse(export.stream(), media_type="application/x-tar", headers={
+        "Content-Disposition": f'attachment; filename="{campaign_id}{suffix}.tar"',
+        "X-Archive-Manifest": export.manifest["id"],
+    })
+
+
+@router.get("/campaigns/{campaign_id}/export")
+def export_campaign_archive(campaign_id: str):
+    """Stream a tar archive of every campaign document and image, led by a manifest of their checksums"""
+    return _archive_response(campaign_id, None)
+
+
+@router.post("/campaigns/{campaign_id}/export")
+def export_campaign_changes(campaign_id: str, base: dict):
+    """Stream an incremental archive: the manifest of an earlier export in, only what changed since out"""
+    return _archive_response(campaign_id, base)
+
+
+@router.post("/campaigns/import")
+async def import_campaign_archive(request: Request, into: Optional[str] = None):
+    """Import a campaign from a streamed tar archive (the request body).
+
+    The body is spooled to disk in chunks under a size cap, then verified
+    and validated before anything is published. The campaign gets a fresh
+    id; with ?into=<id> the archive (full or incremental) updates that
+    campaign instead.
+    """
+    incoming_dir = image_store.get_incoming_dir()
+    os.makedirs(incoming_dir, exist_ok=True)
+    temp_path = os.path.join(incoming_dir, f".{uuid.uuid4().hex}.upload")
+    size = 0
+    try:
+        with open(temp_path, "wb") as f:
+            async for chunk in request.stream():
+                size += len(chunk)
+                if size > MAX_ARCHIVE_IMPORT_BYTES:
+                    raise HTTPException(status_code=413, detail="Archive too large")
+                f.write(chunk)
+
+        def run_import():
+            with open(temp_path, "rb") as archive:
+                return import_campaign(archive, into)
+
+        try:
+            result = await asyncio.to_thread(run_import)
+        except ArchiveError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        os.remove(temp_path)
+
+    dm_context_cache.invalidate(result["campaign_id"])
+    return {"success": True, **result}
@@ -2,141 +2,39 @@
 DM message route, image generation helpers, and image serving routes
 """
 
+import json
 import os
 import re
-import uuid
+from typing import Optional
 
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
-import httpx
+from fastapi import APIRouter, Header, HTTPException, Request
+from fastapi.responses import StreamingResponse
 import anthropic
-import replicate
 
-from config import IMAGES_DIR
-from models import DMMessage, ImageRequest
-from helpers import load_campaign_json, save_campaign_json, get_campaign_images_dir
+from models import DMMessage, ImageRequest, ImageBatchRequest
+from helpers import load_campaign_json, get_campaign_images_dir, estimate_tokens
+from image_generation import campaign_art_style, generate_flux_image, generate_scene_image, style_prompt
+from image_batch import MAX_BATCH_ITEMS, SEED_SOURCES, run_batch, seed_items
+from http_cache import cached_file_response, is_immutable_name
+import image_store
+from image_store import parse_blob_name
+from image_reuse import reuse_report
+from image_gallery import read_page as read_gallery_page, record_image as record_gallery_image
+from image_quota import served_key, usage_report
+from access_tracker import tracker
+from image_derivatives import SIZES, resolve_image, read_placeholder, schedule_derivatives, schedule_directory
 from campaign_schema import BLOOMBURROW_SYSTEM
-from campaign_logic import (
-    load_campaign_content,
-    load_campaign_state,
-    load_dm_prep_data,
-    build_dm_context,
-)
-from dm_context_builder import (
-    build_dm_system_injection,
-    build_dm_system_prompt,
-    build_rules_reference,
-    build_lore_section,
-)
+from dm_context_cache import assemble_campaign_injection
+from knowledge_index import build_retrieval_query
+from dm_context_builder import assemble_dm_system_prompt
+from campaign_logic import load_campaign_state
+from session_sync import load_session, save_session
+from run_narration import wait_for_narration
 
 router = APIRouter()
 
-# Default style for backwards compatibility
-DEFAULT_ART_STYLE = "fantasy illustration, detailed, atmospheric lighting"
-
-
-# === Image Generation Helpers ===
-
-def craft_image_prompt(scene_description: str, session: dict) -> str:
-    """Use Claude to craft an optimized image generation prompt"""
-    party_info = ""
-    if session.get("party"):
-        party_info = ", ".join([f"{m['name']} (a {m['species'].lower()})" for m in session["party"]])
-
-    location = session.get("location", "a woodland location")
-
-    try:
-        client = anthropic.Anthropic()
-        response = client.messages.create(
-            model="claude-3-5-haiku-latest",
-            max_tokens=200,
-            messages=[{
-                "role": "user",
-                "content": f"""Convert this scene description into an optimized image generation prompt.
-
-Scene: {scene_description}
-Location: {location}
-Characters present: {party_info}
-
-Rules:
-- Output ONLY the prompt, nothing else
-- 1-2 sentences max
-- Focus on composition, lighting, mood, key visual elements
-- Describe it as a rich, atmospheric fantasy illustration with earthy tones
-- Include specific details about any characters (species, clothing, expressions)
-- No action verbs - describe a frozen moment
-- Be specific about colors and lighting"""
-            }]
-        )
-        return response.content[0].text.strip()
-    except Exception as e:
-        print(f"Prompt crafting failed: {e}")
-        return scene_description  # Fall back to original
-
-
-def download_image(url: str, campaign_id: str = None) -> str:
-    """Download image from URL and save locally, return local path"""
-    try:
-        response = httpx.get(url, timeout=30.0)
-        response.raise_for_status()
-
-        # Generate unique filename
-        filename = f"{uuid.uuid4().hex}.webp"
-
-        # Save to campaign-specific directory if campaign_id provided
-        if campaign_id:
-            images_dir = get_campaign_images_dir(campaign_id)
-            os.makedirs(images_dir, exist_ok=True)
-            filepath = os.path.join(images_dir, filename)
-            url_path = f"/api/campaigns/{campaign_id}/images/{filename}"
-        else:
-            filepath = os.path.join(IMAGES_DIR, filename)
-            url_path = f"/api/images/{filename}"
-
-        with open(filepath, "wb") as f:
-            f.write(response.content)
-
-        return url_path
-    except Exception as e:
-        print(f"Failed to download image: {e}")
-        return None
-
-def generate_scene_image(scene_description: str, session: dict, campaign_id: str = None, art_style: str = None) -> tuple[str, str]:
-    """Generate an image for a scene and return (local_URL, crafted_prompt)"""
-
-    # First, craft an optimized prompt
-    crafted_prompt = craft_image_prompt(scene_description, session)
-
-    # Use provided art style or fall back to default
-    style = art_style or "fantasy illustration, detailed, atmospheric lighting"
-
-    # Add style prefix
-    full_prompt = f"{style}, {crafted_prompt}"
-
-    try:
-        output = replicate.run(
-            "black-forest-labs/flux-schnell",
-            input={
-                "prompt": full_prompt,
-                "num_outputs": 1,
-                "aspect_ratio": "16:9",
-                "output_format": "webp",
-                "output_quality": 80
-            }
-        )
-        # Convert FileOutput to string URL and download locally
-        if output and len(output) > 0:
-            remote_url = str(output[0])
-            local_url = download_image(remote_url, campaign_id)
-            if local_url:
-                return local_url, crafted_prompt
-            # Fallback to remote URL if download fails
-            return remote_url, crafted_prompt
-        return None, crafted_prompt
-    except Exception as e:
-        print(f"Image generation failed: {e}")
-        return None, crafted_prompt
-
+# Images kept on the session for the DM's context; the gallery holds the rest
+SESSION_IMAGES_KEPT = 20
 
 # === DM Message Route ===
 
@@ -150,57 +48,16 @@ def dm_message(campaign_id: str, msg: DMMessage):
         # Fall back to Bloomburrow for backwards compatibility
         system_config = BLOOMBURROW_SYSTEM
 
-    # Build prompts from system config
-    system_prompt = build_dm_system_prompt(system_config)
-    rules = build_rules_reference(system_config)
-    lore = build_lore_section(system_config)
-
     # Get current session
-    session = load_campaign_json(campaign_id, "current_session.json")
-
-    # Check for authored campaign content
-    campaign_context_section = ""
-    content = load_campaign_content(campaign_id)
-    if content:
-        state = load_campaign_state(campaign_id)
-
-        # Load author notes for DM guidance
-        prep_data = load_dm_prep_data(campaign_id)
-        author_notes = []
-        if prep_data.author_notes:
-            author_notes.extend([n.dict() for n in prep_data.author_notes])
-        if prep_data.pinned:
-            author_notes.extend([n.dict() for n in prep_data.pinned])
-
-        if state.current_run_id:
-            # Build run details
-            if state.current_run_type == "anchor":
-                run = next((r for r in content.anchor_runs if r.id == state.current_run_id), None)
-                if run:
-                    run_details = {
-                        "type": "anchor",
-                        "id": run.id,
-                        "hook": run.hook,
-                        "goal": run.goal,
-                        "tone": run.tone or content.tone,
-                        "must_include": run.must_include,
-                        "reveal": run.reveal
-                    }
-                    dm_context = build_dm_context(content, state, run_details)
-                    campaign_context_section = build_dm_system_injection(dm_context, session, author_notes)
-            else:
-                filler_index = int(state.current_run_id.split("_")[1])
-                run_details = {
-                    "type": "filler",
-                    "index": filler_index,
-                    "hook": content.filler_seeds[filler_index],
-                    "goal": "Complete the task",
-                    "tone": content.tone,
-                    "must_include": [],
-                    "reveal": None
-                }
-                dm_context = build_dm_context(content, state, run_details)
-                campaign_context_section = build_dm_system_injection(dm_context, session, author_notes)
+    session = load_session(campaign_id)
+
+    # Campaign content, state and prep notes are materialized between writes;
+    # per turn only the party status and the knowledge relevant to the
+    # latest exchanges are assembled
+    injection = assemble_campaign_injection(
+        campaign_id, session, query=build_retrieval_query(session, msg.message)
+    )
+    campaign_context_section = injection["text"]
 
     # Get current state if requested (for freestyle campaigns or fallback)
     state_context = ""
@@ -229,18 +86,15 @@ def dm_message(campaign_id: str, msg: DMMessage):
                 state_context += f"- {img.get('prompt', 'unknown scene')}\n"
 
     # Combine into full system prompt
-    full_system = f"""{system_prompt}
-
-{campaign_context_section}
-
-{state_context}
-
-## Rules Reference
-{rules}
+    full_system = assemble_dm_system_prompt(system_config, campaign_context_section, state_context)
 
-## World Lore (Brief)
-{lore}
-"""
+    # A run intro pre-generated at start-run becomes the DM's opening turn,
+    # so the model answers the player's first message in its light
+    intro = take_run_intro(campaign_id, session)
+    if intro:
+        session.setdefault("log", []).append({"type": "chat", "role": "dm", "content": intro["text"], "intro": True})
+        if intro.get("image_url"):
+            show_session_image(campaign_id, session, intro["image_url"], "Run intro", source="intro")
 
     # Build conversation history from session log
     messages = []
@@ -248,6 +102,8 @@ def dm_message(campaign_id: str, msg: DMMessage):
         for entry in session["log"]:
             if entry.get("type") == "chat":
                 role = "user" if entry["role"] == "player" else "assistant"
+                if entry.get("intro") and (not messages or messages[-1]["role"] != "user"):
+                    messages.append({"role": "user", "content": "[The run begins.]"})
                 messages.append({"role": role, "content": entry["content"]})
 
     # Add current message, with illustration request if needed
@@ -281,11 +137,7 @@ def dm_message(campaign_id: str, msg: DMMessage):
 
             # Store image in session
             if image_url and session.get("active"):
-                session.setdefault("images", []).append({
-                    "url": image_url,
-                    "prompt": crafted_prompt
-                })
-                session["currentImage"] = image_url
+                show_session_image(campaign_id, session, image_url, crafted_prompt)
 
             # Remove the [SCENE:] tag from the response shown to users
             dm_response_clean = re.sub(r'\[SCENE:\s*.+?\]', '', dm_response, flags=re.IGNORECASE | re.DOTALL).strip()
@@ -297,11 +149,7 @@ def dm_message(campaign_id: str, msg: DMMessage):
                 first_para = dm_response.split('\n\n')[0][:500]
                 image_url, crafted_prompt = generate_scene_image(first_para, session, campaign_id, art_style)
                 if image_url:
-                    session.setdefault("images", []).append({
-                        "url": image_url,
-                        "prompt": crafted_prompt
-                    })
-                    session["currentImage"] = image_url
+                    show_session_image(campaign_id, session, image_url, crafted_prompt)
 
         # Check for [PHASE: ...] tag and update session
         phase_match = re.search(r'\[PHASE:\s*(\w+)\]', dm_response, re.IGNORECASE)
@@ -331,65 +179,204 @@ def dm_message(campaign_id: str, msg: DMMessage):
                 "role": "dm",
                 "content": dm_response_clean
             })
-            save_campaign_json(campaign_id, "current_session.json", session)
+            save_session(campaign_id, session)
 
         return {
             "response": dm_response_clean,
-            "image_url": image_url
+            "image_url": image_url,
+            "intro": intro["text"] if intro else None,
+            "prompt_breakdown": {
+                "system_tokens": estimate_tokens(full_system),
+                "campaign_context_tokens": estimate_tokens(campaign_context_section),
+                "history_messages": len(messages),
+                "retrieval": injection["retrieval"],
+            }
         }
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI error: {str(e)}")
 
 
+def take_run_intro(campaign_id: str, session: dict):
+    """Return the active run's ready intro if this session hasn't opened the run yet, else None.
+
+    The session remembers which run it has opened, so every run in a session
+    gets its intro exactly once. Never waits on a generation still in flight.
+    """
+    if not session.get("active"):
+        return None
+    state = load_campaign_state(campaign_id)
+    if not state.current_run_id or session.get("introRunId") == state.current_run_id:
+        return None
+
+    intro = wait_for_narration(campaign_id, state.current_run_id, "intro")
+    if not intro or intro.get("status") != "ready":
+        return None
+    session["introRunId"] = state.current_run_id
+    return intro
+
+
+def show_session_image(campaign_id: str, session: dict, url: str, prompt: str, source: str = "scene"):
+    """Make an image the session's current scene and add it to the campaign gallery.
+
+    The session keeps only its most recent images; the gallery keeps them all.
+    """
+    session["images"] = (session.get("images", []) + [{"url": url, "prompt": prompt}])[-SESSION_IMAGES_KEPT:]
+    session["currentImage"] = url
+    state = load_campaign_state(campaign_id)
+    record_gallery_image(campaign_id, url, prompt, source=source, run_id=state.current_run_id,
+                         session_id=session.get("sessionId"))
+
+
 # === Image Generation Routes ===
 
 @router.post("/campaigns/{campaign_id}/image/generate")
 def generate_image(campaign_id: str, request: ImageRequest):
     """Generate an image using Replicate Flux"""
 
-    # Load campaign system config for art style
-    system_config = load_campaign_json(campaign_id, "system.json")
-    art_style = system_config.get("art_style", DEFAULT_ART_STYLE) if system_config else DEFAULT_ART_STYLE
-
-    # Build the full prompt with style
-    if request.style == "scene":
-        full_prompt = f"{art_style}, scenic landscape view, {request.prompt}"
-    elif request.style == "character":
-        full_prompt = f"{art_style}, character portrait, {request.prompt}"
-    elif request.style == "enemy":
-        full_prompt = f"{art_style}, creature design, slightly menacing but not scary, {request.prompt}"
-    else:
-        full_prompt = f"{art_style}, {request.prompt}"
-
+    full_prompt = style_prompt(campaign_art_style(campaign_id), request.style, request.prompt)
     try:
-        output = replicate.run(
-            "black-forest-labs/flux-schnell",
-            input={
-                "prompt": full_prompt,
-                "num_outputs": 1,
-                "aspect_ratio": "16:9",
-                "output_format": "webp",
-                "output_quality": 80
-            }
-        )
+        image_url = generate_flux_image(full_prompt, campaign_id)
+        record_gallery_image(campaign_id, image_url, full_prompt, source=request.style)
+        return {"image_url": image_url, "prompt": full_prompt}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Image generation error: {str(e)}")
 
-        # Flux returns a list of URLs - download to campaign directory
-        if output and len(output) > 0:
-            remote_url = str(output[0])
-            local_url = download_image(remote_url, campaign_id)
-            return {"image_url": local_url or remote_url, "prompt": full_prompt}
 
-        return {"image_url": None, "prompt": full_prompt}
+@router.post("/campaigns/{campaign_id}/image/batch")
+def generate_image_batch(campaign_id: str, request: ImageBatchRequest):
+    """Generate many images concurrently, streaming one NDJSON line per finished item.
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Image generation error: {str(e)}")
+    Items come from the request and/or are seeded from campaign.json
+    ("npcs", "locations"). Each line carries the item's index, its full
+    prompt and either image_url or error; a final line summarizes the batch.
+    """
+    unknown = [source for source in request.seed if source not in SEED_SOURCES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown seed sources: {', '.join(unknown)}")
+
+    items = [item.model_dump() for item in request.items]
+    if request.seed:
+        content = load_campaign_json(campaign_id, "campaign.json")
+        if not content:
+            raise HTTPException(status_code=404, detail="Campaign content not found")
+        items += seed_items(content, request.seed)
+
+    if not items:
+        raise HTTPException(status_code=400, detail="No images to generate")
+    if len(items) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_ITEMS} images per batch")
+
+    lines = (json.dumps(result) + "\n" for result in run_batch(campaign_id, items, request.concurrency))
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
+
+def _campaign_images_dir(campaign_id: str, filename: str) -> str:
+    """Directory an image lives in: the content store for blob names, else the campaign's own images"""
+    blob = parse_blob_name(filename)
+    images_dir = image_store.blob_dir(blob[0]) if blob else get_campaign_images_dir(campaign_id)
+    if os.path.basename(filename) != filename or not os.path.isfile(os.path.join(images_dir, filename)):
+        raise HTTPException(status_code=404, detail="Image not found")
+    return images_dir
+
+
+@router.get("/campaigns/{campaign_id}/images")
+def list_campaign_images(campaign_id: str, before: Optional[int] = None, limit: int = 24,
+                         run_id: Optional[str] = None):
+    """Page through the campaign's image gallery, newest first.
+
+    Pass `next_before` from a response as `before` for the next page;
+    `run_id` limits the gallery to one run's images.
+    """
+    return read_gallery_page(campaign_id, before=before, limit=limit, run_id=run_id)
+
+
+@router.get("/campaigns/{campaign_id}/images/reuse")
+def get_image_reuse_report(campaign_id: str):
+    """Scene image reuse settings, hits, estimated savings and recent similarity scores"""
+    return reuse_report(campaign_id)
+
+
+@router.get("/campaigns/{campaign_id}/images/usage")
+def get_image_usage(campaign_id: str):
+    """Retained image bytes and count against the campaign's quota, and evictions so far"""
+    return usage_report(campaign_id)
 
 
 @router.get("/campaigns/{campaign_id}/images/{filename}")
-def get_campaign_image(campaign_id: str, filename: str):
-    """Serve images from a campaign's images directory"""
-    filepath = os.path.join(get_campaign_images_dir(campaign_id), filename)
-    if os.path.exists(filepath):
-        return FileResponse(filepath, media_type="image/webp")
-    raise HTTPException(status_code=404, detail="Image not found")
+def get_campaign_image(campaign_id: str, filename: str, request: Request, size: Optional[str] = None,
+                       accept: Optional[str] = Header(None)):
+    """Serve a campaign image, optionally as a smaller derivative.
+
+    ?size=thumb|medium|full picks a rendition; its format (AVIF, WebP or
+    JPEG) is negotiated from Accept. Without a size the original is served.
+    Generated images have content-hash or uuid names and never change, so
+    they are marked immutable; ETags, conditional requests and Range are honoured.
+    """
+    if size is not None and size not in SIZES:
+        raise HTTPException(status_code=400, detail=f"Unknown size. Use one of: {', '.join(SIZES)}")
+    images_dir = _campaign_images_dir(campaign_id, filename)
+
+    path, media_type = resolve_image(images_dir, filename, size, accept)
+    if parse_blob_name(filename):
+        # Last-served times decide which images quota eviction drops first
+        tracker.touch(campaign_id, served_key(filename))
+    headers = {"Vary": "Accept"} if size else None
+    # An original standing in for a derivative still being rendered must not be cached for good
+    fallback = size is not None and os.path.basename(path) == filename
+    immutable = is_immutable_name(filename) and not fallback
+    return cached_file_response(request, path, media_type, immutable=immutable, headers=headers)
+
+
+@router.get("/campaigns/{campaign_id}/images/{filename}/placeholder")
+def get_campaign_image_placeholder(campaign_id: str, filename: str):
+    """Tiny inline data-URI placeholder to show while the image loads"""
+    images_dir = _campaign_images_dir(campaign_id, filename)
+    placeholder = read_placeholder(images_dir, filename)
+    if placeholder is None:
+        schedule_derivatives(images_dir, filename)
+    return {"filename": filename, "placeholder": placeholder}
+
+
+@router.post("/campaigns/{campaign_id}/images/derivatives")
+def generate_campaign_derivatives(campaign_id: str):
+    """Queue derivative rendering for every image in the campaign that lacks them"""
+    queued = schedule_directory(get_campaign_images_dir(campaign_id))
+    for name in image_store.blobs_held_by(campaign_id):
+        sha, _ = parse_blob_name(name)
+        if schedule_derivatives(image_store.blob_dir(sha), name):
+            queued += 1
+    return {"success": True, "queued": queued}
+
+
+@router.post("/campaigns/{campaign_id}/images/{filename}/keep")
+def keep_campaign_image(campaign_id: str, filename: str):
+    """Archive an image so it outlives the session it was generated in"""
+    blob = parse_blob_name(filename)
+    if not blob or not image_store.add_ref(blob[0], image_store.archive_holder(campaign_id)):
+        raise HTTPException(status_code=404, detail="Image not found in store")
+    return {"success": True, "filename": filename}
+
+
+@router.delete("/campaigns/{campaign_id}/images/{filename}/keep")
+def unkeep_campaign_image(campaign_id: str, filename: str):
+    """Remove an image from the campaign's archive; it is collected once nothing else holds it"""
+    blob = parse_blob_name(filename)
+    if not blob:
+        raise HTTPException(status_code=404, detail="Image not found in store")
+    image_store.remove_ref(blob[0], image_store.archive_holder(campaign_id))
+    return {"success": True, "filename": filename}
+
+
+# === Image Store Maintenance ===
+
+@router.get("/image-store/report")
+def get_image_storage_report():
+    """Blob store size, with what is unreferenced and what GC could reclaim now"""
+    return image_store.storage_report()
+
+
+@router.post("/image-store/gc")
+def run_image_gc():
+    """Delete blobs that have been unreferenced for longer than the grace period"""
+    return image_store.collect_garbage()
@@ -4,12 +4,14 @@ DM Prep notes, pins, conversation, and coach message routes
 
 import uuid
 from datetime import datetime
+from typing import Optional
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, BackgroundTasks, HTTPException
 import anthropic
 
 from models import DMPrepMessageRequest, DMPrepNoteCreate, DMPrepNoteUpdate, DMPrepPinRequest
 from helpers import load_campaign_json
+from access_tracker import tracker
 from campaign_schema import DMPrepNote, BLOOMBURROW_SYSTEM
 from campaign_logic import (
     load_campaign_content,
@@ -17,23 +19,78 @@ from campaign_logic import (
     load_dm_prep_data,
     save_dm_prep_data,
 )
-from prep_coach_builder import build_prep_coach_system_prompt, build_prep_coach_context
+from prep_coach_builder import (
+    build_prep_coach_system_prompt,
+    build_prep_coach_context,
+    build_conversation_summary_prompt,
+    fallback_conversation_summary,
+)
+from prep_conversation import (
+    append_messages,
+    build_history_window,
+    clear_conversation,
+    read_page,
+    update_summary,
+)
 
 router = APIRouter()
 
+# Messages returned per page of conversation history
+CONVERSATION_PAGE_SIZE = 50
+
+
+def summarize_conversation(previous_summary: str, messages: list[dict]) -> str:
+    """Use Claude to fold older messages into the rolling conversation summary"""
+    try:
+        client = anthropic.Anthropic()
+        response = client.messages.create(
+            model="claude-3-5-haiku-latest",
+            max_tokens=500,
+            messages=[{
+                "role": "user",
+                "content": build_conversation_summary_prompt(previous_summary, messages)
+            }]
+        )
+        return response.content[0].text.strip()
+    except Exception as e:
+        print(f"Conversation summary failed: {e}")
+        return fallback_conversation_summary(previous_summary, messages)
+
+
+def refresh_conversation_summary(campaign_id: str, previous_summary: str, messages: list[dict]):
+    """Fold messages that scrolled out of the window into the stored summary (runs after the response)"""
+    summary = summarize_conversation(previous_summary, messages)
+    update_summary(campaign_id, summary, messages[-1]["seq"])
+
 
 @router.get("/campaigns/{campaign_id}/dm-prep")
-def get_dm_prep(campaign_id: str):
-    """Get all DM prep data for a campaign"""
+def get_dm_prep(campaign_id: str, limit: int = CONVERSATION_PAGE_SIZE):
+    """Get DM prep data for a campaign with the latest page of conversation"""
     prep_data = load_dm_prep_data(campaign_id)
-    # Update last accessed
-    prep_data.last_accessed = datetime.utcnow().isoformat() + "Z"
-    save_dm_prep_data(campaign_id, prep_data)
-    return prep_data.dict()
+    # Record the access without rewriting dm_prep.json
+    tracker.touch(campaign_id, "dm_prep")
+    prep_data.last_accessed = tracker.get(campaign_id, "dm_prep")
+
+    page = read_page(campaign_id, limit=limit)
+    return {
+        **prep_data.model_dump(),
+        "conversation": page["messages"],
+        "conversation_page": {
+            "next_before": page["next_before"],
+            "has_more": page["has_more"],
+            "total": page["total"],
+        },
+    }
+
+
+@router.get("/campaigns/{campaign_id}/dm-prep/conversation")
+def get_dm_prep_conversation(campaign_id: str, before: Optional[int] = None, limit: int = CONVERSATION_PAGE_SIZE):
+    """Page backwards through prep coach conversation history"""
+    return read_page(campaign_id, before=before, limit=limit)
 
 
 @router.post("/campaigns/{campaign_id}/dm-prep/message")
-def dm_prep_message(campaign_id: str, request: DMPrepMessageRequest):
+def dm_prep_message(campaign_id: str, request: DMPrepMessageRequest, background_tasks: BackgroundTasks):
     """Send a message to the Prep Coach AI"""
     # Load system config
     system_config = load_campaign_json(campaign_id, "system.json")
@@ -42,24 +99,32 @@ def dm_prep_message(campaign_id: str, request: DMPrepMessageRequest):
 
     # Load campaign content
     content = load_campaign_content(campaign_id)
-    content_dict = content.dict() if content else None
+    content_dict = content.model_dump() if content else None
 
     # Load campaign state
     state = load_campaign_state(campaign_id)
-    state_dict = state.dict() if state else None
+    state_dict = state.model_dump() if state else None
 
     # Load existing prep data
     prep_data = load_dm_prep_data(campaign_id)
 
+    # Anything that has scrolled out of the history window is folded in with
+    # the extractive summary for this turn; the model-written summary is
+    # refreshed after the response so the turn never waits on it
+    history = build_history_window(campaign_id)
+    summary = history["summary"]
+    if history["to_summarize"]:
+        summary = fallback_conversation_summary(summary, history["to_summarize"])
+
     # Build system prompt and context
     system_prompt = build_prep_coach_system_prompt(system_config)
-    context = build_prep_coach_context(content_dict, state_dict, prep_data.dict(), system_config)
+    context = build_prep_coach_context(content_dict, state_dict, prep_data.model_dump(), system_config, summary)
 
     full_system = f"{system_prompt}\n\n---\n\n{context}" if context else system_prompt
 
-    # Build messages from conversation history
+    # Build messages from the history window
     messages = []
-    for msg in prep_data.conversation:
+    for msg in history["messages"]:
         messages.append({"role": msg.get("role", "user"), "content": msg.get("content", "")})
 
     # Add new user message
@@ -77,11 +142,17 @@ def dm_prep_message(campaign_id: str, request: DMPrepMessageRequest):
 
         assistant_response = response.content[0].text
 
-        # Update conversation history
-        prep_data.conversation.append({"role": "user", "content": request.message})
-        prep_data.conversation.append({"role": "assistant", "content": assistant_response})
-        prep_data.last_accessed = datetime.utcnow().isoformat() + "Z"
-        save_dm_prep_data(campaign_id, prep_data)
+        # Append the exchange to the conversation log
+        append_messages(campaign_id, [
+            {"role": "user", "content": request.message},
+            {"role": "assistant", "content": assistant_response},
+        ])
+        tracker.touch(campaign_id, "dm_prep")
+
+        if history["to_summarize"]:
+            background_tasks.add_task(
+                refresh_conversation_summary, campaign_id, history["summary"], history["to_summarize"]
+            )
 
         return {"response": assistant_response}
 
@@ -106,10 +177,10 @@ def create_dm_prep_note(campaign_id: str, request: DMPrepNoteCreate):
     )
 
     prep_data.author_notes.append(note)
-    prep_data.last_accessed = datetime.utcnow().isoformat() + "Z"
     save_dm_prep_data(campaign_id, prep_data)
+    tracker.touch(campaign_id, "dm_prep")
 
-    return note.dict()
+    return note.model_dump()
 
 
 @router.put("/campaigns/{campaign_id}/dm-prep/note/{note_id}")
@@ -127,9 +198,9 @@ def update_dm_prep_note(campaign_id: str, note_id: str, request: DMPrepNoteUpdat
             if request.related_to is not None:
                 prep_data.author_notes[i].related_to = request.related_to
 
-            prep_data.last_accessed = datetime.utcnow().isoformat() + "Z"
             save_dm_prep_data(campaign_id, prep_data)
-            return prep_data.author_notes[i].dict()
+            tracker.touch(campaign_id, "dm_prep")
+            return prep_data.author_notes[i].model_dump()
 
     raise HTTPException(status_code=404, detail="Note not found")
 
@@ -146,8 +217,8 @@ def delete_dm_prep_note(campaign_id: str, note_id: str):
     if len(prep_data.author_notes) == original_count:
         raise HTTPException(status_code=404, detail="Note not found")
 
-    prep_data.last_accessed = datetime.utcnow().isoformat() + "Z"
     save_dm_prep_data(campaign_id, prep_data)
+    tracker.touch(campaign_id, "dm_prep")
     return {"deleted": note_id}
 
 
@@ -168,10 +239,10 @@ def pin_dm_prep_insight(campaign_id: str, request: DMPrepPinRequest):
     )
 
     prep_data.pinned.append(pinned_note)
-    prep_data.last_accessed = datetime.utcnow().isoformat() + "Z"
     save_dm_prep_data(campaign_id, prep_data)
+    tracker.touch(campaign_id, "dm_prep")
 
-    return pinned_note.dict()
+    return pinned_note.model_dump()
 
 
 @router.delete("/campaigns/{campaign_id}/dm-prep/pin/{pin_id}")
@@ -186,16 +257,13 @@ def delete_dm_prep_pin(campaign_id: str, pin_id: str):
     if len(prep_data.pinned) == original_count:
         raise HTTPException(status_code=404, detail="Pinned note not found")
 
-    prep_data.last_accessed = datetime.utcnow().isoformat() + "Z"
     save_dm_prep_data(campaign_id, prep_data)
+    tracker.touch(campaign_id, "dm_prep")
     return {"deleted": pin_id}
 
 
 @router.delete("/campaigns/{campaign_id}/dm-prep/conversation")
 def clear_dm_prep_conversation(campaign_id: str):
     """Clear the prep coach conversation history"""
-    prep_data = load_dm_prep_data(campaign_id)
-    prep_data.conversation = []
-    prep_data.last_accessed = datetime.utcnow().isoformat() + "Z"
-    save_dm_prep_data(campaign_id, prep_data)
+    clear_conversation(campaign_id)
     return {"success": True}
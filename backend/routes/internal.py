@@ -0,0 +1,25 @@
+"""
+Worker-internal routes, called by the multi-worker dispatcher (never forwarded from clients)
+"""
+
+from fastapi import APIRouter
+
+from access_tracker import tracker
+import dm_context_cache
+import run_narration
+
+router = APIRouter()
+
+
+@router.post("/internal/campaigns/{campaign_id}/release")
+def release_campaign(campaign_id: str):
+    """Hand a campaign over to another worker.
+
+    Pending access times are flushed, narration still generating in the
+    background is waited for, and the campaign's materialized context is
+    dropped, so nothing in this process writes or serves it afterwards.
+    """
+    tracker.flush()
+    settled = run_narration.wait_for_campaign(campaign_id)
+    dm_context_cache.invalidate(campaign_id)
+    return {"released": campaign_id, "settled": settled}
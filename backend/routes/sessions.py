@@ -2,20 +2,30 @@
 Session CRUD and dice routes
 """
 
-from fastapi import APIRouter, HTTPException
+import uuid
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import Response
 
 from models import SessionStart, SessionUpdate, SessionEnd, DiceRoll
 from helpers import load_campaign_json, save_campaign_json
+from image_store import release_holder, session_holder
+from session_sync import load_session, public_session, save_session, session_changes
 
 router = APIRouter()
 
 
 @router.get("/campaigns/{campaign_id}/session")
-def get_session(campaign_id: str):
-    data = load_campaign_json(campaign_id, "current_session.json")
+def get_session(campaign_id: str, since: Optional[int] = Query(None, ge=0)):
+    """The current session; with since=<version>, only what changed after that version (304 if nothing)"""
+    data = load_session(campaign_id)
+    if since is not None:
+        changes = session_changes(data, since)
+        return Response(status_code=304) if changes is None else changes
     if not data:
         return {"active": False}
-    return data
+    return public_session(data)
 
 @router.post("/campaigns/{campaign_id}/session/start")
 def start_session(campaign_id: str, session: SessionStart):
@@ -42,6 +52,7 @@ def start_session(campaign_id: str, session: SessionStart):
 
     session_data = {
         "active": True,
+        "sessionId": uuid.uuid4().hex,
         "runState": "hook",
         "quest": session.quest,
         "location": session.location,
@@ -53,12 +64,13 @@ def start_session(campaign_id: str, session: SessionStart):
         "log": []
     }
 
-    save_campaign_json(campaign_id, "current_session.json", session_data)
-    return session_data
+    # Images from any previous session are no longer on screen
+    release_holder(session_holder(campaign_id))
+    return save_session(campaign_id, session_data)
 
 @router.put("/campaigns/{campaign_id}/session/update")
 def update_session(campaign_id: str, update: SessionUpdate):
-    data = load_campaign_json(campaign_id, "current_session.json")
+    data = load_session(campaign_id)
     if not data.get("active"):
         raise HTTPException(status_code=400, detail="No active session")
 
@@ -73,13 +85,12 @@ def update_session(campaign_id: str, update: SessionUpdate):
     if update.lootCollected is not None:
         data["lootCollected"] = update.lootCollected
 
-    save_campaign_json(campaign_id, "current_session.json", data)
-    return data
+    return save_session(campaign_id, data)
 
 @router.post("/campaigns/{campaign_id}/session/end")
 def end_session(campaign_id: str, data: SessionEnd):
     """End session with outcome: 'victory', 'retreat', or 'failed'"""
-    session = load_campaign_json(campaign_id, "current_session.json")
+    session = load_session(campaign_id)
     roster = load_campaign_json(campaign_id, "roster.json")
     town = load_campaign_json(campaign_id, "town.json")
     outcome = data.outcome
@@ -105,8 +116,9 @@ def end_session(campaign_id: str, data: SessionEnd):
                     break
         save_campaign_json(campaign_id, "roster.json", roster)
 
-    # Clear session
-    save_campaign_json(campaign_id, "current_session.json", {"active": False})
+    # Clear session; its images stay only if kept or still in the campaign's library
+    save_session(campaign_id, {"active": False})
+    release_holder(session_holder(campaign_id))
 
     return {"outcome": outcome, "message": f"Run ended: {outcome}"}
 
@@ -129,7 +141,7 @@ def log_dice_roll(campaign_id: str, roll: DiceRoll):
             threshold_result = "failure"
 
     # Log to session if active
-    session = load_campaign_json(campaign_id, "current_session.json")
+    session = load_session(campaign_id)
     if session.get("active"):
         log_entry = {
             "type": "roll",
@@ -141,7 +153,7 @@ def log_dice_roll(campaign_id: str, roll: DiceRoll):
             "threshold": threshold_result
         }
         session.setdefault("log", []).append(log_entry)
-        save_campaign_json(campaign_id, "current_session.json", session)
+        save_session(campaign_id, session)
 
     return {
         "die": roll.dieType,
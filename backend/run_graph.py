@@ -0,0 +1,208 @@
+"""
+Run graph
+Anchor run triggers compiled once per content version into a dependency DAG:
+after-run edges, plus threshold buckets for run counts and threat stages, so
+available runs come from set lookups and bisects instead of re-checking every
+trigger, and queries like "what unlocks after X" or "earliest path to Y"
+are cheap
+"""
+
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Optional
+
+from campaign_schema import CampaignContent, CampaignState, RunTriggerType
+from helpers import get_campaign_file_version
+
+# Campaigns whose compiled graphs are kept at once
+MAX_CACHED_GRAPHS = 64
+
+
+class _Buckets:
+    """Run ids grouped by a numeric threshold; everything at or below a value in one bisect"""
+
+    def __init__(self, thresholds: dict[int, list[str]]):
+        self.values = sorted(thresholds)
+        self.ids = [thresholds[v] for v in self.values]
+
+    def up_to(self, value: int) -> list[str]:
+        return [run_id for bucket in self.ids[:bisect_right(self.values, value)] for run_id in bucket]
+
+    def between(self, low: int, high: int) -> list[str]:
+        """Ids whose threshold is above low and at most high"""
+        return [run_id for bucket in self.ids[bisect_right(self.values, low):bisect_right(self.values, high)]
+                for run_id in bucket]
+
+
+class RunGraph:
+    """Compiled anchor-run triggers for one version of campaign content"""
+
+    def __init__(self, content: CampaignContent):
+        self.runs = {run.id: run for run in content.anchor_runs}
+        self.position = {run.id: i for i, run in enumerate(content.anchor_runs)}
+        self.filler_count = len(content.filler_seeds)
+
+        # Trigger values parsed once: run id for after_run, int for the thresholds
+        self.requires: dict[str, tuple] = {}
+        self.start: list[str] = []
+        self.dependents: dict[str, list[str]] = {run_id: [] for run_id in self.runs}
+        counts: dict[int, list[str]] = {}
+        stages: dict[int, list[str]] = {}
+        for run in content.anchor_runs:
+            kind, value = run.trigger.type, run.trigger.value
+            if kind == RunTriggerType.START:
+                self.start.append(run.id)
+                self.requires[run.id] = (kind, None)
+            elif kind == RunTriggerType.AFTER_RUN:
+                self.requires[run.id] = (kind, value)
+                self.dependents.setdefault(value, []).append(run.id)
+            elif kind == RunTriggerType.AFTER_RUNS_COUNT:
+                self.requires[run.id] = (kind, int(value))
+                counts.setdefault(int(value), []).append(run.id)
+            elif kind == RunTriggerType.THREAT_STAGE:
+                self.requires[run.id] = (kind, int(value))
+                stages.setdefault(int(value), []).append(run.id)
+        self.count_buckets = _Buckets(counts)
+        self.stage_buckets = _Buckets(stages)
+        self.unreachable = self._find_unreachable()
+
+        # Available anchors memoized per state; polls between state changes hit this
+        self._available: "OrderedDict[tuple, list[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _find_unreachable(self) -> set[str]:
+        """Runs whose after-run chain loops or names a run that doesn't exist"""
+        unreachable = set()
+        for run_id in self.runs:
+            seen = set()
+            current = run_id
+            while self.requires[current][0] == RunTriggerType.AFTER_RUN:
+                seen.add(current)
+                current = self.requires[current][1]
+                if current not in self.runs or current in seen:
+                    unreachable.add(run_id)
+                    break
+        return unreachable
+
+    # === Availability ===
+
+    def unlocked(self, state: CampaignState) -> set[str]:
+        """Every anchor whose trigger is met (completed or not)"""
+        unlocked = set(self.start)
+        for run_id in state.anchor_runs_completed:
+            unlocked.update(self.dependents.get(run_id, ()))
+        unlocked.update(self.count_buckets.up_to(state.runs_completed))
+        unlocked.update(self.stage_buckets.up_to(state.threat_stage))
+        return unlocked
+
+    def available_anchors(self, state: CampaignState) -> list[str]:
+        """Unlocked, uncompleted anchors in authored order"""
+        key = (tuple(state.anchor_runs_completed), state.runs_completed, state.threat_stage)
+        with self._lock:
+            if key in self._available:
+                self._available.move_to_end(key)
+                return self._available[key]
+
+        completed = set(state.anchor_runs_completed)
+        available = sorted((run_id for run_id in self.unlocked(state) if run_id not in completed),
+                           key=self.position.__getitem__)
+        with self._lock:
+            self._available[key] = available
+            while len(self._available) > 32:
+                self._available.popitem(last=False)
+        return available
+
+    def available_fillers(self, state: CampaignState) -> list[int]:
+        used = set(state.filler_seeds_used)
+        return [i for i in range(self.filler_count) if i not in used]
+
+    def newly_unlocked(self, before: CampaignState, after: CampaignState) -> list[str]:
+        """Anchors a state change made available, found from the change alone"""
+        completed = set(after.anchor_runs_completed)
+        gained = set()
+        for run_id in completed.difference(before.anchor_runs_completed):
+            gained.update(self.dependents.get(run_id, ()))
+        gained.update(self.count_buckets.between(before.runs_completed, after.runs_completed))
+        gained.update(self.stage_buckets.between(before.threat_stage, after.threat_stage))
+        already = self.unlocked(before)
+        return sorted((run_id for run_id in gained if run_id not in completed and run_id not in already),
+                      key=self.position.__getitem__)
+
+    # === Queries ===
+
+    def unlocks_after(self, run_id: str) -> dict:
+        """Runs unlocked directly by completing run_id, and everything downstream of it"""
+        direct = list(self.dependents.get(run_id, ()))
+        downstream, frontier = [], list(direct)
+        while frontier:
+            current = frontier.pop(0)
+            if current in downstream:
+                continue
+            downstream.append(current)
+            frontier.extend(self.dependents.get(current, ()))
+        return {"run_id": run_id, "direct": direct, "transitive": downstream}
+
+    def earliest_path(self, run_id: str, state: CampaignState) -> dict:
+        """Shortest sequence of anchor runs to complete before (and including) run_id.
+
+        The after-run chain is walked back to its root; a root gated on run
+        count reports how many more runs (of any kind) are needed, and one gated
+        on threat stage reports the stage required, since threat is not chosen.
+        """
+        if run_id not in self.runs:
+            raise KeyError(run_id)
+        completed = set(state.anchor_runs_completed)
+        result = {"run_id": run_id, "reachable": run_id not in self.unreachable, "path": [],
+                  "extra_runs_needed": 0, "threat_stage_required": None,
+                  "available_now": run_id in self.available_anchors(state)}
+        if run_id in completed or not result["reachable"]:
+            return result
+
+        chain = [run_id]
+        while self.requires[chain[-1]][0] == RunTriggerType.AFTER_RUN:
+            prerequisite = self.requires[chain[-1]][1]
+            if prerequisite in completed:
+                break
+            chain.append(prerequisite)
+        result["path"] = chain[::-1]
+
+        kind, value = self.requires[chain[-1]]
+        if kind == RunTriggerType.AFTER_RUNS_COUNT:
+            result["extra_runs_needed"] = max(0, value - state.runs_completed)
+        elif kind == RunTriggerType.THREAT_STAGE and state.threat_stage < value:
+            result["threat_stage_required"] = value
+        return result
+
+    def describe(self) -> dict:
+        """The compiled graph: each run's trigger and the runs it unlocks"""
+        return {
+            "runs": [
+                {"id": run_id, "trigger": {"type": kind.value, "value": value},
+                 "unlocks": self.dependents.get(run_id, [])}
+                for run_id, (kind, value) in self.requires.items()
+            ],
+            "start": self.start,
+            "unreachable": sorted(self.unreachable, key=self.position.__getitem__),
+        }
+
+
+_graphs: "OrderedDict[str, tuple]" = OrderedDict()
+_graphs_lock = threading.Lock()
+
+
+def get_run_graph(campaign_id: str, content: CampaignContent) -> RunGraph:
+    """Compiled graph for a campaign's content, rebuilt only when campaign.json changes"""
+    version = get_campaign_file_version(campaign_id, "campaign.json")
+    with _graphs_lock:
+        cached = _graphs.get(campaign_id)
+        if cached and cached[0] == version:
+            _graphs.move_to_end(campaign_id)
+            return cached[1]
+
+    graph = RunGraph(content)
+    with _graphs_lock:
+        _graphs[campaign_id] = (version, graph)
+        while len(_graphs) > MAX_CACHED_GRAPHS:
+            _graphs.popitem(last=False)
+    return graph
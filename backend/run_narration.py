@@ -0,0 +1,184 @@
+"""
+Run narration
+Pre-generates a run's intro narration when it starts (and its resolution when
+it completes) in the background, cached against the run id in
+run_narration.json so the first DM turn can be served without a cold call
+"""
+
+import re
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Optional
+
+import anthropic
+
+from helpers import load_campaign_json, save_campaign_json
+from campaign_schema import BLOOMBURROW_SYSTEM
+from image_generation import DEFAULT_ART_STYLE, generate_scene_image
+from dm_context_builder import (
+    assemble_dm_system_prompt,
+    build_dm_system_injection,
+    build_run_intro_prompt,
+    build_run_resolution_prompt,
+)
+
+NARRATION_FILENAME = "run_narration.json"
+
+# Longest a narration endpoint may wait for a generation in progress
+MAX_WAIT_SECONDS = 30.0
+
+_SCENE_RE = re.compile(r'\[SCENE:\s*(.+?)\]', re.IGNORECASE | re.DOTALL)
+
+_locks: dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+# Generations running in this process: (campaign_id, run_id, kind) -> (token, done event)
+_inflight: dict[tuple, tuple[str, threading.Event]] = {}
+
+
+def _campaign_lock(campaign_id: str) -> threading.Lock:
+    with _locks_guard:
+        if campaign_id not in _locks:
+            _locks[campaign_id] = threading.Lock()
+        return _locks[campaign_id]
+
+
+def _write_result(campaign_id: str, run_id: str, kind: str, entry: dict) -> bool:
+    """Store a finished generation unless a newer request has replaced it"""
+    with _campaign_lock(campaign_id):
+        data = load_campaign_json(campaign_id, NARRATION_FILENAME)
+        current = data.get(run_id, {}).get(kind)
+        if not current or current.get("token") != entry["token"]:
+            return False
+        data[run_id][kind] = entry
+        save_campaign_json(campaign_id, NARRATION_FILENAME, data)
+        return True
+
+
+def get_narration(campaign_id: str, run_id: str, kind: str) -> Optional[dict]:
+    """Cached narration entry ("intro" or "resolution") for a run, or None"""
+    return load_campaign_json(campaign_id, NARRATION_FILENAME).get(run_id, {}).get(kind)
+
+
+def clear_narration(campaign_id: str):
+    """Drop all cached narration for a campaign"""
+    with _campaign_lock(campaign_id):
+        save_campaign_json(campaign_id, NARRATION_FILENAME, {})
+
+
+def discard_run(campaign_id: str, run_id: str):
+    """Drop a run's cached narration once nothing will read it again"""
+    with _campaign_lock(campaign_id):
+        data = load_campaign_json(campaign_id, NARRATION_FILENAME)
+        if data.pop(run_id, None) is not None:
+            save_campaign_json(campaign_id, NARRATION_FILENAME, data)
+
+
+def mark_pending(campaign_id: str, run_id: str, kind: str, outcome: Optional[str] = None) -> str:
+    """Record that a narration is about to be generated; returns the token identifying this request.
+
+    Any earlier entry for the run and kind is replaced, and an older
+    generation still running will find its token stale and drop its result.
+    A pending resolution replaces the whole run entry since its intro is no
+    longer needed.
+    """
+    token = uuid.uuid4().hex
+    with _locks_guard:
+        _inflight[(campaign_id, run_id, kind)] = (token, threading.Event())
+    with _campaign_lock(campaign_id):
+        data = load_campaign_json(campaign_id, NARRATION_FILENAME)
+        if kind == "resolution":
+            data[run_id] = {}
+        data.setdefault(run_id, {})[kind] = {
+            "status": "pending",
+            "token": token,
+            "outcome": outcome,
+            "text": None,
+            "image_url": None,
+            "requested_at": datetime.utcnow().isoformat() + "Z",
+        }
+        save_campaign_json(campaign_id, NARRATION_FILENAME, data)
+    return token
+
+
+def wait_for_campaign(campaign_id: str, timeout: float = MAX_WAIT_SECONDS) -> bool:
+    """Wait for every generation this process is running for a campaign; False if one outlasts timeout"""
+    deadline = time.monotonic() + timeout
+    with _locks_guard:
+        events = [done for key, (_, done) in _inflight.items() if key[0] == campaign_id]
+    return all(done.wait(max(0.0, deadline - time.monotonic())) for done in events)
+
+
+def wait_for_narration(campaign_id: str, run_id: str, kind: str, timeout: float = 0) -> Optional[dict]:
+    """Return the narration entry, waiting up to timeout if it is generating in this process"""
+    with _locks_guard:
+        inflight = _inflight.get((campaign_id, run_id, kind))
+    if inflight and timeout > 0:
+        inflight[1].wait(min(timeout, MAX_WAIT_SECONDS))
+    return get_narration(campaign_id, run_id, kind)
+
+
+# === Generation ===
+
+def _generate_text(system: str, prompt: str) -> str:
+    client = anthropic.Anthropic()
+    response = client.messages.create(
+        model="claude-sonnet-4-20250514",
+        max_tokens=1024,
+        system=system,
+        messages=[{"role": "user", "content": prompt}]
+    )
+    return response.content[0].text
+
+
+def generate_narration(campaign_id: str, run_id: str, kind: str, token: str, dm_context: dict,
+                       outcome: Optional[str] = None, illustrate: bool = False):
+    """Generate and cache a run's intro or resolution narration (meant for a background task)"""
+    system_config = load_campaign_json(campaign_id, "system.json") or BLOOMBURROW_SYSTEM
+    if kind == "intro":
+        prompt = build_run_intro_prompt(dm_context)
+    else:
+        prompt = build_run_resolution_prompt(dm_context, outcome)
+    if illustrate:
+        prompt += "\n\n[Please include a [SCENE: ...] tag with visual details for illustration.]"
+
+    try:
+        system = assemble_dm_system_prompt(system_config, build_dm_system_injection(dm_context))
+        text = _generate_text(system, prompt)
+
+        image_url = None
+        scene_match = _SCENE_RE.search(text)
+        if illustrate:
+            scene = scene_match.group(1).strip() if scene_match else text.split("\n\n")[0][:500]
+            session = load_campaign_json(campaign_id, "current_session.json")
+            art_style = system_config.get("art_style", DEFAULT_ART_STYLE)
+            image_url, _ = generate_scene_image(scene, session, campaign_id, art_style)
+
+        entry = {
+            "status": "ready",
+            "token": token,
+            "outcome": outcome,
+            "text": _SCENE_RE.sub("", text).strip(),
+            "image_url": image_url,
+            "generated_at": datetime.utcnow().isoformat() + "Z",
+        }
+    except Exception as e:
+        entry = {
+            "status": "failed",
+            "token": token,
+            "outcome": outcome,
+            "text": None,
+            "image_url": None,
+            "error": str(e),
+        }
+
+    _write_result(campaign_id, run_id, kind, entry)
+    with _locks_guard:
+        key = (campaign_id, run_id, kind)
+        inflight = _inflight.get(key)
+        if inflight and inflight[0] == token:
+            del _inflight[key]
+    if inflight and inflight[0] == token:
+        inflight[1].set()
@@ -0,0 +1,105 @@
+"""
+Session delta sync
+Every save of current_session.json advances one version counter: new log
+entries take the next sequence numbers, and a save that changes header
+fields takes the one after and stamps them with it. Clients that pass the
+last version they saw get back only the fields and entries newer than it
+"""
+
+import hashlib
+import json
+from typing import Optional
+
+from helpers import load_campaign_json, save_campaign_json
+
+SESSION_FILENAME = "current_session.json"
+
+# Bookkeeping kept in the session file but never sent to clients
+SYNC_KEY = "_sync"
+
+# Sequenced separately from the header fields
+LOG_KEY = "log"
+
+
+def _digest(value) -> str:
+    encoded = json.dumps(value, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return hashlib.blake2b(encoded, digest_size=8).hexdigest()
+
+
+def _header(session: dict) -> dict:
+    return {k: v for k, v in session.items() if k not in (SYNC_KEY, LOG_KEY, "version")}
+
+
+def public_session(session: dict) -> dict:
+    """The session as clients see it"""
+    return {k: v for k, v in session.items() if k != SYNC_KEY}
+
+
+def load_session(campaign_id: str) -> dict:
+    return load_campaign_json(campaign_id, SESSION_FILENAME)
+
+
+def save_session(campaign_id: str, session: dict) -> dict:
+    """Stamp what changed since the session was loaded, save it, and return its public view.
+
+    A session that wasn't loaded from the file (a new or ended session)
+    starts a new sync base: clients behind it get the whole session.
+    """
+    sync = session.get(SYNC_KEY)
+    if sync is None:
+        version = load_session(campaign_id).get("version", 0)
+        sync = {"base": version + 1, "fields": {}, "removed": {}}
+    else:
+        version = session.get("version", 0)
+
+    for entry in session.get(LOG_KEY, []):
+        if "seq" not in entry:
+            version += 1
+            entry["seq"] = version
+
+    header = _header(session)
+    changed = [k for k, v in header.items() if sync["fields"].get(k, [None, None])[1] != _digest(v)]
+    removed = [k for k in sync["fields"] if k not in header]
+    if changed or removed or version < sync["base"]:
+        version += 1
+        for key in changed:
+            sync["fields"][key] = [version, _digest(header[key])]
+            sync["removed"].pop(key, None)
+        for key in removed:
+            del sync["fields"][key]
+            sync["removed"][key] = version
+
+    session["version"] = version
+    session[SYNC_KEY] = sync
+    save_campaign_json(campaign_id, SESSION_FILENAME, session)
+    return public_session(session)
+
+
+def session_changes(session: dict, since: int) -> Optional[dict]:
+    """What changed after version `since`, or None if nothing has.
+
+    full is true when the client's copy belongs to an earlier session (or
+    can't be placed): changed then holds every field and log the whole log.
+    """
+    version = session.get("version", 0)
+    sync = session.get(SYNC_KEY)
+    header = _header(session)
+    log = session.get(LOG_KEY)
+
+    if sync is not None and sync["base"] <= since <= version:
+        if since == version:
+            return None
+        changes = {
+            "full": False,
+            "version": version,
+            "changed": {k: header[k] for k, (stamp, _) in sync["fields"].items() if stamp > since},
+            "removed": sorted(k for k, stamp in sync["removed"].items() if stamp > since),
+        }
+        if log is not None:
+            changes[LOG_KEY] = [entry for entry in log if entry.get("seq", 0) > since]
+        return changes
+
+    changes = {"full": True, "version": version, "changed": header or {"active": False}, "removed": []}
+    if log is not None:
+        changes[LOG_KEY] = log
+    return changes
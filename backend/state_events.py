@@ -0,0 +1,355 @@
+"""
+Campaign state events
+Runtime state recorded as typed events in an append-only log, with periodic
+snapshots. State loads from the latest snapshot plus the events after it, so
+writes are small appends, and earlier states can be replayed or restored
+"""
+
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel
+
+from campaign_schema import CampaignState, NPCState
+from content_index import filler_index
+from helpers import get_campaign_dir, get_campaign_file_version
+
+STATE_LOG_DIRNAME = "state_log"
+EVENTS_FILENAME = os.path.join(STATE_LOG_DIRNAME, "events.jsonl")
+
+# Pre-log state file, read once as the log's first event
+LEGACY_STATE_FILENAME = "state.json"
+
+# Events between snapshots
+SNAPSHOT_INTERVAL = 50
+
+# Largest page returned by read_events
+MAX_PAGE_SIZE = 200
+
+# Campaigns whose current state is kept in memory
+MAX_CACHED_CAMPAIGNS = 64
+
+# Events that replace the whole state rather than change part of it
+FULL_STATE_EVENTS = ("state_imported", "state_reset", "state_replaced", "state_restored")
+
+EVENT_TYPES = FULL_STATE_EVENTS + (
+    "run_started",
+    "run_completed",
+    "threat_advanced",
+    "facts_learned",
+    "locations_visited",
+    "npc_met",
+    "npcs_added",
+)
+
+_locks: dict[str, threading.RLock] = {}
+_locks_guard = threading.Lock()
+
+# campaign directory -> (log version, head seq, log offset after head, state as JSON).
+# Callers get a fresh model validated from the JSON, which is several times
+# cheaper than deep-copying a long campaign's state.
+_heads: "OrderedDict[str, tuple]" = OrderedDict()
+_heads_lock = threading.Lock()
+
+
+def _campaign_lock(campaign_id: str) -> threading.RLock:
+    with _locks_guard:
+        if campaign_id not in _locks:
+            _locks[campaign_id] = threading.RLock()
+        return _locks[campaign_id]
+
+
+# === Applying events ===
+
+def state_lock(campaign_id: str) -> threading.RLock:
+    """Held while a campaign's log is written; hold it to read the log and its snapshots consistently"""
+    return _campaign_lock(campaign_id)
+
+
+def apply_event(state: CampaignState, event: dict) -> CampaignState:
+    """Apply one event to a state in place and return it"""
+    kind = event["type"]
+    if kind in FULL_STATE_EVENTS:
+        return CampaignState(**event["state"])
+    if kind == "run_started":
+        state.current_run_id = event["run_id"]
+        state.current_run_type = event["run_type"]
+    elif kind == "run_completed":
+        state.runs_completed += 1
+        if event["outcome"] == "victory":
+            if event["run_type"] == "anchor":
+                state.anchor_runs_completed.add(event["run_id"])
+            else:
+                state.filler_seeds_used.add(filler_index(event["run_id"]))
+        state.current_run_id = None
+        state.current_run_type = None
+    elif kind == "threat_advanced":
+        state.threat_stage = event["stage"]
+    elif kind == "facts_learned":
+        state.facts_known.update(event["facts"])
+    elif kind == "locations_visited":
+        state.locations_visited.update(event["locations"])
+    elif kind == "npc_met":
+        if event["npc"] in state.npcs:
+            state.npcs[event["npc"]].met = True
+    elif kind == "npcs_added":
+        for key in event["npcs"]:
+            state.npcs.setdefault(key, NPCState())
+    else:
+        raise ValueError(f"Unknown state event type: {kind}")
+    return state
+
+
+# === Log files ===
+
+def get_state_log_dir(campaign_id: str) -> str:
+    return os.path.join(get_campaign_dir(campaign_id), STATE_LOG_DIRNAME)
+
+
+def _events_path(campaign_id: str) -> str:
+    return os.path.join(get_campaign_dir(campaign_id), EVENTS_FILENAME)
+
+
+def has_state(campaign_id: str) -> bool:
+    """Whether the campaign has any recorded state (log or pre-log state file)"""
+    return (os.path.exists(_events_path(campaign_id))
+            or os.path.exists(os.path.join(get_campaign_dir(campaign_id), LEGACY_STATE_FILENAME)))
+
+
+def _snapshots(campaign_id: str) -> list[int]:
+    """Sequence numbers of the campaign's snapshots, ascending"""
+    log_dir = get_state_log_dir(campaign_id)
+    if not os.path.isdir(log_dir):
+        return []
+    return sorted(int(name[9:-5]) for name in os.listdir(log_dir)
+                  if name.startswith("snapshot_") and name.endswith(".json"))
+
+
+class _Snapshot(BaseModel):
+    seq: int
+    offset: int
+    state: CampaignState
+
+
+def _load_snapshot(campaign_id: str, seq: int) -> _Snapshot:
+    with open(os.path.join(get_state_log_dir(campaign_id), f"snapshot_{seq:08d}.json"), "rb") as f:
+        return _Snapshot.model_validate_json(f.read())
+
+
+def _write_snapshot(campaign_id: str, seq: int, offset: int, state: CampaignState):
+    filepath = os.path.join(get_state_log_dir(campaign_id), f"snapshot_{seq:08d}.json")
+    with open(filepath + ".tmp", "w") as f:
+        json.dump({"seq": seq, "offset": offset, "state": state.model_dump()}, f, indent=2)
+    os.replace(filepath + ".tmp", filepath)
+
+
+def _read_from(campaign_id: str, offset: int, until: Optional[int] = None):
+    """Events from a byte offset, each with the offset just past it.
+
+    Stops before a torn final line from an interrupted append.
+    """
+    filepath = _events_path(campaign_id)
+    if not os.path.exists(filepath):
+        return
+    with open(filepath, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                return
+            offset += len(line)
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if until is not None and event["seq"] > until:
+                return
+            yield event, offset
+
+
+def _base(campaign_id: str, at: Optional[int] = None) -> tuple[int, int, CampaignState]:
+    """(seq, offset, state) of the latest snapshot at or before `at`, or the empty log"""
+    seqs = [s for s in _snapshots(campaign_id) if at is None or s <= at]
+    if seqs:
+        snapshot = _load_snapshot(campaign_id, seqs[-1])
+        return snapshot.seq, snapshot.offset, snapshot.state
+    return 0, 0, CampaignState()
+
+
+def _replay(campaign_id: str, seq: int, offset: int, state: CampaignState,
+            until: Optional[int] = None) -> tuple[int, int, CampaignState]:
+    for event, end in _read_from(campaign_id, offset, until):
+        if event["seq"] <= seq:
+            offset = end
+            continue
+        state = apply_event(state, event)
+        seq, offset = event["seq"], end
+    return seq, offset, state
+
+
+# === Loading ===
+
+def _head(campaign_id: str) -> tuple[int, int, CampaignState]:
+    """(seq, offset, state) at the end of the log, replaying only what's new since last time"""
+    version = get_campaign_file_version(campaign_id, EVENTS_FILENAME)
+    key = get_campaign_dir(campaign_id)
+    with _heads_lock:
+        cached = _heads.get(key)
+    if cached and cached[0] == version:
+        return cached[1], cached[2], CampaignState.model_validate_json(cached[3])
+
+    if cached and version and cached[0] and cached[0][0] == version[0] and version[2] >= cached[2]:
+        # Same file, appended to since: replay just the new tail
+        seq, offset, state = _replay(campaign_id, cached[1], cached[2], CampaignState.model_validate_json(cached[3]))
+    else:
+        seq, offset, state = _replay(campaign_id, *_base(campaign_id))
+    with _heads_lock:
+        _heads[key] = (version, seq, offset, state.model_dump_json())
+        _heads.move_to_end(key)
+        while len(_heads) > MAX_CACHED_CAMPAIGNS:
+            _heads.popitem(last=False)
+    return seq, offset, state
+
+
+def load_state(campaign_id: str) -> CampaignState:
+    """Current state: latest snapshot plus the events after it"""
+    if not os.path.exists(_events_path(campaign_id)):
+        try:
+            with open(os.path.join(get_campaign_dir(campaign_id), LEGACY_STATE_FILENAME), "rb") as f:
+                return CampaignState.model_validate_json(f.read())
+        except FileNotFoundError:
+            return CampaignState()
+    return _head(campaign_id)[2]
+
+
+def head_seq(campaign_id: str) -> int:
+    """Sequence number of the latest event (0 before any)"""
+    if not os.path.exists(_events_path(campaign_id)):
+        return 0
+    return _head(campaign_id)[0]
+
+
+def state_at(campaign_id: str, seq: int) -> CampaignState:
+    """State as it was right after event `seq`"""
+    if seq < 1 or seq > head_seq(campaign_id):
+        raise KeyError(seq)
+    return _replay(campaign_id, *_base(campaign_id, at=seq), until=seq)[2]
+
+
+# === Recording ===
+
+def record_events(campaign_id: str, events: list[dict]) -> CampaignState:
+    """Append one command's events as a batch and return the resulting state.
+
+    Events are applied before anything is written, so an invalid event leaves
+    the log untouched. A campaign's first batch is preceded by a state_imported
+    event (a batch of its own) carrying the state it had before the log existed.
+    """
+    if not events:
+        return load_state(campaign_id)
+    with _campaign_lock(campaign_id):
+        batches = [(uuid.uuid4().hex[:12], events)]
+        if not os.path.exists(_events_path(campaign_id)):
+            imported = {"type": "state_imported", "state": load_state(campaign_id).model_dump()}
+            batches.insert(0, (uuid.uuid4().hex[:12], [imported]))
+        seq, offset, state = _head(campaign_id)
+
+        now = datetime.utcnow().isoformat() + "Z"
+        stamped = []
+        for batch, batch_events in batches:
+            for event in batch_events:
+                seq += 1
+                event = {"seq": seq, "batch": batch, "at": now, **event}
+                state = apply_event(state, event)
+                stamped.append(event)
+
+        os.makedirs(get_state_log_dir(campaign_id), exist_ok=True)
+        first_seq = stamped[0]["seq"]
+        with open(_events_path(campaign_id), "ab") as f:
+            if f.tell() > offset:
+                # Bytes past the last whole event are a torn append; end that line so it is skipped
+                f.write(b"\n")
+            f.write(b"".join(json.dumps(e).encode("utf-8") + b"\n" for e in stamped))
+            f.flush()
+            os.fsync(f.fileno())
+            offset = f.tell()
+
+        if seq // SNAPSHOT_INTERVAL > (first_seq - 1) // SNAPSHOT_INTERVAL:
+            _write_snapshot(campaign_id, seq, offset, state)
+        return state
+
+
+def record_event(campaign_id: str, event_type: str, **data) -> CampaignState:
+    return record_events(campaign_id, [{"type": event_type, **data}])
+
+
+def undo(campaign_id: str, steps: int = 1) -> dict:
+    """Restore the state from before the last `steps` commands.
+
+    Restores are themselves recorded, and commands already undone are skipped,
+    so repeated undos keep walking back through history. Returns the target
+    seq and the restored state; raises ValueError if there is nothing to undo.
+    """
+    with _campaign_lock(campaign_id):
+        batches = _batches(campaign_id)
+        cursor = batches[-1][1] if batches else 0
+        remaining = steps
+        for first, last, kind, to_seq in reversed(batches):
+            if not remaining:
+                break
+            if last > cursor:
+                continue
+            if kind == "state_restored":
+                cursor = to_seq
+            elif first == 1:
+                break
+            else:
+                cursor = first - 1
+                remaining -= 1
+        if remaining == steps:
+            raise ValueError("Nothing to undo")
+
+        restored = state_at(campaign_id, cursor)
+        state = record_event(campaign_id, "state_restored", to_seq=cursor, state=restored.model_dump())
+    return {"to_seq": cursor, "steps": steps - remaining, "state": state}
+
+
+def _batches(campaign_id: str) -> list[tuple]:
+    """(first seq, last seq, first event type, restore target) per recorded batch"""
+    batches: list[list] = []
+    for event, _ in _read_from(campaign_id, 0):
+        if batches and batches[-1][4] == event["batch"]:
+            batches[-1][1] = event["seq"]
+        else:
+            batches.append([event["seq"], event["seq"], event["type"], event.get("to_seq"), event["batch"]])
+    return [tuple(b[:4]) for b in batches]
+
+
+# === Reading ===
+
+def read_events(campaign_id: str, after: int = 0, limit: int = 50) -> dict:
+    """A page of events after a sequence number, oldest first (full-state payloads left out)"""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    snapshots = [s for s in _snapshots(campaign_id) if s <= after]
+    offset = _load_snapshot(campaign_id, snapshots[-1]).offset if snapshots else 0
+
+    events, has_more = [], False
+    for event, _ in _read_from(campaign_id, offset):
+        if event["seq"] <= after:
+            continue
+        if len(events) == limit:
+            has_more = True
+            break
+        if event["type"] in FULL_STATE_EVENTS:
+            event = {k: v for k, v in event.items() if k != "state"}
+        events.append(event)
+    return {
+        "events": events,
+        "next_after": events[-1]["seq"] if has_more else None,
+        "has_more": has_more,
+        "head": head_seq(campaign_id),
+    }
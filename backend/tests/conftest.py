@@ -37,6 +37,33 @@ def data_dir(tmp_path, monkeypatch):
     return d
 
 
+@pytest.fixture(autouse=True)
+def offline_narration(monkeypatch):
+    """Keep background run narration off the network; returns the prompts it was asked for"""
+    import run_narration
+
+    calls = []
+
+    def fake_generate_text(system, prompt):
+        calls.append(prompt)
+        return "Bramblewick waves you over from the hedge. Will you help? [SCENE: a hedge at dusk]"
+
+    monkeypatch.setattr(run_narration, "_generate_text", fake_generate_text)
+    monkeypatch.setattr(run_narration, "generate_scene_image", lambda *args: ("/api/images/intro.webp", "a hedge"))
+    monkeypatch.setattr(run_narration, "_inflight", {})
+    return calls
+
+
+@pytest.fixture(autouse=True)
+def reset_access_tracker():
+    """Keep batched access times from leaking between tests"""
+    from access_tracker import tracker
+
+    tracker._pending.clear()
+    yield tracker
+    tracker._pending.clear()
+
+
 @pytest.fixture
 def sample_content():
     """Return a CampaignContent built from EXAMPLE_CAMPAIGN"""
@@ -0,0 +1,187 @@
+"""
+Tests for campaign archive export and import (campaign_archive.py and its routes)
+"""
+
+import hashlib
+import io
+import json
+import os
+import tarfile
+
+import pytest
+
+import image_store
+
+
+@pytest.fixture
+def archived_campaign(campaign_dir, data_dir):
+    """The test campaign, listed in campaigns.json, holding a session image and a banner"""
+    session_image = image_store.put_bytes(b"session image bytes", ".webp",
+                                          holder=image_store.session_holder("test_campaign"))
+    banner = image_store.put_bytes(b"banner bytes", ".webp", holder=image_store.banner_holder("test_campaign"))
+    with open(str(campaign_dir / "current_session.json"), "w") as f:
+        json.dump({"active": True, "images": [f"/api/campaigns/test_campaign/images/{session_image}"]}, f)
+    campaign = {"id": "test_campaign", "name": "Rotwood Tales", "bannerFile": banner,
+                "bannerImage": "/api/campaigns/test_campaign/banner?v=abc"}
+    with open(str(data_dir / "campaigns.json"), "w") as f:
+        json.dump({"activeCampaignId": None, "campaigns": [campaign]}, f)
+    return {"dir": campaign_dir, "session_image": session_image, "banner": banner}
+
+
+def _members(archive: bytes) -> dict:
+    with tarfile.open(fileobj=io.BytesIO(archive), mode="r:") as tar:
+        return {m.name: tar.extractfile(m).read() for m in tar.getmembers()}
+
+
+def _tar(entries: list[tuple[str, bytes]]) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        for name, data in entries:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def _campaign_ids(data_dir) -> list[str]:
+    with open(str(data_dir / "campaigns.json")) as f:
+        return [c["id"] for c in json.load(f)["campaigns"]]
+
+
+# === Export ===
+
+
+class TestExport:
+    def test_manifest_leads_the_archive(self, client, archived_campaign):
+        resp = client.get("/campaigns/test_campaign/export")
+        assert resp.status_code == 200
+        assert resp.headers["content-type"] == "application/x-tar"
+        with tarfile.open(fileobj=io.BytesIO(resp.content), mode="r|") as tar:
+            assert tar.next().name == "manifest.json"
+
+    def test_checksums_match_contents(self, client, archived_campaign):
+        resp = client.get("/campaigns/test_campaign/export")
+        members = _members(resp.content)
+        manifest = json.loads(members["manifest.json"])
+        assert resp.headers["X-Archive-Manifest"] == manifest["id"]
+        assert "campaign.json" in manifest["files"]
+        for rel, entry in manifest["files"].items():
+            data = members[f"files/{rel}"]
+            assert hashlib.sha256(data).hexdigest() == entry["sha256"]
+            assert len(data) == entry["size"]
+        for name, entry in manifest["blobs"].items():
+            assert hashlib.sha256(members[f"blobs/{name}"]).hexdigest() == entry["sha256"]
+
+    def test_blobs_carry_their_holders(self, client, archived_campaign):
+        manifest = json.loads(_members(client.get("/campaigns/test_campaign/export").content)["manifest.json"])
+        assert manifest["blobs"][archived_campaign["session_image"]]["holders"] == ["session"]
+        assert manifest["blobs"][archived_campaign["banner"]]["holders"] == ["banner"]
+
+    def test_temp_files_left_out(self, client, archived_campaign):
+        (archived_campaign["dir"] / "roster.json.tmp").write_text("{")
+        manifest = json.loads(_members(client.get("/campaigns/test_campaign/export").content)["manifest.json"])
+        assert "roster.json.tmp" not in manifest["files"]
+
+    def test_incremental_export_has_only_changes(self, client, archived_campaign):
+        first = json.loads(_members(client.get("/campaigns/test_campaign/export").content)["manifest.json"])
+        (archived_campaign["dir"] / "town.json").write_text(json.dumps({"name": "Renamed", "seeds": 1}))
+
+        members = _members(client.post("/campaigns/test_campaign/export", json=first).content)
+        manifest = json.loads(members.pop("manifest.json"))
+        assert sorted(members) == ["files/town.json"]
+        assert manifest["base"] == first["id"]
+        assert set(manifest["files"]) == set(first["files"])
+
+    def test_unknown_campaign_404(self, client, data_dir):
+        assert client.get("/campaigns/nonexistent/export").status_code == 404
+
+
+# === Import ===
+
+
+class TestImport:
+    def test_round_trip_under_new_id(self, client, archived_campaign, data_dir):
+        archive = client.get("/campaigns/test_campaign/export").content
+        resp = client.post("/campaigns/import", content=archive)
+        assert resp.status_code == 200
+        new_id = resp.json()["campaign_id"]
+        assert new_id != "test_campaign"
+        assert new_id.startswith("rotwood_tales_")
+        assert _campaign_ids(data_dir) == ["test_campaign", new_id]
+
+        assert client.get(f"/campaigns/{new_id}/content").json()["name"] == "The Rotwood Blight"
+        assert client.get(f"/campaigns/{new_id}/state").json()["threat_stage"] == 1
+
+    def test_ids_remapped(self, client, archived_campaign, data_dir):
+        archive = client.get("/campaigns/test_campaign/export").content
+        new_id = client.post("/campaigns/import", content=archive).json()["campaign_id"]
+
+        session = json.loads((data_dir / "campaigns" / new_id / "current_session.json").read_text())
+        assert session["images"] == [f"/api/campaigns/{new_id}/images/{archived_campaign['session_image']}"]
+        entry = client.get(f"/campaigns/{new_id}").json()
+        assert entry["bannerImage"] == f"/api/campaigns/{new_id}/banner?v=abc"
+
+    def test_image_references_restored(self, client, archived_campaign):
+        archive = client.get("/campaigns/test_campaign/export").content
+        new_id = client.post("/campaigns/import", content=archive).json()["campaign_id"]
+
+        sha, _ = image_store.parse_blob_name(archived_campaign["session_image"])
+        assert image_store.session_holder(new_id) in image_store.get_blob(sha)["refs"]
+        sha, _ = image_store.parse_blob_name(archived_campaign["banner"])
+        assert image_store.banner_holder(new_id) in image_store.get_blob(sha)["refs"]
+
+    def test_incremental_import_into_copy(self, client, archived_campaign, data_dir):
+        first = client.get("/campaigns/test_campaign/export").content
+        copy_id = client.post("/campaigns/import", content=first).json()["campaign_id"]
+
+        (archived_campaign["dir"] / "town.json").write_text(json.dumps({"name": "Renamed", "seeds": 1}))
+        base = json.loads(_members(first)["manifest.json"])
+        changes = client.post("/campaigns/test_campaign/export", json=base).content
+
+        resp = client.post(f"/campaigns/import?into={copy_id}", content=changes)
+        assert resp.status_code == 200
+        assert json.loads((data_dir / "campaigns" / copy_id / "town.json").read_text())["name"] == "Renamed"
+        assert (data_dir / "campaigns" / copy_id / "campaign.json").exists()
+        assert _campaign_ids(data_dir) == ["test_campaign", copy_id]
+
+    def test_incremental_import_needs_target(self, client, archived_campaign):
+        base = json.loads(_members(client.get("/campaigns/test_campaign/export").content)["manifest.json"])
+        changes = client.post("/campaigns/test_campaign/export", json=base).content
+        resp = client.post("/campaigns/import", content=changes)
+        assert resp.status_code == 400
+
+    def test_checksum_mismatch_rejected(self, client, archived_campaign, data_dir):
+        members = _members(client.get("/campaigns/test_campaign/export").content)
+        members["files/roster.json"] = b'{"characters": []}'
+        resp = client.post("/campaigns/import", content=_tar(list(members.items())))
+        assert resp.status_code == 400
+        assert "Checksum mismatch" in resp.json()["detail"]
+        assert _campaign_ids(data_dir) == ["test_campaign"]
+        assert sorted(os.listdir(str(data_dir / "campaigns"))) == ["test_campaign"]
+
+    def test_invalid_document_rejected(self, client, archived_campaign, data_dir):
+        members = _members(client.get("/campaigns/test_campaign/export").content)
+        manifest = json.loads(members["manifest.json"])
+        broken = json.dumps({"name": "Broken"}).encode("utf-8")
+        members["files/campaign.json"] = broken
+        manifest["files"]["campaign.json"] = {"sha256": hashlib.sha256(broken).hexdigest(), "size": len(broken)}
+        members["manifest.json"] = json.dumps(manifest).encode("utf-8")
+
+        resp = client.post("/campaigns/import", content=_tar(list(members.items())))
+        assert resp.status_code == 400
+        assert "campaign.json is invalid" in resp.json()["detail"]
+        assert _campaign_ids(data_dir) == ["test_campaign"]
+
+    def test_path_traversal_rejected(self, client, archived_campaign, data_dir):
+        members = _members(client.get("/campaigns/test_campaign/export").content)
+        manifest = json.loads(members["manifest.json"])
+        manifest["files"]["../escape.json"] = {"sha256": hashlib.sha256(b"{}").hexdigest(), "size": 2}
+        archive = _tar([("manifest.json", json.dumps(manifest).encode("utf-8")), ("files/../escape.json", b"{}")])
+
+        resp = client.post("/campaigns/import", content=archive)
+        assert resp.status_code == 400
+        assert not (data_dir / "campaigns" / "escape.json").exists()
+
+    def test_not_an_archive_rejected(self, client, data_dir):
+        resp = client.post("/campaigns/import", content=b"definitely not a tar file" * 40)
+        assert resp.status_code == 400
@@ -0,0 +1,82 @@
+"""
+Tests for the compiled campaign content index in content_index.py
+"""
+
+import json
+
+import content_index
+from campaign_logic import build_dm_context, current_run_details, select_next_run
+from campaign_schema import CampaignContent, CampaignState
+from content_index import ContentIndex, filler_index, get_content_index, npc_key
+from helpers import save_campaign_json
+
+
+class TestLookups:
+    def test_runs_npcs_and_locations(self, sample_content):
+        index = ContentIndex(sample_content)
+        assert index.runs["first_signs"].id == "first_signs"
+        assert index.npcs["captain_thornfeather"].name == "Captain Thornfeather"
+        assert set(index.locations) == {loc.name for loc in sample_content.locations}
+        assert index.secrets == {npc.secret for npc in sample_content.npcs}
+        assert index.reveals == {run.reveal for run in sample_content.anchor_runs if run.reveal}
+
+    def test_details_are_copies(self, sample_content):
+        index = ContentIndex(sample_content)
+        details = index.details("first_signs")
+        details["must_include"].append("something else")
+        assert index.details("first_signs")["must_include"] == sample_content.anchor_runs[0].must_include
+        assert index.details("filler_0")["hook"] == sample_content.filler_seeds[0]
+        assert index.details("first_signs", "filler") is None
+        assert index.details("filler_99") is None
+
+    def test_key_helpers(self):
+        assert npc_key("Old Mossback") == "old_mossback"
+        assert filler_index("filler_3") == 3
+        assert filler_index("first_signs") is None
+        assert filler_index("filler_x") is None
+
+
+class TestMatchesUncompiled:
+    def test_dm_context_same_with_index(self, sample_content, sample_state):
+        index = ContentIndex(sample_content)
+        state = sample_state.model_copy(update={"current_run_id": "find_the_scholar", "current_run_type": "anchor"})
+        details = current_run_details(sample_content, state, index)
+        assert details == current_run_details(sample_content, state)
+        assert build_dm_context(sample_content, state, details, index) == \
+            build_dm_context(sample_content, state, details)
+
+    def test_completed_reveals_are_not_hidden(self, sample_content):
+        state = CampaignState(anchor_runs_completed=[run.id for run in sample_content.anchor_runs])
+        context = build_dm_context(sample_content, state, {})
+        assert not any(line.startswith("Run reveal") for line in context["party_does_not_know"])
+
+    def test_next_run_anchor_details(self, sample_content):
+        run = select_next_run(sample_content, CampaignState(), index=ContentIndex(sample_content))
+        assert run["type"] == "anchor" and run["id"] == "first_signs"
+
+
+class TestCache:
+    def test_compiled_once_per_content(self, campaign_dir, sample_content, monkeypatch):
+        calls = []
+        validate = CampaignContent.model_validate_json
+        monkeypatch.setattr(CampaignContent, "model_validate_json",
+                            lambda raw: calls.append(1) or validate(raw))
+        content_index._by_hash.clear()
+
+        first = get_content_index("test_campaign")
+        assert get_content_index("test_campaign") is first
+        # Rewriting identical content changes the file version but not the hash
+        save_campaign_json("test_campaign", "campaign.json", json.loads((campaign_dir / "campaign.json").read_text()))
+        assert get_content_index("test_campaign") is first
+        assert len(calls) == 1
+
+        changed = sample_content.model_copy(update={"tone": "grim"})
+        save_campaign_json("test_campaign", "campaign.json", changed.model_dump(mode="json"))
+        assert get_content_index("test_campaign").content.tone == "grim"
+        assert len(calls) == 2
+
+    def test_missing_or_invalid_content(self, campaign_dir):
+        (campaign_dir / "campaign.json").write_text('{"name": "broken"}')
+        assert get_content_index("test_campaign") is None
+        (campaign_dir / "campaign.json").unlink()
+        assert get_content_index("test_campaign") is None
@@ -0,0 +1,157 @@
+"""
+Tests for campaign-affinity routing in dispatcher.py and the interprocess locks behind it
+"""
+
+import threading
+
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from dispatcher import Dispatcher, HashRing, campaign_key
+from interprocess import FileLock
+
+
+def fake_worker(name: str, released: list):
+    """A worker app that says who served each request"""
+    app = FastAPI()
+
+    @app.post("/internal/campaigns/{campaign_id}/release")
+    def release(campaign_id: str):
+        released.append((name, campaign_id))
+        return {"released": campaign_id}
+
+    @app.api_route("/{path:path}", methods=["GET", "POST", "PUT"])
+    async def serve(path: str, request: Request):
+        return {"worker": name, "path": path, "query": str(request.query_params), "body": (await request.body()).decode()}
+
+    return app
+
+
+@pytest.fixture
+def released():
+    return []
+
+
+@pytest.fixture
+def dispatcher(released):
+    workers = {
+        name: httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_worker(name, released)), base_url=f"http://{name}")
+        for name in ("worker-0", "worker-1", "worker-2")
+    }
+    return Dispatcher(workers)
+
+
+@pytest.fixture
+def front(dispatcher):
+    with TestClient(dispatcher) as client:
+        yield client
+
+
+# === Routing ===
+
+
+class TestHashRing:
+    def test_stable(self):
+        ring = HashRing(["a", "b", "c"])
+        assert all(ring.node_for(f"camp{i}") == HashRing(["c", "b", "a"]).node_for(f"camp{i}") for i in range(50))
+
+    def test_spreads_keys(self):
+        ring = HashRing(["a", "b", "c"])
+        assert {ring.node_for(f"camp{i}") for i in range(200)} == {"a", "b", "c"}
+
+    def test_adding_a_node_only_moves_keys_to_it(self):
+        ring = HashRing(["a", "b", "c"])
+        before = {f"camp{i}": ring.node_for(f"camp{i}") for i in range(300)}
+        ring.add("d")
+        moved = {key for key, node in before.items() if ring.node_for(key) != node}
+        assert moved
+        assert all(ring.node_for(key) == "d" for key in moved)
+
+    def test_removing_a_node_only_moves_its_keys(self):
+        ring = HashRing(["a", "b", "c"])
+        before = {f"camp{i}": ring.node_for(f"camp{i}") for i in range(300)}
+        ring.remove("b")
+        assert ring.nodes == {"a", "c"}
+        for key, node in before.items():
+            if node != "b":
+                assert ring.node_for(key) == node
+
+    def test_empty(self):
+        with pytest.raises(LookupError):
+            HashRing().node_for("camp")
+
+
+class TestCampaignKey:
+    def test_campaign_paths(self):
+        assert campaign_key("/api/campaigns/rotwood") == "rotwood"
+        assert campaign_key("/api/campaigns/rotwood/session/scene") == "rotwood"
+        assert campaign_key("/campaigns/rotwood/state") == "rotwood"
+
+    def test_not_campaign_scoped(self):
+        assert campaign_key("/api/campaigns") is None
+        assert campaign_key("/api/images/abc.webp") is None
+        assert campaign_key("/") is None
+
+    def test_import(self):
+        assert campaign_key("/api/campaigns/import") is None
+        assert campaign_key("/api/campaigns/import", b"into=rotwood") == "rotwood"
+
+
+# === Dispatching ===
+
+
+class TestDispatcher:
+    def test_campaign_always_served_by_its_owner(self, front, dispatcher):
+        owner = dispatcher.ring.node_for("rotwood")
+        workers = {front.get(f"/api/campaigns/rotwood/{page}").json()["worker"] for page in ("state", "content", "session")}
+        assert workers == {owner}
+
+    def test_other_requests_round_robin(self, front):
+        assert {front.get("/api/campaigns").json()["worker"] for _ in range(6)} == {"worker-0", "worker-1", "worker-2"}
+
+    def test_forwards_body_and_query(self, front):
+        data = front.post("/api/campaigns/rotwood/session/scene?x=1", content=b'{"scene": "hedge"}').json()
+        assert data["path"] == "api/campaigns/rotwood/session/scene"
+        assert data["query"] == "x=1"
+        assert data["body"] == '{"scene": "hedge"}'
+
+    def test_internal_routes_not_exposed(self, front, released):
+        assert front.post("/internal/campaigns/rotwood/release").status_code == 404
+        assert front.post("/api/internal/campaigns/rotwood/release").status_code == 404
+        assert released == []
+
+    def test_moved_campaign_released_by_previous_owner(self, front, dispatcher, released):
+        campaigns = [f"camp{i}" for i in range(40)]
+        owners = {c: front.get(f"/api/campaigns/{c}/state").json()["worker"] for c in campaigns}
+        dispatcher.remove_worker("worker-1")
+        for c in campaigns:
+            assert front.get(f"/api/campaigns/{c}/state").json()["worker"] != "worker-1"
+        moved = sorted(c for c, owner in owners.items() if owner == "worker-1")
+        assert moved
+        assert sorted(released) == [("worker-1", c) for c in moved]
+
+    def test_no_workers(self):
+        with TestClient(Dispatcher()) as client:
+            assert client.get("/api/campaigns/rotwood").status_code == 503
+
+
+class TestFileLock:
+    def test_reentrant(self, data_dir):
+        lock = FileLock("test")
+        with lock:
+            with lock:
+                pass
+        assert (data_dir / "locks" / "test.lock").exists()
+
+    def test_excludes_other_threads(self, data_dir):
+        lock = FileLock("test")
+        order = []
+        with lock:
+            thread = threading.Thread(target=lambda: (lock.acquire(), order.append("other"), lock.release()))
+            thread.start()
+            thread.join(0.2)
+            order.append("holder")
+        thread.join()
+        assert order == ["holder", "other"]
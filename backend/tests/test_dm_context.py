@@ -0,0 +1,159 @@
+"""
+Tests for DM prompt injection assembly, the materialized context cache, and knowledge retrieval
+"""
+
+import pytest
+
+import dm_context_cache
+from campaign_logic import (
+    load_campaign_content,
+    load_campaign_state,
+    save_campaign_state,
+    build_dm_context,
+    current_run_details,
+)
+from dm_context_builder import build_dm_system_injection
+
+
+@pytest.fixture
+def active_run(campaign_dir):
+    """Start the find_the_scholar anchor run in the test campaign"""
+    state = load_campaign_state("test_campaign")
+    state.current_run_id = "find_the_scholar"
+    state.current_run_type = "anchor"
+    save_campaign_state("test_campaign", state)
+    return state
+
+
+def _session(hearts: int) -> dict:
+    return {
+        "active": True,
+        "party": [{"name": "Pip", "species": "Mousefolk", "currentHearts": hearts, "currentThreads": 3}],
+    }
+
+
+class TestMaterializedInjection:
+    def test_matches_direct_build(self, active_run):
+        content = load_campaign_content("test_campaign")
+        dm_context = build_dm_context(content, active_run, current_run_details(content, active_run))
+        expected = build_dm_system_injection(dm_context, _session(5), [])
+
+        assert dm_context_cache.build_campaign_injection("test_campaign", _session(5)) == expected
+
+    def test_reused_between_turns(self, active_run):
+        first = dm_context_cache.get_materialized_injection("test_campaign")
+        second = dm_context_cache.get_materialized_injection("test_campaign")
+        assert first is second
+
+    def test_party_status_rendered_per_turn(self, active_run):
+        assert "Hearts: 5/5" in dm_context_cache.build_campaign_injection("test_campaign", _session(5))
+        assert "Hearts: 2/5" in dm_context_cache.build_campaign_injection("test_campaign", _session(2))
+
+    def test_state_write_invalidates(self, active_run):
+        first = dm_context_cache.get_materialized_injection("test_campaign")
+        active_run.facts_known.append("The shrine is older than the city")
+        save_campaign_state("test_campaign", active_run)
+
+        injection = dm_context_cache.build_campaign_injection("test_campaign")
+        assert dm_context_cache.get_materialized_injection("test_campaign") is not first
+        assert "The shrine is older than the city" in injection
+
+    def test_prep_note_invalidates(self, client, active_run):
+        dm_context_cache.get_materialized_injection("test_campaign")
+        client.post("/campaigns/test_campaign/dm-prep/note", json={"content": "Bramblewick whispers", "category": "voice"})
+        assert "Bramblewick whispers" in dm_context_cache.build_campaign_injection("test_campaign")
+
+    def test_no_active_run_is_empty(self, campaign_dir):
+        assert dm_context_cache.build_campaign_injection("test_campaign", _session(5)) == ""
+
+
+# === Knowledge retrieval ===
+
+
+class TestKnowledgeRetrieval:
+    def _items(self):
+        return [
+            {"id": "npc:Bramblewick", "kind": "npc", "label": "Bramblewick", "text": "Bramblewick ratfolk hermit scholar insects"},
+            {"id": "npc:Mossback", "kind": "npc", "label": "Mossback", "text": "Mossback frogfolk augur marsh vision"},
+            {"id": "location:Camp", "kind": "location", "label": "Camp", "text": "Sunken patrol camp tents claw marks"},
+            {"id": "fact:0", "kind": "fact", "label": "The marsh is rising", "text": "The marsh is rising"},
+        ]
+
+    def test_bm25_ranks_matching_item_first(self):
+        from knowledge_index import KnowledgeIndex
+
+        index = KnowledgeIndex()
+        index.update(self._items())
+        selection = index.select("we ask the augur about his vision", top_k=1)
+        assert selection["ids"] == {"npc:Mossback"}
+
+    def test_always_kept_items_are_added(self):
+        from knowledge_index import KnowledgeIndex
+
+        index = KnowledgeIndex()
+        index.update(self._items())
+        selection = index.select("marsh", top_k=1, always={"location:Camp"})
+        assert "location:Camp" in selection["ids"]
+        assert len(selection["ids"]) == 2
+
+    def test_rebuild_only_tokenizes_changed_items(self):
+        from knowledge_index import KnowledgeIndex
+
+        first = KnowledgeIndex()
+        first.update(self._items())
+        items = self._items()
+        items[3] = {**items[3], "text": "The marsh has flooded"}
+        second = KnowledgeIndex(previous=first)
+        assert second.update(items) == 1
+
+    def test_must_include_names_from_run(self, active_run):
+        materialized = dm_context_cache.get_materialized_injection("test_campaign")
+        # find_the_scholar's goal names Bramblewick
+        assert "npc:Bramblewick" in materialized.always
+
+    def test_top_k_limits_injection(self, active_run):
+        result = dm_context_cache.assemble_campaign_injection(
+            "test_campaign", query="old augur marsh vision", top_k=1
+        )
+        selected = {s["id"] for s in result["retrieval"]["selected"] if not s["must_include"]}
+        assert selected == {"npc:Old Mossback"}
+        assert "Old Mossback" in result["text"]
+        assert "Captain Thornfeather (Birdfolk)" not in result["text"]
+
+    def test_small_index_keeps_everything(self):
+        from knowledge_index import KnowledgeIndex
+
+        index = KnowledgeIndex()
+        index.update(self._items())
+        assert len(index.select("", top_k=4)["ids"]) == 4
+
+    def test_empty_query_balances_kinds(self):
+        from knowledge_index import KnowledgeIndex
+
+        items = [
+            {"id": f"npc:{i}", "kind": "npc", "label": f"npc {i}", "text": f"npc {i}"} for i in range(10)
+        ] + [
+            {"id": f"fact:{i}", "kind": "fact", "label": f"fact {i}", "text": f"fact {i}"} for i in range(3)
+        ]
+        index = KnowledgeIndex()
+        index.update(items)
+        selection = index.select("", top_k=4, kinds=[item["kind"] for item in items])
+        assert {"fact:0", "fact:1"} <= selection["ids"]
+
+    def test_names_match_whole_tokens(self):
+        from knowledge_index import must_include_ids
+
+        dm_context = {"run": {"id": "r", "hook": "A crash in the woods", "goal": "Find Bramblewick", "must_include": []}}
+        items = [
+            {"id": "npc:Ash", "kind": "npc", "label": "Ash"},
+            {"id": "npc:Bramblewick", "kind": "npc", "label": "Bramblewick"},
+        ]
+        assert must_include_ids(dm_context, items) == {"npc:Bramblewick"}
+
+    def test_fact_ids_survive_list_edits(self):
+        from knowledge_index import collect_knowledge_items
+
+        base = {"npc_states": {}, "campaign_context": {}, "party_does_not_know": []}
+        before = collect_knowledge_items({**base, "party_knows": ["The marsh is rising"]})
+        after = collect_knowledge_items({**base, "party_knows": ["A new fact", "The marsh is rising"]})
+        assert before[0]["id"] == after[1]["id"]
@@ -0,0 +1,217 @@
+"""
+Tests for DM prep storage: the prep coach conversation log, access tracking, and routes
+"""
+
+import json
+
+import pytest
+
+import prep_conversation
+from prep_conversation import (
+    append_messages,
+    build_history_window,
+    clear_conversation,
+    load_index,
+    read_page,
+    update_summary,
+)
+
+
+def _exchange(n: int) -> list[dict]:
+    messages = []
+    for i in range(n):
+        messages.append({"role": "user", "content": f"question {i}"})
+        messages.append({"role": "assistant", "content": f"answer {i}"})
+    return messages
+
+
+# === Conversation log ===
+
+
+class TestConversationLog:
+    def test_append_assigns_sequence_numbers(self, campaign_dir):
+        written = append_messages("test_campaign", _exchange(2))
+        assert [m["seq"] for m in written] == [1, 2, 3, 4]
+        assert load_index("test_campaign")["next_seq"] == 5
+
+    def test_segments_roll_over(self, campaign_dir, monkeypatch):
+        monkeypatch.setattr(prep_conversation, "SEGMENT_MAX_MESSAGES", 3)
+        append_messages("test_campaign", _exchange(4))
+        segments = load_index("test_campaign")["segments"]
+        assert [s["count"] for s in segments] == [3, 3, 2]
+        assert segments[1]["first_seq"] == 4
+
+    def test_read_page_walks_backwards(self, campaign_dir, monkeypatch):
+        monkeypatch.setattr(prep_conversation, "SEGMENT_MAX_MESSAGES", 3)
+        append_messages("test_campaign", _exchange(5))
+
+        page = read_page("test_campaign", limit=4)
+        assert [m["seq"] for m in page["messages"]] == [7, 8, 9, 10]
+        assert page["has_more"] is True
+
+        older = read_page("test_campaign", before=page["next_before"], limit=4)
+        assert [m["seq"] for m in older["messages"]] == [3, 4, 5, 6]
+
+        oldest = read_page("test_campaign", before=older["next_before"], limit=4)
+        assert [m["seq"] for m in oldest["messages"]] == [1, 2]
+        assert oldest["has_more"] is False
+
+    def test_window_sends_everything_under_budget(self, campaign_dir):
+        append_messages("test_campaign", _exchange(3))
+        history = build_history_window("test_campaign", token_budget=1000)
+        assert len(history["messages"]) == 6
+        assert history["to_summarize"] == []
+
+    def test_window_overflow_marks_older_messages_for_summary(self, campaign_dir):
+        append_messages("test_campaign", _exchange(10))
+        history = build_history_window("test_campaign", token_budget=20)
+        assert history["messages"][0]["role"] == "user"
+        assert history["to_summarize"]
+        assert history["to_summarize"][-1]["seq"] + 1 == history["messages"][0]["seq"]
+
+    def test_summary_excludes_folded_messages(self, campaign_dir):
+        append_messages("test_campaign", _exchange(10))
+        update_summary("test_campaign", "- earlier talk", 16)
+        history = build_history_window("test_campaign", token_budget=1000)
+        assert history["summary"] == "- earlier talk"
+        assert [m["seq"] for m in history["messages"]] == [17, 18, 19, 20]
+
+    def test_clear_conversation(self, campaign_dir):
+        append_messages("test_campaign", _exchange(1))
+        clear_conversation("test_campaign")
+        assert read_page("test_campaign")["messages"] == []
+
+
+# === Routes ===
+
+
+class TestDMPrepRoutes:
+    def test_get_dm_prep_pages_conversation(self, client, campaign_dir):
+        append_messages("test_campaign", _exchange(30))
+        resp = client.get("/campaigns/test_campaign/dm-prep?limit=10")
+        assert resp.status_code == 200
+        data = resp.json()
+        assert len(data["conversation"]) == 10
+        assert data["conversation"][-1]["content"] == "answer 29"
+        assert data["conversation_page"]["has_more"] is True
+        assert data["conversation_page"]["total"] == 60
+
+    def test_get_conversation_page(self, client, campaign_dir):
+        append_messages("test_campaign", _exchange(5))
+        resp = client.get("/campaigns/test_campaign/dm-prep/conversation?before=5&limit=2")
+        assert [m["seq"] for m in resp.json()["messages"]] == [3, 4]
+
+    def test_inline_conversation_is_migrated(self, client, campaign_dir):
+        with open(str(campaign_dir / "dm_prep.json"), "w") as f:
+            json.dump({"conversation": _exchange(2)}, f)
+
+        data = client.get("/campaigns/test_campaign/dm-prep").json()
+        assert [m["content"] for m in data["conversation"]][:2] == ["question 0", "answer 0"]
+
+        with open(str(campaign_dir / "dm_prep.json")) as f:
+            assert json.load(f)["conversation"] == []
+
+    def test_inline_conversation_kept_when_log_exists(self, client, campaign_dir):
+        append_messages("test_campaign", _exchange(1))
+        with open(str(campaign_dir / "dm_prep.json"), "w") as f:
+            json.dump({"conversation": _exchange(2)}, f)
+
+        data = client.get("/campaigns/test_campaign/dm-prep").json()
+        assert len(data["conversation"]) == 2
+
+        legacy = campaign_dir / "prep_conversation" / prep_conversation.LEGACY_FILENAME
+        with open(str(legacy)) as f:
+            assert [m["content"] for m in json.load(f)][:2] == ["question 0", "answer 0"]
+
+    def test_overflow_summary_refreshed_after_response(self, client, campaign_dir, monkeypatch):
+        from routes import dm_prep
+
+        class _Text:
+            text = "Noted."
+
+        class _Client:
+            class messages:
+                @staticmethod
+                def create(**kwargs):
+                    class _Response:
+                        content = [_Text()]
+                    return _Response()
+
+        monkeypatch.setattr(dm_prep.anthropic, "Anthropic", lambda: _Client())
+        monkeypatch.setattr(dm_prep, "summarize_conversation", lambda prev, msgs: "- model summary")
+        monkeypatch.setattr(dm_prep, "build_history_window", lambda cid: build_history_window(cid, token_budget=20))
+        append_messages("test_campaign", _exchange(10))
+
+        resp = client.post("/campaigns/test_campaign/dm-prep/message", json={"message": "next?"})
+        assert resp.status_code == 200
+        assert load_index("test_campaign")["summary"] == "- model summary"
+
+    def test_clear_conversation_route(self, client, campaign_dir):
+        append_messages("test_campaign", _exchange(2))
+        resp = client.delete("/campaigns/test_campaign/dm-prep/conversation")
+        assert resp.status_code == 200
+        assert client.get("/campaigns/test_campaign/dm-prep").json()["conversation"] == []
+
+
+# === Access tracking ===
+
+
+class TestAccessTracker:
+    def test_get_dm_prep_does_not_rewrite_document(self, client, campaign_dir):
+        client.post("/campaigns/test_campaign/dm-prep/note", json={"content": "Speak softly"})
+        prep_path = str(campaign_dir / "dm_prep.json")
+        with open(prep_path) as f:
+            before = f.read()
+
+        data = client.get("/campaigns/test_campaign/dm-prep").json()
+        assert data["last_accessed"] is not None
+        with open(prep_path) as f:
+            assert f.read() == before
+
+    def test_touches_are_batched_until_flush(self, campaign_dir):
+        from access_tracker import AccessTracker, ACCESS_FILENAME
+
+        tracker = AccessTracker(flush_interval=3600)
+        tracker.touch("test_campaign", "dm_prep")
+        assert not (campaign_dir / ACCESS_FILENAME).exists()
+        assert tracker.get("test_campaign", "dm_prep") is not None
+
+        tracker.flush()
+        with open(str(campaign_dir / ACCESS_FILENAME)) as f:
+            assert "dm_prep" in json.load(f)
+
+    def test_background_thread_flushes_without_traffic(self, campaign_dir):
+        import time
+        from access_tracker import AccessTracker, ACCESS_FILENAME
+
+        tracker = AccessTracker(flush_interval=0.05)
+        tracker.start()
+        try:
+            tracker.touch("test_campaign", "dm_prep")
+            deadline = time.monotonic() + 2
+            while not (campaign_dir / ACCESS_FILENAME).exists() and time.monotonic() < deadline:
+                time.sleep(0.02)
+            assert (campaign_dir / ACCESS_FILENAME).exists()
+        finally:
+            tracker.stop()
+
+    def test_touch_leaves_flushing_to_the_thread(self, campaign_dir):
+        from access_tracker import AccessTracker, ACCESS_FILENAME
+
+        tracker = AccessTracker(flush_interval=3600)
+        tracker.start()
+        try:
+            tracker._last_flush -= 7200  # interval long past
+            tracker.touch("test_campaign", "dm_prep")
+            assert not (campaign_dir / ACCESS_FILENAME).exists()
+        finally:
+            tracker.stop()
+        assert (campaign_dir / ACCESS_FILENAME).exists()
+
+    def test_flush_skips_deleted_campaigns(self, data_dir):
+        from access_tracker import AccessTracker
+
+        tracker = AccessTracker(flush_interval=3600)
+        tracker.touch("gone_campaign", "dm_prep")
+        tracker.flush()
+        assert not (data_dir / "campaigns" / "gone_campaign").exists()
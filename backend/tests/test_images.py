@@ -0,0 +1,641 @@
+"""
+Tests for campaign image serving: derivatives, format negotiation and HTTP caching
+"""
+
+import io
+import json
+import os
+
+import httpx
+import pytest
+from PIL import Image
+
+import downloads
+import image_batch
+import image_derivatives
+import image_gallery
+import image_generation
+import image_quota
+import image_reuse
+import image_store
+
+
+@pytest.fixture
+def scene_image(campaign_dir):
+    """A generated scene image in the test campaign's images directory"""
+    images_dir = campaign_dir / "images"
+    images_dir.mkdir()
+    Image.new("RGB", (1600, 900), (90, 140, 60)).save(str(images_dir / "scene.webp"), format="WEBP")
+    return images_dir
+
+
+@pytest.fixture
+def registered_campaign(campaign_dir, data_dir):
+    """List the test campaign in campaigns.json"""
+    with open(str(data_dir / "campaigns.json"), "w") as f:
+        json.dump({"activeCampaignId": None, "campaigns": [{"id": "test_campaign", "name": "Test"}]}, f)
+    return campaign_dir
+
+
+def _png_bytes() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 32), (200, 120, 40)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class TestImageDerivatives:
+    def test_render_all_sizes(self, scene_image):
+        result = image_derivatives.render_derivatives(str(scene_image), "scene.webp")
+        assert result["placeholder"].startswith("data:image/webp;base64,")
+
+        thumb = image_derivatives.derivative_path(str(scene_image), "scene.webp", "thumb", "jpeg")
+        with Image.open(thumb) as img:
+            assert max(img.size) == 320
+
+    def test_rendered_in_process_pool(self, scene_image):
+        future = image_derivatives.schedule_derivatives(str(scene_image), "scene.webp")
+        future.result(timeout=60)
+        assert image_derivatives.has_derivatives(str(scene_image), "scene.webp")
+        assert image_derivatives.schedule_derivatives(str(scene_image), "scene.webp") is None
+
+    def test_negotiate_format(self):
+        assert image_derivatives.negotiate_format("image/avif,image/webp,*/*") == image_derivatives.FORMATS[0]
+        assert image_derivatives.negotiate_format("image/webp,*/*") == "webp"
+        assert image_derivatives.negotiate_format("*/*") == "jpeg"
+        assert image_derivatives.negotiate_format(None) == "jpeg"
+
+    def test_without_avif_encoder(self, scene_image, monkeypatch):
+        monkeypatch.setattr(image_derivatives, "FORMATS", ("webp", "jpeg"))
+        assert image_derivatives.negotiate_format("image/avif,image/webp,*/*") == "webp"
+        image_derivatives.render_derivatives(str(scene_image), "scene.webp")
+        assert image_derivatives.has_derivatives(str(scene_image), "scene.webp")
+        assert os.path.exists(image_derivatives.derivative_path(str(scene_image), "scene.webp", "thumb", "webp"))
+        assert not os.path.exists(image_derivatives.derivative_path(str(scene_image), "scene.webp", "thumb", "avif"))
+
+
+class TestImageRoutes:
+    def test_original_served_with_its_type(self, client, scene_image):
+        resp = client.get("/campaigns/test_campaign/images/scene.webp")
+        assert resp.status_code == 200
+        assert resp.headers["content-type"] == "image/webp"
+
+    def test_size_negotiated_from_accept(self, client, scene_image):
+        image_derivatives.render_derivatives(str(scene_image), "scene.webp")
+        resp = client.get("/campaigns/test_campaign/images/scene.webp?size=thumb", headers={"Accept": "image/webp"})
+        assert resp.headers["content-type"] == "image/webp"
+        assert "Accept" in resp.headers["vary"]
+
+        resp = client.get("/campaigns/test_campaign/images/scene.webp?size=thumb", headers={"Accept": "image/png"})
+        assert resp.headers["content-type"] == "image/jpeg"
+        assert len(resp.content) < os.path.getsize(str(scene_image / "scene.webp")) * 4
+
+    def test_missing_derivative_falls_back_and_queues(self, client, scene_image, monkeypatch):
+        queued = []
+        monkeypatch.setattr(image_derivatives, "schedule_derivatives", lambda d, f: queued.append(f))
+        resp = client.get("/campaigns/test_campaign/images/scene.webp?size=medium")
+        assert resp.status_code == 200
+        assert resp.headers["content-type"] == "image/webp"
+        assert queued == ["scene.webp"]
+
+    def test_unknown_size_rejected(self, client, scene_image):
+        assert client.get("/campaigns/test_campaign/images/scene.webp?size=huge").status_code == 400
+
+    def test_placeholder(self, client, scene_image):
+        image_derivatives.render_derivatives(str(scene_image), "scene.webp")
+        data = client.get("/campaigns/test_campaign/images/scene.webp/placeholder").json()
+        assert data["placeholder"].startswith("data:image/webp")
+
+    def test_bulk_derivatives(self, client, scene_image, monkeypatch):
+        queued = []
+        monkeypatch.setattr(image_derivatives, "schedule_derivatives", lambda d, f: queued.append(f) or True)
+        data = client.post("/campaigns/test_campaign/images/derivatives").json()
+        assert data["queued"] == 1
+        assert queued == ["scene.webp"]
+
+
+# === HTTP caching ===
+
+
+class TestImageCaching:
+    UUID_NAME = "0123456789abcdef0123456789abcdef.webp"
+
+    @pytest.fixture
+    def uuid_image(self, scene_image):
+        os.rename(str(scene_image / "scene.webp"), str(scene_image / self.UUID_NAME))
+        return f"/campaigns/test_campaign/images/{self.UUID_NAME}"
+
+    def test_uuid_images_are_immutable(self, client, uuid_image):
+        resp = client.get(uuid_image)
+        assert "immutable" in resp.headers["cache-control"]
+        assert resp.headers["etag"]
+
+    def test_if_none_match_returns_304(self, client, uuid_image):
+        etag = client.get(uuid_image).headers["etag"]
+        resp = client.get(uuid_image, headers={"If-None-Match": etag})
+        assert resp.status_code == 304
+        assert resp.content == b""
+
+    def test_range_request(self, client, uuid_image):
+        resp = client.get(uuid_image, headers={"Range": "bytes=0-9"})
+        assert resp.status_code == 206
+        assert len(resp.content) == 10
+
+    def test_pending_derivative_not_immutable(self, client, uuid_image, monkeypatch):
+        monkeypatch.setattr(image_derivatives, "schedule_derivatives", lambda d, f: None)
+        resp = client.get(uuid_image + "?size=thumb")
+        assert resp.headers["cache-control"] == "no-cache"
+
+
+class TestBannerCaching:
+    def _upload(self, client):
+        return client.post(
+            "/campaigns/test_campaign/banner", files={"file": ("banner.png", _png_bytes(), "image/png")}
+        ).json()
+
+    def test_upload_records_file_and_hash(self, client, registered_campaign, data_dir):
+        url = self._upload(client)["bannerImage"]
+        with open(str(data_dir / "campaigns.json")) as f:
+            campaign = json.load(f)["campaigns"][0]
+        assert campaign["bannerFile"] == f"{campaign['bannerHash']}.webp"
+        assert url.endswith(f"?v={campaign['bannerHash'][:12]}")
+
+    def test_versioned_banner_is_immutable(self, client, registered_campaign):
+        url = self._upload(client)["bannerImage"].removeprefix("/api")
+        assert "immutable" in client.get(url).headers["cache-control"]
+
+        resp = client.get("/campaigns/test_campaign/banner")
+        assert resp.headers["cache-control"] == "no-cache"
+        assert client.get("/campaigns/test_campaign/banner", headers={"If-None-Match": resp.headers["etag"]}).status_code == 304
+
+    def test_legacy_banner_still_served(self, client, registered_campaign):
+        with open(str(registered_campaign / "banner.png"), "wb") as f:
+            f.write(_png_bytes())
+        resp = client.get("/campaigns/test_campaign/banner")
+        assert resp.status_code == 200
+        assert resp.headers["content-type"] == "image/png"
+
+
+class TestBannerUpload:
+    def _upload(self, client, content, content_type="image/jpeg"):
+        return client.post("/campaigns/test_campaign/banner", files={"file": ("photo", content, content_type)})
+
+    def _photo(self, size=(3000, 4000), color=(30, 60, 90)) -> bytes:
+        buffer = io.BytesIO()
+        Image.new("RGB", size, color).save(buffer, format="JPEG")
+        return buffer.getvalue()
+
+    def test_transcoded_to_standard_banner(self, client, registered_campaign):
+        url = self._upload(client, self._photo())
+        resp = client.get(url.json()["bannerImage"].removeprefix("/api"))
+        assert resp.headers["content-type"] == "image/webp"
+        with Image.open(io.BytesIO(resp.content)) as banner:
+            assert banner.size == image_derivatives.BANNER_SIZE
+
+    def test_derivatives_published_with_banner(self, client, registered_campaign):
+        url = self._upload(client, self._photo()).json()["bannerImage"].removeprefix("/api")
+        resp = client.get(url + "&size=thumb", headers={"Accept": "image/avif,image/webp"})
+        assert resp.headers["content-type"] == image_derivatives.MEDIA_TYPES[image_derivatives.FORMATS[0]]
+        assert "immutable" in resp.headers["cache-control"]
+
+    def test_oversized_upload_rejected(self, client, registered_campaign, monkeypatch):
+        import routes.campaigns
+        monkeypatch.setattr(routes.campaigns, "MAX_BANNER_UPLOAD_BYTES", 1024)
+        assert self._upload(client, self._photo()).status_code == 413
+        assert client.get("/campaigns/test_campaign/banner").status_code == 404
+        incoming = image_store.get_incoming_dir()
+        assert not os.path.isdir(incoming) or os.listdir(incoming) == []
+
+    def test_cap_enforced_while_streaming(self, tmp_path):
+        import asyncio
+        from fastapi import HTTPException, UploadFile
+        from routes.campaigns import _receive_upload
+
+        upload = UploadFile(io.BytesIO(b"x" * 300_000))  # no declared size, as with chunked uploads
+        with pytest.raises(HTTPException) as excinfo:
+            asyncio.run(_receive_upload(upload, str(tmp_path), 100_000))
+        assert excinfo.value.status_code == 413
+        assert os.listdir(tmp_path) == []
+
+    def test_unreadable_image_rejected(self, client, registered_campaign):
+        assert self._upload(client, b"not really a jpeg").status_code == 400
+        assert os.listdir(image_store.get_incoming_dir()) == []
+
+    def test_replacing_banner_releases_old_one(self, client, registered_campaign, data_dir):
+        self._upload(client, self._photo())
+        with open(str(data_dir / "campaigns.json")) as f:
+            first = json.load(f)["campaigns"][0]["bannerHash"]
+        self._upload(client, self._photo((800, 600), (200, 40, 40)))
+        assert image_store.get_blob(first)["refs"] == []
+
+
+# === Downloads ===
+
+
+@pytest.fixture
+def remote(monkeypatch):
+    """Serve canned responses to the pooled download client: {url: (content_type, body)}"""
+    routes = {}
+
+    def handler(request):
+        content_type, body = routes[str(request.url)]
+        return httpx.Response(200, headers={"content-type": content_type}, content=body)
+
+    monkeypatch.setattr(downloads, "_client", httpx.Client(transport=httpx.MockTransport(handler)))
+    return routes
+
+
+class TestImageDownloads:
+    def test_streams_to_file_with_checksum(self, remote, tmp_path):
+        import hashlib
+
+        body = _png_bytes()
+        remote["https://cdn.test/a.png"] = ("image/png", body)
+        result = downloads.download_image_file("https://cdn.test/a.png", str(tmp_path))
+        assert result["filename"].endswith(".png")
+        assert result["sha256"] == hashlib.sha256(body).hexdigest()
+        with open(result["path"], "rb") as f:
+            assert f.read() == body
+
+    def test_oversized_download_leaves_nothing(self, remote, tmp_path):
+        remote["https://cdn.test/big.webp"] = ("image/webp", b"x" * 5000)
+        with pytest.raises(downloads.DownloadError):
+            downloads.download_image_file("https://cdn.test/big.webp", str(tmp_path), max_bytes=1000)
+        assert os.listdir(str(tmp_path)) == []
+
+    def test_rejects_non_image(self, remote, tmp_path):
+        remote["https://cdn.test/page"] = ("text/html", b"<html></html>")
+        with pytest.raises(downloads.DownloadError):
+            downloads.download_image_file("https://cdn.test/page", str(tmp_path))
+        assert os.listdir(str(tmp_path)) == []
+
+    def test_download_image_returns_campaign_url(self, remote, campaign_dir, monkeypatch):
+        import image_generation
+
+        monkeypatch.setattr(image_generation, "schedule_derivatives", lambda d, f: None)
+        remote["https://cdn.test/scene.webp"] = ("image/webp", b"RIFF0000WEBP")
+        url = image_generation.download_image("https://cdn.test/scene.webp", "test_campaign")
+        assert url.startswith("/api/campaigns/test_campaign/images/")
+        assert url.endswith(".webp")
+        sha, _ = image_store.parse_blob_name(url.rsplit("/", 1)[1])
+        assert image_store.get_blob(sha)["refs"] == ["session:test_campaign", "library:test_campaign"]
+
+
+# === Content-addressed store ===
+
+
+def _store(content: bytes, holder=None) -> str:
+    return image_store.put_bytes(content, ".png", holder=holder)
+
+
+class TestImageStore:
+    def test_identical_images_are_deduplicated(self, data_dir):
+        body = _png_bytes()
+        first = _store(body, image_store.session_holder("a"))
+        second = _store(body, image_store.session_holder("b"))
+        assert first == second
+        sha, _ = image_store.parse_blob_name(first)
+        assert image_store.get_blob(sha)["refs"] == ["session:a", "session:b"]
+        assert len([n for n in os.listdir(image_store.blob_dir(sha)) if n.endswith(".png")]) == 1
+
+    def test_missing_blob_file_restored_with_its_references(self, data_dir):
+        body = _png_bytes()
+        name = _store(body, image_store.session_holder("a"))
+        sha, ext = image_store.parse_blob_name(name)
+        os.remove(image_store.blob_path(sha, ext))
+
+        _store(body, image_store.session_holder("b"))
+        assert os.path.exists(image_store.blob_path(sha, ext))
+        assert image_store.get_blob(sha)["refs"] == ["session:a", "session:b"]
+
+    def test_gc_respects_references_and_grace(self, data_dir):
+        name = _store(_png_bytes(), image_store.session_holder("a"))
+        sha, ext = image_store.parse_blob_name(name)
+
+        assert image_store.collect_garbage(grace_seconds=0)["deleted_blobs"] == 0
+        image_store.release_holder(image_store.session_holder("a"))
+        assert image_store.collect_garbage(grace_seconds=3600)["deleted_blobs"] == 0
+        assert image_store.storage_report(grace_seconds=3600)["unreferenced_blobs"] == 1
+
+        report = image_store.storage_report(grace_seconds=0)
+        assert report["reclaimable_bytes"] == image_store.get_blob(sha)["size"]
+        assert image_store.collect_garbage(grace_seconds=0)["deleted_blobs"] == 1
+        assert not os.path.exists(image_store.blob_path(sha, ext))
+
+    def test_end_session_releases_unkept_images(self, client, campaign_dir):
+        kept = _store(_png_bytes(), image_store.session_holder("test_campaign"))
+        client.post(f"/campaigns/test_campaign/images/{kept}/keep")
+        dropped = _store(b"other image", image_store.session_holder("test_campaign"))
+
+        client.post("/campaigns/test_campaign/session/end", json={"outcome": "retreat"})
+        assert image_store.get_blob(image_store.parse_blob_name(kept)[0])["refs"] == ["archive:test_campaign"]
+        assert image_store.get_blob(image_store.parse_blob_name(dropped)[0])["refs"] == []
+
+    def test_blob_served_through_campaign_route(self, client, campaign_dir):
+        name = _store(_png_bytes(), image_store.session_holder("test_campaign"))
+        resp = client.get(f"/campaigns/test_campaign/images/{name}")
+        assert resp.status_code == 200
+        assert "immutable" in resp.headers["cache-control"]
+
+    def test_report_route(self, client, data_dir):
+        _store(_png_bytes())
+        assert client.get("/image-store/report").json()["blobs"] == 1
+
+
+# === Scene image reuse ===
+
+
+@pytest.fixture
+def reuse_enabled(registered_campaign, data_dir):
+    with open(str(data_dir / "campaigns.json"), "w") as f:
+        json.dump({"activeCampaignId": None, "campaigns": [
+            {"id": "test_campaign", "name": "Test", "imageReuse": True, "imageReuseThreshold": 0.8}
+        ]}, f)
+    return registered_campaign
+
+
+def _stored_scene(prompt, location="Thornwick Meadow", party=("Pip",)) -> str:
+    name = _store(prompt.encode("utf-8"), image_store.library_holder("test_campaign"))
+    url = f"/api/campaigns/test_campaign/images/{name}"
+    image_reuse.record_image("test_campaign", url, prompt, location, list(party))
+    return url
+
+
+class TestImageReuse:
+    PROMPT = "a hedgehog knight by a mossy stone bridge at dusk, fireflies"
+
+    def test_similar_scene_reuses_image(self, campaign_dir):
+        url = _stored_scene(self.PROMPT)
+        match = image_reuse.find_reusable(
+            "test_campaign", self.PROMPT + ", lanterns", "Thornwick Meadow", ["Pip"], 0.8)
+        assert match["url"] == url
+        assert match["similarity"] >= 0.8
+
+    def test_different_location_is_not_reused(self, campaign_dir):
+        _stored_scene(self.PROMPT)
+        assert image_reuse.find_reusable("test_campaign", self.PROMPT, "Saltmarsh Docks", ["Pip"], 0.8) is None
+        recent = image_reuse.load_reuse_index("test_campaign")["recent"]
+        assert recent[-1]["reused"] is False and 0 < recent[-1]["similarity"] < 0.8
+
+    def test_collected_image_is_not_reused(self, campaign_dir):
+        url = _stored_scene(self.PROMPT)
+        sha, ext = image_store.parse_blob_name(url.rsplit("/", 1)[-1])
+        os.remove(image_store.blob_path(sha, ext))
+        assert image_reuse.find_reusable("test_campaign", self.PROMPT, "Thornwick Meadow", ["Pip"]) is None
+
+    def test_generation_skipped_when_reuse_enabled(self, reuse_enabled, monkeypatch):
+        url = _stored_scene(self.PROMPT)
+        monkeypatch.setattr(image_generation, "craft_image_prompt", lambda *args: self.PROMPT)
+        monkeypatch.setattr(image_generation.replicate, "run", lambda *a, **k: pytest.fail("generated"))
+        session = {"location": "Thornwick Meadow", "party": [{"name": "Pip"}]}
+
+        image_url, _ = image_generation.generate_scene_image("the bridge again", session, "test_campaign")
+        assert image_url == url
+        sha = image_store.parse_blob_name(url.rsplit("/", 1)[-1])[0]
+        assert image_store.session_holder("test_campaign") in image_store.get_blob(sha)["refs"]
+
+    def test_report_route(self, client, reuse_enabled):
+        _stored_scene(self.PROMPT)
+        image_reuse.find_reusable("test_campaign", self.PROMPT, "Thornwick Meadow", ["Pip"], 0.8)
+        report = client.get("/campaigns/test_campaign/images/reuse").json()
+        assert report["enabled"] is True
+        assert (report["generated"], report["reused"]) == (1, 1)
+        assert report["estimated_savings_usd"] == image_reuse.COST_PER_IMAGE_USD
+
+    def test_settings_updated_through_campaign(self, client, registered_campaign):
+        resp = client.put("/campaigns/test_campaign", json={"imageReuse": True, "imageReuseThreshold": 0.9})
+        assert resp.status_code == 200
+        assert image_reuse.reuse_settings("test_campaign") == {"enabled": True, "threshold": 0.9}
+
+
+# === Batch generation ===
+
+
+@pytest.fixture
+def fake_flux(monkeypatch):
+    """Stand-in for Flux that tracks how many generations run at once"""
+    import threading
+    import time
+
+    state = {"active": 0, "peak": 0, "prompts": []}
+    lock = threading.Lock()
+
+    def generate(full_prompt, campaign_id=None):
+        with lock:
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+            state["prompts"].append(full_prompt)
+        time.sleep(0.02)
+        with lock:
+            state["active"] -= 1
+        if "cursed" in full_prompt:
+            raise RuntimeError("NSFW filter")
+        return f"/api/campaigns/{campaign_id}/images/{len(full_prompt)}.webp"
+
+    monkeypatch.setattr(image_batch, "generate_flux_image", generate)
+    return state
+
+
+def _stream(resp) -> list[dict]:
+    return [json.loads(line) for line in resp.text.splitlines() if line]
+
+
+class TestImageBatch:
+    def test_items_stream_with_bounded_concurrency(self, client, campaign_dir, fake_flux):
+        items = [{"prompt": f"mushroom grove {i}", "style": "scene"} for i in range(8)]
+        resp = client.post("/campaigns/test_campaign/image/batch", json={"items": items, "concurrency": 3})
+        assert resp.headers["content-type"].startswith("application/x-ndjson")
+
+        lines = _stream(resp)
+        assert sorted(line["index"] for line in lines[:-1]) == list(range(8))
+        assert lines[-1] == {"done": True, "total": 8, "succeeded": 8, "failed": 0}
+        assert 1 < fake_flux["peak"] <= 3
+
+    def test_prompts_use_campaign_style_and_prefixes(self, client, campaign_dir, fake_flux):
+        (campaign_dir / "system.json").write_text(json.dumps({"art_style": "ink wash"}))
+        client.post("/campaigns/test_campaign/image/batch",
+                    json={"items": [{"prompt": "a toad bandit", "style": "enemy"}]})
+        assert fake_flux["prompts"] == [
+            "ink wash, creature design, slightly menacing but not scary, a toad bandit"
+        ]
+
+    def test_seeded_from_npcs_and_locations(self, client, campaign_dir, sample_content, fake_flux):
+        resp = client.post("/campaigns/test_campaign/image/batch", json={"seed": ["npcs", "locations"]})
+        summary = _stream(resp)[-1]
+        assert summary["total"] == len(sample_content.npcs) + len(sample_content.locations)
+        npc = sample_content.npcs[0]
+        assert any(npc.name in p and "character portrait" in p for p in fake_flux["prompts"])
+
+    def test_failed_item_reported_without_stopping_batch(self, client, campaign_dir, fake_flux):
+        items = [{"prompt": "a cursed idol"}, {"prompt": "a sunny glade"}]
+        lines = _stream(client.post("/campaigns/test_campaign/image/batch", json={"items": items}))
+        failed = next(line for line in lines if line.get("index") == 0)
+        assert failed["image_url"] is None and failed["error"] == "NSFW filter"
+        assert lines[-1]["succeeded"] == 1
+
+    def test_rejects_empty_and_unknown_seed(self, client, campaign_dir, fake_flux):
+        assert client.post("/campaigns/test_campaign/image/batch", json={}).status_code == 400
+        assert client.post("/campaigns/test_campaign/image/batch", json={"seed": ["items"]}).status_code == 400
+
+
+# === Quotas ===
+
+
+def _download(campaign_id, content: bytes) -> str:
+    """A generated image as download_image stores it: session and library references, counted"""
+    name = _store(content, image_store.session_holder(campaign_id))
+    sha, _ = image_store.parse_blob_name(name)
+    image_store.add_ref(sha, image_store.library_holder(campaign_id))
+    image_quota.record_download(campaign_id, name, image_store.get_blob(sha)["size"])
+    return name
+
+
+def _refs(name):
+    return image_store.get_blob(image_store.parse_blob_name(name)[0])["refs"]
+
+
+@pytest.fixture
+def quota(registered_campaign, data_dir):
+    """Limit the test campaign to three retained images"""
+    with open(str(data_dir / "campaigns.json"), "w") as f:
+        json.dump({"activeCampaignId": None, "campaigns": [
+            {"id": "test_campaign", "name": "Test", "imageQuotaCount": 3}
+        ]}, f)
+    return registered_campaign
+
+
+class TestImageQuota:
+    def test_usage_tracked_per_download(self, client, quota):
+        first = _download("test_campaign", b"image one")
+        _download("test_campaign", b"image two")
+        usage = client.get("/campaigns/test_campaign/images/usage").json()
+        assert (usage["count"], usage["bytes"]) == (2, len(b"image one") + len(b"image two"))
+        assert usage["max_count"] == 3 and usage["over_quota"] is False
+        assert usage["evictable_count"] == 0  # all still shown in the active session
+        assert first in image_quota.load_usage("test_campaign")["images"]
+
+    def test_least_recently_served_evicted(self, client, quota):
+        names = [_download("test_campaign", f"image {i}".encode()) for i in range(3)]
+        image_store.release_holder(image_store.session_holder("test_campaign"))  # session ended
+        client.get(f"/campaigns/test_campaign/images/{names[0]}")  # served recently
+
+        newest = _store(b"image 3", image_store.library_holder("test_campaign"))
+        assert image_quota.record_download("test_campaign", newest, 7) == [names[1]]
+        assert _refs(names[1]) == []
+        assert "library:test_campaign" in _refs(names[0])
+
+    def test_protected_images_never_evicted(self, client, quota):
+        kept = _download("test_campaign", b"kept")
+        client.post(f"/campaigns/test_campaign/images/{kept}/keep")
+        live = [_download("test_campaign", f"live {i}".encode()) for i in range(3)]
+
+        usage = client.get("/campaigns/test_campaign/images/usage").json()
+        assert usage["count"] == 4 and usage["over_quota"] is True
+        assert all("library:test_campaign" in _refs(name) for name in [kept] + live)
+
+    def test_lowered_limit_enforced_on_update(self, client, quota):
+        names = [_download("test_campaign", f"image {i}".encode()) for i in range(3)]
+        image_store.release_holder(image_store.session_holder("test_campaign"))
+        client.put("/campaigns/test_campaign", json={"imageQuotaCount": 1})
+        assert client.get("/campaigns/test_campaign/images/usage").json()["count"] == 1
+        assert _refs(names[2]) == ["library:test_campaign"]
+
+    def test_evicted_image_not_reused(self, quota):
+        name = _download("test_campaign", b"old scene")
+        url = f"/api/campaigns/test_campaign/images/{name}"
+        image_reuse.record_image("test_campaign", url, "a mossy bridge", "Thornwick", [])
+        image_store.release_holder(image_store.session_holder("test_campaign"))
+        image_store.release_holder(image_store.library_holder("test_campaign"))
+        assert image_reuse.find_reusable("test_campaign", "a mossy bridge", "Thornwick", []) is None
+
+    def test_report_reads_index_once(self, quota, monkeypatch):
+        for i in range(3):
+            _download("test_campaign", f"image {i}".encode())
+        reads = []
+        original = image_store._load_refs
+        monkeypatch.setattr(image_store, "_load_refs", lambda: reads.append(1) or original())
+        assert image_quota.usage_report("test_campaign")["count"] == 3
+        assert len(reads) == 1
+
+    def test_rebuild_skips_collected_blobs(self, quota, monkeypatch):
+        _download("test_campaign", b"kept")
+        gone = _download("test_campaign", b"collected")
+        held = image_store.blobs_held_by("test_campaign")
+        monkeypatch.setattr(image_store, "blobs_held_by", lambda campaign_id: held)
+        sha, _ = image_store.parse_blob_name(gone)
+        refs = image_store._load_refs()
+        del refs[sha]
+        image_store._save_refs(refs)
+        assert gone not in image_quota._rebuild_usage("test_campaign")["images"]
+
+
+# === Gallery ===
+
+
+def _gallery_image(content: bytes, run_id=None, prompt="") -> dict:
+    name = _store(content, image_store.library_holder("test_campaign"))
+    return image_gallery.record_image("test_campaign", f"/api/campaigns/test_campaign/images/{name}",
+                                      prompt, run_id=run_id)
+
+
+class TestImageGallery:
+    def test_cursor_pages_newest_first(self, client, campaign_dir):
+        seqs = [_gallery_image(f"image {i}".encode())["seq"] for i in range(5)]
+        first = client.get("/campaigns/test_campaign/images?limit=2").json()
+        assert [img["seq"] for img in first["images"]] == seqs[:-3:-1]
+        assert first["has_more"] is True and first["total"] == 5
+
+        second = client.get(f"/campaigns/test_campaign/images?limit=2&before={first['next_before']}").json()
+        last = client.get(f"/campaigns/test_campaign/images?limit=2&before={second['next_before']}").json()
+        assert [img["seq"] for img in second["images"] + last["images"]] == seqs[2::-1]
+        assert last["has_more"] is False and last["next_before"] is None
+
+    def test_run_filter_skips_other_segments(self, campaign_dir, monkeypatch):
+        monkeypatch.setattr(image_gallery, "SEGMENT_MAX_ENTRIES", 2)
+        _gallery_image(b"a", run_id="first_signs")
+        _gallery_image(b"b", run_id="filler_0")
+        _gallery_image(b"c", run_id="filler_0")
+        _gallery_image(b"d", run_id="filler_1")
+
+        read = []
+        original = image_gallery._read_segment
+        monkeypatch.setattr(image_gallery, "_read_segment",
+                            lambda cid, segment: read.append(segment["name"]) or original(cid, segment))
+        page = image_gallery.read_page("test_campaign", run_id="first_signs")
+        assert [img["run_id"] for img in page["images"]] == ["first_signs"]
+        assert read == ["segment_000001.jsonl"]
+
+    def test_entry_fields_and_remote_urls_ignored(self, campaign_dir):
+        entry = _gallery_image(b"scene bytes", run_id="first_signs", prompt="a mossy bridge")
+        assert entry["size"] == len(b"scene bytes") and entry["prompt"] == "a mossy bridge"
+        assert image_gallery.record_image("test_campaign", "https://replicate.delivery/x.webp") is None
+        assert image_gallery.read_page("test_campaign")["total"] == 1
+
+    def test_backfill_from_existing_images(self, campaign_dir, scene_image):
+        held = _store(b"stored earlier", image_store.archive_holder("test_campaign"))
+        _store(b"banner", image_store.banner_holder("test_campaign"))
+
+        page = image_gallery.read_page("test_campaign")
+        assert sorted(img["name"] for img in page["images"]) == sorted(["scene.webp", held])
+        assert all(img["source"] == "backfill" and img["available"] for img in page["images"])
+        assert image_gallery.backfill("test_campaign") == 0
+
+    def test_session_images_recorded_with_run(self, campaign_dir, sample_state):
+        from routes import dm_ai
+        from helpers import save_campaign_json
+
+        save_campaign_json("test_campaign", "state.json", {**sample_state.dict(), "current_run_id": "filler_0"})
+        session = {"active": True, "sessionId": "s1", "images": [{"url": "/old.webp"}] * dm_ai.SESSION_IMAGES_KEPT}
+        name = _store(b"new scene", image_store.session_holder("test_campaign"))
+        url = f"/api/campaigns/test_campaign/images/{name}"
+
+        dm_ai.show_session_image("test_campaign", session, url, "the hedge")
+        assert len(session["images"]) == dm_ai.SESSION_IMAGES_KEPT
+        assert session["images"][-1] == {"url": url, "prompt": "the hedge"} and session["currentImage"] == url
+        image = image_gallery.read_page("test_campaign", run_id="filler_0")["images"][0]
+        assert (image["url"], image["session_id"]) == (url, "s1")
+
+    def test_gallery_outlives_session(self, client, campaign_dir):
+        _download("test_campaign", b"scene from the run")
+        client.post("/campaigns/test_campaign/session/end", json={"outcome": "retreat"})
+        images = client.get("/campaigns/test_campaign/images").json()["images"]
+        assert len(images) == 1 and images[0]["available"] is True
@@ -0,0 +1,130 @@
+"""
+Tests for RFC 6902 JSON Patch application in json_patch.py
+"""
+
+import copy
+
+import pytest
+
+from json_patch import JsonPatchError, JsonPatchTestFailed, apply_patch, parse_pointer, touched_sections
+
+
+@pytest.fixture
+def doc():
+    return {"name": "Rotwood", "npcs": [{"name": "Bramblewick"}, {"name": "Thornfeather"}], "tags": {"a/b": 1, "m~n": 2}}
+
+
+# === Pointers ===
+
+
+class TestParsePointer:
+    def test_root(self):
+        assert parse_pointer("") == []
+
+    def test_escapes(self):
+        assert parse_pointer("/tags/a~1b") == ["tags", "a/b"]
+        assert parse_pointer("/tags/m~0n") == ["tags", "m~n"]
+
+    def test_must_start_with_slash(self):
+        with pytest.raises(JsonPatchError):
+            parse_pointer("npcs/0")
+
+
+# === Operations ===
+
+
+class TestApplyPatch:
+    def test_add_member(self, doc):
+        result = apply_patch(doc, [{"op": "add", "path": "/premise", "value": "Blight"}])
+        assert result["premise"] == "Blight"
+
+    def test_add_appends_with_dash(self, doc):
+        result = apply_patch(doc, [{"op": "add", "path": "/npcs/-", "value": {"name": "Mossback"}}])
+        assert [n["name"] for n in result["npcs"]] == ["Bramblewick", "Thornfeather", "Mossback"]
+
+    def test_add_inserts_at_index(self, doc):
+        result = apply_patch(doc, [{"op": "add", "path": "/npcs/0", "value": {"name": "Mossback"}}])
+        assert result["npcs"][0]["name"] == "Mossback"
+        assert len(result["npcs"]) == 3
+
+    def test_remove(self, doc):
+        result = apply_patch(doc, [{"op": "remove", "path": "/npcs/0"}])
+        assert result["npcs"] == [{"name": "Thornfeather"}]
+
+    def test_replace_nested(self, doc):
+        result = apply_patch(doc, [{"op": "replace", "path": "/npcs/1/name", "value": "Captain"}])
+        assert result["npcs"][1]["name"] == "Captain"
+
+    def test_replace_missing_member_rejected(self, doc):
+        with pytest.raises(JsonPatchError, match="does not exist"):
+            apply_patch(doc, [{"op": "replace", "path": "/premise", "value": "x"}])
+
+    def test_move(self, doc):
+        result = apply_patch(doc, [{"op": "move", "from": "/npcs/0", "path": "/npcs/1"}])
+        assert [n["name"] for n in result["npcs"]] == ["Thornfeather", "Bramblewick"]
+
+    def test_move_into_own_child_rejected(self, doc):
+        with pytest.raises(JsonPatchError):
+            apply_patch(doc, [{"op": "move", "from": "/npcs", "path": "/npcs/0/npcs"}])
+
+    def test_copy(self, doc):
+        result = apply_patch(doc, [{"op": "copy", "from": "/name", "path": "/title"}])
+        assert result["title"] == "Rotwood"
+
+    def test_test_passes(self, doc):
+        assert apply_patch(doc, [{"op": "test", "path": "/npcs/0/name", "value": "Bramblewick"}]) == doc
+
+    def test_test_failure(self, doc):
+        with pytest.raises(JsonPatchTestFailed):
+            apply_patch(doc, [{"op": "test", "path": "/name", "value": "Other"}])
+
+    def test_test_distinguishes_bool_from_int(self):
+        with pytest.raises(JsonPatchTestFailed):
+            apply_patch({"flag": True}, [{"op": "test", "path": "/flag", "value": 1}])
+
+    def test_index_out_of_range_rejected(self, doc):
+        with pytest.raises(JsonPatchError, match="out of range"):
+            apply_patch(doc, [{"op": "remove", "path": "/npcs/5"}])
+
+    def test_leading_zero_index_rejected(self, doc):
+        with pytest.raises(JsonPatchError):
+            apply_patch(doc, [{"op": "remove", "path": "/npcs/01"}])
+
+    def test_unknown_op_rejected(self, doc):
+        with pytest.raises(JsonPatchError, match="Unknown op"):
+            apply_patch(doc, [{"op": "merge", "path": "/name"}])
+
+    def test_error_names_failing_operation(self, doc):
+        with pytest.raises(JsonPatchError, match="Operation 1"):
+            apply_patch(doc, [{"op": "remove", "path": "/name"}, {"op": "remove", "path": "/name"}])
+
+    def test_input_never_modified(self, doc):
+        before = copy.deepcopy(doc)
+        apply_patch(doc, [
+            {"op": "replace", "path": "/npcs/0/name", "value": "Changed"},
+            {"op": "remove", "path": "/tags/a~1b"},
+        ])
+        with pytest.raises(JsonPatchError):
+            apply_patch(doc, [{"op": "remove", "path": "/name"}, {"op": "remove", "path": "/missing"}])
+        assert doc == before
+
+    def test_untouched_sections_shared(self, doc):
+        result = apply_patch(doc, [{"op": "replace", "path": "/npcs/0/name", "value": "Changed"}])
+        assert result["tags"] is doc["tags"]
+        assert result["npcs"][1] is doc["npcs"][1]
+
+
+# === Touched sections ===
+
+
+class TestTouchedSections:
+    def test_top_level_members(self):
+        patch = [
+            {"op": "replace", "path": "/npcs/0/name", "value": "x"},
+            {"op": "move", "from": "/locations/0", "path": "/anchor_runs/0"},
+            {"op": "test", "path": "/premise", "value": "y"},
+        ]
+        assert touched_sections(patch) == {"npcs", "locations", "anchor_runs"}
+
+    def test_whole_document(self):
+        assert touched_sections([{"op": "replace", "path": "", "value": {}}]) == {""}
@@ -104,6 +104,84 @@ class TestSessionUpdate:
         assert resp.status_code == 400
 
 
+# === Session delta sync ===
+
+
+class TestSessionSync:
+    def _start(self, client):
+        return client.post(
+            "/campaigns/test_campaign/session/start",
+            json={"quest": "Test", "location": "Here", "partyIds": ["char_001"]},
+        ).json()
+
+    def _roll(self, client, result=12):
+        client.post("/campaigns/test_campaign/dice/roll", json={"dieType": "d20", "result": result})
+
+    def test_full_session_has_version_not_bookkeeping(self, client, campaign_dir):
+        started = self._start(client)
+        data = client.get("/campaigns/test_campaign/session").json()
+        assert data["version"] == started["version"]
+        assert "_sync" not in data and "_sync" not in started
+
+    def test_unchanged_is_304(self, client, campaign_dir):
+        version = self._start(client)["version"]
+        resp = client.get(f"/campaigns/test_campaign/session?since={version}")
+        assert resp.status_code == 304
+        assert resp.content == b""
+
+    def test_new_log_entries_only(self, client, campaign_dir):
+        self._roll(client, 5)
+        version = self._start(client)["version"]
+        self._roll(client, 8)
+        first = client.get(f"/campaigns/test_campaign/session?since={version}").json()
+        assert first["full"] is False
+        assert first["changed"] == {}
+        assert [e["result"] for e in first["log"]] == [8]
+
+        self._roll(client, 17)
+        second = client.get(f"/campaigns/test_campaign/session?since={first['version']}").json()
+        assert [e["result"] for e in second["log"]] == [17]
+        assert second["log"][0]["seq"] > first["log"][0]["seq"]
+
+    def test_changed_header_fields_only(self, client, campaign_dir):
+        version = self._start(client)["version"]
+        client.put("/campaigns/test_campaign/session/update", json={"roomNumber": 2, "runState": "hook"})
+        data = client.get(f"/campaigns/test_campaign/session?since={version}").json()
+        assert data["changed"] == {"roomNumber": 2}
+        assert data["log"] == []
+        assert data["version"] > version
+
+    def test_client_from_previous_session_gets_everything(self, client, campaign_dir):
+        old = self._start(client)["version"]
+        self._roll(client)
+        client.post("/campaigns/test_campaign/session/end", json={"outcome": "retreat"})
+        data = client.get(f"/campaigns/test_campaign/session?since={old}").json()
+        assert data["full"] is True
+        assert data["changed"] == {"active": False}
+
+        new = self._start(client)
+        data = client.get(f"/campaigns/test_campaign/session?since={old}").json()
+        assert data["full"] is True
+        assert data["version"] == new["version"] > old
+        assert data["changed"]["sessionId"] == new["sessionId"]
+        assert data["log"] == []
+
+    def test_legacy_session_file(self, client, campaign_dir):
+        legacy = {"active": True, "sessionId": "s1", "runState": "hook", "log": [{"type": "roll", "result": 3}]}
+        (campaign_dir / "current_session.json").write_text(json.dumps(legacy))
+        data = client.get("/campaigns/test_campaign/session?since=0").json()
+        assert data["full"] is True
+        assert data["log"] == legacy["log"]
+
+        self._roll(client, 9)
+        data = client.get("/campaigns/test_campaign/session").json()
+        assert [e["seq"] for e in data["log"]] == [1, 2]
+        assert client.get(f"/campaigns/test_campaign/session?since={data['version']}").status_code == 304
+
+    def test_negative_since_rejected(self, client, campaign_dir):
+        assert client.get("/campaigns/test_campaign/session?since=-1").status_code == 422
+
+
 # === Session end ===
 
 
@@ -210,6 +288,20 @@ class TestRunLifecycle:
         # threat_stage should increment from 1 to 2
         assert data["threat_stage"] == 2
 
+    def test_complete_run_keeps_fact_order(self, client, campaign_dir):
+        facts = ["zeta clue", "alpha clue", "mid clue", "alpha clue"]
+        for outcome in ("retreat", "retreat"):
+            client.post("/campaigns/test_campaign/start-run?run_type=anchor&run_id=find_the_scholar")
+            resp = client.post(
+                "/campaigns/test_campaign/complete-run",
+                json={"outcome": outcome, "facts_learned": facts, "npcs_met": [], "locations_visited": []},
+            )
+            assert resp.status_code == 200
+
+        state = client.get("/campaigns/test_campaign/state").json()
+        learned = [f for f in state["facts_known"] if f.endswith("clue")]
+        assert learned == ["zeta clue", "alpha clue", "mid clue"]
+
     def test_complete_run_no_active_run_400(self, client, campaign_dir):
         resp = client.post(
             "/campaigns/test_campaign/complete-run",
@@ -235,6 +327,130 @@ class TestRunLifecycle:
         assert state["anchor_runs_completed"] == []
 
 
+# === Content and system patches ===
+
+
+NEW_NPC = {
+    "name": "Sister Quill",
+    "species": "Birdfolk",
+    "role": "Archivist",
+    "wants": "To finish the valley chronicle",
+    "secret": "She burned the pages about the shrine",
+}
+
+
+class TestContentPatch:
+    URL = "/campaigns/test_campaign/content"
+
+    def test_patch_single_npc(self, client, campaign_dir):
+        resp = client.patch(self.URL, json=[{"op": "replace", "path": "/npcs/0/wants", "value": "Peace and quiet"}])
+        assert resp.status_code == 200
+        assert resp.json()["sections"] == ["npcs"]
+
+        saved = json.loads((campaign_dir / "campaign.json").read_text())
+        assert saved["npcs"][0]["wants"] == "Peace and quiet"
+        assert client.get(self.URL).json()["npcs"][0]["wants"] == "Peace and quiet"
+
+    def test_new_npc_added_to_state(self, client, campaign_dir):
+        resp = client.patch(self.URL, json=[{"op": "add", "path": "/npcs/-", "value": NEW_NPC}])
+        assert resp.status_code == 200
+        assert "sister_quill" in client.get("/campaigns/test_campaign/state").json()["npcs"]
+
+    def test_invalid_section_rejected_without_writing(self, client, campaign_dir):
+        before = (campaign_dir / "campaign.json").read_text()
+        resp = client.patch(self.URL, json=[{"op": "replace", "path": "/npcs/0/name", "value": ""}])
+        assert resp.status_code == 400
+        assert list(resp.json()["detail"]["errors"]) == ["npcs"]
+        assert (campaign_dir / "campaign.json").read_text() == before
+
+    def test_after_run_cross_reference_checked(self, client, campaign_dir):
+        resp = client.patch(self.URL, json=[
+            {"op": "replace", "path": "/anchor_runs/1/trigger", "value": {"type": "after_run", "value": "nowhere"}},
+        ])
+        assert resp.status_code == 400
+        assert "unknown run" in resp.json()["detail"]["errors"]["anchor_runs"][0]
+
+    def test_missing_start_run_reported_under_anchor_runs(self, client, campaign_dir):
+        resp = client.patch(self.URL, json=[
+            {"op": "replace", "path": "/anchor_runs/0/trigger", "value": {"type": "threat_stage", "value": "1"}},
+        ])
+        assert resp.status_code == 400
+        assert "available from start" in resp.json()["detail"]["errors"]["anchor_runs"][0]
+
+    def test_dry_run_reports_errors_by_section(self, client, campaign_dir):
+        before = (campaign_dir / "campaign.json").read_text()
+        resp = client.patch(f"{self.URL}?dry_run=true", json=[
+            {"op": "replace", "path": "/npcs/0/name", "value": ""},
+            {"op": "replace", "path": "/locations", "value": []},
+            {"op": "replace", "path": "/name", "value": "Renamed"},
+        ])
+        assert resp.status_code == 200
+        data = resp.json()
+        assert data["valid"] is False
+        assert set(data["errors"]) == {"npcs", "locations"}
+        assert data["sections"] == ["locations", "name", "npcs"]
+        assert (campaign_dir / "campaign.json").read_text() == before
+
+    def test_dry_run_valid_does_not_write(self, client, campaign_dir):
+        before = (campaign_dir / "campaign.json").read_text()
+        resp = client.patch(f"{self.URL}?dry_run=true", json=[{"op": "replace", "path": "/name", "value": "Renamed"}])
+        assert resp.json()["valid"] is True
+        assert (campaign_dir / "campaign.json").read_text() == before
+
+    def test_if_match_current_version(self, client, campaign_dir):
+        etag = client.get(self.URL).headers["ETag"]
+        resp = client.patch(self.URL, json=[{"op": "replace", "path": "/name", "value": "Renamed"}],
+                            headers={"If-Match": etag})
+        assert resp.status_code == 200
+        assert resp.json()["etag"] != etag
+        assert resp.headers["ETag"] == resp.json()["etag"]
+
+    def test_stale_if_match_rejected(self, client, campaign_dir):
+        etag = client.get(self.URL).headers["ETag"]
+        client.patch(self.URL, json=[{"op": "replace", "path": "/name", "value": "First"}])
+        resp = client.patch(self.URL, json=[{"op": "replace", "path": "/name", "value": "Second"}],
+                            headers={"If-Match": etag})
+        assert resp.status_code == 412
+        assert client.get(self.URL).json()["name"] == "First"
+
+    def test_failed_test_op_conflicts(self, client, campaign_dir):
+        resp = client.patch(self.URL, json=[
+            {"op": "test", "path": "/name", "value": "Someone else's name"},
+            {"op": "replace", "path": "/name", "value": "Renamed"},
+        ])
+        assert resp.status_code == 409
+
+    def test_unapplicable_patch_rejected(self, client, campaign_dir):
+        resp = client.patch(self.URL, json=[{"op": "remove", "path": "/npcs/99"}])
+        assert resp.status_code == 422
+
+    def test_missing_content_404(self, client, data_dir):
+        resp = client.patch("/campaigns/nonexistent/content", json=[{"op": "replace", "path": "/name", "value": "x"}])
+        assert resp.status_code == 404
+
+
+class TestSystemPatch:
+    URL = "/campaigns/test_campaign/system"
+
+    def test_patch_section(self, client, campaign_dir):
+        resp = client.patch(self.URL, json=[{"op": "replace", "path": "/game_name", "value": "Valley Tales"}])
+        assert resp.status_code == 200
+        assert client.get(self.URL).json()["game_name"] == "Valley Tales"
+
+    def test_section_validators_run(self, client, campaign_dir):
+        resp = client.patch(f"{self.URL}?dry_run=true", json=[
+            {"op": "replace", "path": "/leveling/thresholds", "value": [10, 5, 20, 30]},
+        ])
+        data = resp.json()
+        assert data["valid"] is False
+        assert "ascending" in data["errors"]["leveling"][0]
+
+    def test_stale_if_match_rejected(self, client, campaign_dir):
+        resp = client.patch(self.URL, json=[{"op": "replace", "path": "/game_name", "value": "x"}],
+                            headers={"If-Match": '"stale"'})
+        assert resp.status_code == 412
+
+
 # === Dice rolling ===
 
 
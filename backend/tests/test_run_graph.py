@@ -0,0 +1,95 @@
+"""
+Tests for the compiled anchor-run trigger graph in run_graph.py
+"""
+
+import copy
+import itertools
+
+import pytest
+
+from campaign_schema import CampaignContent, CampaignState, EXAMPLE_CAMPAIGN
+from campaign_logic import check_trigger, save_campaign_state
+from run_graph import RunGraph, get_run_graph
+
+
+def _content_with_triggers(triggers: dict) -> CampaignContent:
+    data = copy.deepcopy(EXAMPLE_CAMPAIGN)
+    for run in data["anchor_runs"]:
+        if run["id"] in triggers:
+            run["trigger"] = triggers[run["id"]]
+    return CampaignContent(**data)
+
+
+class TestAvailability:
+    def test_matches_checking_every_trigger(self, sample_content):
+        graph = RunGraph(sample_content)
+        ids = [run.id for run in sample_content.anchor_runs]
+        for completed_count, runs, stage in itertools.product(range(len(ids) + 1), range(5), range(5)):
+            state = CampaignState(anchor_runs_completed=ids[:completed_count], runs_completed=runs,
+                                  threat_stage=stage)
+            expected = [run.id for run in sample_content.anchor_runs
+                        if run.id not in state.anchor_runs_completed and check_trigger(run.trigger, state)]
+            assert graph.available_anchors(state) == expected
+
+    def test_newly_unlocked_from_the_change(self, sample_content):
+        graph = RunGraph(sample_content)
+        before = CampaignState(runs_completed=1)
+        after = CampaignState(anchor_runs_completed=["first_signs"], runs_completed=2, threat_stage=3)
+        assert graph.newly_unlocked(before, after) == ["find_the_scholar", "the_lost_patrol", "heart_of_the_rot"]
+        assert graph.newly_unlocked(after, after) == []
+
+    def test_graph_cached_until_content_changes(self, campaign_dir, sample_content):
+        graph = get_run_graph("test_campaign", sample_content)
+        assert get_run_graph("test_campaign", sample_content) is graph
+        (campaign_dir / "campaign.json").write_text((campaign_dir / "campaign.json").read_text() + " ")
+        assert get_run_graph("test_campaign", sample_content) is not graph
+
+
+class TestQueries:
+    def test_unlocks_after(self):
+        content = _content_with_triggers({"the_lost_patrol": {"type": "after_run", "value": "find_the_scholar"}})
+        result = RunGraph(content).unlocks_after("first_signs")
+        assert result["direct"] == ["find_the_scholar"]
+        assert result["transitive"] == ["find_the_scholar", "the_lost_patrol"]
+
+    def test_earliest_path_walks_the_chain(self):
+        content = _content_with_triggers({
+            "first_signs": {"type": "after_runs_count", "value": "2"},
+            "the_lost_patrol": {"type": "after_run", "value": "find_the_scholar"},
+        })
+        path = RunGraph(content).earliest_path("the_lost_patrol", CampaignState(runs_completed=1))
+        assert path["path"] == ["first_signs", "find_the_scholar", "the_lost_patrol"]
+        assert path["extra_runs_needed"] == 1 and path["available_now"] is False
+
+        done = CampaignState(anchor_runs_completed=["first_signs"], runs_completed=2)
+        assert RunGraph(content).earliest_path("the_lost_patrol", done)["path"] == ["find_the_scholar", "the_lost_patrol"]
+
+    def test_earliest_path_reports_threat_gate(self, sample_content):
+        path = RunGraph(sample_content).earliest_path("heart_of_the_rot", CampaignState(threat_stage=1))
+        assert path["path"] == ["heart_of_the_rot"] and path["threat_stage_required"] == 3
+
+    def test_cycles_unreachable(self):
+        content = _content_with_triggers({
+            "first_signs": {"type": "after_run", "value": "find_the_scholar"},
+            "the_lost_patrol": {"type": "after_run", "value": "first_signs"},
+        })
+        graph = RunGraph(content)
+        assert graph.unreachable == {"first_signs", "find_the_scholar", "the_lost_patrol"}
+        assert graph.earliest_path("first_signs", CampaignState())["reachable"] is False
+
+
+class TestRunGraphRoutes:
+    def test_graph_unlocks_and_path(self, client, campaign_dir):
+        graph = client.get("/campaigns/test_campaign/runs/graph").json()
+        assert graph["start"] == ["first_signs"] and graph["unreachable"] == []
+        assert client.get("/campaigns/test_campaign/runs/first_signs/unlocks").json()["direct"] == ["find_the_scholar"]
+        path = client.get("/campaigns/test_campaign/runs/find_the_scholar/path").json()
+        assert path["available_now"] is True and path["path"] == ["find_the_scholar"]
+        assert client.get("/campaigns/test_campaign/runs/nope/path").status_code == 404
+
+    def test_complete_run_reports_unlocked(self, client, campaign_dir):
+        save_campaign_state("test_campaign", CampaignState())
+        client.post("/campaigns/test_campaign/start-run?run_type=anchor&run_id=first_signs")
+        resp = client.post("/campaigns/test_campaign/complete-run",
+                           json={"outcome": "victory", "facts_learned": [], "npcs_met": [], "locations_visited": []})
+        assert resp.json()["unlocked"] == ["find_the_scholar"]
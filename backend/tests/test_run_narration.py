@@ -0,0 +1,161 @@
+"""
+Tests for background run intro/resolution narration and how the DM turn uses it
+"""
+
+import json
+
+import pytest
+
+import run_narration
+from routes import dm_ai
+
+START = "/campaigns/test_campaign/start-run?run_type=anchor&run_id=find_the_scholar"
+
+
+def _start_session(client):
+    resp = client.post("/campaigns/test_campaign/session/start", json={"partyIds": ["char_001"], "quest": "Find the scholar", "location": "The Brambles"})
+    assert resp.status_code == 200
+
+
+class _FakeMessages:
+    def __init__(self, sent):
+        self.sent = sent
+
+    def create(self, **kwargs):
+        self.sent.append(kwargs)
+
+        class _Text:
+            text = "The hermit peers at you."
+
+        class _Response:
+            content = [_Text()]
+
+        return _Response()
+
+
+@pytest.fixture
+def fake_dm(monkeypatch):
+    """Replace the DM model client; returns the list of requests it received"""
+    sent = []
+
+    class _Client:
+        messages = _FakeMessages(sent)
+
+    monkeypatch.setattr(dm_ai.anthropic, "Anthropic", lambda: _Client())
+    return sent
+
+
+class TestNarrationCache:
+    def test_pending_then_ready(self, campaign_dir):
+        token = run_narration.mark_pending("test_campaign", "find_the_scholar", "intro")
+        assert run_narration.get_narration("test_campaign", "find_the_scholar", "intro")["status"] == "pending"
+
+        run_narration.generate_narration("test_campaign", "find_the_scholar", "intro", token, _dm_context())
+        entry = run_narration.wait_for_narration("test_campaign", "find_the_scholar", "intro", timeout=1)
+        assert entry["status"] == "ready"
+        assert "[SCENE" not in entry["text"]
+
+    def test_stale_generation_is_dropped(self, campaign_dir):
+        old = run_narration.mark_pending("test_campaign", "find_the_scholar", "intro")
+        new = run_narration.mark_pending("test_campaign", "find_the_scholar", "intro")
+
+        run_narration.generate_narration("test_campaign", "find_the_scholar", "intro", old, _dm_context())
+        entry = run_narration.get_narration("test_campaign", "find_the_scholar", "intro")
+        assert entry["status"] == "pending"
+        assert entry["token"] == new
+        assert ("test_campaign", "find_the_scholar", "intro") in run_narration._inflight
+
+    def test_failure_is_recorded(self, campaign_dir, monkeypatch):
+        def boom(system, prompt):
+            raise RuntimeError("model unavailable")
+
+        monkeypatch.setattr(run_narration, "_generate_text", boom)
+        token = run_narration.mark_pending("test_campaign", "find_the_scholar", "intro")
+        run_narration.generate_narration("test_campaign", "find_the_scholar", "intro", token, _dm_context())
+        entry = run_narration.get_narration("test_campaign", "find_the_scholar", "intro")
+        assert entry["status"] == "failed"
+        assert "model unavailable" in entry["error"]
+
+
+class TestNarrationRoutes:
+    def test_start_run_generates_intro(self, client, campaign_dir, offline_narration):
+        client.post(START)
+        resp = client.get("/campaigns/test_campaign/run-intro")
+        assert resp.status_code == 200
+        data = resp.json()
+        assert data["run_id"] == "find_the_scholar"
+        assert data["status"] == "ready"
+        assert data["image_url"] is None
+        assert "Begin this run" in offline_narration[0]
+
+    def test_illustrated_intro(self, client, campaign_dir):
+        client.post(START + "&illustrate=true")
+        assert client.get("/campaigns/test_campaign/run-intro").json()["image_url"] == "/api/images/intro.webp"
+
+    def test_run_intro_without_active_run(self, client, campaign_dir):
+        assert client.get("/campaigns/test_campaign/run-intro").status_code == 400
+
+    def test_resolution_read_once(self, client, campaign_dir, offline_narration):
+        client.post(START)
+        resp = client.post(
+            "/campaigns/test_campaign/complete-run",
+            json={"outcome": "victory", "facts_learned": [], "npcs_met": [], "locations_visited": []},
+        )
+        run_id = resp.json()["run_id"]
+        assert "completed the run victoriously" in offline_narration[-1]
+
+        data = client.get(f"/campaigns/test_campaign/run-resolution?run_id={run_id}").json()
+        assert data["status"] == "ready"
+        assert data["outcome"] == "victory"
+
+        with open(campaign_dir / "run_narration.json") as f:
+            assert json.load(f) == {}
+        assert client.get(f"/campaigns/test_campaign/run-resolution?run_id={run_id}").status_code == 404
+
+
+class TestFirstTurn:
+    def test_intro_threaded_before_first_message(self, client, campaign_dir, fake_dm):
+        _start_session(client)
+        client.post(START)
+
+        resp = client.post("/campaigns/test_campaign/dm/message", json={"message": "We accept!"})
+        assert resp.status_code == 200
+        assert resp.json()["intro"].startswith("Bramblewick waves")
+
+        messages = fake_dm[0]["messages"]
+        assert [m["role"] for m in messages] == ["user", "assistant", "user"]
+        assert messages[1]["content"].startswith("Bramblewick waves")
+        assert messages[2]["content"] == "We accept!"
+
+    def test_intro_once_per_run(self, client, campaign_dir, fake_dm):
+        _start_session(client)
+        client.post(START)
+        client.post("/campaigns/test_campaign/dm/message", json={"message": "We accept!"})
+        resp = client.post("/campaigns/test_campaign/dm/message", json={"message": "Onward"})
+
+        assert resp.json()["intro"] is None
+        roles = [m["role"] for m in fake_dm[1]["messages"]]
+        assert roles == ["user", "assistant", "user", "assistant", "user"]
+
+    def test_next_run_in_same_session_gets_intro(self, client, campaign_dir, fake_dm):
+        _start_session(client)
+        client.post(START)
+        client.post("/campaigns/test_campaign/dm/message", json={"message": "We accept!"})
+        client.post(
+            "/campaigns/test_campaign/complete-run",
+            json={"outcome": "victory", "facts_learned": [], "npcs_met": [], "locations_visited": []},
+        )
+        client.post("/campaigns/test_campaign/start-run?run_type=filler&filler_index=1")
+
+        resp = client.post("/campaigns/test_campaign/dm/message", json={"message": "What now?"})
+        assert resp.json()["intro"] is not None
+
+
+def _dm_context():
+    from campaign_logic import load_campaign_content, load_campaign_state, build_dm_context, current_run_details
+
+    content = load_campaign_content("test_campaign")
+    state = load_campaign_state("test_campaign")
+    state.current_run_id = "find_the_scholar"
+    state.current_run_type = "anchor"
+    return build_dm_context(content, state, current_run_details(content, state))
@@ -19,6 +19,10 @@ from campaign_schema import (
     Threat,
     ThreatAdvanceTrigger,
     ValidationResult,
+    content_from_json,
+    content_from_yaml,
+    content_to_json,
+    content_to_yaml,
     validate_campaign_content,
     EXAMPLE_CAMPAIGN,
     BLOOMBURROW_SYSTEM,
@@ -192,6 +196,24 @@ class TestCampaignContent:
             CampaignContent(**data)
 
 
+# === Serialization ===
+
+
+class TestContentSerialization:
+    def test_json_round_trip(self):
+        content = CampaignContent(**EXAMPLE_CAMPAIGN)
+        assert content_from_json(content_to_json(content)) == content
+
+    def test_yaml_round_trip(self):
+        content = CampaignContent(**EXAMPLE_CAMPAIGN)
+        assert content_from_yaml(content_to_yaml(content)) == content
+
+    def test_yaml_writes_enums_as_plain_strings(self):
+        text = content_to_yaml(CampaignContent(**EXAMPLE_CAMPAIGN))
+        assert "!!python" not in text
+        assert "type: after_run" in text
+
+
 # === validate_campaign_content ===
 
 
@@ -243,6 +265,34 @@ class TestCampaignState:
         assert "old_mossback" in state.npcs
         assert state.npcs["bramblewick"].met is False
 
+    def test_collections_dedupe_in_first_seen_order(self):
+        state = CampaignState(facts_known=["b", "a", "b", "c", "a"], filler_seeds_used=[2, 0, 2])
+        assert list(state.facts_known) == ["b", "a", "c"]
+        assert list(state.filler_seeds_used) == [2, 0]
+
+    def test_collections_serialize_as_lists(self):
+        state = CampaignState(locations_visited=["The Hollow", "The Pond"])
+        state.locations_visited.add("The Hollow")
+        state.locations_visited.add("The Bridge")
+        dumped = state.model_dump()
+        assert dumped["locations_visited"] == ["The Hollow", "The Pond", "The Bridge"]
+        assert type(dumped["locations_visited"]) is list
+        assert CampaignState(**dumped) == state
+
+    def test_collections_membership_and_list_api(self):
+        state = CampaignState(anchor_runs_completed=["first"])
+        state.anchor_runs_completed.append("second")
+        state.anchor_runs_completed.extend(["first", "third"])
+        assert "second" in state.anchor_runs_completed
+        assert state.anchor_runs_completed[-1] == "third"
+        assert state.anchor_runs_completed == ["first", "second", "third"]
+
+    def test_deep_copy_is_independent(self):
+        state = CampaignState(facts_known=["a"])
+        copied = state.model_copy(deep=True)
+        copied.facts_known.add("b")
+        assert list(state.facts_known) == ["a"]
+
 
 # === CampaignSystem ===
 
@@ -264,6 +314,12 @@ class TestCampaignSystem:
         system = CampaignSystem(**data)
         assert len(system.stats.colors) == len(system.stats.names)
 
+    def test_stat_colors_fill_does_not_mutate_input(self):
+        data = copy.deepcopy(BLOOMBURROW_SYSTEM)
+        data["stats"]["colors"] = []
+        CampaignSystem(**data)
+        assert data["stats"]["colors"] == []
+
     def test_too_few_species_rejected(self):
         data = copy.deepcopy(BLOOMBURROW_SYSTEM)
         data["species"] = [data["species"][0]]
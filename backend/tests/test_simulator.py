@@ -0,0 +1,73 @@
+"""
+Tests for the vectorized campaign playthrough simulator
+"""
+
+import copy
+import json
+
+import pytest
+
+from campaign_schema import CampaignContent, CampaignState, EXAMPLE_CAMPAIGN
+from campaign_simulator import main, simulate
+
+
+class TestSimulate:
+    def test_seeded_runs_are_reproducible(self, sample_content):
+        assert simulate(sample_content, 2000, seed=7) == simulate(sample_content, 2000, seed=7)
+
+    def test_always_winning_without_threat_gets_stuck(self, sample_content):
+        # heart_of_the_rot needs threat stage 3, which only failures advance
+        report = simulate(sample_content, 500, victory=1.0, failed=0.0, seed=1)
+        assert report["end_reasons"]["stuck"] == 1.0
+        assert report["runs_to_completion"] is None
+        rates = {run["id"]: run["completion_rate"] for run in report["anchor_runs"]}
+        assert rates == {"first_signs": 1.0, "find_the_scholar": 1.0, "the_lost_patrol": 1.0, "heart_of_the_rot": 0.0}
+        assert report["unreachable_runs"] == [{"id": "heart_of_the_rot", "reason": "never_completed"}]
+
+    def test_always_failing_maxes_threat(self, sample_content):
+        report = simulate(sample_content, 500, victory=0.0, failed=1.0, seed=1)
+        stages = len(sample_content.threat.stages)
+        assert report["threat_maxed_rate"] == 1.0
+        assert report["runs_to_completion"]["min"] == report["runs_to_completion"]["max"] == stages - 1
+        assert report["threat_stage_distribution"][-1] == 1.0
+
+    def test_periodic_threat_and_batches(self, sample_content, monkeypatch):
+        import campaign_simulator
+        monkeypatch.setattr(campaign_simulator, "BATCH_SIZE", 300)
+        data = copy.deepcopy(EXAMPLE_CAMPAIGN)
+        data["threat"]["advance_on"] = "every_2_runs"
+        report = simulate(CampaignContent(**data), 1000, victory=1.0, failed=0.0, seed=3)
+        # Threat reaches stage 3 after six runs, unlocking the final anchor
+        assert report["end_reasons"]["all_anchors"] == 1.0
+        assert report["runs_to_completion"]["max"] == 7
+
+    def test_from_current_state(self, sample_content):
+        state = CampaignState(anchor_runs_completed=["first_signs", "find_the_scholar", "the_lost_patrol"],
+                              runs_completed=5, threat_stage=3)
+        report = simulate(sample_content, 100, victory=1.0, failed=0.0, state=state)
+        assert report["runs_to_completion"]["mean"] == 6
+
+    def test_rejects_impossible_probabilities(self, sample_content):
+        with pytest.raises(ValueError):
+            simulate(sample_content, 10, victory=0.8, failed=0.5)
+
+
+class TestSimulateInterfaces:
+    def test_endpoint(self, client, campaign_dir):
+        resp = client.post("/campaigns/test_campaign/simulate", json={"playthroughs": 1000, "seed": 1})
+        assert resp.status_code == 200
+        assert resp.json()["playthroughs"] == 1000
+        bad = client.post("/campaigns/test_campaign/simulate", json={"victory": 0.9, "failed": 0.9})
+        assert bad.status_code == 400
+
+    def test_cli_json(self, tmp_path, capsys):
+        path = tmp_path / "campaign.json"
+        path.write_text(json.dumps(EXAMPLE_CAMPAIGN))
+        main([str(path), "-n", "200", "--seed", "2", "--json"])
+        assert json.loads(capsys.readouterr().out)["playthroughs"] == 200
+
+    def test_cli_summary(self, tmp_path, capsys):
+        path = tmp_path / "campaign.json"
+        path.write_text(json.dumps(EXAMPLE_CAMPAIGN))
+        main([str(path), "-n", "200"])
+        assert "Runs to completion" in capsys.readouterr().out
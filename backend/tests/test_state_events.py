@@ -0,0 +1,154 @@
+"""
+Tests for the event-sourced campaign state in state_events.py
+"""
+
+import os
+
+import pytest
+
+import state_events
+from campaign_schema import CampaignState
+from campaign_logic import load_campaign_state
+from helpers import get_campaign_dir
+
+
+def _play(client, run_id="first_signs", outcome="victory", **changes):
+    client.post(f"/campaigns/test_campaign/start-run?run_type=anchor&run_id={run_id}")
+    body = {"outcome": outcome, "facts_learned": [], "npcs_met": [], "locations_visited": [], **changes}
+    resp = client.post("/campaigns/test_campaign/complete-run", json=body)
+    assert resp.status_code == 200
+    return resp.json()
+
+
+class TestEventLog:
+    def test_first_event_imports_existing_state(self, campaign_dir, sample_state):
+        state = state_events.record_event("test_campaign", "facts_learned", facts=["new fact"])
+        assert state.runs_completed == sample_state.runs_completed
+        assert list(state.facts_known) == list(sample_state.facts_known) + ["new fact"]
+
+        events = state_events.read_events("test_campaign")["events"]
+        assert [e["type"] for e in events] == ["state_imported", "facts_learned"]
+        assert events[0]["batch"] != events[1]["batch"]
+        assert "state" not in events[0]
+
+    def test_complete_run_is_one_batch(self, client, campaign_dir):
+        _play(client, outcome="failed", facts_learned=["the moss glows"], npcs_met=["Bramblewick"],
+              locations_visited=["The Withered Clearing"])
+
+        events = state_events.read_events("test_campaign")["events"]
+        completed = [e for e in events if e["batch"] == events[-1]["batch"]]
+        assert [e["type"] for e in completed] == [
+            "run_completed", "facts_learned", "locations_visited", "npc_met", "threat_advanced"]
+        state = load_campaign_state("test_campaign")
+        assert state.threat_stage == 2 and state.npcs["bramblewick"].met
+        assert state.current_run_id is None
+
+    def test_state_matches_full_replay(self, client, campaign_dir):
+        for outcome in ("victory", "retreat", "failed"):
+            _play(client, outcome=outcome, facts_learned=[outcome])
+        cached = load_campaign_state("test_campaign")
+        replayed = state_events._replay("test_campaign", 0, 0, CampaignState())[2]
+        assert replayed == cached
+
+    def test_loaded_states_are_independent(self, campaign_dir):
+        state_events.record_event("test_campaign", "facts_learned", facts=["a"])
+        loaded = load_campaign_state("test_campaign")
+        loaded.facts_known.add("mutated")
+        loaded.npcs["old_mossback"].met = True
+        again = load_campaign_state("test_campaign")
+        assert "mutated" not in again.facts_known
+        assert again.npcs["old_mossback"].met is False
+
+    def test_unknown_event_leaves_log_untouched(self, campaign_dir):
+        state_events.record_event("test_campaign", "facts_learned", facts=["a"])
+        head = state_events.head_seq("test_campaign")
+        with pytest.raises(ValueError):
+            state_events.record_events("test_campaign", [{"type": "facts_learned", "facts": ["b"]},
+                                                         {"type": "mystery"}])
+        assert state_events.head_seq("test_campaign") == head
+        assert "b" not in load_campaign_state("test_campaign").facts_known
+
+    def test_torn_append_is_skipped(self, campaign_dir):
+        state_events.record_event("test_campaign", "facts_learned", facts=["a"])
+        path = os.path.join(get_campaign_dir("test_campaign"), state_events.EVENTS_FILENAME)
+        with open(path, "ab") as f:
+            f.write(b'{"seq": 99, "type": "facts_le')
+        state_events._heads.clear()
+        assert state_events.head_seq("test_campaign") == 2
+
+        state = state_events.record_event("test_campaign", "facts_learned", facts=["b"])
+        state_events._heads.clear()
+        assert load_campaign_state("test_campaign") == state
+        assert state_events.head_seq("test_campaign") == 3
+
+
+class TestSnapshots:
+    def test_snapshot_written_and_used(self, campaign_dir, monkeypatch):
+        monkeypatch.setattr(state_events, "SNAPSHOT_INTERVAL", 5)
+        for i in range(12):
+            state_events.record_event("test_campaign", "facts_learned", facts=[f"fact {i}"])
+        assert state_events._snapshots("test_campaign") == [5, 10]
+
+        state_events._heads.clear()
+        seq, offset, _ = state_events._base("test_campaign")
+        assert seq == 10
+        assert [e["seq"] for e, _ in state_events._read_from("test_campaign", offset)] == [11, 12, 13]
+        assert list(load_campaign_state("test_campaign").facts_known)[-1] == "fact 11"
+
+    def test_state_at_earlier_seq(self, campaign_dir, monkeypatch):
+        monkeypatch.setattr(state_events, "SNAPSHOT_INTERVAL", 3)
+        for i in range(7):
+            state_events.record_event("test_campaign", "facts_learned", facts=[f"fact {i}"])
+        past = state_events.state_at("test_campaign", 5)
+        assert list(past.facts_known)[-1] == "fact 3"
+        with pytest.raises(KeyError):
+            state_events.state_at("test_campaign", 99)
+
+
+class TestUndo:
+    def test_undo_walks_back_and_skips_restores(self, client, campaign_dir):
+        start = load_campaign_state("test_campaign")
+        _play(client, "first_signs")
+        after_first = load_campaign_state("test_campaign")
+        _play(client, "find_the_scholar")
+
+        # Each play is two commands: starting the run, then completing it
+        resp = client.post("/campaigns/test_campaign/state/undo")
+        assert resp.status_code == 200
+        state = CampaignState(**resp.json()["state"])
+        assert state.current_run_id == "find_the_scholar"
+        assert "find_the_scholar" not in state.anchor_runs_completed
+
+        client.post("/campaigns/test_campaign/state/undo")
+        assert load_campaign_state("test_campaign") == after_first
+
+        resp = client.post("/campaigns/test_campaign/state/undo?steps=2")
+        assert resp.json()["steps"] == 2
+        assert load_campaign_state("test_campaign") == start
+
+    def test_nothing_to_undo(self, client, campaign_dir):
+        assert client.post("/campaigns/test_campaign/state/undo").status_code == 400
+        state_events.record_event("test_campaign", "facts_learned", facts=["a"])
+        assert client.post("/campaigns/test_campaign/state/undo").status_code == 200
+        assert client.post("/campaigns/test_campaign/state/undo").status_code == 400
+
+    def test_reset_keeps_history(self, client, campaign_dir):
+        _play(client)
+        assert client.post("/campaigns/test_campaign/state/reset").status_code == 200
+        assert load_campaign_state("test_campaign").runs_completed == 0
+
+        client.post("/campaigns/test_campaign/state/undo")
+        assert "first_signs" in load_campaign_state("test_campaign").anchor_runs_completed
+
+
+class TestStateRoutes:
+    def test_state_at_and_events(self, client, campaign_dir):
+        _play(client, facts_learned=["lichen"])
+        events = client.get("/campaigns/test_campaign/state/events?limit=2").json()
+        assert events["has_more"] and events["next_after"] == 2 and events["head"] >= 4
+
+        run_started = next(e for e in state_events.read_events("test_campaign")["events"]
+                           if e["type"] == "run_started")
+        state = client.get(f"/campaigns/test_campaign/state?at={run_started['seq']}").json()
+        assert state["current_run_id"] == "first_signs"
+        assert client.get("/campaigns/test_campaign/state?at=999").status_code == 404
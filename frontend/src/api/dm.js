@@ -5,3 +5,7 @@ export const sendDMMessage = (campaignId, data) =>
     method: 'POST',
     body: JSON.stringify(data),
   })
+
+// Archive a session image (by its served URL) so it outlives the session
+export const keepImage = (imageUrl) =>
+  apiFetch(`${imageUrl.replace(/^\/api/, '')}/keep`, { method: 'POST' })
@@ -41,3 +41,6 @@ export const clearConversation = (campaignId) =>
   apiFetch(`/campaigns/${campaignId}/dm-prep/conversation`, {
     method: 'DELETE',
   })
+
+export const fetchPrepConversation = (campaignId, before) =>
+  apiFetch(`/campaigns/${campaignId}/dm-prep/conversation${before ? `?before=${before}` : ''}`)
@@ -1,7 +1,37 @@
-import { apiFetch } from './client'
+import { API_BASE, apiFetch } from './client'
 
 export const generateImage = (campaignId, data) =>
   apiFetch(`/campaigns/${campaignId}/image/generate`, {
     method: 'POST',
     body: JSON.stringify(data),
   })
+
+// Streams NDJSON results; onResult is called for each finished item, then the summary
+export async function generateImageBatch(campaignId, data, onResult) {
+  const res = await fetch(`${API_BASE}/campaigns/${campaignId}/image/batch`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(data),
+  })
+  if (!res.ok) throw new Error((await res.json()).detail)
+
+  const reader = res.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  for (;;) {
+    const { done, value } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+    const lines = buffer.split('\n')
+    buffer = lines.pop()
+    lines.filter(Boolean).forEach(line => onResult(JSON.parse(line)))
+  }
+}
+
+// One page of the campaign gallery, newest first; pass next_before as `before` for older images
+export const fetchGallery = (campaignId, { before, limit = 24, runId } = {}) => {
+  const params = new URLSearchParams({ limit })
+  if (before) params.set('before', before)
+  if (runId) params.set('run_id', runId)
+  return apiFetch(`/campaigns/${campaignId}/images?${params}`)
+}
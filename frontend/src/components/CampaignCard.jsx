@@ -23,7 +23,7 @@ function CampaignCard({ campaign, onClick }) {
       <div
         className="campaign-card-banner"
         style={campaign.bannerImage ? {
-          backgroundImage: `url(${campaign.bannerImage})`,
+          backgroundImage: `url(${campaign.bannerImage}${campaign.bannerImage.includes('?') ? '&' : '?'}size=medium)`,
           backgroundSize: 'cover',
           backgroundPosition: 'center'
         } : {}}
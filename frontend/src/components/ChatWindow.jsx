@@ -119,6 +119,11 @@ function ChatWindow({ session, onSessionUpdate, onRefreshSession }) {
         requestIllustration: illustrate,
       })
 
+      // A pre-generated run intro opens the run ahead of the player's message
+      if (data.intro) {
+        setMessages(prev => [...prev.slice(0, -1), { role: 'dm', content: data.intro }, prev[prev.length - 1]])
+      }
+
       if (data.response) {
         setMessages(prev => [...prev, { role: 'dm', content: data.response }])
       }
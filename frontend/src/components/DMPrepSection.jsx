@@ -191,6 +191,7 @@ function DMPrepSection({ campaignId, npcs = [], locations = [], runs = [] }) {
         <PrepCoachChat
           campaignId={campaignId}
           conversation={prepData?.conversation || []}
+          conversationPage={prepData?.conversation_page}
           onConversationUpdate={handleConversationUpdate}
           onPinInsight={handlePinInsight}
         />
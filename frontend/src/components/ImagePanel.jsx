@@ -1,10 +1,52 @@
 import React, { useState } from 'react'
+import { useCampaignContext } from '../context/CampaignContext'
+import { keepImage } from '../api/dm'
+import { fetchGallery } from '../api/images'
+
+// Campaign images are served with smaller renditions via ?size=
+const sizedUrl = (url, size) =>
+  url?.startsWith('/api/campaigns/') ? `${url}?size=${size}` : url
 
 function ImagePanel({ session }) {
+  const { campaignId } = useCampaignContext()
   const [showGallery, setShowGallery] = useState(false)
+  const [kept, setKept] = useState({})
+  const [gallery, setGallery] = useState({ images: [], nextBefore: null, hasMore: false })
+  const [loadingGallery, setLoadingGallery] = useState(false)
+
+  // The gallery reads the campaign's image index, not the session
+  const loadGallery = async (before) => {
+    setLoadingGallery(true)
+    try {
+      const page = await fetchGallery(campaignId, { before })
+      setGallery(prev => ({
+        images: before ? [...prev.images, ...page.images] : page.images,
+        nextBefore: page.next_before,
+        hasMore: page.has_more,
+      }))
+    } catch (err) {
+      console.error('Failed to load gallery:', err)
+    } finally {
+      setLoadingGallery(false)
+    }
+  }
+
+  const toggleGallery = () => {
+    if (!showGallery) loadGallery()
+    setShowGallery(!showGallery)
+  }
+
+  const handleKeep = async (url) => {
+    try {
+      await keepImage(url)
+      setKept(prev => ({ ...prev, [url]: true }))
+    } catch (err) {
+      console.error('Failed to keep image:', err)
+    }
+  }
 
   const currentImage = session?.currentImage
-  const allImages = (session?.images || []).filter(img => img.url)
+  const allImages = gallery.images.filter(img => img.available)
 
   if (!session?.active) {
     return null
@@ -14,9 +56,9 @@ function ImagePanel({ session }) {
     <div className="card image-panel">
       <div className="card-header purple">
         Scene
-        {allImages.length > 1 && (
+        {currentImage && (
           <button
-            onClick={() => setShowGallery(!showGallery)}
+            onClick={toggleGallery}
             style={{
               float: 'right',
               background: 'rgba(255,255,255,0.2)',
@@ -28,17 +70,18 @@ function ImagePanel({ session }) {
               color: 'inherit'
             }}
           >
-            {showGallery ? 'Current' : `Gallery (${allImages.length})`}
+            {showGallery ? 'Current' : 'Gallery'}
           </button>
         )}
       </div>
       <div className="card-body">
         {showGallery ? (
           <div className="image-gallery">
-            {allImages.map((img, i) => (
-              <div key={i} className="gallery-item">
+            {allImages.map(img => (
+              <div key={img.seq} className="gallery-item">
                 <img
-                  src={img.url}
+                  src={sizedUrl(img.url, 'thumb')}
+                  loading="lazy"
                   alt={img.prompt}
                   title={img.prompt}
                   style={{
@@ -51,14 +94,33 @@ function ImagePanel({ session }) {
                 />
                 <div style={{ fontSize: '0.7rem', color: '#666', marginBottom: '0.75rem' }}>
                   {img.prompt?.substring(0, 60)}...
+                  {img.url.startsWith('/api/campaigns/') && (
+                    <button
+                      className="btn btn-secondary btn-sm"
+                      style={{ marginLeft: '0.5rem' }}
+                      onClick={() => handleKeep(img.url)}
+                      disabled={kept[img.url]}
+                    >
+                      {kept[img.url] ? 'Kept' : 'Keep'}
+                    </button>
+                  )}
                 </div>
               </div>
             ))}
+            {gallery.hasMore && (
+              <button
+                className="btn btn-secondary btn-sm"
+                onClick={() => loadGallery(gallery.nextBefore)}
+                disabled={loadingGallery}
+              >
+                {loadingGallery ? 'Loading...' : 'Load more'}
+              </button>
+            )}
           </div>
         ) : currentImage ? (
           <div className="scene-image">
             <img
-              src={currentImage}
+              src={sizedUrl(currentImage, 'medium')}
               alt="Current scene"
               style={{
                 width: '100%',
@@ -1,13 +1,16 @@
 import React, { useState, useRef, useEffect } from 'react'
-import { sendPrepMessage, clearConversation as apiClearConversation } from '../api/dmPrep'
+import { sendPrepMessage, fetchPrepConversation, clearConversation as apiClearConversation } from '../api/dmPrep'
 
-function PrepCoachChat({ campaignId, conversation = [], onConversationUpdate, onPinInsight }) {
+function PrepCoachChat({ campaignId, conversation = [], conversationPage = null, onConversationUpdate, onPinInsight }) {
   const [messages, setMessages] = useState(conversation)
+  const [olderCursor, setOlderCursor] = useState(conversationPage?.has_more ? conversationPage.next_before : null)
+  const [loadingOlder, setLoadingOlder] = useState(false)
   const [input, setInput] = useState('')
   const [loading, setLoading] = useState(false)
   const [showPinDialog, setShowPinDialog] = useState(null)
   const [pinCategory, setPinCategory] = useState('general')
   const messagesEndRef = useRef(null)
+  const prependedRef = useRef(false)
 
   // Sync messages with conversation prop
   useEffect(() => {
@@ -15,10 +18,34 @@ function PrepCoachChat({ campaignId, conversation = [], onConversationUpdate, on
   }, [conversation])
 
   useEffect(() => {
-    // Scroll to bottom when new messages arrive
+    setOlderCursor(conversationPage?.has_more ? conversationPage.next_before : null)
+  }, [conversationPage])
+
+  useEffect(() => {
+    // Scroll to bottom when new messages arrive, not when older ones are prepended
+    if (prependedRef.current) {
+      prependedRef.current = false
+      return
+    }
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' })
   }, [messages])
 
+  const loadOlderMessages = async () => {
+    if (!olderCursor || loadingOlder) return
+
+    setLoadingOlder(true)
+    try {
+      const page = await fetchPrepConversation(campaignId, olderCursor)
+      prependedRef.current = true
+      setMessages(prev => [...page.messages, ...prev])
+      setOlderCursor(page.has_more ? page.next_before : null)
+    } catch (err) {
+      console.error('Failed to load earlier messages:', err)
+    } finally {
+      setLoadingOlder(false)
+    }
+  }
+
   const sendMessage = async () => {
     if (!input.trim() || loading) return
 
@@ -60,6 +87,7 @@ function PrepCoachChat({ campaignId, conversation = [], onConversationUpdate, on
     try {
       await apiClearConversation(campaignId)
       setMessages([])
+      setOlderCursor(null)
       onConversationUpdate?.([])
     } catch (err) {
       console.error('Failed to clear conversation:', err)
@@ -147,6 +175,12 @@ function PrepCoachChat({ campaignId, conversation = [], onConversationUpdate, on
       </div>
 
       <div className="prep-chat-messages">
+        {olderCursor && (
+          <button className="btn btn-secondary btn-sm" onClick={loadOlderMessages} disabled={loadingOlder}>
+            {loadingOlder ? 'Loading...' : 'Load earlier messages'}
+          </button>
+        )}
+
         {messages.length === 0 && (
           <div className="prep-chat-intro">
             <p><strong>Welcome to the Prep Coach!</strong></p>